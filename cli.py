@@ -0,0 +1,390 @@
+# cli.py - Консольный (headless) режим приложения
+
+import sys
+import time
+import logging
+import argparse
+import contextlib
+
+from core.config import load_config, get_config_value
+from utils.logging_setup import setup_logging
+
+# Первый аргумент командной строки, по которому main.py переключается в консольный режим
+COMMANDS = ('mirror', 'sync', 'catalog', 'check', 'hosts', 'launch', 'prefetch', 'cache')
+
+# Коды возврата команд запуска: 0 - успех, 1 - ошибка, 2 - неверные аргументы, 3 - запуск прерван (нет ответа/отказ)
+EXIT_ABORTED = 3
+
+
+def _run_mirror(config, args):
+    from core.mirror import run_mirror_server
+    run_mirror_server(config, archive_root=args.root, bind_address=args.bind, port=args.port)
+    return 0
+
+
+def _run_catalog(config, args):
+    from core.catalog import update_catalog_file
+    archive_root = args.root or get_config_value(config, 'MirrorServer', 'Root', default='', type_cast=str)
+    if not archive_root:
+        print("Не указан каталог архивов ([MirrorServer] Root или аргумент командной строки).", file=sys.stderr)
+        return 2
+    catalog = update_catalog_file(archive_root, config=config, catalog_path=args.output, full_rebuild=args.full, workers=args.workers)
+    print(f"Архивов в каталоге: {len(catalog['archives'])}.")
+    return 0
+
+
+def _run_check(config, args):
+    import json
+    import threading
+    from core.batch_check import split_targets, check_servers_batch
+
+    text = " ".join(args.targets)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            text += "\n" + f.read()
+    targets = split_targets(text)
+    if not targets:
+        print("Не указаны адреса серверов.", file=sys.stderr)
+        return 2
+
+    timeout = None
+    if args.timeout is not None:
+        timeout = (min(args.timeout, get_config_value(config, 'BatchCheck', 'ConnectTimeoutSec', default=3, type_cast=float)), args.timeout)
+
+    def print_result(result):
+        if args.format == 'jsonl':
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+
+    cancel_event = threading.Event()
+    try:
+        results = check_servers_batch(config, targets, print_result, cancel_event.is_set, concurrency=args.concurrency, timeout=timeout)
+    except KeyboardInterrupt:
+        cancel_event.set()
+        print("Проверка прервана.", file=sys.stderr)
+        return 130
+
+    if args.format == 'table':
+        sort_key = {'target': lambda r: r['target'], 'version': lambda r: (r['version'] or ''), 'time': lambda r: r['elapsed_ms']}[args.sort]
+        print(f"{'Сервер':<40} {'Edition':<8} {'Версия':<14} {'Состояние':<22} {'мс':>6}  Ошибка")
+        for r in sorted(results, key=sort_key):
+            print(f"{r['target']:<40} {r['edition'] or '-':<8} {r['version'] or '-':<14} {r['server_state'] or '-':<22} {r['elapsed_ms']:>6}  {r['error'] or ''}")
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+def _run_hosts(config, args):
+    import json
+    from core.host_stats import get_host_stats_snapshot, reset_host_stats
+
+    if args.reset:
+        reset_host_stats(args.reset if args.reset != '*' else None)
+        print("Статистика сброшена.", file=sys.stderr)
+        return 0
+    snapshot = get_host_stats_snapshot(config)
+    if args.format == 'jsonl':
+        for host_stats in snapshot:
+            print(json.dumps(host_stats, ensure_ascii=False))
+        return 0
+    print(f"{'Хост':<40} {'Ответов':>7} {'p50 мс':>7} {'p90 мс':>7} {'p99 мс':>7} {'Подкл. с':>8} {'Чтение с':>8} {'Ошибок':>6}  Последняя ошибка")
+    for h in snapshot:
+        print(f"{h['host']:<40} {h['samples']:>7} {h['p50_ms'] if h['p50_ms'] is not None else '-':>7} "
+              f"{h['p90_ms'] if h['p90_ms'] is not None else '-':>7} {h['p99_ms'] if h['p99_ms'] is not None else '-':>7} "
+              f"{h['connect_timeout_sec']:>8} {h['read_timeout_sec']:>8} {h['failures']:>6}  {h['last_error'] or ''}")
+    return 0
+
+
+def _run_sync(config, args):
+    import time
+    import threading
+    from core.sync import parse_sync_entry, list_remote_entries, select_newer_entries, run_sync, format_entry, format_summary
+    from utils.bandwidth import set_bandwidth_limit
+
+    entry_strings = list(args.entries)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            entry_strings.extend(line for line in (l.strip() for l in f) if line and not line.startswith('#'))
+
+    entries = []
+    for entry_string in entry_strings:
+        entry = parse_sync_entry(entry_string)
+        if entry is None:
+            print(f"Некорректная запись: '{entry_string}'", file=sys.stderr)
+            return 2
+        entries.append(entry)
+    if args.newer_than:
+        entries.extend(select_newer_entries(list_remote_entries(config), args.newer_than))
+
+    # Убираем дубликаты, сохраняя порядок
+    unique_entries = list({(e['app_type'], e['version']): e for e in entries}.values())
+    if not unique_entries:
+        print("Нет дистрибутивов для синхронизации.", file=sys.stderr)
+        return 2
+
+    bandwidth_kbps = args.bandwidth_kbps if args.bandwidth_kbps is not None else \
+        get_config_value(config, 'Sync', 'BandwidthLimitKBps', default=0, type_cast=int)
+    set_bandwidth_limit(bandwidth_kbps * 1024)
+
+    cancel_event = threading.Event()
+
+    def print_result(result):
+        error_suffix = f": {result['error']}" if result['error'] else ''
+        print(f"[{result['status']}] {format_entry(result['entry'])}{error_suffix}", flush=True)
+
+    print(f"Синхронизация {len(unique_entries)} дистрибутивов...", flush=True)
+    started_at = time.monotonic()
+    try:
+        results = run_sync(config, unique_entries, concurrency=args.concurrency,
+                           is_canceled_callback=cancel_event.is_set, on_result=print_result)
+    except KeyboardInterrupt:
+        # Частично скачанные архивы остаются во временной папке и будут докачаны при следующем запуске
+        cancel_event.set()
+        print("Синхронизация прервана.", file=sys.stderr)
+        return 130
+    print()
+    print(format_summary(results, time.monotonic() - started_at))
+    return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+
+def _ask_choice(progress, question, options):
+    """Вопрос в терминале. Без терминала (вызов из тикетной системы) ответа нет - возвращает None."""
+    if not sys.stdin.isatty():
+        return None
+    progress.finish()
+    answer = input(f"{question} [{'/'.join(options)}]: ").strip()
+    for option in options:
+        if answer.lower() == option.lower():
+            return option
+    return None
+
+
+def _make_launch_questions(args, progress):
+    def choose_app_type(launch_data):
+        if args.app_type:
+            return args.app_type
+        print(f"Тип приложения не определен по edition '{launch_data.get('edition')}' (укажите --app-type).", file=sys.stderr)
+        return _ask_choice(progress, "Тип приложения", ['RMS', 'Chain'])
+
+    def confirm_server_state(launch_data):
+        if args.yes:
+            return True
+        print(f"Состояние сервера '{launch_data['parsed_target']['UrlOrIp']}': '{launch_data['server_state']}' (для запуска укажите --yes).", file=sys.stderr)
+        return _ask_choice(progress, "Продолжить запуск BackOffice?", ['Yes', 'No']) == 'Yes'
+
+    return choose_app_type, confirm_server_state
+
+
+def _print_launch_result(args, result):
+    import json
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+    elif result['ok']:
+        print(f"{result['target']}: {result['app_type']} {result['version_formatted']} - {result['installer_path']}"
+              + (f" (PID {result['pid']})" if result.get('pid') else ""), flush=True)
+    else:
+        print(f"{result['target']}: {result['error']}", flush=True)
+
+
+def _run_launch_pipeline(config, args, target, start):
+    """Шаги запуска для одного адреса; start=False - только подготовка дистрибутива (prefetch)."""
+    from core.headless import resolve_target, prepare_installer, start_backoffice, summarize_launch_data
+    from utils.console_progress import ConsoleProgress
+    from utils.exceptions import AbortOperation
+
+    progress = ConsoleProgress()
+    choose_app_type, confirm_server_state = _make_launch_questions(args, progress)
+    if not start:
+        # Для подготовки дистрибутива состояние сервера не важно
+        confirm_server_state = lambda launch_data: True # noqa: E731
+    started_at = time.perf_counter()
+    launch_data = {'target_string': target, 'force_refresh': args.refresh}
+    result = {'ok': False, 'error': None}
+    try:
+        resolve_target(config, launch_data, progress.update_status, progress.update_progress,
+                       choose_app_type, confirm_server_state)
+        prepare_installer(config, launch_data, progress.update_status, progress.update_progress)
+        if start:
+            start_backoffice(config, launch_data, progress.update_status, progress.update_progress)
+            from core.launch_history import record_target
+            record_target(config, target)
+        result['ok'] = True
+        exit_code = 0
+    except AbortOperation as e:
+        logging.info(f"Запуск '{target}' прерван: {e}")
+        result['error'] = str(e)
+        exit_code = EXIT_ABORTED
+    except Exception as e:
+        logging.error(f"Ошибка запуска '{target}': {e}")
+        result['error'] = str(e)
+        exit_code = 1
+    finally:
+        progress.finish()
+    result.update(summarize_launch_data(launch_data))
+    result['elapsed_ms'] = int((time.perf_counter() - started_at) * 1000)
+    result['startup_ms'] = args.startup_ms
+    _print_launch_result(args, result)
+    return exit_code
+
+
+def _run_launch(config, args):
+    try:
+        return _run_launch_pipeline(config, args, args.target, start=True)
+    except KeyboardInterrupt:
+        print("Запуск прерван.", file=sys.stderr)
+        return 130
+
+
+def _run_prefetch(config, args):
+    exit_code = 0
+    try:
+        for target in args.targets:
+            exit_code = max(exit_code, _run_launch_pipeline(config, args, target, start=False))
+    except KeyboardInterrupt:
+        print("Подготовка прервана.", file=sys.stderr)
+        return 130
+    return exit_code
+
+
+def _list_caches(config):
+    """Сводка по локальным кэшам: имя, путь, число записей."""
+    import os
+    from core.probe_cache import get_probe_cache_snapshot, _get_disk_path as probe_cache_path
+    from core.discovery import get_remembered_winners, _get_disk_path as discovery_cache_path
+    from core.host_stats import get_host_stats_snapshot, _get_disk_path as host_stats_path
+    from core.config_templates import get_templates_dir
+    from core.peer_cache import get_peer_cache_dir
+
+    def count_entries(path, suffix=''):
+        try:
+            return sum(1 for name in os.listdir(path) if name.endswith(suffix) and not name.startswith('.'))
+        except OSError:
+            return 0
+
+    installer_root = get_config_value(config, 'Settings', 'InstallerRoot', default='D:\\Backs')
+    templates_dir = get_templates_dir(config)
+    peer_cache_dir = get_peer_cache_dir(config)
+    return [
+        {'name': 'probe', 'path': os.path.abspath(probe_cache_path()), 'entries': len(get_probe_cache_snapshot(config))},
+        {'name': 'discovery', 'path': os.path.abspath(discovery_cache_path()), 'entries': len(get_remembered_winners())},
+        {'name': 'hosts', 'path': os.path.abspath(host_stats_path()), 'entries': len(get_host_stats_snapshot(config))},
+        {'name': 'templates', 'path': os.path.abspath(templates_dir), 'entries': count_entries(templates_dir, '.xml')},
+        {'name': 'archives', 'path': peer_cache_dir, 'entries': count_entries(peer_cache_dir, '.zip')},
+        {'name': 'installers', 'path': installer_root, 'entries': sum(
+            1 for name in (os.listdir(installer_root) if os.path.isdir(installer_root) else [])
+            if not name.startswith(('.', '_')) and os.path.isdir(os.path.join(installer_root, name)))},
+    ]
+
+
+def _clear_cache(config, name):
+    import shutil
+    if name in ('probe', 'all'):
+        from core.probe_cache import invalidate_probe
+        invalidate_probe(config)
+    if name in ('discovery', 'all'):
+        from core.discovery import forget_winners
+        forget_winners()
+    if name in ('hosts', 'all'):
+        from core.host_stats import reset_host_stats
+        reset_host_stats()
+    if name in ('templates', 'all'):
+        from core.config_templates import get_templates_dir
+        shutil.rmtree(get_templates_dir(config), ignore_errors=True)
+
+
+def _run_cache(config, args):
+    import json
+    if args.action == 'clear':
+        _clear_cache(config, args.name)
+        print(f"Кэш '{args.name}' очищен.", file=sys.stderr)
+        return 0
+    caches = _list_caches(config)
+    if args.json:
+        for cache in caches:
+            print(json.dumps(cache, ensure_ascii=False))
+        return 0
+    print(f"{'Кэш':<12} {'Записей':>7}  Путь")
+    for cache in caches:
+        print(f"{cache['name']:<12} {cache['entries']:>7}  {cache['path']}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="BackOfficeLauncher", description="BackOffice Launcher: консольный режим.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    mirror_parser = subparsers.add_parser('mirror', help="Запустить локальное зеркало дистрибутивов (HTTP).")
+    mirror_parser.add_argument('root', nargs='?', default=None, help="Каталог архивов зеркала (по умолчанию [MirrorServer] Root).")
+    mirror_parser.add_argument('--bind', default=None, help="Адрес для прослушивания (по умолчанию все интерфейсы).")
+    mirror_parser.add_argument('--port', type=int, default=None, help="TCP-порт (по умолчанию [MirrorServer] Port).")
+    mirror_parser.set_defaults(handler=_run_mirror)
+
+    catalog_parser = subparsers.add_parser('catalog', help="Построить каталог архивов (SHA-256, CRC файлов) для зеркала.")
+    catalog_parser.add_argument('root', nargs='?', default=None, help="Каталог архивов (по умолчанию [MirrorServer] Root).")
+    catalog_parser.add_argument('--output', default=None, help="Файл каталога (по умолчанию catalog.json в каталоге архивов).")
+    catalog_parser.add_argument('--full', action='store_true', help="Перехешировать все архивы, игнорируя предыдущий каталог.")
+    catalog_parser.add_argument('--workers', type=int, default=None, help="Число потоков хеширования.")
+    catalog_parser.set_defaults(handler=_run_catalog)
+
+    check_parser = subparsers.add_parser('check', help="Проверить версии и состояние множества серверов.")
+    check_parser.add_argument('targets', nargs='*', help="Адреса серверов (URL или IP:порт).")
+    check_parser.add_argument('--file', default=None, help="Файл со списком адресов.")
+    check_parser.add_argument('--concurrency', type=int, default=None, help="Число одновременных запросов (по умолчанию [BatchCheck] Concurrency).")
+    check_parser.add_argument('--timeout', type=float, default=None, help="Таймаут на один сервер, сек (по умолчанию [BatchCheck] ReadTimeoutSec).")
+    check_parser.add_argument('--format', choices=('jsonl', 'table'), default='jsonl', help="Формат вывода: JSON по строке на сервер по мере ответов или таблица в конце.")
+    check_parser.add_argument('--sort', choices=('target', 'version', 'time'), default='target', help="Сортировка таблицы.")
+    check_parser.set_defaults(handler=_run_check)
+
+    hosts_parser = subparsers.add_parser('hosts', help="Показать выученные таймауты и статистику ответов хостов.")
+    hosts_parser.add_argument('--format', choices=('jsonl', 'table'), default='table', help="Формат вывода.")
+    hosts_parser.add_argument('--reset', metavar='ХОСТ:ПОРТ', default=None, help="Сбросить статистику хоста ('*' - всех хостов).")
+    hosts_parser.set_defaults(handler=_run_hosts)
+
+    sync_parser = subparsers.add_parser('sync', help="Скачать и распаковать набор версий в InstallerRoot.")
+    sync_parser.add_argument('entries', nargs='*', help="Записи вида \"iiko RMS 7.5.6\" или \"SyrveChain 812\".")
+    sync_parser.add_argument('--file', default=None, help="Файл со списком записей (по одной в строке).")
+    sync_parser.add_argument('--newer-than', default=None, help="Добавить все версии из удаленного каталога новее указанной.")
+    sync_parser.add_argument('--concurrency', type=int, default=None, help="Число одновременных загрузок (по умолчанию [Sync] Concurrency).")
+    sync_parser.add_argument('--bandwidth-kbps', type=int, default=None, help="Общий лимит скорости, КБ/с (по умолчанию [Sync] BandwidthLimitKBps, 0 - без лимита).")
+    sync_parser.set_defaults(handler=_run_sync)
+
+    launch_parser = subparsers.add_parser('launch', help="Запустить BackOffice для сервера без окна приложения.")
+    launch_parser.add_argument('target', help="Адрес сервера (URL или IP:порт).")
+    prefetch_parser = subparsers.add_parser('prefetch', help="Опросить серверы и заранее подготовить их дистрибутивы в InstallerRoot.")
+    prefetch_parser.add_argument('targets', nargs='+', help="Адреса серверов (URL или IP:порт).")
+    for launch_like_parser, handler in ((launch_parser, _run_launch), (prefetch_parser, _run_prefetch)):
+        launch_like_parser.add_argument('--app-type', choices=('RMS', 'Chain'), default=None,
+                                        help="Тип приложения, если его нельзя определить по edition сервера.")
+        launch_like_parser.add_argument('--refresh', action='store_true', help="Опросить сервер, не используя кэш ответов.")
+        launch_like_parser.add_argument('--json', action='store_true', help="Результат - одна строка JSON на сервер.")
+        launch_like_parser.set_defaults(handler=handler)
+    launch_parser.add_argument('--yes', action='store_true', help="Запускать, даже если сервер не в состоянии STARTED_SUCCESSFULLY.")
+
+    cache_parser = subparsers.add_parser('cache', help="Показать или очистить локальные кэши.")
+    cache_parser.add_argument('action', choices=('list', 'clear'), help="Действие.")
+    cache_parser.add_argument('name', nargs='?', choices=('probe', 'discovery', 'hosts', 'templates', 'all'), default='all',
+                              help="Какой кэш очистить (для clear).")
+    cache_parser.add_argument('--json', action='store_true', help="Вывод JSON по строке на кэш.")
+    cache_parser.set_defaults(handler=_run_cache)
+
+    return parser
+
+
+def main(argv, started_at=None):
+    """started_at - time.perf_counter() в начале процесса (для замера времени запуска консольного режима)."""
+    args = build_parser().parse_args(argv)
+    # Служебные сообщения загрузки конфига и журнал - в stderr, stdout остается для результатов команд
+    with contextlib.redirect_stdout(sys.stderr):
+        config = load_config()
+    setup_logging(config, stream=sys.stderr)
+    args.startup_ms = int((time.perf_counter() - started_at) * 1000) if started_at is not None else None
+    logging.info(f"Консольный режим: команда '{args.command}'" + (f", запуск {args.startup_ms} мс." if args.startup_ms is not None else "."))
+    try:
+        return args.handler(config, args)
+    except Exception as e:
+        logging.error(f"Ошибка выполнения команды '{args.command}': {e}")
+        return 1
+    finally:
+        if 'PyQt6' in sys.modules:
+            logging.warning("Консольный режим загрузил PyQt6 - проверьте импорты core/utils.")
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:], started_at=time.perf_counter()))
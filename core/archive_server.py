@@ -0,0 +1,239 @@
+# core/archive_server.py
+
+import os
+import json
+import logging
+import threading
+import urllib.parse
+import email.utils
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ArchiveRequestHandler(BaseHTTPRequestHandler):
+    """
+    Отдает архивы дистрибутивов из каталога server.archive_root по HTTP.
+    Поддерживает HEAD, одиночные диапазоны (Range: bytes=...), ETag/Last-Modified,
+    условные запросы (If-None-Match, If-Modified-Since, If-Range) и каталог /catalog.json.
+    """
+    server_version = "MHrunnerArchiveServer/1.0"
+    protocol_version = "HTTP/1.1"
+    copy_buffer_size = 1024 * 1024 # 1 MB
+
+    def do_GET(self):
+        self._handle_request(send_body=True)
+
+    def do_HEAD(self):
+        self._handle_request(send_body=False)
+
+    def log_message(self, format, *args):
+        # Перенаправляем журнал http.server в стандартный logging
+        logging.debug(f"[{self.server.server_name_label}] {self.address_string()} - {format % args}")
+
+    def _handle_request(self, send_body):
+        request_path = urllib.parse.urlsplit(self.path).path
+
+        if request_path == '/catalog.json':
+            self._send_catalog(send_body)
+            return
+
+        file_path = self._resolve_archive_path(request_path)
+        if file_path is None:
+            self._send_plain_error(404, "Not Found")
+            return
+        if not os.path.isfile(file_path):
+            fetched = self.fetch_missing_archive(file_path, request_path)
+            if fetched is None:
+                return # Наследник уже отправил ответ
+            if not fetched:
+                self._send_plain_error(404, "Not Found")
+                return
+
+        try:
+            file_stat = os.stat(file_path)
+        except OSError as e:
+            logging.warning(f"Не удалось получить размер файла '{file_path}': {e}")
+            self._send_plain_error(404, "Not Found")
+            return
+        file_size = file_stat.st_size
+        etag = make_etag(file_stat)
+        last_modified = email.utils.formatdate(int(file_stat.st_mtime), usegmt=True)
+
+        if self._is_not_modified(etag, int(file_stat.st_mtime)):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        byte_range = None
+        if self._if_range_matches(etag, last_modified):
+            byte_range = self._parse_range_header(self.headers.get('Range'), file_size)
+        if byte_range == 'unsatisfiable':
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{file_size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if byte_range is None:
+            start, end = 0, file_size - 1
+            self.send_response(200)
+        else:
+            start, end = byte_range
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{file_size}")
+
+        length = max(0, end - start + 1)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.end_headers()
+
+        if send_body and length > 0:
+            self._copy_file_range(file_path, start, length)
+
+    def fetch_missing_archive(self, file_path, request_path):
+        """
+        Вызывается, если запрошенного архива нет в каталоге. Наследники могут скачать
+        его из вышестоящего источника и вернуть True или сами отправить ответ и вернуть None.
+        По умолчанию - 404.
+        """
+        return False
+
+    def _is_not_modified(self, etag, mtime):
+        """Проверяет условия If-None-Match / If-Modified-Since (If-None-Match имеет приоритет)."""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            candidates = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in candidates or any(_strip_weak(tag) == _strip_weak(etag) for tag in candidates)
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return mtime <= since
+        return False
+
+    def _if_range_matches(self, etag, last_modified):
+        """Range применяется, только если If-Range отсутствует или совпадает с текущей версией файла."""
+        if_range = self.headers.get('If-Range')
+        if not if_range:
+            return True
+        if_range = if_range.strip()
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            # Для If-Range допустимо только строгое сравнение ETag
+            return not if_range.startswith('W/') and if_range == etag
+        return if_range == last_modified
+
+    def _resolve_archive_path(self, request_path):
+        """Преобразует путь запроса в путь внутри archive_root (без выхода за его пределы)."""
+        relative_path = urllib.parse.unquote(request_path).lstrip('/')
+        if not relative_path:
+            return None
+        archive_root = os.path.abspath(self.server.archive_root)
+        full_path = os.path.abspath(os.path.join(archive_root, *relative_path.split('/')))
+        if os.path.commonpath([archive_root, full_path]) != archive_root:
+            logging.warning(f"Отклонен запрос за пределы каталога архивов: '{request_path}'")
+            return None
+        return full_path
+
+    @staticmethod
+    def _parse_range_header(range_header, file_size):
+        """
+        Разбирает заголовок Range. Возвращает (start, end), None (отдать файл целиком)
+        или 'unsatisfiable'. Несколько диапазонов не поддерживаются - отдаем файл целиком.
+        """
+        if not range_header or not range_header.startswith('bytes='):
+            return None
+        ranges = range_header[len('bytes='):].strip()
+        if ',' in ranges:
+            return None
+
+        start_str, _, end_str = ranges.partition('-')
+        try:
+            if start_str == '':
+                # Суффиксный диапазон: последние N байт
+                suffix_length = int(end_str)
+                if suffix_length <= 0:
+                    return 'unsatisfiable'
+                return max(0, file_size - suffix_length), file_size - 1
+            start = int(start_str)
+            end = int(end_str) if end_str else file_size - 1
+        except ValueError:
+            return None
+
+        if start >= file_size or start > end:
+            return 'unsatisfiable'
+        return start, min(end, file_size - 1)
+
+    def _copy_file_range(self, file_path, start, length):
+        try:
+            with open(file_path, 'rb') as f_src:
+                f_src.seek(start)
+                remaining = length
+                while remaining > 0:
+                    buffer = f_src.read(min(self.copy_buffer_size, remaining))
+                    if not buffer:
+                        break
+                    self.wfile.write(buffer)
+                    remaining -= len(buffer)
+        except (BrokenPipeError, ConnectionResetError):
+            logging.debug(f"Клиент {self.address_string()} закрыл соединение во время передачи '{file_path}'.")
+
+    def _send_catalog(self, send_body):
+        catalog_provider = getattr(self.server, 'catalog_provider', None)
+        catalog = catalog_provider() if catalog_provider else {}
+        body = json.dumps(catalog, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _send_plain_error(self, code, message, headers=None):
+        body = message.encode('utf-8')
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+
+def make_etag(file_stat):
+    """Строгий ETag на основе размера и времени изменения файла."""
+    return f'"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+
+
+def _strip_weak(tag):
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+class ArchiveHTTPServer(ThreadingHTTPServer):
+    """Многопоточный HTTP-сервер архивов. Каждый клиент обслуживается в отдельном потоке."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, archive_root, catalog_provider=None, handler_class=ArchiveRequestHandler, server_name_label="archive-server"):
+        self.archive_root = archive_root
+        self.catalog_provider = catalog_provider
+        self.server_name_label = server_name_label
+        super().__init__(server_address, handler_class)
+
+
+def start_archive_server(bind_address, port, archive_root, catalog_provider=None, handler_class=ArchiveRequestHandler, server_name_label="archive-server"):
+    """Запускает ArchiveHTTPServer в фоновом потоке и возвращает объект сервера."""
+    server = ArchiveHTTPServer((bind_address, port), archive_root, catalog_provider, handler_class, server_name_label)
+    thread = threading.Thread(target=server.serve_forever, name=f"{server_name_label}-thread", daemon=True)
+    thread.start()
+    logging.info(f"HTTP-сервер архивов '{server_name_label}' запущен на {bind_address or '0.0.0.0'}:{server.server_address[1]} (каталог: '{archive_root}').")
+    return server
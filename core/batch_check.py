@@ -0,0 +1,80 @@
+# core/batch_check.py - Пакетная проверка множества серверов
+
+import re
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from core.config import get_config_value
+from core.launcher import build_probe_url, fetch_server_info
+from core.probe_cache import store_probe
+from utils.url_utils import parse_target_string
+
+
+def split_targets(text):
+    """Разбивает текст (строки, запятые, пробелы) на список адресов без повторов, сохраняя порядок."""
+    targets = [t for t in re.split(r"[\s,;]+", text) if t]
+    return list(dict.fromkeys(targets))
+
+
+def probe_target(config, target_string, timeout=None):
+    """
+    Проверяет один сервер. Не выбрасывает исключений: результат - словарь
+    {'target', 'ok', 'edition', 'version', 'server_state', 'probe_url', 'elapsed_ms', 'error'}.
+    """
+    result = {'target': target_string, 'ok': False, 'edition': None, 'version': None,
+              'server_state': None, 'probe_url': None, 'elapsed_ms': None, 'error': None}
+    started_at = time.monotonic()
+    try:
+        parsed_target = parse_target_string(target_string)
+        if parsed_target is None or not parsed_target.get('UrlOrIp'):
+            raise ValueError("Не удалось распарсить адрес.")
+        result['probe_url'] = build_probe_url(parsed_target)
+        server_info = fetch_server_info(config, result['probe_url'], timeout=timeout)
+        result['edition'] = server_info.get('edition')
+        result['version'] = server_info.get('version')
+        result['server_state'] = server_info.get('serverState')
+        if None in (result['edition'], result['version'], result['server_state']):
+            raise ValueError("Ответ сервера не содержит ожидаемых ключей (edition, version, serverState).")
+        result['ok'] = True
+        # Результат пакетной проверки пригодится при последующем запуске BackOffice на этом сервере
+        store_probe(config, parsed_target, server_info, result['probe_url'])
+    except Exception as e:
+        result['error'] = str(e)
+    result['elapsed_ms'] = int((time.monotonic() - started_at) * 1000)
+    return result
+
+
+def check_servers_batch(config, targets, on_result=None, is_canceled_callback=None, concurrency=None, timeout=None):
+    """
+    Параллельно проверяет targets (не более concurrency запросов одновременно).
+    Каждый сервер ограничен собственным таймаутом (connect, read) из [BatchCheck].
+    on_result(result) вызывается по мере завершения проверок; возвращается список
+    результатов в порядке завершения.
+    """
+    concurrency = concurrency or get_config_value(config, 'BatchCheck', 'Concurrency', default=32, type_cast=int)
+    if timeout is None:
+        timeout = (get_config_value(config, 'BatchCheck', 'ConnectTimeoutSec', default=3, type_cast=float),
+                   get_config_value(config, 'BatchCheck', 'ReadTimeoutSec', default=5, type_cast=float))
+    logging.info(f"Пакетная проверка {len(targets)} серверов, параллельно: {concurrency}, таймаут: {timeout}.")
+
+    results = []
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch-check")
+    try:
+        pending = {executor.submit(probe_target, config, target, timeout) for target in targets}
+        while pending:
+            if is_canceled_callback and is_canceled_callback():
+                logging.info("Пакетная проверка отменена.")
+                break
+            # Короткое ожидание, чтобы отмена срабатывала, даже если все запросы висят до таймаута
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results.append(result)
+                if on_result: on_result(result)
+    finally:
+        # Не дожидаемся запросов, которые уже выполняются: их результат не нужен
+        executor.shutdown(wait=False, cancel_futures=True)
+    ok_count = sum(1 for r in results if r['ok'])
+    logging.info(f"Пакетная проверка завершена: ответили {ok_count} из {len(results)}.")
+    return results
@@ -0,0 +1,153 @@
+# core/catalog.py - Каталог архивов дистрибутивов для зеркала
+
+import os
+import re
+import json
+import time
+import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from core.config import get_config_value
+from core.archive_server import make_etag
+from core.peer_cache import compute_sha256
+
+# Версия формата каталога. Увеличивается при несовместимых изменениях структуры.
+# 1 - размер, mtime, ETag; 2 - добавлены SHA-256, центральный каталог ZIP и CRC файлов.
+CATALOG_FORMAT = 2
+CATALOG_FILE_NAME = "catalog.json"
+
+# Типы приложений, для которых в конфиге есть шаблоны имен архивов
+APP_TYPES = ('iikoRMS', 'iikoChain', 'SyrveRMS', 'SyrveChain')
+
+
+def build_archive_name_patterns(config, section='HttpSource'):
+    """
+    Регулярные выражения имен архивов по шаблонам [section] *_ArchiveName.
+    Возвращает {app_type: pattern}; группа 1 шаблона - форматированная версия.
+    """
+    patterns = {}
+    for app_type in APP_TYPES:
+        template = get_config_value(config, section, f'{app_type}_ArchiveName', default=None, type_cast=str)
+        if template and '{version}' in template:
+            prefix, _, suffix = template.partition('{version}')
+            patterns[app_type] = re.compile(f"^{re.escape(prefix)}(\\d+){re.escape(suffix)}$", re.IGNORECASE)
+    return patterns
+
+
+def match_archive_name(patterns, archive_name):
+    """Возвращает (app_type, version_formatted) для имени архива или (None, None)."""
+    for app_type, pattern in patterns.items():
+        match = pattern.match(archive_name)
+        if match:
+            return app_type, match.group(1)
+    return None, None
+
+
+def describe_archive(full_path):
+    """Полное описание одного архива: SHA-256, положение центрального каталога ZIP и CRC файлов."""
+    file_stat = os.stat(full_path)
+    record = {
+        'size': file_stat.st_size,
+        'mtime': int(file_stat.st_mtime),
+        'mtime_ns': file_stat.st_mtime_ns,
+        'etag': make_etag(file_stat),
+        'sha256': compute_sha256(full_path)
+    }
+    try:
+        with zipfile.ZipFile(full_path, 'r') as zip_ref:
+            # Центральный каталог и запись его конца занимают хвост файла начиная с этого смещения:
+            # клиенту достаточно одного Range-запроса, чтобы получить оглавление архива
+            record['central_directory_offset'] = zip_ref.start_dir
+            record['entries'] = {
+                info.filename: {
+                    'crc': f"{info.CRC:08x}",
+                    'size': info.file_size,
+                    'compressed_size': info.compress_size,
+                    'offset': info.header_offset
+                }
+                for info in zip_ref.infolist() if not info.is_dir()
+            }
+    except zipfile.BadZipFile as e:
+        logging.warning(f"Архив '{full_path}' поврежден, в каталог записан без содержимого: {e}")
+        record['bad_zip'] = True
+    return record
+
+
+def build_catalog(archive_root, config=None, previous=None, workers=None):
+    """
+    Сканирует archive_root и строит каталог архивов. Архивы, размер и время изменения
+    которых совпадают с записью в previous (каталог того же формата), не перехешируются.
+    Хеширование выполняется параллельно в workers потоках.
+    """
+    patterns = build_archive_name_patterns(config) if config is not None else {}
+    previous_archives = {}
+    if previous and previous.get('format') == CATALOG_FORMAT:
+        previous_archives = previous.get('archives', {})
+
+    archives = {}
+    to_describe = {}
+    for dirpath, dirnames, filenames in os.walk(archive_root):
+        for filename in filenames:
+            if not filename.lower().endswith('.zip'):
+                continue
+            full_path = os.path.join(dirpath, filename)
+            relative_name = os.path.relpath(full_path, archive_root).replace(os.sep, '/')
+            try:
+                file_stat = os.stat(full_path)
+            except OSError:
+                continue
+            previous_record = previous_archives.get(relative_name)
+            if previous_record and previous_record.get('size') == file_stat.st_size and previous_record.get('mtime_ns') == file_stat.st_mtime_ns:
+                archives[relative_name] = previous_record
+            else:
+                to_describe[relative_name] = full_path
+
+    if to_describe:
+        logging.info(f"Каталог '{archive_root}': хеширование {len(to_describe)} новых или измененных архивов (без изменений: {len(archives)}).")
+        with ThreadPoolExecutor(max_workers=workers or min(4, os.cpu_count() or 1), thread_name_prefix="catalog") as executor:
+            futures = {name: executor.submit(describe_archive, path) for name, path in to_describe.items()}
+            for relative_name, future in futures.items():
+                try:
+                    archives[relative_name] = future.result()
+                except OSError as e:
+                    logging.warning(f"Не удалось обработать архив '{to_describe[relative_name]}': {e}")
+
+    for relative_name, record in archives.items():
+        app_type, version_formatted = match_archive_name(patterns, relative_name)
+        if app_type:
+            record['app_type'] = app_type
+            record['version'] = version_formatted
+
+    return {'format': CATALOG_FORMAT, 'generated': int(time.time()), 'archives': dict(sorted(archives.items()))}
+
+
+def load_catalog(catalog_path):
+    """Загружает каталог из файла. Возвращает None, если файла нет или он поврежден."""
+    try:
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+        return catalog if isinstance(catalog, dict) else None
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Не удалось прочитать каталог '{catalog_path}': {e}. Каталог будет построен заново.")
+        return None
+
+
+def write_catalog(catalog, catalog_path):
+    """Атомарно записывает каталог (через временный файл), чтобы клиенты не прочитали его наполовину."""
+    temp_path = f"{catalog_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, catalog_path)
+
+
+def update_catalog_file(archive_root, config=None, catalog_path=None, full_rebuild=False, workers=None):
+    """Инкрементально обновляет файл каталога архива и возвращает каталог."""
+    catalog_path = catalog_path or os.path.join(archive_root, CATALOG_FILE_NAME)
+    previous = None if full_rebuild else load_catalog(catalog_path)
+    catalog = build_catalog(archive_root, config=config, previous=previous, workers=workers)
+    write_catalog(catalog, catalog_path)
+    logging.info(f"Каталог записан в '{catalog_path}': архивов {len(catalog['archives'])}.")
+    return catalog
@@ -1,6 +1,9 @@
 import configparser
 import os
 import sys
+import logging
+import threading
+from types import MappingProxyType
 
 # --- Конфигурация ---
 CONFIG_FILE = "config.ini"
@@ -12,13 +15,18 @@ DEFAULT_CONFIG = {
         'HttpRequestTimeoutSec': '15',
         'InstallerRoot': 'C:\\iiko_Distr', # Корневой каталог для ЛОКАЛЬНЫХ дистрибутивов
         'ConfigFileWaitTimeoutSec': '60',
-        'ConfigFileCheckIntervalMs': '100',
+        'ConfigFileCheckIntervalMs': '100', # Интервал опроса, если уведомления ОС об изменении файлов недоступны
         'DebugLogging': 'False', # Включить подробное логирование в консоль и файл
         'DefaultLogin': 'iikoUser',
         'AnyDeskPath': 'C:\\Program Files\\AnyDesk\\AnyDesk.exe',
         'LiteManagerPath': 'C:\Program Files (x86)\\LiteManager Pro - Viewer\\ROMViewer.exe', # Путь к исполняемому файлу LiteManager Viewer
         'LiteManagerIdMask': 'MH_11111', # Маска для определения ID LiteManager (1 = цифра)
         'Language': 'ru',
+        'ResumeDownloads': 'True', # Докачивать прерванные HTTP-загрузки (Range/If-Range)
+        'DownloadBufferKB': '256', # Размер буфера чтения HTTP-загрузок, КБ
+        'SpeculativePrep': 'True', # Готовить дистрибутив в фоне, пока открыт диалог выбора типа/подтверждения состояния
+        'MaxConcurrentJobs': '3', # Сколько запусков/проверок выполняется одновременно (остальные ждут в очереди)
+        'ConfigHotReload': 'True', # Перечитывать config.ini при его изменении, без перезапуска приложения
         'height_win': '290', 
         'width_win': '600'
     },
@@ -65,6 +73,100 @@ DEFAULT_CONFIG = {
         'SyrveRMS_ArchiveName': 'Syrve/RMSSOffice{version}.zip', # Указываем подпапку Syrve
         'SyrveChain_ArchiveName': 'Syrve/ChainSOffice{version}.zip' # Указываем подпапку Syrve
     },
+    # Кэш архивов, раздаваемый другим экземплярам приложения в локальной сети
+    'PeerCache': {
+        'Enabled': 'False', # Включить обмен архивами с пирами?
+        'CacheDir': '', # Каталог кэша архивов. Пусто - подпапка _archives в InstallerRoot
+        'ServePort': '8765', # TCP-порт HTTP-сервера кэша
+        'DiscoveryPort': '8766', # UDP-порт анонсов и обнаружения пиров
+        'Broadcast': 'True', # Искать пиров широковещанием в локальной сети
+        'Peers': '', # Явный список пиров через запятую: host[:port]
+        'DiscoveryTimeoutMs': '500',
+        'AnnounceIntervalSec': '60'
+    },
+    # Локальное зеркало дистрибутивов (консольный режим: BackOfficeLauncher.exe mirror)
+    'MirrorServer': {
+        'Root': '', # Каталог с архивами, раскладка как у HttpSource
+        'BindAddress': '', # Пусто - все интерфейсы
+        'Port': '8080',
+        'PullThrough': 'True', # Скачивать отсутствующие архивы из вышестоящих источников
+        'UpstreamOrder': 'http, ftp',
+        'UpstreamUrl': '', # Пусто - используется Url из HttpSource
+        'NegativeCacheSec': '60' # Не повторять поиск ненайденного архива в течение N секунд
+    },
+    # Кэш ответов getServerMonitoringInfo: Launch после Check не опрашивает сервер повторно
+    'ProbeCache': {
+        'TtlSec': '120', # Время жизни ответа в кэше. 0 - кэш отключен
+        'DiskCache': 'False' # Сохранять кэш в probe_cache.json рядом с программой (между запусками)
+    },
+    # Адаптивные таймауты HTTP по статистике ответов каждого хоста (core/host_stats.py)
+    'AdaptiveTimeouts': {
+        'Enabled': 'True', # False - HttpRequestTimeoutSec на подключение и чтение, как раньше
+        'MinSamples': '3', # Сколько ответов нужно, чтобы перейти от значений по умолчанию к выученным
+        'DefaultConnectTimeoutSec': '5', # Таймаут подключения к хосту без истории
+        'ConnectMultiplier': '3', # Таймаут подключения = 90-й перцентиль времени ответа * множитель
+        'ReadMultiplier': '4', # Таймаут чтения = 99-й перцентиль времени ответа * множитель
+        'MinConnectTimeoutSec': '1',
+        'MaxConnectTimeoutSec': '10',
+        'MinReadTimeoutSec': '5',
+        'MaxReadTimeoutSec': '120',
+        'FailFastSec': '30' # Сколько секунд сразу отказывать хосту, отклонившему подключение. 0 - не отказывать
+    },
+    # Шаблоны backclient.config.xml по версиям: запуск BackOffice без первого прогона (core/config_templates.py)
+    'ConfigTemplates': {
+        'Enabled': 'True',
+        'Dir': '' # Каталог шаблонов. Пусто - config_templates рядом с программой
+    },
+    # Подбор схемы и порта, если во вводе они указаны не полностью (core/discovery.py)
+    'Discovery': {
+        'Enabled': 'True',
+        'Ports': '443, 8080, 9080, 80', # Порты-кандидаты для адреса без порта, в порядке приоритета
+        'StaggerMs': '250', # Сдвиг запуска следующего кандидата, пока предыдущий не ответил
+        'AttemptTimeoutSec': '5' # Предел таймаута подключения одной попытки (сами таймауты - из статистики хоста, [AdaptiveTimeouts])
+    },
+    # Пакетная проверка серверов (окно проверки и консольная команда check)
+    'BatchCheck': {
+        'Concurrency': '32', # Число одновременных запросов
+        'ConnectTimeoutSec': '3', # Таймаут подключения к одному серверу
+        'ReadTimeoutSec': '5' # Таймаут ответа одного сервера
+    },
+    # Пакетная синхронизация версий (консольный режим: BackOfficeLauncher.exe sync)
+    'Sync': {
+        'Concurrency': '3', # Число одновременных загрузок
+        'BandwidthLimitKBps': '0' # Общий лимит скорости скачивания, КБ/с. 0 - без ограничения
+    },
+    # Книжка подключений AnyDesk/LiteManager (core/notebook_store.py)
+    'Notebook': {
+        'Path': '', # Путь к базе SQLite книжки. Пусто - notebook.db рядом с программой
+        # Общая папка журналов изменений (например, на сетевом диске): каждая машина пишет свой журнал
+        # и сливает чужие в свою базу. Пусто - книжка не общая. Саму базу в общую папку не класть
+        'JournalDir': '',
+        'JournalSyncSec': '30' # Как часто подтягивать изменения других машин, сек
+    },
+    # Фоновый опрос серверов iiko/Syrve из книжки подключений (core/server_monitor.py)
+    'ServerMonitor': {
+        'Enabled': 'True', # Опрашивать серверы книжки (записи типа Server) в фоне
+        'IntervalSec': '300', # Интервал опроса одного сервера, сек
+        'Jitter': '0.2', # Случайный разброс интервала (доля), чтобы опросы не шли одной волной
+        'Concurrency': '8', # Число одновременных запросов
+        'PrepareOnVersionChange': 'True' # Сменилась версия сервера - заранее готовить дистрибутив новой версии
+    },
+    # Подсказки в строке адреса: книжка подключений и история запусков (core/launch_history.py)
+    'Suggestions': {
+        'Enabled': 'True', # Показывать подсказки при вводе адреса
+        'HistorySize': '500', # Сколько последних адресов помнит история запусков. 0 - не вести историю
+        'MaxResults': '10' # Сколько подсказок показывать
+    },
+    # Один резидентный экземпляр: повторные запуски передают ему адрес и сразу завершаются
+    'Resident': {
+        'Enabled': 'True' # Закрытие окна прячет его в трей; False - каждый запуск открывает отдельное окно
+    },
+    # Замер и ускорение запуска приложения
+    'Startup': {
+        'Profile': 'False', # Замерять импорты и время до первой отрисовки окна, отчет - в журнал
+        'BudgetMs': '0', # Бюджет времени до первой отрисовки, мс (превышение - предупреждение в журнале). 0 - без бюджета
+        'PreloadModules': 'True' # После отрисовки окна догружать модули запуска в фоне
+    },
     # Определяем ФОРМАТ имен ПАПОК для ЛОКАЛЬНОГО хранения дистрибутивов.
     # Это ИМЯ КАТАЛОГА, а не архива.
     'LocalInstallerNames': {
@@ -75,82 +177,322 @@ DEFAULT_CONFIG = {
     }
 }
 
-# Функция загрузки конфига останется здесь, т.к. она работает с файлом конфига
-def load_config():
-    """Загружает конфигурацию из config.ini или создает его со значениями по умолчанию."""
+# Типы значений: bool, int, float - по виду значения по умолчанию в DEFAULT_CONFIG, остальное - строки
+SNAPSHOT_TYPES = (str, bool, int, float)
+# Наблюдение за config.ini: сколько ждать, пока редактор закончит запись, и интервал опроса без уведомлений ОС
+CONFIG_RELOAD_SETTLE_SEC = 0.3
+CONFIG_POLL_INTERVAL_SEC = 1.0
+
+_current_snapshot = None # Последний загруженный или сохраненный снимок
+_snapshot_lock = threading.RLock()
+
+
+def get_config_path():
+    return os.path.join(os.path.dirname(sys.argv[0]), CONFIG_FILE)
+
+
+def _default_type(default_value):
+    if default_value in ('True', 'False'):
+        return bool
+    for type_cast in (int, float):
+        try:
+            type_cast(default_value)
+            return type_cast
+        except ValueError:
+            pass
+    return str
+
+
+def _convert(raw_value, type_cast):
+    """Приведение как у ConfigParser.getboolean/getint/getfloat. ValueError - значение не приводится."""
+    if type_cast is str:
+        return raw_value
+    if type_cast is bool:
+        if raw_value.lower() not in configparser.ConfigParser.BOOLEAN_STATES:
+            raise ValueError(f"Not a boolean: {raw_value}")
+        return configparser.ConfigParser.BOOLEAN_STATES[raw_value.lower()]
+    return type_cast(raw_value)
+
+
+def _file_signature(config_path):
+    try:
+        stat = os.stat(config_path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+class ConfigSnapshot:
+    """
+    Неизменяемый снимок конфигурации. Значения разбираются и приводятся к типам один раз
+    при загрузке, поэтому get_config_value в горячих путях - это поиск в словаре, а не
+    разбор строки ConfigParser. Снимок разделяется потоками без блокировок; перезагрузка
+    файла создает новый снимок, а уже запущенные задачи дорабатывают со своим.
+    """
+    __slots__ = ('path', 'signature', '_sections')
+
+    def __init__(self, sections, path=None, signature=None):
+        # sections: {секция: {ключ: {тип: значение}}}; ключи - в нижнем регистре и в написании DEFAULT_CONFIG
+        object.__setattr__(self, 'path', path)
+        object.__setattr__(self, 'signature', signature)
+        object.__setattr__(self, '_sections', MappingProxyType(
+            {section: MappingProxyType({key: MappingProxyType(typed) for key, typed in values.items()})
+             for section, values in sections.items()}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot неизменяем: для изменения используйте save_config_values().")
+
+    def __delattr__(self, name):
+        raise AttributeError("ConfigSnapshot неизменяем.")
+
+    @classmethod
+    def from_parser(cls, parser, path=None, signature=None):
+        """Снимок из ConfigParser. Неприводимые значения известных ключей заменяются значениями по умолчанию."""
+        sections = {}
+        for section in parser.sections():
+            known_keys = {key.lower(): key for key in DEFAULT_CONFIG.get(section, {})}
+            values = sections[section] = {}
+            for key, raw_value in parser.items(section, raw=True):
+                canonical_key = known_keys.get(key)
+                if canonical_key is not None:
+                    default_value = DEFAULT_CONFIG[section][canonical_key]
+                    expected_type = _default_type(default_value)
+                    try:
+                        _convert(raw_value, expected_type)
+                    except ValueError:
+                        print(f"Некорректное значение [{section}] {key} = '{raw_value}' (ожидается {expected_type.__name__}), "
+                              f"используется значение по умолчанию '{default_value}'.", file=sys.stderr)
+                        raw_value = default_value
+                typed = {}
+                for type_cast in SNAPSHOT_TYPES:
+                    try:
+                        typed[type_cast] = _convert(raw_value, type_cast)
+                    except ValueError:
+                        pass
+                values[key] = typed
+                if canonical_key is not None and canonical_key != key:
+                    values[canonical_key] = typed
+        return cls(sections, path, signature)
+
+    def get(self, section, key, default=None, type_cast=str):
+        try:
+            section_values = self._sections[section]
+        except KeyError:
+            return default
+        typed = section_values.get(key)
+        if typed is None:
+            typed = section_values.get(key.lower())
+            if typed is None:
+                return default
+        if type_cast in typed:
+            return typed[type_cast]
+        if type_cast in SNAPSHOT_TYPES:
+            return default # Значение не приводится к запрошенному типу
+        try:
+            return type_cast(typed[str])
+        except (TypeError, ValueError):
+            return default
+
+    def sections(self):
+        return list(self._sections)
+
+    def items(self, section):
+        """{ключ: строковое значение} секции (ключи в нижнем регистре)."""
+        return {key: typed[str] for key, typed in self._sections.get(section, {}).items() if key == key.lower()}
+
+    def to_parser(self):
+        parser = configparser.ConfigParser()
+        for section in self._sections:
+            parser.add_section(section)
+            for key, value in self.items(section).items():
+                parser.set(section, key, value)
+        return parser
+
+
+def _default_parser():
     config = configparser.ConfigParser()
-    # Проверяем наличие файла конфига в текущей директории
-    config_path = os.path.join(os.path.dirname(sys.argv[0]), CONFIG_FILE)
+    for section, values in DEFAULT_CONFIG.items():
+        config.add_section(section)
+        for key, value in values.items():
+            config.set(section, key, value)
+    return config
+
 
+def _write_parser_atomic(config, config_path):
+    """Запись через временный файл и os.replace: читатель (и наблюдатель) не увидит файл наполовину записанным."""
+    temp_path = f"{config_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as configfile:
+        config.write(configfile)
+    os.replace(temp_path, config_path)
+
+
+def _read_config_parser(config_path):
+    """ConfigParser из config.ini (создает файл или дополняет его недостающими параметрами из DEFAULT_CONFIG)."""
     if not os.path.exists(config_path):
         print(f"Создание файла конфигурации по умолчанию: {config_path}")
+        config = _default_parser()
         try:
-            # Создаем и заполняем конфиг в памяти из DEFAULT_CONFIG
-            for section, values in DEFAULT_CONFIG.items():
-                config.add_section(section)
-                for key, value in values.items():
-                    config.set(section, key, value)
-            # Записываем в файл
-            with open(config_path, 'w', encoding='utf-8') as configfile:
-                config.write(configfile)
+            _write_parser_atomic(config, config_path)
             print(f"Файл конфигурации '{config_path}' успешно создан.")
         except Exception as e:
             print(f"Ошибка при создании файла конфигурации по умолчанию '{config_path}': {e}", file=sys.stderr)
             # Если не удалось создать файл, работаем с конфигом в памяти из DEFAULT_CONFIG
             print("Используются значения конфигурации по умолчанию из памяти.")
-            # Убедимся, что config объект содержит дефолты, даже если создание файла упало
-            config = configparser.ConfigParser()
-            for section, values in DEFAULT_CONFIG.items():
-                 config.add_section(section)
-                 for key, value in values.items():
-                     config.set(section, key, value)
-
-    else:
+        return config
+
+    try:
+        config = configparser.ConfigParser()
+        with open(config_path, 'r', encoding='utf-8') as configfile:
+            config.read_file(configfile)
+        print(f"Файл конфигурации '{config_path}' успешно загружен.")
+    except Exception as e:
+        print(f"Ошибка при загрузке файла конфигурации '{config_path}': {e}", file=sys.stderr)
+        print("Используются значения конфигурации по умолчанию из памяти.")
+        # Если загрузка упала, работаем с дефолтами в памяти
+        return _default_parser()
+
+    # Проверяем наличие всех секций и ключей из DEFAULT_CONFIG и добавляем их, если отсутствуют
+    # Это позволяет добавлять новые настройки в DEFAULT_CONFIG без необходимости удалять старый config.ini
+    config_changed = False
+    for section, values in DEFAULT_CONFIG.items():
+        if not config.has_section(section):
+            config.add_section(section)
+            config_changed = True
+        for key, value in values.items():
+            if not config.has_option(section, key):
+                config.set(section, key, value)
+                config_changed = True
+
+    # Если были добавлены новые настройки, сохраняем обновленный файл
+    if config_changed:
+        print(f"Обновление файла конфигурации '{config_path}' новыми параметрами.")
         try:
-            config.read(config_path, encoding='utf-8')
-            print(f"Файл конфигурации '{config_path}' успешно загружен.")
-            # Проверяем наличие всех секций и ключей из DEFAULT_CONFIG и добавляем их, если отсутствуют
-            # Это позволяет добавлять новые настройки в DEFAULT_CONFIG без необходимости удалять старый config.ini
-            config_changed = False
-            for section, values in DEFAULT_CONFIG.items():
-                if not config.has_section(section):
-                    config.add_section(section)
-                    config_changed = True
-                for key, value in values.items():
-                    if not config.has_option(section, key):
-                        config.set(section, key, value)
-                        config_changed = True
-
-            # Если были добавлены новые настройки, сохраняем обновленный файл
-            if config_changed:
-                 print(f"Обновление файла конфигурации '{config_path}' новыми параметрами.")
-                 try:
-                     with open(config_path, 'w', encoding='utf-8') as configfile:
-                         config.write(configfile)
-                     print(f"Файл конфигурации '{config_path}' успешно обновлен.")
-                 except Exception as e:
-                     print(f"Ошибка при обновлении файла конфигурации '{config_path}': {e}", file=sys.stderr)
+            _write_parser_atomic(config, config_path)
+            print(f"Файл конфигурации '{config_path}' успешно обновлен.")
+        except Exception as e:
+            print(f"Ошибка при обновлении файла конфигурации '{config_path}': {e}", file=sys.stderr)
+    return config
+
+
+# Функция загрузки конфига останется здесь, т.к. она работает с файлом конфига
+def load_config():
+    """Загружает config.ini (или создает его со значениями по умолчанию) и возвращает ConfigSnapshot."""
+    global _current_snapshot
+    config_path = get_config_path()
+    with _snapshot_lock:
+        config = _read_config_parser(config_path)
+        _current_snapshot = ConfigSnapshot.from_parser(config, config_path, _file_signature(config_path))
+        return _current_snapshot
 
 
+def get_current_config():
+    """Последний загруженный снимок конфигурации (None, если load_config еще не вызывался)."""
+    return _current_snapshot
+
+
+def reload_config_if_changed():
+    """
+    Перечитывает config.ini, если он изменился после последней загрузки или сохранения.
+    Возвращает новый снимок или None (файл не менялся, удален или не читается - остается прежний снимок).
+    """
+    global _current_snapshot
+    config_path = get_config_path()
+    with _snapshot_lock:
+        signature = _file_signature(config_path)
+        if signature is None or (_current_snapshot is not None and signature == _current_snapshot.signature):
+            return None
+        config = configparser.ConfigParser()
+        try:
+            with open(config_path, 'r', encoding='utf-8') as configfile:
+                config.read_file(configfile)
+        except (OSError, configparser.Error) as e:
+            logging.warning(f"Не удалось перечитать '{config_path}', остается прежняя конфигурация: {e}")
+            return None
+        # Ключи, удаленные из файла, берутся из значений по умолчанию, как при запуске
+        for section, values in DEFAULT_CONFIG.items():
+            if not config.has_section(section):
+                config.add_section(section)
+            for key, value in values.items():
+                if not config.has_option(section, key):
+                    config.set(section, key, value)
+        _current_snapshot = ConfigSnapshot.from_parser(config, config_path, signature)
+        return _current_snapshot
+
+
+def save_config_values(changes):
+    """
+    Записывает изменения {секция: {ключ: значение}} в config.ini атомарно и возвращает новый снимок.
+    Основа - текущее содержимое файла, а не снимок в памяти: правки, сделанные в файле вручную,
+    не затираются. Ошибка записи (OSError) передается вызывающему.
+    """
+    global _current_snapshot
+    config_path = get_config_path()
+    with _snapshot_lock:
+        config = configparser.ConfigParser()
+        try:
+            with open(config_path, 'r', encoding='utf-8') as configfile:
+                config.read_file(configfile)
+        except (OSError, configparser.Error):
+            config = _current_snapshot.to_parser() if _current_snapshot is not None else _default_parser()
+        for section, values in changes.items():
+            if not config.has_section(section):
+                config.add_section(section)
+            for key, value in values.items():
+                config.set(section, key, str(value))
+        _write_parser_atomic(config, config_path)
+        _current_snapshot = ConfigSnapshot.from_parser(config, config_path, _file_signature(config_path))
+        return _current_snapshot
+
+
+class ConfigWatcher:
+    """
+    Следит за config.ini в фоновом потоке и вызывает on_reload(снимок) после изменения файла.
+    Собственные записи save_config_values повторной перезагрузки не вызывают.
+    """
+
+    def __init__(self, on_reload):
+        self.on_reload = on_reload
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="config-watcher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        from utils.file_watcher import create_file_watcher
+        try:
+            with create_file_watcher(get_config_path(), poll_interval_sec=CONFIG_POLL_INTERVAL_SEC) as watcher:
+                logging.debug(f"Наблюдение за '{get_config_path()}' ({watcher.backend_name}).")
+                while not self._stop_event.is_set():
+                    if not watcher.wait(CONFIG_POLL_INTERVAL_SEC):
+                        continue
+                    # Редактор может записывать файл в несколько приемов - ждем, пока запись закончится
+                    if self._stop_event.wait(CONFIG_RELOAD_SETTLE_SEC):
+                        return
+                    snapshot = reload_config_if_changed()
+                    if snapshot is not None:
+                        logging.info(f"Файл конфигурации '{snapshot.path}' изменен, настройки перезагружены.")
+                        self.on_reload(snapshot)
         except Exception as e:
-            print(f"Ошибка при загрузке файла конфигурации '{config_path}': {e}", file=sys.stderr)
-            print("Используются значения конфигурации по умолчанию из памяти.")
-            # Если загрузка упала, работаем с дефолтами в памяти
-            config = configparser.ConfigParser()
-            for section, values in DEFAULT_CONFIG.items():
-                 config.add_section(section)
-                 for key, value in values.items():
-                     config.set(section, key, value)
+            logging.error(f"Наблюдение за файлом конфигурации остановлено: {e}")
 
+    def stop(self):
+        self._stop_event.set()
 
-    return config
 
 # Функция получения значения конфига тоже здесь
 def get_config_value(config, section, key, default=None, type_cast=str):
-    """Безопасно получает значение конфигурации с приведением типа и значением по умолчанию."""
+    """
+    Безопасно получает значение конфигурации с приведением типа и значением по умолчанию.
+    config - ConfigSnapshot (из load_config), ConfigParser или None (тогда возвращается default).
+    """
     # В этой функции не используем log_message, чтобы избежать циклических зависимостей
     # при инициализации логирования, которая зависит от конфига.
-    # Вместо этого используем print/sys.stderr.
+    if config is None:
+        return default
+    if type(config) is ConfigSnapshot:
+        return config.get(section, key, default, type_cast)
     try:
         if type_cast == bool:
             return config.getboolean(section, key)
@@ -161,7 +503,6 @@ def get_config_value(config, section, key, default=None, type_cast=str):
         else:
             return config.get(section, key)
     except (configparser.NoSectionError, configparser.NoOptionError, ValueError) as e:
-        # print(f"Внимание: Не удалось получить значение конфигурации [{section}]{key}. Использование значения по умолчанию: {default}. Ошибка: {e}", file=sys.stderr)
         return default
 
 # Глобальная переменная для уровня отладки
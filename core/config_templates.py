@@ -0,0 +1,105 @@
+# core/config_templates.py - Шаблоны backclient.config.xml для запуска без первого прогона
+#
+# При первом запуске версии BackOffice генерирует config/backclient.config.xml, после
+# чего лаунчер останавливает процесс, правит файл и запускает BackOffice снова.
+# Сгенерированный файл сохраняется как шаблон для типа приложения (производитель входит
+# в app_type) и версии; при следующих запусках этой версии отредактированная копия
+# шаблона кладется в папку AppData заранее, и BackOffice запускается один раз.
+
+import os
+import sys
+import shutil
+import logging
+
+from core.config import get_config_value
+from utils.file_utils import edit_config_file
+from utils.url_utils import sanitize_for_path
+
+CONFIG_TEMPLATES_DIR_NAME = "config_templates"
+CONFIG_RELATIVE_PATH = os.path.join("config", "backclient.config.xml")
+
+
+def is_config_templates_enabled(config):
+    return get_config_value(config, 'ConfigTemplates', 'Enabled', default=True, type_cast=bool)
+
+
+def get_templates_dir(config):
+    templates_dir = get_config_value(config, 'ConfigTemplates', 'Dir', default='', type_cast=str)
+    return templates_dir or os.path.join(os.path.dirname(sys.argv[0]), CONFIG_TEMPLATES_DIR_NAME)
+
+
+def get_template_path(config, app_type, version_formatted):
+    return os.path.join(get_templates_dir(config), f"{sanitize_for_path(app_type)}_{sanitize_for_path(version_formatted)}.xml")
+
+
+def capture_template(config, app_type, version_formatted, generated_config_path):
+    """Сохраняет сгенерированный BackOffice (еще не отредактированный) конфиг как шаблон версии."""
+    import xml.etree.ElementTree as ET
+    if not is_config_templates_enabled(config):
+        return
+    template_path = get_template_path(config, app_type, version_formatted)
+    if os.path.exists(template_path):
+        return
+    try:
+        # Шаблоном может быть только полный конфиг, который потом удастся отредактировать
+        if ET.parse(generated_config_path).getroot().find('.//ServersList') is None:
+            logging.warning(f"Конфиг '{generated_config_path}' не содержит ServersList, шаблон не сохранен.")
+            return
+    except (OSError, ET.ParseError) as e:
+        logging.warning(f"Конфиг '{generated_config_path}' не удалось разобрать, шаблон не сохранен: {e}")
+        return
+    try:
+        os.makedirs(os.path.dirname(template_path), exist_ok=True)
+        shutil.copyfile(generated_config_path, f"{template_path}.tmp")
+        os.replace(f"{template_path}.tmp", template_path)
+        logging.info(f"Сохранен шаблон конфигурации {app_type} {version_formatted}: '{template_path}'")
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить шаблон конфигурации '{template_path}': {e}")
+
+
+def discard_template(config, app_type, version_formatted):
+    template_path = get_template_path(config, app_type, version_formatted)
+    try:
+        os.remove(template_path)
+        logging.info(f"Шаблон конфигурации удален: '{template_path}'")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Не удалось удалить шаблон конфигурации '{template_path}': {e}")
+
+
+def seed_config_from_template(config, launch_data, update_status_callback=None):
+    """
+    Кладет отредактированную копию шаблона в backoffice_temp_dir/config до запуска BackOffice.
+    Возвращает True, если конфиг подготовлен и первый прогон можно пропустить; False - шаблона
+    нет или подготовить конфиг не удалось (тогда используется обычная последовательность).
+    """
+    if not is_config_templates_enabled(config):
+        return False
+    template_path = get_template_path(config, launch_data['app_type'], launch_data['version_formatted'])
+    if not os.path.isfile(template_path):
+        logging.info(f"Шаблона конфигурации для {launch_data['app_type']} {launch_data['version_formatted']} нет, будет выполнен первый запуск.")
+        return False
+
+    config_file_path = os.path.join(launch_data['backoffice_temp_dir'], CONFIG_RELATIVE_PATH)
+    target_login = get_config_value(config, 'Settings', 'DefaultLogin', default='iikoUser', type_cast=str)
+    try:
+        os.makedirs(os.path.dirname(config_file_path), exist_ok=True)
+        shutil.copyfile(template_path, config_file_path)
+    except OSError as e:
+        logging.warning(f"Не удалось скопировать шаблон конфигурации в '{config_file_path}': {e}")
+        return False
+
+    if not edit_config_file(config_file_path, launch_data['parsed_target']['UrlOrIp'], launch_data['parsed_target']['Port'],
+                            launch_data['config_protocol'], target_login, update_status_callback):
+        # Шаблон испорчен (нет ServersList, некорректный XML) - удаляем его, следующий запуск сохранит новый
+        logging.warning(f"Шаблон конфигурации '{template_path}' непригоден, используется обычная последовательность.")
+        discard_template(config, launch_data['app_type'], launch_data['version_formatted'])
+        try:
+            os.remove(config_file_path)
+        except OSError:
+            pass
+        return False
+
+    logging.info(f"Конфигурация подготовлена из шаблона '{template_path}'; первый запуск BackOffice пропускается.")
+    return True
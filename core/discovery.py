@@ -0,0 +1,316 @@
+# core/discovery.py - Обнаружение схемы и порта сервера для неоднозначных адресов
+#
+# Пользователь часто вводит просто "host" или "host:9080", не указывая схему.
+# Вместо последовательного перебора схем/портов кандидаты (схема, порт, IP-адрес)
+# запускаются "лесенкой" со сдвигом [Discovery] StaggerMs (как Happy Eyeballs, RFC 8305):
+# следующий кандидат стартует по таймеру или сразу после неудачи предыдущего,
+# побеждает первый корректный ответ getServerMonitoringInfo. Победитель запоминается
+# для хоста, и при следующем обращении проверяется первым. Таймауты попыток берутся из
+# статистики хостов (core/host_stats.py), результат каждой попытки в нее записывается, а
+# кандидаты, недавно отклонившие подключение, пропускаются сразу.
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import certifi
+import urllib3
+
+from core.config import get_config_value
+from core.host_stats import get_timeouts, check_fail_fast, record_success, record_failure
+
+DISCOVERY_CACHE_FILE_NAME = "discovery_cache.json"
+PROBE_PATH = "/resto/getServerMonitoringInfo.jsp"
+
+_winners = {} # хост -> {'scheme', 'port', 'found_at'}
+_lock = threading.Lock()
+_disk_loaded = False
+
+
+def is_discovery_needed(config, parsed_target):
+    """Обнаружение нужно, если оно включено и во вводе не указаны явно и схема, и порт."""
+    if not get_config_value(config, 'Discovery', 'Enabled', default=True, type_cast=bool):
+        return False
+    return not (parsed_target.get('PortExplicit') and parsed_target.get('InputScheme'))
+
+
+def _get_disk_path():
+    return os.path.join(os.path.dirname(sys.argv[0]), DISCOVERY_CACHE_FILE_NAME)
+
+
+def _load_winners():
+    """Однократно подгружает запомненные победители с диска."""
+    global _disk_loaded
+    if _disk_loaded:
+        return
+    _disk_loaded = True
+    try:
+        with open(_get_disk_path(), 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        if isinstance(stored, dict):
+            for host, winner in stored.items():
+                _winners.setdefault(host, winner)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.warning(f"Не удалось прочитать кэш обнаружения серверов '{_get_disk_path()}': {e}")
+
+
+def get_remembered_winner(host):
+    with _lock:
+        _load_winners()
+        winner = _winners.get(host.lower())
+        return dict(winner) if winner else None
+
+
+def remember_winner(host, scheme, port):
+    """Запоминает схему и порт, по которым сервер ответил, и сохраняет их на диск."""
+    disk_path = _get_disk_path()
+    with _lock:
+        _load_winners()
+        _winners[host.lower()] = {'scheme': scheme, 'port': port, 'found_at': time.time()}
+        try:
+            with open(f"{disk_path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(_winners, f, ensure_ascii=False, indent=1)
+            os.replace(f"{disk_path}.tmp", disk_path)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить кэш обнаружения серверов '{disk_path}': {e}")
+
+
+def get_remembered_winners():
+    """Копия всех запомненных победителей (для консольной команды cache)."""
+    with _lock:
+        _load_winners()
+        return {host: dict(winner) for host, winner in _winners.items()}
+
+
+def forget_winners(host=None):
+    """Забывает схему и порт хоста (или всех хостов) - следующий запуск снова выполнит обнаружение."""
+    disk_path = _get_disk_path()
+    with _lock:
+        _load_winners()
+        if host is None:
+            _winners.clear()
+        else:
+            _winners.pop(host.lower(), None)
+        try:
+            with open(f"{disk_path}.tmp", 'w', encoding='utf-8') as f:
+                json.dump(_winners, f, ensure_ascii=False, indent=1)
+            os.replace(f"{disk_path}.tmp", disk_path)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить кэш обнаружения серверов '{disk_path}': {e}")
+
+
+def _parse_ports(config):
+    ports_value = get_config_value(config, 'Discovery', 'Ports', default='443, 8080, 9080, 80')
+    ports = []
+    for item in str(ports_value).split(','):
+        item = item.strip()
+        if item.isdigit() and 0 < int(item) <= 65535:
+            ports.append(int(item))
+        elif item:
+            logging.warning(f"[Discovery] Ports: пропущено некорректное значение '{item}'.")
+    return ports
+
+
+def _guess_scheme(port):
+    return "https" if port == 443 else "http"
+
+
+def build_scheme_port_candidates(config, parsed_target):
+    """
+    Список (схема, порт) в порядке попыток: запомненный победитель, затем то, что
+    указано во вводе (явная схема или порт), затем [Discovery] Ports. Для каждого порта
+    сначала пробуется "естественная" схема, альтернативная схема добавляется в конец.
+    """
+    input_scheme = parsed_target.get('InputScheme')
+    if parsed_target.get('PortExplicit'):
+        ports = [parsed_target['Port']]
+    else:
+        ports = _parse_ports(config)
+        if input_scheme:
+            # "http://host" / "https://host" - сначала стандартный порт указанной схемы
+            ports.insert(0, 443 if input_scheme == "https" else 80)
+    ports = list(dict.fromkeys(ports))
+
+    primary, alternate = [], []
+    for port in ports:
+        scheme = input_scheme or _guess_scheme(port)
+        primary.append((scheme, port))
+        if not input_scheme:
+            alternate.append(("http" if scheme == "https" else "https", port))
+    candidates = primary + alternate
+
+    winner = get_remembered_winner(parsed_target['UrlOrIp'])
+    if winner:
+        remembered = (winner['scheme'], winner['port'])
+        # Запомненный победитель ставится первым, только если не противоречит вводу
+        if remembered in candidates:
+            candidates.remove(remembered)
+            candidates.insert(0, remembered)
+    return list(dict.fromkeys(candidates))
+
+
+def resolve_addresses(host, port):
+    """
+    IP-адреса хоста в порядке getaddrinfo, с чередованием IPv6/IPv4 (RFC 8305, п. 4),
+    чтобы недоступное семейство адресов не задерживало подключение.
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ConnectionError(f"Не удалось разрешить имя '{host}': {e}")
+    by_family = {}
+    for family, _, _, _, sockaddr in infos:
+        address = sockaddr[0]
+        if address not in by_family.setdefault(family, []):
+            by_family[family].append(address)
+    families = list(by_family.values())
+    addresses = []
+    while any(families):
+        for family_addresses in families:
+            if family_addresses:
+                addresses.append(family_addresses.pop(0))
+    return addresses
+
+
+def _candidate_url(host, scheme, port):
+    """URL кандидата для статистики хостов (ключ - имя хоста и порт, а не IP-адрес)."""
+    return f"{scheme}://[{host}]:{port}" if ':' in host and not host.startswith('[') else f"{scheme}://{host}:{port}"
+
+
+def _probe_candidate(host, scheme, port, address, timeouts, cancel_event):
+    """
+    Один запрос getServerMonitoringInfo к конкретному адресу. timeouts - (подключение, чтение).
+    Возвращает разобранный JSON или выбрасывает исключение. Время до заголовков ответа
+    или ошибка подключения записываются в статистику хоста.
+    """
+    if cancel_event.is_set():
+        raise ConnectionError("Отменено: найден другой кандидат.")
+    stats_url = _candidate_url(host, scheme, port)
+    pool_timeout = urllib3.Timeout(connect=timeouts[0], read=timeouts[1])
+    if scheme == "https":
+        # Подключаемся к IP, но проверяем сертификат и передаем SNI по исходному имени хоста
+        pool = urllib3.HTTPSConnectionPool(address, port, timeout=pool_timeout, retries=False, maxsize=1,
+                                           cert_reqs='CERT_REQUIRED', ca_certs=certifi.where(),
+                                           server_hostname=host, assert_hostname=host)
+    else:
+        pool = urllib3.HTTPConnectionPool(address, port, timeout=pool_timeout, retries=False, maxsize=1)
+    default_port = 443 if scheme == "https" else 80
+    host_header = host if port == default_port else f"{host}:{port}"
+    if ':' in host and not host.startswith('['):
+        host_header = f"[{host}]" if port == default_port else f"[{host}]:{port}"
+    try:
+        started_at = time.monotonic()
+        try:
+            response = pool.request('GET', PROBE_PATH, headers={'Host': host_header}, redirect=False, preload_content=False)
+        except urllib3.exceptions.HTTPError as e:
+            if not cancel_event.is_set():
+                record_failure(stats_url, e)
+            raise
+        record_success(stats_url, time.monotonic() - started_at)
+        try:
+            data = response.read()
+        finally:
+            response.release_conn()
+        if response.status != 200:
+            raise ConnectionError(f"HTTP {response.status}")
+        server_info = json.loads(data.decode('utf-8'))
+    finally:
+        pool.close()
+    if not isinstance(server_info, dict) or None in [server_info.get("edition"), server_info.get("version"), server_info.get("serverState")]:
+        raise ValueError("Ответ не похож на getServerMonitoringInfo (нет edition, version, serverState).")
+    return server_info
+
+
+def _candidate_timeouts(config, host, scheme, port, timeout):
+    """
+    (подключение, чтение) для кандидата: явный timeout или выученные для хоста и порта.
+    Подключение ограничено [Discovery] AttemptTimeoutSec: закрытые порты-кандидаты не должны
+    задерживать обнаружение дольше, чем позволяет настройка.
+    """
+    if timeout is not None:
+        return timeout, timeout
+    connect_timeout, read_timeout = get_timeouts(config, _candidate_url(host, scheme, port))
+    attempt_timeout = get_config_value(config, 'Discovery', 'AttemptTimeoutSec', default=5, type_cast=float)
+    return min(connect_timeout, attempt_timeout), read_timeout
+
+
+def discover_server(config, parsed_target, timeout=None, force_refresh=False):
+    """
+    Находит схему и порт, по которым отвечает сервер parsed_target.
+    Возвращает (server_info, scheme, port). Если не ответил ни один кандидат,
+    выбрасывает ConnectionError со сводкой ошибок по каждому кандидату.
+    force_refresh - пробовать и кандидатов, недавно отклонивших подключение.
+    """
+    host = parsed_target['UrlOrIp']
+    stagger_sec = get_config_value(config, 'Discovery', 'StaggerMs', default=250, type_cast=int) / 1000.0
+
+    errors = []
+    candidates = []
+    for scheme, port in build_scheme_port_candidates(config, parsed_target):
+        if not force_refresh:
+            # Проверка до начала опроса: отказ одного IP-адреса в этом же обнаружении не отбраковывает остальные
+            try:
+                check_fail_fast(config, _candidate_url(host, scheme, port))
+            except ConnectionError as e:
+                errors.append(f"{scheme}://{host}:{port}: {e}")
+                continue
+        candidates.append((scheme, port, _candidate_timeouts(config, host, scheme, port, timeout)))
+
+    addresses = resolve_addresses(host, parsed_target['Port'])
+    attempts = [(scheme, port, address, timeouts)
+                for scheme, port, timeouts in candidates
+                for address in addresses]
+    if not attempts:
+        summary = "; ".join(errors[-6:]) if errors else "нет кандидатов"
+        raise ConnectionError(f"Нет кандидатов для обнаружения сервера '{host}': {summary}")
+    logging.info(f"Обнаружение схемы/порта для '{host}': {len(attempts)} кандидатов, сдвиг {stagger_sec * 1000:.0f} мс.")
+    logging.debug(f"Кандидаты: {attempts}")
+
+    started_at = time.monotonic()
+    cancel_event = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=len(attempts), thread_name_prefix="discovery")
+    try:
+        running = {}
+        next_index = 0
+        next_start_at = started_at
+        # Общий срок: все кандидаты успевают стартовать и отработать свой таймаут
+        deadline = started_at + stagger_sec * len(attempts) + max(sum(attempt[3]) for attempt in attempts)
+        while next_index < len(attempts) or running:
+            now = time.monotonic()
+            if next_index < len(attempts) and (now >= next_start_at or not running):
+                attempt = attempts[next_index]
+                next_index += 1
+                running[executor.submit(_probe_candidate, host, *attempt, cancel_event)] = attempt
+                next_start_at = now + stagger_sec
+                continue
+            if now >= deadline:
+                break
+            wait_timeout = max(0.0, min(next_start_at - now, deadline - now)) if next_index < len(attempts) else deadline - now
+            done, _ = wait(running, timeout=wait_timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                scheme, port, address, _ = running.pop(future)
+                try:
+                    server_info = future.result()
+                except Exception as e:
+                    errors.append(f"{scheme}://{address}:{port}: {e}")
+                    logging.debug(f"Кандидат {scheme}://{address}:{port} не ответил: {e}")
+                    # Неудача - следующий кандидат стартует сразу, не дожидаясь сдвига
+                    next_start_at = time.monotonic()
+                    continue
+                elapsed_ms = (time.monotonic() - started_at) * 1000
+                logging.info(f"Сервер '{host}' ответил по {scheme}://{address}:{port} за {elapsed_ms:.0f} мс.")
+                remember_winner(host, scheme, port)
+                return server_info, scheme, port
+    finally:
+        cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    summary = "; ".join(errors[-6:]) if errors else "таймаут"
+    raise ConnectionError(f"Сервер '{host}' не ответил ни по одной схеме/порту ({len(attempts)} кандидатов): {summary}")
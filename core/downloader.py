@@ -1,15 +1,20 @@
 # core/downloader.py - Обновленный
 
-import requests
 import os
 import urllib.parse
 import time
 import logging
-from ftplib import FTP
 import shutil
 
 # Импортируем get_config_value из core.config
 from core.config import get_config_value
+from core.peer_cache import is_peer_cache_enabled, get_cache_key, find_peer_with_archive, compute_sha256
+from core.http_stream import stream_response_to_file
+from core.host_stats import get_timeouts, check_fail_fast, record_success, record_failure
+from utils.bandwidth import throttle
+
+# Суффикс файла-спутника с ETag частично скачанного архива (для докачки)
+RESUME_ETAG_SUFFIX = ".etag"
 
 # Добавляем is_canceled_callback в параметры функций скачивания
 def download_from_http(config, app_type, version_formatted, temp_archive_path, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback=None):
@@ -40,46 +45,192 @@ def download_from_http(config, app_type, version_formatted, temp_archive_path, u
     if update_status_callback: update_status_callback(f"Скачивание с HTTP: {os.path.basename(http_full_url)}...")
     logging.info(f"Попытка скачивания с HTTP: '{http_full_url}' в '{temp_archive_path}'.")
 
-    try:
-        response = requests.get(http_full_url, stream=True, timeout=get_config_value(config, 'Settings', 'HttpRequestTimeoutSec', default=15, type_cast=int))
-        response.raise_for_status()
+    return download_url_to_file(config, http_full_url, temp_archive_path, "HTTP", update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback)
 
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded_size = 0
-        buffer_size = 8192
 
-        with open(temp_archive_path, 'wb') as f_dst:
-            for chunk in response.iter_content(chunk_size=buffer_size):
-                if is_canceled_callback and is_canceled_callback():
-                     logging.warning("Скачивание HTTP отменено.")
-                     if update_status_callback: update_status_callback("Скачивание HTTP отменено.")
-                     # Очищаем частичный файл при отмене
-                     if os.path.exists(temp_archive_path):
-                         try: os.remove(temp_archive_path)
-                         except Exception as e: logging.warning(f"Ошибка при удалении частичного файла '{temp_archive_path}' после отмены: {e}")
-                     return False # Сигнал отмены
+def download_url_to_file(config, url, temp_archive_path, source_label, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback=None):
+    """
+    Потоково скачивает url в temp_archive_path. Общая часть HTTP-источников (HTTP, кэш пиров, зеркало).
+    Если включен ResumeDownloads и от прерванной попытки остался частичный файл с сохраненным ETag,
+    файл докачивается запросом Range/If-Range.
+    """
+    import requests # Тяжелый импорт - только при первом скачивании, не на старте приложения
+    resume_enabled = get_config_value(config, 'Settings', 'ResumeDownloads', default=True, type_cast=bool)
+    resume_from, saved_etag = get_resume_state(temp_archive_path) if resume_enabled else (0, None)
+    request_headers = {}
+    if resume_from > 0:
+        request_headers = {'Range': f"bytes={resume_from}-", 'If-Range': saved_etag}
+
+    try:
+        # Источник, только что отклонивший подключение, пропускаем сразу - перейдем к следующему
+        check_fail_fast(config, url)
+    except ConnectionError as e:
+        logging.warning(f"Источник {source_label} пропущен: {e}")
+        if update_status_callback: update_status_callback(f"Источник {source_label} недоступен, пропуск.")
+        return False
 
-                if chunk:
-                    f_dst.write(chunk)
-                    downloaded_size += len(chunk)
-                    if update_progress_callback and total_size > 0:
-                         current_source_progress = (downloaded_size / total_size)
-                         update_progress_callback(progress_base + current_source_progress * progress_range)
+    try:
+        response = requests.get(url, stream=True, headers=request_headers, timeout=get_timeouts(config, url))
+        record_success(url, response.elapsed.total_seconds())
+        if response.status_code == 416 and resume_from > 0:
+            # Частичный файл не соответствует файлу источника - начинаем заново
+            response.close()
+            logging.info(f"Источник {source_label} отклонил докачку '{temp_archive_path}'. Скачивание заново.")
+            discard_resume_state(temp_archive_path, remove_partial=True)
+            return download_url_to_file(config, url, temp_archive_path, source_label, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback)
+        response.raise_for_status()
 
-        logging.info("Скачивание HTTP завершено.")
-        if update_status_callback: update_status_callback("Скачивание HTTP завершено.")
+        content_length = int(response.headers.get('content-length', 0))
+        if resume_from > 0 and response.status_code == 206:
+            logging.info(f"Докачка {source_label} '{temp_archive_path}' с позиции {resume_from} байт.")
+            file_mode = 'r+b'
+            downloaded_size = resume_from
+            total_size = resume_from + content_length if content_length else 0
+        else:
+            file_mode = 'wb'
+            downloaded_size = 0
+            total_size = content_length
+        start_offset = downloaded_size
+        # Для сжатых ответов Content-Length - размер сжатых данных, поэтому размер файла заранее неизвестен
+        exact_size_known = total_size > 0 and response.headers.get('Content-Encoding', 'identity').strip().lower() in ('', 'identity')
+
+        etag = response.headers.get('ETag')
+        if resume_enabled:
+            # Докачка возможна только со строгим ETag, иначе нельзя убедиться, что файл не изменился
+            if etag and not etag.startswith('W/'):
+                _save_resume_etag(temp_archive_path, etag)
+            else:
+                discard_resume_state(temp_archive_path)
+        buffer_size = get_config_value(config, 'Settings', 'DownloadBufferKB', default=256, type_cast=int) * 1024
+
+        def handle_data(nbytes):
+            nonlocal downloaded_size
+            downloaded_size += nbytes
+            throttle(nbytes)
+            if update_progress_callback and total_size > 0:
+                 current_source_progress = (downloaded_size / total_size)
+                 update_progress_callback(progress_base + current_source_progress * progress_range)
+
+        with open(temp_archive_path, file_mode) as f_dst:
+            f_dst.seek(start_offset)
+            completed = False
+            try:
+                if exact_size_known:
+                    # Резервируем место под весь файл заранее, чтобы запись не фрагментировала диск
+                    f_dst.truncate(total_size)
+                completed, _ = stream_response_to_file(response, f_dst, buffer_size, handle_data, is_canceled_callback)
+            finally:
+                response.close()
+                # Обрезаем зарезервированное место до реально записанных данных, чтобы докачка продолжила с верной
+                # позиции - и при отмене, и когда источник закрыл соединение раньше времени (completed, но файл короче)
+                if f_dst.tell() != total_size:
+                    f_dst.truncate()
+
+        if not completed:
+             logging.warning(f"Скачивание {source_label} отменено.")
+             if update_status_callback: update_status_callback(f"Скачивание {source_label} отменено.")
+             if has_resumable_download(temp_archive_path):
+                 # Оставляем частичный файл для докачки при следующей попытке
+                 logging.info(f"Частичный файл '{temp_archive_path}' ({downloaded_size} байт) сохранен для докачки.")
+             elif os.path.exists(temp_archive_path):
+                 # Очищаем частичный файл при отмене
+                 try: os.remove(temp_archive_path)
+                 except Exception as e: logging.warning(f"Ошибка при удалении частичного файла '{temp_archive_path}' после отмены: {e}")
+             return False # Сигнал отмены
+
+        if exact_size_known and downloaded_size != total_size:
+            raise IOError(f"Получено {downloaded_size} байт вместо ожидаемых {total_size}.")
+
+        discard_resume_state(temp_archive_path)
+        logging.info(f"Скачивание {source_label} завершено.")
+        if update_status_callback: update_status_callback(f"Скачивание {source_label} завершено.")
         if update_progress_callback: update_progress_callback(progress_base + progress_range)
         return True
 
     except requests.exceptions.RequestException as e:
-        logging.error(f"Ошибка HTTP скачивания с '{http_full_url}': {e}")
-        if update_status_callback: update_status_callback(f"Ошибка HTTP скачивания: {e}", level="ERROR")
+        record_failure(url, e)
+        logging.error(f"Ошибка {source_label} скачивания с '{url}': {e}")
+        if update_status_callback: update_status_callback(f"Ошибка {source_label} скачивания: {e}", level="ERROR")
         return False
     except Exception as e:
-        logging.error(f"Неизвестная ошибка при скачивании с HTTP '{http_full_url}': {e}")
-        if update_status_callback: update_status_callback(f"Неизвестная ошибка HTTP скачивания: {e}", level="ERROR")
+        record_failure(url, e)
+        logging.error(f"Неизвестная ошибка при скачивании с {source_label} '{url}': {e}")
+        if update_status_callback: update_status_callback(f"Неизвестная ошибка {source_label} скачивания: {e}", level="ERROR")
+        return False
+
+
+def get_resume_state(temp_archive_path):
+    """Возвращает (размер частичного файла, ETag) для докачки или (0, None)."""
+    if not has_resumable_download(temp_archive_path):
+        return 0, None
+    try:
+        with open(temp_archive_path + RESUME_ETAG_SUFFIX, 'r', encoding='utf-8') as f:
+            etag = f.read().strip()
+        return os.path.getsize(temp_archive_path), etag or None
+    except OSError:
+        return 0, None
+
+
+def has_resumable_download(temp_archive_path):
+    """Есть ли частичный файл, который можно докачать (файл не пуст и сохранен ETag)."""
+    try:
+        return os.path.getsize(temp_archive_path) > 0 and os.path.exists(temp_archive_path + RESUME_ETAG_SUFFIX)
+    except OSError:
+        return False
+
+
+def discard_resume_state(temp_archive_path, remove_partial=False):
+    """Удаляет сохраненный ETag (и, при remove_partial, сам частичный файл)."""
+    paths = [temp_archive_path + RESUME_ETAG_SUFFIX]
+    if remove_partial:
+        paths.append(temp_archive_path)
+    for path in paths:
+        if os.path.exists(path):
+            try: os.remove(path)
+            except OSError as e: logging.warning(f"Не удалось удалить файл '{path}': {e}")
+
+
+def _save_resume_etag(temp_archive_path, etag):
+    try:
+        with open(temp_archive_path + RESUME_ETAG_SUFFIX, 'w', encoding='utf-8') as f:
+            f.write(etag)
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить ETag для докачки '{temp_archive_path}': {e}")
+
+
+def download_from_peer(config, app_type, version_formatted, temp_archive_path, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback=None):
+    """Скачивает архив дистрибутива у другого экземпляра приложения в локальной сети (кэш пиров)."""
+    logging.debug(f"Попытка скачивания из кэша пиров.")
+    if is_canceled_callback and is_canceled_callback(): return False # Проверка отмены
+
+    if not is_peer_cache_enabled(config):
+        logging.debug("Кэш пиров отключен в конфиге.")
+        return False
+
+    cache_key = get_cache_key(app_type, version_formatted)
+    peer = find_peer_with_archive(config, cache_key)
+    if peer is None:
+        return False
+    peer_base_url, expected_sha256, _ = peer
+
+    peer_url = f"{peer_base_url}/{urllib.parse.quote(cache_key)}"
+    if update_status_callback: update_status_callback(f"Скачивание у пира: {cache_key}...")
+    logging.info(f"Попытка скачивания у пира: '{peer_url}' в '{temp_archive_path}'.")
+
+    if not download_url_to_file(config, peer_url, temp_archive_path, "PEER", update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback):
+        return False
+
+    # Пир мог отдать устаревший или поврежденный файл - сверяем с объявленной контрольной суммой
+    actual_sha256 = compute_sha256(temp_archive_path)
+    if actual_sha256 != expected_sha256:
+        logging.error(f"Контрольная сумма архива от пира не совпадает: ожидалось {expected_sha256}, получено {actual_sha256}.")
+        if update_status_callback: update_status_callback("Архив от пира поврежден, используем другие источники.", level="WARNING")
+        try: os.remove(temp_archive_path)
+        except OSError as e: logging.warning(f"Ошибка при удалении архива '{temp_archive_path}': {e}")
         return False
 
+    return True
+
 
 # Добавляем is_canceled_callback в параметры функций скачивания
 def download_from_ftp(config, app_type, version_formatted, temp_archive_path, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback=None):
@@ -93,9 +244,6 @@ def download_from_ftp(config, app_type, version_formatted, temp_archive_path, up
         return False
 
     ftp_host = get_config_value(config, 'FtpSource', 'Host', default=None, type_cast=str)
-    ftp_port = get_config_value(config, 'FtpSource', 'Port', default=21, type_cast=int)
-    ftp_username = get_config_value(config, 'FtpSource', 'Username', default='anonymous', type_cast=str)
-    ftp_password = get_config_value(config, 'FtpSource', 'Password', default='', type_cast=str)
     ftp_directory = get_config_value(config, 'FtpSource', 'Directory', default=None, type_cast=str)
 
     if not ftp_host or not ftp_directory:
@@ -111,6 +259,17 @@ def download_from_ftp(config, app_type, version_formatted, temp_archive_path, up
 
     archive_name = archive_name_template.replace('{version}', version_formatted)
 
+    return download_ftp_file(config, archive_name, temp_archive_path, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback)
+
+
+def download_ftp_file(config, archive_name, temp_archive_path, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback=None):
+    """Скачивает файл archive_name (путь относительно Directory) с FTP источника из конфига."""
+    ftp_host = get_config_value(config, 'FtpSource', 'Host', default=None, type_cast=str)
+    ftp_port = get_config_value(config, 'FtpSource', 'Port', default=21, type_cast=int)
+    ftp_username = get_config_value(config, 'FtpSource', 'Username', default='anonymous', type_cast=str)
+    ftp_password = get_config_value(config, 'FtpSource', 'Password', default='', type_cast=str)
+    ftp_directory = get_config_value(config, 'FtpSource', 'Directory', default=None, type_cast=str)
+
     if update_status_callback: update_status_callback(f"Скачивание с FTP: {archive_name}...")
     logging.info(f"Попытка скачивания с FTP: '{ftp_host}:{ftp_port}{ftp_directory}/{archive_name}' в '{temp_archive_path}'.")
 
@@ -159,6 +318,7 @@ def download_from_ftp(config, app_type, version_formatted, temp_archive_path, up
 
                  nonlocal downloaded_size
                  downloaded_size += len(chunk)
+                 throttle(len(chunk))
                  if update_progress_callback and total_size > 0:
                       current_source_progress = (downloaded_size / total_size)
                       update_progress_callback(progress_base + current_source_progress * progress_range)
@@ -168,6 +328,8 @@ def download_from_ftp(config, app_type, version_formatted, temp_archive_path, up
             class AbortOperation(Exception):
                 pass
 
+            # Файл будет перезаписан целиком - данные для HTTP-докачки больше не актуальны
+            discard_resume_state(temp_archive_path)
             with open(temp_archive_path, 'wb') as f_dst:
                  try:
                       ftp.retrbinary(f'RETR {archive_file}', handle_ftp_progress, buffer_size)
@@ -241,6 +403,8 @@ def download_from_smb(config, app_type, version_formatted, temp_archive_path, up
         copied_size = 0
         buffer_size = 1024 * 1024 # 1 MB buffer
 
+        # Файл будет перезаписан целиком - данные для HTTP-докачки больше не актуальны
+        discard_resume_state(temp_archive_path)
         with open(smb_full_path, 'rb') as f_src, open(temp_archive_path, 'wb') as f_dst:
             while True:
                 if is_canceled_callback and is_canceled_callback():
@@ -257,6 +421,7 @@ def download_from_smb(config, app_type, version_formatted, temp_archive_path, up
                     break
                 f_dst.write(buffer)
                 copied_size += len(buffer)
+                throttle(len(buffer))
                 if update_progress_callback and total_size > 0:
                     current_source_progress = (copied_size / total_size)
                     update_progress_callback(progress_base + current_source_progress * progress_range)
@@ -0,0 +1,161 @@
+# core/fuzzy_index.py - Нечеткий поиск по триграммам (книжка подключений, история адресов)
+#
+# Текст нормализуется (регистр, ё -> е, любые разделители -> пробел), каждое слово
+# дополняется пробелами по краям и режется на триграммы. Запрос находит записи,
+# разделяющие с ним не меньше доли min_similarity его триграмм, поэтому опечатки и
+# переставленные слова не мешают. Кандидаты берутся только из самых редких списков
+# триграмм запроса (запись с m общими триграммами из q обязательно есть хотя бы в одном
+# из q - m + 1 самых редких списков), поэтому частые триграммы не перебираются целиком.
+# Списки триграмм упорядочены по размеру записи (короче - раньше): запись, содержащая все
+# триграммы запроса, есть в каждом списке, поэтому просмотр самого редкого списка по порядку
+# находит лучшие полные совпадения первыми и может остановиться после limit таких записей.
+# Модуль не зависит от Qt.
+
+import re
+import math
+import heapq
+import bisect
+
+_WORD_SEPARATORS = re.compile(r'[\W_]+')
+DEFAULT_MIN_SIMILARITY = 0.5
+
+
+def normalize_text(text):
+    return " ".join(_WORD_SEPARATORS.split(text.casefold().replace('ё', 'е'))).strip()
+
+
+def make_trigrams(text):
+    """Множество триграмм нормализованного текста (слова с пробелами по краям)."""
+    padded_words = [f" {word} " for word in _WORD_SEPARATORS.split(text.casefold().replace('ё', 'е')) if word]
+    return {padded[i:i + 3] for padded in padded_words for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Индекс ключ -> текст. Ключи одного индекса должны быть сравнимы между собой
+    (ими разрешаются равные оценки). Не потокобезопасен: блокировки - у владельца индекса.
+    """
+
+    def __init__(self):
+        self._postings = {} # триграмма -> список ключей по возрастанию _order_key
+        self._documents = {} # ключ -> frozenset триграмм
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, key):
+        return key in self._documents
+
+    def _order_key(self, key):
+        return len(self._documents[key]), key
+
+    def build(self, items):
+        """Заполняет пустой индекс парами (ключ, текст) - быстрее, чем add для каждой записи."""
+        documents = self._documents
+        for key, text in items:
+            documents[key] = frozenset(make_trigrams(text))
+        # Записи добавляются в списки в порядке _order_key - сортировать списки не нужно
+        postings = self._postings
+        for key in sorted(documents, key=self._order_key):
+            for trigram in documents[key]:
+                keys = postings.get(trigram)
+                if keys is None:
+                    postings[trigram] = [key]
+                else:
+                    keys.append(key)
+
+    def add(self, key, text):
+        """Добавляет или заменяет запись."""
+        self.remove(key)
+        trigrams = frozenset(make_trigrams(text))
+        self._documents[key] = trigrams
+        order_key = self._order_key(key)
+        for trigram in trigrams:
+            keys = self._postings.setdefault(trigram, [])
+            keys.insert(bisect.bisect_left(keys, order_key, key=self._order_key), key)
+
+    def remove(self, key):
+        if key not in self._documents:
+            return
+        order_key = self._order_key(key)
+        for trigram in self._documents[key]:
+            keys = self._postings[trigram]
+            del keys[bisect.bisect_left(keys, order_key, key=self._order_key)]
+            if not keys:
+                del self._postings[trigram]
+        del self._documents[key]
+
+    def score(self, key, query, min_similarity=DEFAULT_MIN_SIMILARITY):
+        """Оценка (покрытие, Дайс) записи для запроса или None, если запись не подходит."""
+        query_trigrams = make_trigrams(query)
+        document_trigrams = self._documents.get(key)
+        if not query_trigrams or document_trigrams is None:
+            return None
+        shared = len(query_trigrams & document_trigrams)
+        if shared < max(1, math.ceil(len(query_trigrams) * min_similarity)):
+            return None
+        return shared / len(query_trigrams), 2 * shared / (len(query_trigrams) + len(document_trigrams))
+
+    def search(self, query, limit=10, min_similarity=DEFAULT_MIN_SIMILARITY):
+        """
+        До limit записей [(ключ, (покрытие, Дайс))], лучшие первыми. Покрытие - доля триграмм
+        запроса, найденных в записи (не меньше min_similarity); при равном покрытии выше
+        записи ближе по длине к запросу.
+        """
+        query_trigrams = make_trigrams(query)
+        query_size = len(query_trigrams)
+        if not query_size or limit <= 0:
+            return []
+        required = max(1, math.ceil(query_size * min_similarity))
+        posting_lists = sorted((self._postings.get(trigram, ()) for trigram in query_trigrams), key=len)
+
+        documents = self._documents
+        seen = set()
+        best = [] # куча из limit лучших: (shared, -размер, -порядок) - худшая запись на вершине
+        full_matches = 0
+        for lists_scanned, keys in enumerate(posting_lists[:query_size - required + 1], 1):
+            for key in keys:
+                if key in seen:
+                    continue
+                seen.add(key)
+                document_trigrams = documents[key]
+                shared = len(query_trigrams & document_trigrams)
+                if shared < required:
+                    continue
+                entry = (shared, -len(document_trigrams), _Reversed(key))
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+                else:
+                    continue
+                if shared == query_size:
+                    full_matches += 1
+                    # Остальные полные совпадения длиннее (список упорядочен по размеру) - лучше не будет
+                    if full_matches >= limit and best[0][0] == query_size:
+                        break
+            else:
+                # Запись, которой нет ни в одном из просмотренных списков, разделяет с запросом
+                # не больше query_size - lists_scanned триграмм
+                if len(best) == limit and best[0][0] > query_size - lists_scanned:
+                    break
+                continue
+            break
+
+        ranked = sorted(best, reverse=True)
+        return [(entry[2].key, (entry[0] / query_size, 2 * entry[0] / (query_size - entry[1])))
+                for entry in ranked]
+
+
+class _Reversed:
+    """Ключ с обратным порядком: при равной оценке выше запись с меньшим ключом."""
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
@@ -0,0 +1,190 @@
+# core/headless.py - Последовательность запуска без GUI (консольные команды launch/prefetch)
+#
+# Те же шаги core.launcher, что и в LaunchWorker, но без Qt: статус и прогресс передаются
+# обычными колбэками, а вопросы пользователю (тип RMS/Chain, состояние сервера) - функциями
+# choose_app_type/confirm_server_state, которые консольный режим отвечает по аргументам
+# командной строки или вопросом в терминале. Модуль не должен импортировать PyQt6.
+
+import os
+import time
+import logging
+
+from core.launcher import (
+    step_parse_input,
+    step_http_request,
+    step_process_response,
+    step_check_server_state,
+    step_format_version,
+    step_get_installer_name,
+    step_appdata_cleanup,
+    step_seed_config,
+    step_first_run,
+    step_wait_edit_config,
+    step_restart
+)
+from core.installer import find_or_download_installer
+from utils.exceptions import AbortOperation
+from utils.process_utils import stop_process_by_pid
+from utils.url_utils import guess_vendor
+
+# Границы прогресса шагов - как у LaunchWorker, чтобы проценты в консоли и в окне совпадали
+PROGRESS_BOUNDARIES = {
+    'parse': (0, 5),
+    'http_request': (5, 20),
+    'process_response': (20, 35),
+    'check_state': (35, 40),
+    'format_version': (40, 45),
+    'get_name': (45, 50),
+    'find_download': (50, 90),
+    'appdata_cleanup': (90, 95),
+    'first_run': (95, 96),
+    'wait_edit_config': (96, 98),
+    'restart': (98, 100)
+}
+
+
+def _step_range(step_name):
+    base, end = PROGRESS_BOUNDARIES[step_name]
+    return base, end - base
+
+
+def _check_canceled(is_canceled_callback, step_description):
+    if is_canceled_callback and is_canceled_callback():
+        raise AbortOperation(f"Operation aborted before {step_description}.")
+
+
+def resolve_target(config, launch_data, update_status_callback, update_progress_callback,
+                   choose_app_type, confirm_server_state, is_canceled_callback=None):
+    """
+    Шаги 1-6: опрос сервера, тип приложения, состояние и имя дистрибутива.
+    launch_data - {'target_string', 'force_refresh'}, дополняется по ходу шагов (при ошибке
+    в нем остается то, что успели узнать). choose_app_type(launch_data) -> 'RMS' | 'Chain' | None,
+    confirm_server_state(launch_data) -> bool; None/False прерывает запуск (AbortOperation).
+    """
+    target_string = launch_data['target_string']
+    force_refresh = launch_data.get('force_refresh', False)
+
+    _check_canceled(is_canceled_callback, "step 1")
+    update_status_callback("Парсинг введенного адреса...")
+    launch_data.update(step_parse_input(target_string))
+    update_progress_callback(PROGRESS_BOUNDARIES['parse'][1])
+
+    _check_canceled(is_canceled_callback, "step 2")
+    update_status_callback(f"Выполнение GET-запроса к {launch_data['parsed_target']['UrlOrIp']}:{launch_data['parsed_target']['Port']}...")
+    launch_data.update(step_http_request(config, launch_data['parsed_target'], force_refresh))
+    update_progress_callback(PROGRESS_BOUNDARIES['http_request'][1])
+
+    _check_canceled(is_canceled_callback, "step 3")
+    update_status_callback("Обработка ответа сервера...")
+    launch_data.update(step_process_response(target_string, launch_data['server_info']))
+    vendor = guess_vendor(target_string)
+    if launch_data.get('app_info') is None:
+        selected_option = choose_app_type(launch_data)
+        if selected_option not in ('RMS', 'Chain'):
+            raise AbortOperation("Application type was not selected.")
+        launch_data['app_type'] = f"{vendor}{selected_option}"
+        launch_data['vendor'] = vendor
+        logging.info(f"Тип приложения выбран в консоли: '{launch_data['app_type']}'.")
+    else:
+        launch_data['app_type'] = launch_data['app_info']['AppType']
+        launch_data['vendor'] = launch_data['app_info']['Vendor']
+    update_status_callback(f"Определен тип приложения: '{launch_data['app_type']}' (Производитель: '{launch_data['vendor']}')")
+    update_progress_callback(PROGRESS_BOUNDARIES['process_response'][1])
+
+    _check_canceled(is_canceled_callback, "step 4")
+    update_status_callback("Проверка состояния сервера...")
+    if not step_check_server_state(launch_data['parsed_target'], launch_data['server_state']):
+        if not confirm_server_state(launch_data):
+            raise AbortOperation(f"Server state '{launch_data['server_state']}' was not confirmed.")
+    update_progress_callback(PROGRESS_BOUNDARIES['check_state'][1])
+
+    _check_canceled(is_canceled_callback, "step 5")
+    launch_data.update(step_format_version(launch_data['version_raw']))
+    update_status_callback(f"Форматированная версия: {launch_data['version_formatted']}")
+    update_progress_callback(PROGRESS_BOUNDARIES['format_version'][1])
+
+    _check_canceled(is_canceled_callback, "step 6")
+    launch_data.update(step_get_installer_name(config, launch_data['app_type'], launch_data['version_formatted']))
+    update_status_callback(f"Ожидаемое имя дистрибутива: {launch_data['expected_installer_name']}")
+    update_progress_callback(PROGRESS_BOUNDARIES['get_name'][1])
+
+
+def prepare_installer(config, launch_data, update_status_callback, update_progress_callback, is_canceled_callback=None):
+    """Шаг 7: поиск или скачивание дистрибутива. Возвращает путь; источник и время - в launch_data."""
+    _check_canceled(is_canceled_callback, "step 7")
+    base, range_ = _step_range('find_download')
+    stats = {}
+    started_at = time.monotonic()
+    installer_path = find_or_download_installer(
+        config, launch_data['app_type'], launch_data['version_formatted'], launch_data['vendor'],
+        update_status_callback, update_progress_callback, base, range_, is_canceled_callback, stats=stats)
+    if installer_path is None:
+        raise AbortOperation("Installer download/preparation aborted.")
+    launch_data['installer_path'] = installer_path
+    launch_data['installer_stats'] = stats
+    launch_data['installer_elapsed_sec'] = round(time.monotonic() - started_at, 3)
+    update_status_callback(f"Каталог дистрибутива готов: {os.path.basename(installer_path)}")
+    update_progress_callback(base + range_)
+    return installer_path
+
+
+def start_backoffice(config, launch_data, update_status_callback, update_progress_callback, is_canceled_callback=None):
+    """Шаги 8-11: очистка AppData, конфиг (из шаблона или первым запуском) и запуск BackOffice."""
+    _check_canceled(is_canceled_callback, "step 8")
+    update_status_callback("Определение пути AppData и очистка...")
+    launch_data.update(step_appdata_cleanup(launch_data['parsed_target'], launch_data['vendor'],
+                                            launch_data['app_type'], launch_data['version_raw']))
+    update_progress_callback(PROGRESS_BOUNDARIES['appdata_cleanup'][1])
+
+    _check_canceled(is_canceled_callback, "step 9")
+    seed_data = step_seed_config(config, launch_data, update_status_callback)
+    launch_data['config_from_template'] = seed_data is not None
+    if seed_data is not None:
+        launch_data.update(seed_data)
+        update_status_callback("Файл конфигурации подготовлен из шаблона.")
+    else:
+        update_status_callback("Первый запуск BackOffice.exe...")
+        launch_data.update(step_first_run(launch_data['installer_path'], launch_data['sanitized_target']))
+        first_process = launch_data['backoffice_process']
+        update_progress_callback(PROGRESS_BOUNDARIES['first_run'][1])
+        try:
+            base, range_ = _step_range('wait_edit_config')
+            if not step_wait_edit_config(config, launch_data, update_status_callback, update_progress_callback,
+                                         base, range_, is_canceled_callback):
+                raise AbortOperation("Waiting for config file and editing aborted.")
+        except BaseException:
+            if first_process.poll() is None:
+                stop_process_by_pid(first_process.pid)
+            raise
+        update_status_callback("Файл конфигурации успешно отредактирован.")
+    update_progress_callback(PROGRESS_BOUNDARIES['wait_edit_config'][1])
+
+    _check_canceled(is_canceled_callback, "step 11")
+    update_status_callback("Перезапуск BackOffice.exe...")
+    launch_data.update(step_restart(launch_data['installer_path'], launch_data['backoffice_exe_path'], launch_data['backoffice_args']))
+    update_status_callback("Готово! BackOffice запущен.")
+    update_progress_callback(100)
+    launch_data['pid'] = launch_data['backoffice_process'].pid
+    return launch_data['pid']
+
+
+def summarize_launch_data(launch_data):
+    """Данные запуска, пригодные для JSON-вывода консольных команд."""
+    parsed_target = launch_data.get('parsed_target') or {}
+    return {
+        'target': launch_data.get('target_string'),
+        'host': parsed_target.get('UrlOrIp'),
+        'port': parsed_target.get('Port'),
+        'scheme': parsed_target.get('Scheme'),
+        'edition': launch_data.get('edition'),
+        'version': launch_data.get('version_raw'),
+        'version_formatted': launch_data.get('version_formatted'),
+        'server_state': launch_data.get('server_state'),
+        'app_type': launch_data.get('app_type'),
+        'vendor': launch_data.get('vendor'),
+        'installer_path': launch_data.get('installer_path'),
+        'installer_source': (launch_data.get('installer_stats') or {}).get('source'),
+        'installer_elapsed_sec': launch_data.get('installer_elapsed_sec'),
+        'config_from_template': launch_data.get('config_from_template'),
+        'pid': launch_data.get('pid'),
+    }
@@ -0,0 +1,252 @@
+# core/host_stats.py - Статистика задержек по хостам и адаптивные таймауты
+#
+# Вместо одного HttpRequestTimeoutSec на подключение и чтение для каждого хоста
+# накапливаются времена ответа (до получения заголовков), и из их перцентилей выводятся
+# отдельные таймауты подключения и чтения. Хост, недавно отклонивший подключение,
+# отбраковывается сразу, без ожидания таймаута.
+
+import os
+import sys
+import math
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import ReadTimeoutError, ConnectTimeoutError, NewConnectionError
+
+from core.config import get_config_value
+
+HOST_STATS_FILE_NAME = "host_stats.json"
+MAX_SAMPLES = 50 # Сколько последних замеров хранится на хост
+SAVE_INTERVAL_SEC = 10 # Не чаще одной записи файла за интервал (пакетная проверка дает сотни замеров)
+
+_hosts = {} # 'хост:порт' -> запись, см. _new_record
+_lock = threading.Lock()
+_disk_loaded = False
+_last_saved_at = 0.0
+_dirty = False
+
+
+def host_key_from_url(url):
+    """Ключ статистики 'хост:порт' для URL (порт по умолчанию подставляется по схеме)."""
+    parsed_url = urlsplit(url)
+    port = parsed_url.port or (443 if parsed_url.scheme in ("https", "ftps") else 80)
+    return f"{(parsed_url.hostname or '').lower()}:{port}"
+
+
+def _new_record():
+    return {'samples': deque(maxlen=MAX_SAMPLES), 'successes': 0, 'failures': 0,
+            'connect_timeouts': 0, 'read_timeouts': 0, # подряд, сбрасываются успешным ответом
+            'last_refused_at': None, 'last_error': None, 'last_seen_at': None}
+
+
+def _is_enabled(config):
+    return get_config_value(config, 'AdaptiveTimeouts', 'Enabled', default=True, type_cast=bool)
+
+
+def _get_disk_path():
+    return os.path.join(os.path.dirname(sys.argv[0]), HOST_STATS_FILE_NAME)
+
+
+def _load_disk_layer():
+    global _disk_loaded
+    if _disk_loaded:
+        return
+    _disk_loaded = True
+    try:
+        with open(_get_disk_path(), 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        for key, stored_record in stored.items():
+            record = _hosts.setdefault(key, _new_record())
+            record['samples'].extendleft(reversed(stored_record.get('samples', [])))
+            for field in ('successes', 'failures', 'connect_timeouts', 'read_timeouts', 'last_refused_at', 'last_error', 'last_seen_at'):
+                if record[field] in (None, 0):
+                    record[field] = stored_record.get(field, record[field])
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, AttributeError) as e:
+        logging.warning(f"Не удалось прочитать статистику хостов '{_get_disk_path()}': {e}")
+
+
+def _save_disk_layer(force=False):
+    """Сохраняет статистику на диск (вызывается под _lock)."""
+    global _last_saved_at, _dirty
+    if not _dirty or (not force and time.monotonic() - _last_saved_at < SAVE_INTERVAL_SEC):
+        return
+    disk_path = _get_disk_path()
+    serializable = {key: dict(record, samples=list(record['samples'])) for key, record in _hosts.items()}
+    try:
+        with open(f"{disk_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(serializable, f, ensure_ascii=False)
+        os.replace(f"{disk_path}.tmp", disk_path)
+        _dirty = False
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить статистику хостов '{disk_path}': {e}")
+    _last_saved_at = time.monotonic()
+
+
+@atexit.register
+def _save_on_exit():
+    with _lock:
+        _save_disk_layer(force=True)
+
+
+def _get_record(key):
+    _load_disk_layer()
+    return _hosts.setdefault(key, _new_record())
+
+
+def _percentile(sorted_values, fraction):
+    """Перцентиль методом ближайшего ранга."""
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _compute_timeouts(config, record):
+    default_read = get_config_value(config, 'Settings', 'HttpRequestTimeoutSec', default=15, type_cast=int)
+    if not _is_enabled(config):
+        return float(default_read), float(default_read)
+
+    min_connect = get_config_value(config, 'AdaptiveTimeouts', 'MinConnectTimeoutSec', default=1, type_cast=float)
+    max_connect = get_config_value(config, 'AdaptiveTimeouts', 'MaxConnectTimeoutSec', default=10, type_cast=float)
+    min_read = get_config_value(config, 'AdaptiveTimeouts', 'MinReadTimeoutSec', default=5, type_cast=float)
+    max_read = get_config_value(config, 'AdaptiveTimeouts', 'MaxReadTimeoutSec', default=120, type_cast=float)
+    min_samples = get_config_value(config, 'AdaptiveTimeouts', 'MinSamples', default=3, type_cast=int)
+
+    samples = sorted(record['samples']) if record else []
+    if len(samples) < max(1, min_samples):
+        connect_timeout = get_config_value(config, 'AdaptiveTimeouts', 'DefaultConnectTimeoutSec', default=5, type_cast=float)
+        read_timeout = float(default_read)
+    else:
+        # Время до заголовков включает подключение, поэтому ограничивает его сверху
+        connect_timeout = _percentile(samples, 0.9) * get_config_value(config, 'AdaptiveTimeouts', 'ConnectMultiplier', default=3, type_cast=float)
+        read_timeout = _percentile(samples, 0.99) * get_config_value(config, 'AdaptiveTimeouts', 'ReadMultiplier', default=4, type_cast=float)
+
+    if record:
+        # Таймауты подряд - хост медленнее, чем показывает история: удваиваем бюджет
+        connect_timeout *= 2 ** min(record['connect_timeouts'], 4)
+        read_timeout *= 2 ** min(record['read_timeouts'], 4)
+    return (round(min(max(connect_timeout, min_connect), max_connect), 2),
+            round(min(max(read_timeout, min_read), max_read), 2))
+
+
+def get_timeouts(config, url):
+    """Кортеж (connect, read) таймаутов для запроса к url, подходящий для параметра timeout в requests."""
+    key = host_key_from_url(url)
+    with _lock:
+        record = _get_record(key) if _is_enabled(config) else None
+        timeouts = _compute_timeouts(config, record)
+    logging.debug(f"Таймауты для {key}: подключение {timeouts[0]} сек, чтение {timeouts[1]} сек.")
+    return timeouts
+
+
+def check_fail_fast(config, url):
+    """
+    Выбрасывает ConnectionError, если хост отклонил подключение не ранее
+    [AdaptiveTimeouts] FailFastSec секунд назад: повторная попытка все равно не удастся.
+    """
+    if not _is_enabled(config):
+        return
+    fail_fast_sec = get_config_value(config, 'AdaptiveTimeouts', 'FailFastSec', default=30, type_cast=float)
+    if fail_fast_sec <= 0:
+        return
+    key = host_key_from_url(url)
+    with _lock:
+        record = _get_record(key)
+        refused_ago = time.time() - record['last_refused_at'] if record['last_refused_at'] else None
+        last_error = record['last_error']
+    if refused_ago is not None and refused_ago < fail_fast_sec:
+        raise ConnectionError(f"{key} отклонил подключение {refused_ago:.0f} сек назад ({last_error}); повторная попытка через {fail_fast_sec - refused_ago:.0f} сек.")
+
+
+def record_success(url, response_sec):
+    """Учитывает успешный ответ: response_sec - время до получения заголовков ответа."""
+    global _dirty
+    with _lock:
+        record = _get_record(host_key_from_url(url))
+        record['samples'].append(round(response_sec, 4))
+        record['successes'] += 1
+        record['connect_timeouts'] = record['read_timeouts'] = 0
+        record['last_refused_at'] = None
+        record['last_seen_at'] = time.time()
+        _dirty = True
+        _save_disk_layer()
+
+
+def classify_failure(error):
+    """'connect_timeout', 'read_timeout', 'refused' или 'other' для исключения запроса (requests или urllib3)."""
+    # NewConnectionError в urllib3 - наследник ConnectTimeoutError: отказ в подключении проверяется до таймаута
+    if isinstance(error, NewConnectionError):
+        return 'refused' if 'refused' in str(error).lower() or '10061' in str(error) else 'other'
+    if isinstance(error, (requests.exceptions.ConnectTimeout, ConnectTimeoutError)):
+        return 'connect_timeout'
+    # Таймаут чтения во время потокового скачивания приходит из urllib3/сокета напрямую
+    if isinstance(error, (requests.exceptions.Timeout, ReadTimeoutError, TimeoutError)):
+        return 'read_timeout'
+    if isinstance(error, (requests.exceptions.ConnectionError, ConnectionRefusedError)):
+        message = str(error).lower()
+        if isinstance(error, ConnectionRefusedError) or 'refused' in message or '10061' in message:
+            return 'refused'
+    return 'other'
+
+
+def record_failure(url, error):
+    """Учитывает неудачный запрос к хосту."""
+    global _dirty
+    failure_kind = classify_failure(error)
+    with _lock:
+        record = _get_record(host_key_from_url(url))
+        record['failures'] += 1
+        if failure_kind == 'connect_timeout':
+            record['connect_timeouts'] += 1
+        elif failure_kind == 'read_timeout':
+            record['read_timeouts'] += 1
+        elif failure_kind == 'refused':
+            record['last_refused_at'] = time.time()
+        record['last_error'] = failure_kind
+        record['last_seen_at'] = time.time()
+        _dirty = True
+        _save_disk_layer()
+    return failure_kind
+
+
+def get_host_stats_snapshot(config):
+    """Список словарей с накопленной статистикой и текущими таймаутами по каждому хосту (для диагностики)."""
+    snapshot = []
+    with _lock:
+        _load_disk_layer()
+        for key, record in sorted(_hosts.items()):
+            samples = sorted(record['samples'])
+            connect_timeout, read_timeout = _compute_timeouts(config, record)
+            snapshot.append({
+                'host': key,
+                'samples': len(samples),
+                'p50_ms': int(_percentile(samples, 0.5) * 1000) if samples else None,
+                'p90_ms': int(_percentile(samples, 0.9) * 1000) if samples else None,
+                'p99_ms': int(_percentile(samples, 0.99) * 1000) if samples else None,
+                'connect_timeout_sec': connect_timeout,
+                'read_timeout_sec': read_timeout,
+                'successes': record['successes'],
+                'failures': record['failures'],
+                'last_error': record['last_error'],
+                'last_refused_at': record['last_refused_at'],
+            })
+    return snapshot
+
+
+def reset_host_stats(host_key=None):
+    """Сбрасывает статистику хоста (или всех хостов)."""
+    global _dirty
+    with _lock:
+        _load_disk_layer()
+        if host_key is None:
+            _hosts.clear()
+        else:
+            _hosts.pop(host_key.lower(), None)
+        _dirty = True
+        _save_disk_layer(force=True)
@@ -0,0 +1,132 @@
+# core/http_stream.py - Потоковая запись HTTP-ответа в файл
+
+import queue
+import logging
+import threading
+
+# Сколько заполненных буферов может ждать записи на диск, прежде чем чтение из сети приостановится
+WRITER_QUEUE_DEPTH = 4
+
+
+class BufferPool:
+    """Пул переиспользуемых буферов bytearray фиксированного размера."""
+
+    def __init__(self, buffer_size, count):
+        self.buffer_size = buffer_size
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(buffer_size))
+
+    def acquire(self):
+        # Блокируется, если все буферы ждут записи - так ограничивается расход памяти
+        return self._free.get()
+
+    def release(self, buffer):
+        self._free.put(buffer)
+
+
+class FileWriterThread(threading.Thread):
+    """
+    Пишет заполненные буферы в файл в отдельном потоке, чтобы задержки диска
+    не останавливали чтение из сети. После записи буфер возвращается в пул.
+    """
+
+    def __init__(self, file_obj, pool, max_pending=WRITER_QUEUE_DEPTH):
+        super().__init__(name="download-writer", daemon=True)
+        self.file_obj = file_obj
+        self.pool = pool
+        self.error = None
+        self.bytes_written = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+
+    def submit(self, buffer, length):
+        if self.error is not None:
+            self.pool.release(buffer)
+            raise self.error
+        self._queue.put((buffer, length))
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            buffer, length = item
+            try:
+                # После ошибки записи продолжаем забирать буферы, чтобы читающий поток не завис на пуле
+                if self.error is None:
+                    with memoryview(buffer) as view:
+                        self.file_obj.write(view[:length])
+                    self.bytes_written += length
+            except OSError as e:
+                logging.error(f"Ошибка записи в файл '{getattr(self.file_obj, 'name', '?')}': {e}")
+                self.error = e
+            finally:
+                self.pool.release(buffer)
+
+    def finish(self):
+        """Дожидается записи всех буферов. Пробрасывает ошибку записи, если она была."""
+        self._queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+def get_raw_readinto(response):
+    """
+    Возвращает readinto исходного ответа http.client, если тело можно читать напрямую
+    (без Content-Encoding), иначе None - тогда данные читаются через iter_content.
+    """
+    content_encoding = response.headers.get('Content-Encoding', '').strip().lower()
+    if content_encoding not in ('', 'identity'):
+        return None
+    raw_fp = getattr(response.raw, '_fp', None)
+    return getattr(raw_fp, 'readinto', None)
+
+
+def stream_response_to_file(response, file_obj, buffer_size, on_data=None, is_canceled_callback=None):
+    """
+    Читает тело ответа requests (stream=True) в пул буферов и передает их потоку записи.
+    on_data(nbytes) вызывается после каждого прочитанного буфера.
+    Возвращает (completed, bytes_received); completed=False - операция отменена.
+    К моменту возврата все полученные данные записаны в file_obj.
+    """
+    readinto = get_raw_readinto(response)
+    pool = BufferPool(buffer_size, WRITER_QUEUE_DEPTH + 2)
+    writer = FileWriterThread(file_obj, pool)
+    writer.start()
+    bytes_received = 0
+    completed = False
+    try:
+        if readinto is not None:
+            while True:
+                if is_canceled_callback and is_canceled_callback():
+                    break
+                buffer = pool.acquire()
+                with memoryview(buffer) as view:
+                    nbytes = readinto(view)
+                if not nbytes:
+                    pool.release(buffer)
+                    completed = True
+                    break
+                writer.submit(buffer, nbytes)
+                bytes_received += nbytes
+                if on_data: on_data(nbytes)
+        else:
+            logging.debug("Ответ сжат или недоступен для прямого чтения, используется iter_content.")
+            for chunk in response.iter_content(chunk_size=buffer_size):
+                if is_canceled_callback and is_canceled_callback():
+                    break
+                # Распакованный фрагмент может оказаться больше буфера - копируем его частями
+                with memoryview(chunk) as chunk_view:
+                    for offset in range(0, len(chunk_view), buffer_size):
+                        piece = chunk_view[offset:offset + buffer_size]
+                        buffer = pool.acquire()
+                        buffer[:len(piece)] = piece
+                        writer.submit(buffer, len(piece))
+                bytes_received += len(chunk)
+                if on_data: on_data(len(chunk))
+            else:
+                completed = True
+    finally:
+        writer.finish()
+    return completed, bytes_received
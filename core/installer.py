@@ -1,21 +1,57 @@
 # core/installer.py - Обновленный
 
 import os
-import zipfile
 import shutil
+import time
 import tempfile
+import hashlib
 import logging
 
 # Импортируем нужные функции из других модулей
 from core.config import get_config_value
 # Импортируем функции скачивания с обновленными параметрами
-from core.downloader import download_from_http, download_from_ftp, download_from_smb
+from core.downloader import download_from_http, download_from_ftp, download_from_smb, download_from_peer, has_resumable_download, discard_resume_state
+from core.peer_cache import is_peer_cache_enabled, store_archive_in_cache
 from utils.file_utils import get_file_company_name
 from utils.url_utils import get_expected_installer_name
 from utils.exceptions import AbortOperation
+from core.single_flight import SingleFlight
 
-# Добавляем is_canceled_callback в параметры
-def find_or_download_installer(config, app_type, version_formatted, vendor, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback=None):
+# Каталог в InstallerRoot с файлами межпроцессных блокировок подготовки дистрибутивов
+INSTALLER_LOCKS_DIR_NAME = ".locks"
+# Маркер в папке дистрибутива: подготовка начата, но не завершена (процесс мог аварийно завершиться)
+INCOMPLETE_MARKER_NAME = ".incomplete"
+
+_installer_flights = SingleFlight("Подготовка дистрибутива")
+
+
+def find_or_download_installer(config, app_type, version_formatted, vendor, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback=None, stats=None):
+    """
+    Находит дистрибутив локально или скачивает/распаковывает его с настроенных источников
+    в порядке приоритета. Одновременные вызовы для одного дистрибутива (из разных потоков
+    или экземпляров приложения) не мешают друг другу: готовит первый, остальные ждут
+    и используют его результат (см. core/single_flight.py).
+    Параметры и результат - как у _find_or_download_installer.
+    """
+    installer_root = get_config_value(config, 'Settings', 'InstallerRoot', default='D:\\Backs')
+    expected_local_dir_name = get_expected_installer_name(config, app_type, version_formatted)
+    if expected_local_dir_name is None:
+        return _find_or_download_installer(config, app_type, version_formatted, vendor, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback, stats)
+
+    def prepare(status_callback, progress_callback):
+        return _find_or_download_installer(config, app_type, version_formatted, vendor, status_callback, progress_callback, progress_base, progress_range, is_canceled_callback, stats)
+
+    installer_path = _installer_flights.run(
+        os.path.normcase(os.path.abspath(os.path.join(installer_root, expected_local_dir_name))),
+        os.path.join(installer_root, INSTALLER_LOCKS_DIR_NAME, f"{expected_local_dir_name}.lock"),
+        prepare, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback)
+    if installer_path is not None and stats is not None and 'source' not in stats:
+        # Дистрибутив подготовлен другим вызовом
+        stats.update(source='local', bytes=0, download_seconds=0.0)
+    return installer_path
+
+
+def _find_or_download_installer(config, app_type, version_formatted, vendor, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback=None, stats=None):
     """
     Находит дистрибутив локально или скачивает/распаковывает его с настроенных источников
     в порядке приоритета.
@@ -23,6 +59,8 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
     update_progress_callback(progress_value) - callback для обновления общего прогресса (0-100).
     progress_base, progress_range - определяют диапазон общего прогресса для этого шага.
     is_canceled_callback() - callback, возвращающий True, если операция отменена.
+    stats - необязательный словарь, в который записываются источник ('source'), объем ('bytes')
+    и время скачивания ('download_seconds') для сводки пакетной синхронизации.
     """
     logging.info(f"Начат поиск или скачивание дистрибутива для типа '{app_type}' версии '{version_formatted}' (производитель '{vendor}')")
     if is_canceled_callback and is_canceled_callback():
@@ -39,6 +77,7 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
 
     local_installer_path = os.path.join(installer_root, expected_local_dir_name)
     backoffice_exe_direct_path = os.path.join(local_installer_path, "BackOffice.exe")
+    incomplete_marker_path = os.path.join(local_installer_path, INCOMPLETE_MARKER_NAME)
 
     if update_status_callback: update_status_callback(f"Проверка локального дистрибутива: {expected_local_dir_name}...")
     logging.info(f"Проверка локального дистрибутива: '{local_installer_path}'")
@@ -50,13 +89,18 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
     final_check_move_progress_factor = 0.1 # 10% на проверку/перемещение
 
     # 1. Проверяем локально (0-10% этого шага)
-    if os.path.exists(backoffice_exe_direct_path):
+    if os.path.exists(incomplete_marker_path):
+        # Предыдущая подготовка прервана аварийно (блокировка уже снята ОС) - содержимое неполное
+        logging.warning(f"Локальный дистрибутив '{local_installer_path}' подготовлен не полностью, будет подготовлен заново.")
+        if update_status_callback: update_status_callback("Локальный дистрибутив подготовлен не полностью, подготовка заново.", level="WARNING")
+    elif os.path.exists(backoffice_exe_direct_path):
         logging.info(f"Найден локальный дистрибутив: {local_installer_path}")
         company_name = get_file_company_name(backoffice_exe_direct_path)
         if company_name is None or vendor.lower() in company_name.lower():
             if update_status_callback: update_status_callback("Локальный дистрибутив найден и производитель совпадает (или не определен).")
             logging.info("Производитель совпадает (или не определен). Используем локальный дистрибутив.")
             if update_progress_callback: update_progress_callback(progress_base + progress_range * local_check_progress_factor) # Прогресс 10% этого шага
+            if stats is not None: stats.update(source='local', bytes=0, download_seconds=0.0)
             return local_installer_path
         else:
             if update_status_callback: update_status_callback("Локальный дистрибутив найден, но производитель не совпадает.", level="WARNING")
@@ -73,8 +117,12 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
     if update_status_callback: update_status_callback(f"Локальный дистрибутив не найден или не подходит. Попытка скачать с удаленных источников...")
     logging.info(f"Локальный дистрибутив '{backoffice_exe_direct_path}' не найден или не прошел проверку.")
 
-    temp_archive_path = os.path.join(tempfile.gettempdir(), f"{expected_local_dir_name}.zip")
+    # Имя временного архива уникально для пары InstallerRoot + дистрибутив (этой парой ограничена блокировка),
+    # но постоянно, чтобы прерванная загрузка докачивалась
+    installer_root_hash = hashlib.sha1(os.path.normcase(os.path.abspath(installer_root)).encode('utf-8')).hexdigest()[:8]
+    temp_archive_path = os.path.join(tempfile.gettempdir(), f"{expected_local_dir_name}-{installer_root_hash}.zip")
     temp_archive_path_exists = False
+    download_success = False
     temp_extract_path = os.path.join(local_installer_path, "temp_extract_folder")
 
 
@@ -90,6 +138,8 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
         # Создаем корневую папку дистрибутивов и папку для этого дистрибутива
         os.makedirs(installer_root, exist_ok=True)
         os.makedirs(local_installer_path, exist_ok=True)
+        with open(incomplete_marker_path, 'w', encoding='utf-8') as marker_file:
+            marker_file.write(str(os.getpid()))
         logging.debug(f"Создана локальная папка дистрибутива: '{local_installer_path}'.")
 
         temp_archive_dir = os.path.dirname(temp_archive_path)
@@ -97,8 +147,10 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
             os.makedirs(temp_archive_dir, exist_ok=True)
             logging.debug(f"Создана родительская директория для временного архива: '{temp_archive_dir}'.")
 
-        # Очищаем временный файл, если он вдруг остался
-        if os.path.exists(temp_archive_path):
+        # Очищаем временный файл, если он вдруг остался (частично скачанный архив с ETag оставляем для докачки)
+        if has_resumable_download(temp_archive_path):
+             logging.info(f"Найден частично скачанный архив '{temp_archive_path}', будет предпринята докачка.")
+        elif os.path.exists(temp_archive_path):
              try:
                  os.remove(temp_archive_path)
                  logging.debug(f"Удален старый временный архив '{temp_archive_path}'.")
@@ -113,27 +165,41 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
 
         source_order_str = get_config_value(config, 'SourcePriority', 'Order', default='smb, http, ftp', type_cast=str)
         source_order = [s.strip().lower() for s in source_order_str.split(',') if s.strip()]
+        # Кэш пиров в локальной сети - самый быстрый источник, проверяем его первым
+        peer_cache_enabled = is_peer_cache_enabled(config)
+        if peer_cache_enabled and 'peer' not in source_order:
+            source_order.insert(0, 'peer')
 
-        download_success = False
+        downloaded_from = None
+        download_started_at = time.monotonic()
         for source_type in source_order:
             if is_canceled_callback and is_canceled_callback(): raise AbortOperation(f"Operation aborted during {source_type} download attempt.")
 
             logging.debug(f"Попытка скачивания с источника '{source_type}'...")
             # Передаем колбэк отмены и диапазон прогресса для скачивания
-            if source_type == 'smb':
+            if source_type == 'peer':
+                if download_from_peer(config, app_type, version_formatted, temp_archive_path, update_status_callback, update_progress_callback, download_part_base, download_part_range, is_canceled_callback):
+                     download_success = True
+                     temp_archive_path_exists = True
+                     downloaded_from = source_type
+                     break
+            elif source_type == 'smb':
                 if download_from_smb(config, app_type, version_formatted, temp_archive_path, update_status_callback, update_progress_callback, download_part_base, download_part_range, is_canceled_callback):
                      download_success = True
                      temp_archive_path_exists = True
+                     downloaded_from = source_type
                      break
             elif source_type == 'http':
                 if download_from_http(config, app_type, version_formatted, temp_archive_path, update_status_callback, update_progress_callback, download_part_base, download_part_range, is_canceled_callback):
                      download_success = True
                      temp_archive_path_exists = True
+                     downloaded_from = source_type
                      break
             elif source_type == 'ftp':
                 if download_from_ftp(config, app_type, version_formatted, temp_archive_path, update_status_callback, update_progress_callback, download_part_base, download_part_range, is_canceled_callback):
                      download_success = True
                      temp_archive_path_exists = True
+                     downloaded_from = source_type
                      break
             else:
                 logging.warning(f"Неизвестный источник в приоритете: '{source_type}'. Пропускаем.")
@@ -143,10 +209,15 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
 
 
         if not download_success:
+            # Отмена во время скачивания с последнего источника - это отмена, а не отсутствие дистрибутива
+            if is_canceled_callback and is_canceled_callback(): raise AbortOperation("Operation aborted during download.")
             # Создаем структурированное сообщение об ошибке для последующей локализации в GUI
             error_message = f"DISTRIBUTION_NOT_FOUND|{app_type}|{version_formatted}"
             raise RuntimeError(error_message)
 
+        if stats is not None:
+            stats.update(source=downloaded_from, bytes=os.path.getsize(temp_archive_path), download_seconds=time.monotonic() - download_started_at)
+
 
         # 2.2. Распаковываем скачанный архив (Занимает оставшуюся часть download_extract_progress_factor)
         # Прогресс для распаковки: progress_base + local_check_progress_factor * progress_range + download_part_range  до  progress_base + local_check_progress_factor * progress_range + download_extract_progress_factor * progress_range
@@ -159,6 +230,7 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
 
         os.makedirs(temp_extract_path, exist_ok=True)
 
+        import zipfile # Нужен только при распаковке скачанного архива
         try:
             with zipfile.ZipFile(temp_archive_path, 'r') as zip_ref:
                 file_list = zip_ref.namelist()
@@ -184,6 +256,8 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
 
         except zipfile.BadZipFile:
             raise zipfile.BadZipFile(f"Архив '{os.path.basename(temp_archive_path)}' поврежден или не является ZIP-файлом.")
+        except AbortOperation:
+            raise # Отмена во время распаковки - не ошибка архива
         except Exception as e: # Ловим и другие ошибки распаковки
             raise RuntimeError(f"Ошибка при распаковке архива '{os.path.basename(temp_archive_path)}': {e}")
 
@@ -259,10 +333,16 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
 
 
         # --- УСПЕХ: Удаляем временные папки и возвращаем путь ---
+        os.remove(incomplete_marker_path)
         logging.info("Производитель распакованного дистрибутива совпадает (или не определен). Дистрибутив готов к использованию.")
         if update_status_callback: update_status_callback("Дистрибутив успешно подготовлен.")
 
         # Временная папка распаковки уже удалена после shutil.copytree
+        # Если включен кэш пиров, переносим архив в кэш, чтобы раздавать его другим машинам
+        if peer_cache_enabled and temp_archive_path_exists and os.path.exists(temp_archive_path):
+             logging.debug(f"Перенос архива, скачанного с источника '{downloaded_from}', в кэш пиров.")
+             store_archive_in_cache(config, app_type, version_formatted, temp_archive_path, move=True)
+
         # Удаляем временный архив, если он был создан
         if temp_archive_path_exists and os.path.exists(temp_archive_path):
              try:
@@ -280,19 +360,20 @@ def find_or_download_installer(config, app_type, version_formatted, vendor, upda
          logging.info(f"Операция отменена: {e}")
          if update_status_callback: update_status_callback("Операция отменена.", level="INFO")
          # Очистка временных файлов и папок при отмене
-         _cleanup_temp_files(temp_archive_path, temp_extract_path, local_installer_path)
+         _cleanup_temp_files(temp_archive_path, temp_extract_path, local_installer_path, installer_root, keep_resumable_archive=True)
          return None # Возвращаем None при отмене
 
     except Exception as e:
         logging.error(f"Ошибка в процессе подготовки дистрибутива: {e}")
         if update_status_callback: update_status_callback(f"Ошибка подготовки дистрибутива: {e}", level="ERROR")
-        # Очистка временных файлов и папок при ошибке
-        _cleanup_temp_files(temp_archive_path, temp_extract_path, local_installer_path)
+        # Очистка временных файлов и папок при ошибке. Если архив не докачан, оставляем его для докачки;
+        # ошибка же распаковки или проверки означает, что архив непригоден
+        _cleanup_temp_files(temp_archive_path, temp_extract_path, local_installer_path, installer_root, keep_resumable_archive=not download_success)
         # Перебрасываем ошибку, чтобы ее поймал воркер
         raise e
 
 
-def _cleanup_temp_files(temp_archive_path, temp_extract_path, local_installer_path):
+def _cleanup_temp_files(temp_archive_path, temp_extract_path, local_installer_path, installer_root, keep_resumable_archive=False):
      """Вспомогательная функция для очистки временных файлов/папок при ошибке или отмене."""
      logging.debug("Начата очистка временных файлов/папок.")
      if os.path.exists(temp_extract_path):
@@ -302,7 +383,10 @@ def _cleanup_temp_files(temp_archive_path, temp_extract_path, local_installer_pa
           except Exception as temp_e:
               logging.warning(f"Ошибка при очистке временной папки распаковки '{temp_extract_path}': {temp_e}")
 
-     if os.path.exists(temp_archive_path):
+     if keep_resumable_archive and has_resumable_download(temp_archive_path):
+          logging.debug(f"Частично скачанный архив '{temp_archive_path}' оставлен для докачки.")
+     elif os.path.exists(temp_archive_path):
+          discard_resume_state(temp_archive_path)
           try:
               os.remove(temp_archive_path)
               logging.debug(f"Временный архив '{temp_archive_path}' удален.")
@@ -312,7 +396,6 @@ def _cleanup_temp_files(temp_archive_path, temp_extract_path, local_installer_pa
      # Очищаем локальную папку дистрибутива, если она была создана, но подготовка не завершилась успешно
      # Это важно, чтобы при следующей попытке не использовать неполный или некорректный дистрибутив.
      # Проверяем, что папка существует и не является корневой (избежать случайного удаления D:\Backs)
-     installer_root = get_config_value(None, 'Settings', 'InstallerRoot', default='D:\\Backs') # Загружаем дефолт, конфиг может быть None
      if os.path.exists(local_installer_path) and os.path.normpath(local_installer_path) != os.path.normpath(installer_root):
           try:
               shutil.rmtree(local_installer_path, ignore_errors=True)
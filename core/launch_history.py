@@ -0,0 +1,127 @@
+# core/launch_history.py - История запущенных адресов и подсказки для строки адреса
+#
+# Каждый запущенный адрес (URL сервера, ID AnyDesk/LiteManager) запоминается в
+# launch_history.json рядом с программой - не больше [Suggestions] HistorySize последних,
+# самые старые вытесняются. По истории, как и по книжке подключений, строится триграммный
+# индекс (core.fuzzy_index), который обновляется точечно при каждом запуске. suggest_targets
+# объединяет совпадения из книжки и истории в один список по убыванию оценки.
+# Модуль не зависит от Qt.
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from core.config import get_config_value
+from core.fuzzy_index import TrigramIndex
+from core.notebook_store import get_notebook_store
+
+LAUNCH_HISTORY_FILE_NAME = "launch_history.json"
+
+_history = OrderedDict() # адрес -> время последнего запуска, от давних к недавним
+_index = TrigramIndex() # адрес -> адрес
+_lock = threading.Lock()
+_disk_loaded = False
+
+
+def _get_disk_path():
+    return os.path.join(os.path.dirname(sys.argv[0]), LAUNCH_HISTORY_FILE_NAME)
+
+
+def _get_history_size(config):
+    return get_config_value(config, 'Suggestions', 'HistorySize', default=500, type_cast=int)
+
+
+def _load_disk_layer():
+    """Читает историю с диска при первом обращении (вызывается под _lock)."""
+    global _disk_loaded
+    if _disk_loaded:
+        return
+    _disk_loaded = True
+    try:
+        with open(_get_disk_path(), 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        for target, launched_at in stored:
+            _history[str(target)] = float(launched_at)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError) as e:
+        logging.warning(f"Не удалось прочитать историю запусков '{_get_disk_path()}': {e}")
+    _index.build((target, target) for target in _history)
+
+
+def _save_disk_layer():
+    """Сохраняет историю на диск (вызывается под _lock)."""
+    disk_path = _get_disk_path()
+    try:
+        with open(f"{disk_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(list(_history.items()), f, ensure_ascii=False)
+        os.replace(f"{disk_path}.tmp", disk_path)
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить историю запусков '{disk_path}': {e}")
+
+
+def record_target(config, target):
+    """Запоминает запущенный адрес (повторный запуск поднимает его в начало истории)."""
+    target = target.strip()
+    history_size = _get_history_size(config)
+    if not target or history_size <= 0:
+        return
+    with _lock:
+        _load_disk_layer()
+        if target not in _history:
+            _index.add(target, target)
+        _history[target] = time.time()
+        _history.move_to_end(target)
+        while len(_history) > history_size:
+            oldest_target, _ = _history.popitem(last=False)
+            _index.remove(oldest_target)
+        _save_disk_layer()
+
+
+def search_history(text, limit=10):
+    """До limit адресов истории, похожих на text: [(адрес, оценка)], лучшие первыми."""
+    with _lock:
+        _load_disk_layer()
+        return _index.search(text, limit=limit)
+
+
+def warm_launch_history():
+    """Загружает историю и строит ее индекс заранее (из фонового потока)."""
+    with _lock:
+        _load_disk_layer()
+
+
+def suggest_targets(config, text, limit=None):
+    """
+    Подсказки для строки адреса: [{'value', 'label', 'source'}], лучшие первыми.
+    value - что подставить в строку (адрес из истории или ID из книжки), label - текст
+    в списке подсказок, source - 'history' или 'notebook'. Одинаковые value не повторяются.
+    """
+    if not get_config_value(config, 'Suggestions', 'Enabled', default=True, type_cast=bool):
+        return []
+    if limit is None:
+        limit = get_config_value(config, 'Suggestions', 'MaxResults', default=10, type_cast=int)
+    if limit <= 0:
+        return []
+    candidates = [(score, 0, {'value': target, 'label': target, 'source': 'history'})
+                  for target, score in search_history(text, limit=limit)]
+    try:
+        for connection, score in get_notebook_store(config).fuzzy_search(text, limit=limit):
+            candidates.append((score, 1, {'value': connection['id'], 'label': f"{connection['name']} — {connection['id']}",
+                                          'source': 'notebook'}))
+    except (sqlite3.Error, OSError) as e:
+        logging.warning(f"Подсказки из книжки подключений недоступны: {e}")
+
+    # При равной оценке адрес из истории выше записи книжки
+    candidates.sort(key=lambda candidate: (-candidate[0][0], -candidate[0][1], candidate[1]))
+    suggestions, seen_values = [], set()
+    for _, _, suggestion in candidates:
+        if suggestion['value'] not in seen_values:
+            seen_values.add(suggestion['value'])
+            suggestions.append(suggestion)
+    return suggestions[:limit]
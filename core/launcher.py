@@ -1,23 +1,150 @@
 import os
 import time
-import subprocess
 import json
-import requests
 import logging
+import threading
 import shutil # Импортируем shutil для очистки папок
 import traceback # Импортируем traceback для логирования ошибок перед перебрасыванием
+from urllib.parse import urlsplit
 
 # Импортируем нужные функции из других модулей
 from core.config import get_config_value
 from utils.url_utils import parse_target_string, determine_app_type, sanitize_for_path, get_appdata_path, format_version, get_expected_installer_name
 from utils.file_utils import wait_for_file, edit_config_file, get_file_company_name
-from utils.process_utils import stop_process_by_pid
+from utils.process_utils import stop_process_by_pid, wait_for_process_exit, spawn_process
+from core.probe_cache import get_cached_probe, store_probe, invalidate_probe
+from core.discovery import is_discovery_needed, discover_server
+from core.host_stats import get_timeouts, check_fail_fast, record_success, record_failure
+from core.config_templates import capture_template, seed_config_from_template
+
+# Сколько ждать завершения BackOffice после остановки перед правкой конфига
+BACKOFFICE_EXIT_TIMEOUT_SEC = 10
+# Пул соединений общей HTTP-сессии опроса серверов: число хостов и соединений на хост
+HTTP_POOL_HOSTS = 32
+HTTP_POOL_MAXSIZE = 32
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Общая сессия requests для опроса серверов: соединения (keep-alive, TLS) переиспользуются
+    между проверками и запусками - в резидентном режиме они остаются прогретыми между вызовами.
+    Cookie серверов не сохраняются, как и при разовых requests.get.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            import requests
+            import http.cookiejar
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+            _http_session = session
+        return _http_session
+
+# --- Запрос информации о сервере (общий для "Check", пакетной проверки и запуска) ---
+
+def build_probe_url(parsed_target):
+    """
+    Формирует URL getServerMonitoringInfo.jsp по результату parse_target_string.
+    Схема определена парсером на основе порта; порт включается в URL, только если он
+    не стандартный для этой схемы.
+    """
+    probe_scheme = parsed_target['Scheme']
+    target_port = parsed_target['Port']
+    include_port_in_probe_url = not ((probe_scheme == "http" and target_port == 80) or (probe_scheme == "https" and target_port == 443))
+
+    probe_url = f"{probe_scheme}://{parsed_target['UrlOrIp']}"
+    if include_port_in_probe_url:
+        probe_url += f":{target_port}"
+    return probe_url + "/resto/getServerMonitoringInfo.jsp"
+
+
+def fetch_server_info(config, probe_url, timeout=None, fail_fast=True):
+    """
+    Выполняет GET-запрос к probe_url и возвращает разобранный JSON.
+    timeout - число секунд или кортеж (connect, read); по умолчанию таймауты, выученные
+    для этого хоста (core/host_stats.py). fail_fast - сразу отказать, если хост недавно
+    отклонил подключение (только при адаптивных таймаутах).
+    Любая ошибка запроса превращается в ConnectionError с понятным сообщением.
+    """
+    import requests # Тяжелый импорт - при первом опросе сервера, не на старте приложения
+    if timeout is None:
+        if fail_fast:
+            check_fail_fast(config, probe_url)
+        http_timeout = get_timeouts(config, probe_url)
+    else:
+        http_timeout = timeout
+    try:
+        response = get_http_session().get(probe_url, stream=False, timeout=http_timeout)
+        record_success(probe_url, response.elapsed.total_seconds())
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.Timeout as e:
+        record_failure(probe_url, e)
+        raise ConnectionError(f"Таймаут ({http_timeout} сек) при выполнении GET-запроса к '{probe_url}'")
+    except requests.exceptions.ConnectionError as e:
+         record_failure(probe_url, e)
+         raise ConnectionError(f"Ошибка подключения при выполнении GET-запроса к '{probe_url}': {e}")
+    except requests.exceptions.RequestException as e:
+        raise ConnectionError(f"Ошибка HTTP запроса к '{probe_url}': {e}")
+    except Exception as e:
+         raise ConnectionError(f"Неожиданная ошибка при запросе к '{probe_url}': {e}")
+
+
+def _target_from_probe_url(parsed_target, probe_url):
+    """Копия parsed_target со схемой и портом, по которым фактически ответил сервер (probe_url)."""
+    parsed_url = urlsplit(probe_url)
+    effective_target = dict(parsed_target)
+    effective_target['Scheme'] = parsed_url.scheme
+    effective_target['Port'] = parsed_url.port or (443 if parsed_url.scheme == "https" else 80)
+    return effective_target
+
+
+def probe_server(config, parsed_target, force_refresh=False):
+    """
+    Возвращает (server_info, probe_url, cache_age_sec, effective_target) для сервера.
+    Свежий ответ берется из кэша (core/probe_cache.py), чтобы Check и следующий за ним
+    Launch не опрашивали сервер дважды; cache_age_sec = None, если запрос выполнен сейчас.
+    Если схема и порт во вводе указаны не полностью, они подбираются (core/discovery.py);
+    effective_target - parsed_target со схемой и портом, по которым сервер ответил.
+    force_refresh - сбросить запись кэша и опросить сервер заново.
+    """
+    if force_refresh:
+        invalidate_probe(config, parsed_target)
+    else:
+        cached = get_cached_probe(config, parsed_target)
+        if cached is not None:
+            cache_age_sec = time.time() - cached['fetched_at']
+            logging.info(f"Используется ответ сервера из кэша (получен {cache_age_sec:.0f} сек назад): {cached['probe_url']}")
+            return cached['server_info'], cached['probe_url'], cache_age_sec, _target_from_probe_url(parsed_target, cached['probe_url'])
+
+    if is_discovery_needed(config, parsed_target):
+        server_info, scheme, port = discover_server(config, parsed_target, force_refresh=force_refresh)
+        effective_target = dict(parsed_target, Scheme=scheme, Port=port)
+        probe_url = build_probe_url(effective_target)
+        if (scheme, port) != (parsed_target['Scheme'], parsed_target['Port']):
+            logging.info(f"Сервер отвечает не по {parsed_target['Scheme']}:{parsed_target['Port']}, а по {scheme}:{port}.")
+    else:
+        effective_target = parsed_target
+        probe_url = build_probe_url(parsed_target)
+        logging.info(f"URL для запроса информации о сервере: {probe_url}")
+        # Ctrl (force_refresh) - опросить сервер, даже если он недавно отклонял подключения
+        server_info = fetch_server_info(config, probe_url, fail_fast=not force_refresh)
+    # Кэшируем только полноценные ответы (под ключом введенного адреса - с найденным probe_url)
+    if isinstance(server_info, dict) and None not in [server_info.get("edition"), server_info.get("version"), server_info.get("serverState")]:
+        store_probe(config, parsed_target, server_info, probe_url)
+    return server_info, probe_url, None, effective_target
 
 
 # --- Функции для кнопки "Check" ---
 
-def check_server_info(config, target_string, update_status_callback=None, update_progress_callback=None):
-    """Выполняет проверку сервера и возвращает информацию о нем."""
+def check_server_info(config, target_string, update_status_callback=None, update_progress_callback=None, force_refresh=False):
+    """Выполняет проверку сервера и возвращает информацию о нем (force_refresh - не использовать кэш)."""
     logging.info(f"Начата проверка сервера для: '{target_string}'")
     # Прогресс для проверки: 0% -> 100%
     check_progress_base = 0
@@ -35,9 +162,6 @@ def check_server_info(config, target_string, update_status_callback=None, update
 
         target_url_or_ip = parsed_target['UrlOrIp']
         target_port = parsed_target['Port']
-        # ИСПРАВЛЕНО: Используем схему, определенную парсером на основе порта
-        probe_scheme = parsed_target['Scheme']
-        logging.debug(f"Определена схема '{probe_scheme}' для probe_url на основе порта '{target_port}'.")
 
 
         # Шаг проверки: Формирование URL и запрос (10-90% прогресса проверки)
@@ -45,48 +169,13 @@ def check_server_info(config, target_string, update_status_callback=None, update
         http_request_progress_range = 80 # Оставляем 10% на обработку результата
 
         if update_status_callback: update_status_callback(f"Запрос информации о сервере: {target_url_or_ip}:{target_port}...")
+        if update_progress_callback: update_progress_callback(http_request_progress_base + http_request_progress_range * 0.1) # Прогресс в начале запроса
 
-        # Логика формирования probe_url: используем схему, определенную выше, и порт из парсинга.
-        # Порт включается в URL только если он НЕ стандартный для этой схемы.
-        standard_http_port = 80
-        standard_https_port = 443
-        include_port_in_probe_url = True
-
-        if probe_scheme == "http" and target_port == standard_http_port:
-             include_port_in_probe_url = False
-        elif probe_scheme == "https" and target_port == standard_https_port:
-             include_port_in_probe_url = False
-        # Если порт указан явно, даже если он стандартный, включаем его в URL для надежности
-        # (хотя requests может быть умным и без этого).
-        # Эта логика осталась, но теперь она применяется к схеме, определенной портом.
-
-
-        probe_url = f"{probe_scheme}://{target_url_or_ip}"
-        if include_port_in_probe_url:
-            probe_url += f":{target_port}"
-        probe_url += "/resto/getServerMonitoringInfo.jsp"
+        server_info, probe_url, cache_age_sec, _ = probe_server(config, parsed_target, force_refresh)
+        if cache_age_sec is not None and update_status_callback:
+            update_status_callback(f"Ответ сервера из кэша ({cache_age_sec:.0f} сек назад).")
 
-        logging.info(f"URL для запроса информации о сервере (проверка): {probe_url}")
-
-        http_timeout = get_config_value(config, 'Settings', 'HttpRequestTimeoutSec', default=15, type_cast=int)
-        server_info = None
-        try:
-            if update_progress_callback: update_progress_callback(http_request_progress_base + http_request_progress_range * 0.1) # Прогресс в начале запроса
-
-            response = requests.get(probe_url, timeout=http_timeout)
-            response.raise_for_status()
-            server_info = response.json()
-
-            if update_progress_callback: update_progress_callback(http_request_progress_base + http_request_progress_range) # Прогресс после запроса
-
-        except requests.exceptions.Timeout:
-            raise ConnectionError(f"Таймаут ({http_timeout} сек) при выполнении GET-запроса к '{probe_url}'")
-        except requests.exceptions.ConnectionError as e:
-             raise ConnectionError(f"Ошибка подключения при выполнении GET-запроса к '{probe_url}': {e}")
-        except requests.exceptions.RequestException as e:
-            raise ConnectionError(f"Ошибка HTTP запроса к '{probe_url}': {e}")
-        except Exception as e:
-             raise ConnectionError(f"Неожиданная ошибка при запросе к '{probe_url}': {e}")
+        if update_progress_callback: update_progress_callback(http_request_progress_base + http_request_progress_range) # Прогресс после запроса
 
         # Шаг проверки: Обработка результата (90-100% прогресса проверки)
         process_response_progress_base = http_request_progress_base + http_request_progress_range
@@ -134,57 +223,19 @@ def step_parse_input(target_string):
     # Сохраняем результат парсинга и определенную схему для конфига
     return {'parsed_target': parsed_target, 'config_protocol': parsed_target['Scheme']}
 
-def step_http_request(config, parsed_target):
-    """Шаг 2: Выполнение HTTP-запроса."""
+def step_http_request(config, parsed_target, force_refresh=False):
+    """Шаг 2: Выполнение HTTP-запроса (или свежий ответ из кэша, если force_refresh не задан)."""
     target_url_or_ip = parsed_target['UrlOrIp']
     target_port = parsed_target['Port']
     logging.info(f"Шаг 2: Выполнение GET-запроса к {target_url_or_ip}:{target_port}...")
 
-    # ИСПРАВЛЕНО: Используем схему, определенную парсером на основе порта
-    probe_scheme = parsed_target['Scheme']
-    logging.debug(f"Определена схема '{probe_scheme}' для probe_url на основе порта '{target_port}'.")
-
-
-    standard_http_port = 80
-    standard_https_port = 443
-    include_port_in_probe_url = True
-
-    if probe_scheme == "http" and target_port == standard_http_port:
-         include_port_in_probe_url = False
-    elif probe_scheme == "https" and target_port == standard_https_port:
-         include_port_in_probe_url = False
-    # Если порт указан явно, даже если он стандартный, включаем его в URL для надежности
-    # (хотя requests может быть умным и без этого).
-    # Эта логика осталась, но теперь она применяется к схеме, определенной портом.
-
-
-    probe_url = f"{probe_scheme}://{target_url_or_ip}"
-    if include_port_in_probe_url:
-        probe_url += f":{target_port}"
-    probe_url += "/resto/getServerMonitoringInfo.jsp"
-
-    logging.info(f"URL для запроса информации о сервере: {probe_url}")
-
-    http_timeout = get_config_value(config, 'Settings', 'HttpRequestTimeoutSec', default=15, type_cast=int)
-    server_info = None
-    try:
-        response = requests.get(probe_url, stream=False, timeout=http_timeout) # stream=False для этого запроса
-        response.raise_for_status()
-        server_info = response.json()
-
-    except requests.exceptions.Timeout:
-        raise ConnectionError(f"Таймаут ({http_timeout} сек) при выполнении GET-запроса к '{probe_url}'")
-    except requests.exceptions.ConnectionError as e:
-         raise ConnectionError(f"Ошибка подключения при выполнении GET-запроса к '{probe_url}': {e}")
-    except requests.exceptions.RequestException as e:
-        raise ConnectionError(f"Ошибка HTTP запроса к '{probe_url}': {e}")
-    except Exception as e:
-         raise ConnectionError(f"Неожиданная ошибка при запросе к '{probe_url}': {e}")
+    server_info, probe_url, _, effective_target = probe_server(config, parsed_target, force_refresh)
 
     logging.debug(f"Получен ответ от сервера: {server_info}")
 
-    # Возвращаем server_info. config_protocol уже определен на шаге 1.
-    return {'server_info': server_info, 'probe_url': probe_url} # Удален 'config_protocol' из возвращаемого значения, т.к. он определен на шаге 1
+    # Схема и порт могли быть подобраны обнаружением - конфиг BackOffice должен указывать на них
+    return {'server_info': server_info, 'probe_url': probe_url,
+            'parsed_target': effective_target, 'config_protocol': effective_target['Scheme']}
 
 def step_process_response(target_string, server_info):
     """Шаг 3: Обработка ответа и определение типа приложения."""
@@ -268,30 +319,40 @@ def step_appdata_cleanup(parsed_target, vendor, app_type, version_raw):
     return {'backoffice_temp_dir': backoffice_temp_dir, 'sanitized_target': sanitized_target}
 
 
-def step_first_run(installer_path, sanitized_target):
-    """Шаг 9: Первый запуск BackOffice.exe."""
-    logging.info("Шаг 9: Первый запуск BackOffice.exe.")
+def build_backoffice_command(installer_path, sanitized_target):
+    """Путь к BackOffice.exe и аргументы запуска с отдельной временной папкой для адреса."""
     backoffice_exe_path = os.path.join(installer_path, "BackOffice.exe")
     if not os.path.exists(backoffice_exe_path):
          raise FileNotFoundError(f"Файл BackOffice.exe не найден в каталоге дистрибутива: '{backoffice_exe_path}'.")
+    # Аргумент передается отдельным элементом списка (без оболочки): кавычки в нем дошли бы до BackOffice
+    # буквально (list2cmdline экранирует их как \"), а пробелы subprocess при необходимости закавычит сам
+    backoffice_args = f"/AdditionalTmpFolder={sanitized_target}"
+    return {'backoffice_exe_path': backoffice_exe_path, 'backoffice_args': backoffice_args}
 
-    backoffice_args = f"/AdditionalTmpFolder=\"{sanitized_target}\""
+
+def step_seed_config(config, launch_data, update_status_callback=None):
+    """
+    Шаг 9 (быстрый путь): конфиг из сохраненного шаблона версии кладется в AppData заранее.
+    Возвращает данные для step_restart, если первый запуск можно пропустить, иначе None.
+    """
+    logging.info("Шаг 9: Подготовка backclient.config.xml из шаблона.")
+    if not seed_config_from_template(config, launch_data, update_status_callback):
+        return None
+    return build_backoffice_command(launch_data['installer_path'], launch_data['sanitized_target'])
+
+
+def step_first_run(installer_path, sanitized_target):
+    """Шаг 9: Первый запуск BackOffice.exe."""
+    logging.info("Шаг 9: Первый запуск BackOffice.exe.")
+    command = build_backoffice_command(installer_path, sanitized_target)
+    backoffice_exe_path = command['backoffice_exe_path']
+    backoffice_args = command['backoffice_args']
     logging.info(f"Первый запуск BackOffice.exe: '{backoffice_exe_path}' с аргументами: '{backoffice_args}'")
 
     try:
-        startupinfo = None
-        if os.name == 'nt':
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-        process = subprocess.Popen(
-            [backoffice_exe_path, backoffice_args],
-            cwd=installer_path,
-            shell=True,
-            startupinfo=startupinfo,
-            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-        )
+        # Без командной оболочки: PID процесса - сам BackOffice, а не обертка cmd.exe.
+        # Окно не скрывается: SW_HIDE применился бы к главному окну BackOffice, а не к консоли
+        process = spawn_process([backoffice_exe_path, backoffice_args], cwd=installer_path, hidden=False)
         logging.info(f"BackOffice.exe успешно запущен (первый раз, PID: {process.pid}).")
 
         return {'backoffice_process': process, 'backoffice_exe_path': backoffice_exe_path, 'backoffice_args': backoffice_args}
@@ -341,10 +402,14 @@ def step_wait_edit_config(config, launch_data, update_status_callback, update_pr
     current_process = launch_data.get('backoffice_process')
     if current_process and current_process.poll() is None:
         logging.info(f"Файл конфигурации найден. Остановка процесса BackOffice (PID: {current_process.pid}) для редактирования файла.")
-        stop_process_by_pid(current_process.pid)
-        time.sleep(1.0)
+        # Первый запуск нужен только для генерации конфига - останавливаем сразу принудительно
+        stop_process_by_pid(current_process.pid, graceful_timeout_sec=0)
+        # Ждем фактического завершения процесса; освобождение файла проверит edit_config_file
+        wait_for_process_exit(current_process, BACKOFFICE_EXIT_TIMEOUT_SEC, "BackOffice")
         launch_data['backoffice_process'] = None
 
+    # Сгенерированный конфиг (до правки) - шаблон для следующих запусков этой версии
+    capture_template(config, launch_data['app_type'], launch_data['version_formatted'], config_file_path)
 
     # Редактируем файл конфигурации
     if not edit_config_file(config_file_path, target_url_or_ip, target_port, config_protocol, target_login, update_status_callback):
@@ -359,19 +424,7 @@ def step_restart(installer_path, backoffice_exe_path, backoffice_args):
     logging.info(f"Перезапуск BackOffice.exe: '{backoffice_exe_path}' с аргументами: '{backoffice_args}'")
 
     try:
-         startupinfo = None
-         if os.name == 'nt':
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-         process = subprocess.Popen(
-            [backoffice_exe_path, backoffice_args],
-            cwd=installer_path,
-            shell=True,
-            startupinfo=startupinfo,
-            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-         )
+         process = spawn_process([backoffice_exe_path, backoffice_args], cwd=installer_path, hidden=False)
          logging.info(f"BackOffice.exe успешно перезапущен (PID: {process.pid}).")
 
          return {'backoffice_process': process}
@@ -381,30 +434,3 @@ def step_restart(installer_path, backoffice_exe_path, backoffice_args):
     except Exception as e:
          raise RuntimeError(f"Ошибка при перезапуске BackOffice.exe: {e}")
 
-
-# Вспомогательная функция для очистки временных файлов/папок при ошибке или отмене
-def _cleanup_temp_files(temp_archive_path, temp_extract_path, local_installer_path):
-     """Вспомогательная функция для очистки временных файлов/папок при ошибке или отмене."""
-     logging.debug("Начата очистка временных файлов/папок.")
-     if os.path.exists(temp_extract_path):
-          try:
-              shutil.rmtree(temp_extract_path, ignore_errors=True)
-              logging.debug(f"Временная папка распаковки '{temp_extract_path}' очищена.")
-          except Exception as temp_e:
-              logging.warning(f"Ошибка при очистке временной папки распаковки '{temp_extract_path}': {temp_e}")
-
-     if os.path.exists(temp_archive_path):
-          try:
-              os.remove(temp_archive_path)
-              logging.debug(f"Временный архив '{temp_archive_path}' удален.")
-          except Exception as temp_e:
-              logging.warning(f"Ошибка при очистке временного архива '{temp_archive_path}' после основной ошибки: {temp_e}")
-
-     installer_root = get_config_value(None, 'Settings', 'InstallerRoot', default='D:\\Backs')
-     if os.path.exists(local_installer_path) and os.path.normpath(local_installer_path) != os.path.normpath(installer_root):
-          try:
-              shutil.rmtree(local_installer_path, ignore_errors=True)
-              logging.debug(f"Локальная папка дистрибутива '{local_installer_path}' очищена после ошибки/отмены.")
-          except Exception as cleanup_e:
-               logging.warning(f"Ошибка при очистке локальной папки дистрибутива '{local_installer_path}' после ошибки: {cleanup_e}")
-     logging.debug("Очистка временных файлов/папок завершена.")
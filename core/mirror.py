@@ -0,0 +1,159 @@
+# core/mirror.py
+
+import os
+import time
+import logging
+import threading
+import urllib.parse
+
+from core.config import get_config_value
+from core.archive_server import ArchiveRequestHandler, ArchiveHTTPServer
+from core.catalog import CATALOG_FILE_NAME, build_catalog, load_catalog, write_catalog
+from core.downloader import download_url_to_file, download_ftp_file, discard_resume_state
+
+# Сколько запрос ждет скачивания отсутствующего архива, прежде чем ответить 503:
+# клиент с таймаутом чтения не должен ждать, пока зеркало скачивает большой архив
+FETCH_WAIT_SEC = 2
+# Через сколько секунд клиенту предлагается повторить запрос (заголовок Retry-After)
+FETCH_RETRY_AFTER_SEC = 10
+
+
+class MirrorRequestHandler(ArchiveRequestHandler):
+    """
+    Обработчик локального зеркала: отдает архивы из каталога зеркала, а отсутствующие
+    архивы скачивает из вышестоящих источников (pull-through) и кэширует.
+    """
+    server_version = "MHrunnerMirror/1.0"
+
+    def fetch_missing_archive(self, file_path, request_path):
+        relative_name = urllib.parse.unquote(request_path).lstrip('/')
+        if not relative_name.lower().endswith('.zip'):
+            return False
+        fetched = self.server.fetch_from_upstream(relative_name, file_path)
+        if fetched is None:
+            # Архив еще скачивается в фоне: клиент перейдет к следующему источнику или повторит запрос позже
+            self._send_plain_error(503, "Archive is being fetched from upstream",
+                                   headers={'Retry-After': str(FETCH_RETRY_AFTER_SEC)})
+        return fetched
+
+
+class MirrorHTTPServer(ArchiveHTTPServer):
+    """HTTP-сервер зеркала с pull-through скачиванием промахов из источников HTTP/FTP."""
+
+    def __init__(self, server_address, config, archive_root):
+        super().__init__(server_address, archive_root,
+                         catalog_provider=self.get_catalog,
+                         handler_class=MirrorRequestHandler,
+                         server_name_label="mirror")
+        self.config = config
+        self.pull_through = get_config_value(config, 'MirrorServer', 'PullThrough', default=True, type_cast=bool)
+        upstream_order_str = get_config_value(config, 'MirrorServer', 'UpstreamOrder', default='http, ftp', type_cast=str)
+        self.upstream_order = [s.strip().lower() for s in upstream_order_str.split(',') if s.strip()]
+        self.upstream_url = get_config_value(config, 'MirrorServer', 'UpstreamUrl', default='', type_cast=str) \
+            or get_config_value(config, 'HttpSource', 'Url', default='', type_cast=str)
+        self.miss_ttl = get_config_value(config, 'MirrorServer', 'NegativeCacheSec', default=60, type_cast=int)
+        self._fetches = {} # relative_name -> threading.Event завершения фонового скачивания
+        self._recent_misses = {} # relative_name -> время неудачной попытки
+        self._fetches_lock = threading.Lock() # _fetches и _recent_misses (потоки обработчиков и скачивания)
+        self._catalog_path = os.path.join(archive_root, CATALOG_FILE_NAME)
+        self._catalog = load_catalog(self._catalog_path)
+        self._catalog_lock = threading.Lock()
+
+    def get_catalog(self):
+        """
+        Каталог зеркала (см. core/catalog.py). Обновляется инкрементально при каждом запросе:
+        перехешируются только новые и измененные архивы, изменения сохраняются на диск.
+        """
+        with self._catalog_lock:
+            previous_archives = (self._catalog or {}).get('archives')
+            self._catalog = build_catalog(self.archive_root, config=self.config, previous=self._catalog)
+            if self._catalog['archives'] != previous_archives:
+                try:
+                    write_catalog(self._catalog, self._catalog_path)
+                except OSError as e:
+                    logging.warning(f"Не удалось сохранить каталог зеркала '{self._catalog_path}': {e}")
+            return self._catalog
+
+    def fetch_from_upstream(self, relative_name, file_path, wait_sec=FETCH_WAIT_SEC):
+        """
+        Запускает фоновое скачивание архива из вышестоящих источников в каталог зеркала
+        (одно на архив: одновременные запросы ждут его же) и ждет его не дольше wait_sec.
+        True - архив в каталоге, False - не найден в источниках, None - еще скачивается.
+        """
+        if not self.pull_through:
+            return False
+
+        with self._fetches_lock:
+            if os.path.isfile(file_path):
+                # Архив уже скачал другой поток
+                return True
+            done_event = self._fetches.get(relative_name)
+            if done_event is None:
+                missed_at = self._recent_misses.get(relative_name)
+                if missed_at is not None and time.monotonic() - missed_at < self.miss_ttl:
+                    logging.debug(f"Архив '{relative_name}' недавно не был найден в источниках, повторная попытка позже.")
+                    return False
+                done_event = self._fetches[relative_name] = threading.Event()
+                threading.Thread(target=self._fetch_archive, args=(relative_name, file_path, done_event),
+                                 name="mirror-fetch", daemon=True).start()
+
+        if not done_event.wait(wait_sec):
+            return None
+        return os.path.isfile(file_path)
+
+    def _fetch_archive(self, relative_name, file_path, done_event):
+        """Скачивание архива в фоновом потоке; done_event устанавливается по завершении."""
+        success = False
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            partial_path = f"{file_path}.{threading.get_ident()}.part"
+            logging.info(f"Зеркало: архив '{relative_name}' отсутствует, скачивание из источников {self.upstream_order}.")
+
+            for source_type in self.upstream_order:
+                if source_type == 'http' and self.upstream_url:
+                    upstream_full_url = urllib.parse.urljoin(self.upstream_url.rstrip('/') + '/', urllib.parse.quote(relative_name))
+                    success = download_url_to_file(self.config, upstream_full_url, partial_path, "HTTP", None, None, 0, 0)
+                elif source_type == 'ftp' and get_config_value(self.config, 'FtpSource', 'Host', default=None, type_cast=str):
+                    success = download_ftp_file(self.config, relative_name, partial_path, None, None, 0, 0)
+                elif source_type not in ('http', 'ftp'):
+                    logging.warning(f"Зеркало: неизвестный вышестоящий источник '{source_type}'. Пропускаем.")
+
+                if success:
+                    os.replace(partial_path, file_path)
+                    logging.info(f"Зеркало: архив '{relative_name}' получен из источника '{source_type}'.")
+                    break
+
+                discard_resume_state(partial_path, remove_partial=True)
+            else:
+                logging.warning(f"Зеркало: архив '{relative_name}' не найден ни в одном из вышестоящих источников.")
+        except Exception as e:
+            success = False
+            logging.error(f"Зеркало: ошибка скачивания архива '{relative_name}': {e}")
+        finally:
+            with self._fetches_lock:
+                del self._fetches[relative_name]
+                if success:
+                    self._recent_misses.pop(relative_name, None)
+                else:
+                    self._recent_misses[relative_name] = time.monotonic()
+            done_event.set()
+
+
+def run_mirror_server(config, archive_root=None, bind_address=None, port=None):
+    """Запускает зеркало в текущем потоке (блокирующий вызов) до прерывания Ctrl+C."""
+    archive_root = archive_root or get_config_value(config, 'MirrorServer', 'Root', default='', type_cast=str)
+    if not archive_root:
+        raise ValueError("Не указан каталог зеркала ([MirrorServer] Root или аргумент командной строки).")
+    bind_address = bind_address if bind_address is not None else get_config_value(config, 'MirrorServer', 'BindAddress', default='', type_cast=str)
+    port = port or get_config_value(config, 'MirrorServer', 'Port', default=8080, type_cast=int)
+
+    os.makedirs(archive_root, exist_ok=True)
+    server = MirrorHTTPServer((bind_address, port), config, archive_root)
+    logging.info(f"Зеркало дистрибутивов запущено на {bind_address or '0.0.0.0'}:{server.server_address[1]} (каталог: '{archive_root}', pull-through: {server.pull_through}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Получен сигнал остановки зеркала.")
+    finally:
+        server.server_close()
+        logging.info("Зеркало дистрибутивов остановлено.")
@@ -0,0 +1,156 @@
+# core/notebook_journal.py - Журналы изменений книжки подключений в общей папке
+#
+# Книжку с нескольких машин нельзя держать в одной базе SQLite на сетевом диске:
+# блокировки SQLite по SMB ненадежны, и одновременные записи портят файл. Поэтому каждая
+# машина хранит свою базу локально, а каждое изменение дописывает одной строкой JSON в
+# собственный журнал [Notebook] JournalDir/<машина>.jsonl. Свой журнал пишет только его
+# владелец, чужие только читаются - с места, где остановилось прошлое чтение. Записи
+# сливаются в базе детерминированно (см. NotebookStore.sync_journal), поэтому результат
+# не зависит от порядка чтения журналов. Владелец периодически сжимает свой журнал до
+# последних записей по каждой записи книжки; новая версия файла получает новое поколение
+# в заголовке, и читатели перечитывают ее с начала. Модуль не зависит от Qt.
+
+import os
+import re
+import json
+import uuid
+import socket
+import getpass
+import logging
+import threading
+
+JOURNAL_FILE_SUFFIX = ".jsonl"
+JOURNAL_OPS = ("add", "edit", "delete")
+# Свой журнал сжимается, когда в нем больше записей, чем этот минимум и чем
+# JOURNAL_COMPACT_RATIO * число записей книжки, которые в нем остаются последними
+JOURNAL_COMPACT_MIN_RECORDS = 1000
+JOURNAL_COMPACT_RATIO = 2
+
+
+def default_machine_id():
+    """Имя журнала этой машины: хост-пользователь (на одной машине у разных пользователей свои базы)."""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = "user"
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', f"{socket.gethostname()}-{user}")
+
+
+def record_order(record):
+    """Порядок записей об одной записи книжки: побеждает более поздняя (время, машина, номер)."""
+    return record['ts'], record['machine'], record['seq']
+
+
+class NotebookJournal:
+    """Файлы журналов в общей папке: дописывание в свой, чтение новых строк чужих, сжатие своего."""
+
+    def __init__(self, journal_dir, machine_id):
+        self.journal_dir = journal_dir
+        self.machine_id = machine_id
+        self.path = os.path.join(journal_dir, f"{machine_id}{JOURNAL_FILE_SUFFIX}")
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _header(machine_id):
+        return {'journal': machine_id, 'generation': uuid.uuid4().hex}
+
+    def append(self, record):
+        """Дописывает запись в свой журнал (файл создается с заголовком при первой записи)."""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8', newline='\n') as f:
+                if f.tell() == 0:
+                    f.write(json.dumps(self._header(self.machine_id)) + "\n")
+                f.write(line)
+
+    def rewrite(self, records):
+        """
+        Сжатие: свой журнал заменяется записями records под новым поколением.
+        Возвращает (поколение, размер файла) - с этого места свой журнал читать не нужно.
+        """
+        header = self._header(self.machine_id)
+        temp_path = f"{self.path}.tmp"
+        with self._lock:
+            with open(temp_path, 'w', encoding='utf-8', newline='\n') as f:
+                f.write(json.dumps(header) + "\n")
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.path)
+            return header['generation'], os.path.getsize(self.path)
+
+    def journal_names(self):
+        try:
+            return sorted(name for name in os.listdir(self.journal_dir) if name.endswith(JOURNAL_FILE_SUFFIX))
+        except FileNotFoundError:
+            return []
+
+    def read_new(self, name, generation, offset):
+        """
+        Новые полные строки журнала name после offset.
+        Возвращает (записи, поколение, новое смещение); при смене поколения (журнал сжат) -
+        все записи файла с начала. Недописанная последняя строка остается до следующего чтения.
+        """
+        with open(os.path.join(self.journal_dir, name), 'rb') as f:
+            header_line = f.readline()
+            if not header_line.endswith(b"\n"):
+                return [], generation, offset # Заголовок еще записывается
+            try:
+                file_generation = json.loads(header_line)['generation']
+            except (ValueError, KeyError, TypeError):
+                logging.warning(f"Журнал книжки '{name}' без заголовка - пропущен.")
+                return [], generation, offset
+            if file_generation != generation:
+                offset = len(header_line)
+            f.seek(offset)
+            data = f.read()
+        complete_size = data.rfind(b"\n") + 1
+        records = []
+        for line in data[:complete_size].splitlines():
+            try:
+                record = json.loads(line)
+                if (record.get('op') in JOURNAL_OPS and isinstance(record.get('uid'), str)
+                        and isinstance(record.get('ts'), (int, float)) and isinstance(record.get('seq'), int)
+                        and isinstance(record.get('machine'), str)
+                        and (record['op'] == 'delete' or all(isinstance(record.get(field), str) for field in ('type', 'name', 'id')))):
+                    records.append(record)
+                    continue
+            except (ValueError, AttributeError):
+                pass
+            logging.warning(f"Пропущена поврежденная запись журнала книжки '{name}': {line[:200]!r}")
+        return records, file_generation, offset + complete_size
+
+
+class NotebookJournalSync:
+    """Периодически подтягивает чужие изменения (store.sync_journal) в фоновом потоке; on_change() - если книжка изменилась."""
+
+    def __init__(self, store, interval_sec, on_change=None):
+        self.store = store
+        self.interval_sec = interval_sec
+        self.on_change = on_change
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="notebook-journal-sync", daemon=True)
+        self._thread.start()
+
+    def sync_now(self):
+        """Синхронизировать, не дожидаясь интервала (например, при открытии окна книжки)."""
+        self._wake_event.set()
+
+    def _run(self):
+        # Первая синхронизация - сразу при запуске
+        while not self._stop_event.is_set():
+            try:
+                if self.store.sync_journal() and self.on_change:
+                    self.on_change()
+            except Exception as e:
+                logging.error(f"Ошибка синхронизации журналов книжки подключений: {e}")
+            self._wake_event.wait(self.interval_sec)
+            self._wake_event.clear()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
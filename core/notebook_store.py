@@ -0,0 +1,648 @@
+# core/notebook_store.py - Хранилище книжки подключений (AnyDesk/LiteManager) в SQLite
+#
+# Раньше книжка целиком читалась из notebook.json в словарь и целиком перезаписывалась
+# при каждом изменении. Теперь каждая запись - строка таблицы connections: добавление,
+# изменение и удаление - отдельные транзакции над одной строкой. Поиск идет по индексу
+# FTS5 (имя, ID, ID без пробелов, тип), который триггеры держат в согласии с таблицей;
+# если SQLite собран без FTS5, используется LIKE. notebook.json импортируется один раз
+# и переименовывается в notebook.json.migrated. Для нечеткого поиска с ранжированием
+# (опечатки, переставленные слова) по имени и ID строится триграммный индекс в памяти
+# (core.fuzzy_index): при первом обращении целиком, дальше - точечно при каждом изменении.
+# Записи типа Server - адреса серверов iiko/Syrve; последний результат их фонового опроса
+# (core.server_monitor) хранится в таблице server_status. Если задан [Notebook] JournalDir,
+# каждое изменение еще и дописывается в журнал этой машины в общей папке (core.notebook_journal),
+# а чужие журналы сливаются в локальную базу (sync_journal). Модуль не зависит от Qt.
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+from core.config import get_config_value
+from core.fuzzy_index import TrigramIndex, DEFAULT_MIN_SIMILARITY
+from core.notebook_journal import (NotebookJournal, default_machine_id, record_order,
+                                   JOURNAL_COMPACT_MIN_RECORDS, JOURNAL_COMPACT_RATIO)
+
+NOTEBOOK_DB_FILE_NAME = "notebook.db"
+NOTEBOOK_JSON_FILE_NAME = "notebook.json"
+NOTEBOOK_SERVER_TYPE = "Server"
+NOTEBOOK_TYPES = ("Anydesk", "LiteManager", NOTEBOOK_SERVER_TYPE)
+SCHEMA_VERSION = 2
+# Сколько ждать, пока другой процесс (второе окно, общая книжка) освободит базу
+BUSY_TIMEOUT_SEC = 5
+
+_stores = {} # путь к базе -> NotebookStore
+_stores_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS connections (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    conn_id TEXT NOT NULL,
+    id_digits TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    uid TEXT, -- Постоянный идентификатор записи для журналов изменений (rowid у каждой машины свой)
+    UNIQUE (type, name)
+);
+-- Порядок вывода книжки: постраничное чтение по (type, name, id) идет по индексу
+CREATE INDEX IF NOT EXISTS connections_type_name ON connections (type, name COLLATE NOCASE);
+DROP INDEX IF EXISTS connections_name;
+-- Последний опрос сервера (записи типа Server); версия остается известной и при ошибке опроса
+CREATE TABLE IF NOT EXISTS server_status (
+    id INTEGER PRIMARY KEY,
+    ok INTEGER NOT NULL,
+    version TEXT,
+    edition TEXT,
+    server_state TEXT,
+    latency_ms INTEGER,
+    error TEXT,
+    checked_at REAL NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS connections_status_ad AFTER DELETE ON connections BEGIN
+    DELETE FROM server_status WHERE id = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS connections_status_au AFTER UPDATE OF conn_id ON connections
+WHEN old.conn_id <> new.conn_id BEGIN
+    DELETE FROM server_status WHERE id = old.id;
+END;
+-- Журналы изменений: последняя запись о каждой записи книжки (в том числе удаленной) со всех машин.
+-- Видимая строка connections для (type, name) - самая поздняя неудаленная запись с этими type и name
+CREATE TABLE IF NOT EXISTS journal_entries (
+    uid TEXT PRIMARY KEY,
+    type TEXT,
+    name TEXT,
+    conn_id TEXT,
+    ts REAL NOT NULL,
+    machine TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    deleted INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS journal_entries_type_name ON journal_entries (type, name);
+-- Докуда прочитан каждый журнал общей папки
+CREATE TABLE IF NOT EXISTS journal_files (
+    name TEXT PRIMARY KEY,
+    generation TEXT NOT NULL,
+    offset INTEGER NOT NULL
+);
+-- Свои записи, еще не дописанные в журнал (папка была недоступна)
+CREATE TABLE IF NOT EXISTS journal_outbox (
+    seq INTEGER PRIMARY KEY,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS journal_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS connections_fts USING fts5(
+    name, conn_id, id_digits, type,
+    content='connections', content_rowid='id', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS connections_ai AFTER INSERT ON connections BEGIN
+    INSERT INTO connections_fts (rowid, name, conn_id, id_digits, type)
+    VALUES (new.id, new.name, new.conn_id, new.id_digits, new.type);
+END;
+CREATE TRIGGER IF NOT EXISTS connections_ad AFTER DELETE ON connections BEGIN
+    INSERT INTO connections_fts (connections_fts, rowid, name, conn_id, id_digits, type)
+    VALUES ('delete', old.id, old.name, old.conn_id, old.id_digits, old.type);
+END;
+CREATE TRIGGER IF NOT EXISTS connections_au AFTER UPDATE ON connections BEGIN
+    INSERT INTO connections_fts (connections_fts, rowid, name, conn_id, id_digits, type)
+    VALUES ('delete', old.id, old.name, old.conn_id, old.id_digits, old.type);
+    INSERT INTO connections_fts (rowid, name, conn_id, id_digits, type)
+    VALUES (new.id, new.name, new.conn_id, new.id_digits, new.type);
+END;
+"""
+
+_COLUMNS = "id, type, name, conn_id"
+_ENTRY_COLUMNS = "uid, type, name, conn_id, ts, machine, seq, deleted"
+_STATUS_FIELDS = ('ok', 'version', 'edition', 'server_state', 'latency_ms', 'error', 'checked_at')
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+class NotebookError(Exception):
+    """Ошибка изменения книжки, понятная пользователю (например, имя уже занято)."""
+
+
+def _new_uid():
+    return uuid.uuid4().hex
+
+
+def get_notebook_db_path(config):
+    """[Notebook] Path или notebook.db рядом с программой."""
+    configured_path = get_config_value(config, 'Notebook', 'Path', default='', type_cast=str)
+    return configured_path or os.path.join(os.path.dirname(sys.argv[0]), NOTEBOOK_DB_FILE_NAME)
+
+
+def _digits(conn_id):
+    return re.sub(r'\D', '', conn_id)
+
+
+def sort_key(connection):
+    """Ключ сортировки записи в разделе - как ORDER BY name COLLATE NOCASE, id (NOCASE сворачивает только ASCII)."""
+    return connection['name'].translate(_ASCII_LOWER), connection['rowid']
+
+
+def _row_to_dict(row):
+    return {'rowid': row[0], 'type': row[1], 'name': row[2], 'id': row[3]}
+
+
+def _fuzzy_text(name, conn_id):
+    # ID с пробелами и без них: "123 456 789" находится и по "123456789"
+    return f"{name} {conn_id} {_digits(conn_id)}"
+
+
+def build_fts_query(text):
+    """Запрос FTS5: каждое слово ввода - префикс (слова соединяются через AND). None - в вводе нет слов."""
+    tokens = re.findall(r'\w+', text.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def _entry_to_record(entry):
+    uid, conn_type, name, conn_id, ts, machine, seq, deleted = entry
+    if deleted:
+        return {'op': 'delete', 'uid': uid, 'ts': ts, 'machine': machine, 'seq': seq}
+    return {'op': 'edit', 'uid': uid, 'type': conn_type, 'name': name, 'id': conn_id, 'ts': ts, 'machine': machine, 'seq': seq}
+
+
+class NotebookStore:
+    def __init__(self, db_path, journal_dir=None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        # Одно соединение на процесс, доступ из потоков - под блокировкой
+        self._connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SEC, check_same_thread=False,
+                                           isolation_level=None)
+        self.has_fts = False
+        self._fuzzy_index = None # TrigramIndex rowid -> имя и ID, строится при первом нечетком поиске
+        self._fuzzy_data_version = None # PRAGMA data_version, на которой построен индекс
+        self._fuzzy_lock = threading.Lock()
+        self._init_schema()
+        self.journal = None
+        self._journal_lock = threading.Lock() # Дописывание и сжатие своего журнала - по одному
+        self._journal_published = False
+        if journal_dir:
+            self.journal = NotebookJournal(journal_dir, self._get_machine_id())
+
+    def _init_schema(self):
+        with self._lock:
+            connection = self._connection
+            connection.executescript(_SCHEMA)
+            try:
+                connection.executescript(_FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError as e:
+                logging.warning(f"SQLite без FTS5 ({e}): поиск по книжке подключений будет медленнее (LIKE).")
+            schema_version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if schema_version < 2:
+                self._add_uids()
+            # Версия схемы фиксируется только после успешного переноса: при ошибке чтения JSON попытка повторится
+            if schema_version < SCHEMA_VERSION and (schema_version >= 1 or self._migrate_json()):
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _add_uids(self):
+        """Версия 2: у каждой записи постоянный uid (база версии 1 создана без этой колонки)."""
+        connection = self._connection
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(connections)")]
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            if 'uid' not in columns:
+                connection.execute("ALTER TABLE connections ADD COLUMN uid TEXT")
+            connection.execute("UPDATE connections SET uid = lower(hex(randomblob(16))) WHERE uid IS NULL")
+            connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS connections_uid ON connections (uid)")
+
+    def _find_legacy_json(self):
+        # Старые версии писали notebook.json в текущий рабочий каталог
+        for candidate in (os.path.join(os.getcwd(), NOTEBOOK_JSON_FILE_NAME),
+                          os.path.join(os.path.dirname(os.path.abspath(self.db_path)), NOTEBOOK_JSON_FILE_NAME)):
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def _migrate_json(self):
+        """Однократный импорт notebook.json ({тип: {имя: ID}}) в одной транзакции. False - файл не прочитан."""
+        json_path = self._find_legacy_json()
+        if json_path is None:
+            return True
+        try:
+            # Старые версии сохраняли файл в кодировке системы по умолчанию
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    legacy = json.load(f)
+            except UnicodeDecodeError:
+                with open(json_path, 'r') as f:
+                    legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Не удалось прочитать '{json_path}' для переноса книжки подключений: {e}")
+            return False
+        now = time.time()
+        rows = [(conn_type, str(name), str(conn_id), _digits(str(conn_id)), now, _new_uid())
+                for conn_type, connections in (legacy.items() if isinstance(legacy, dict) else [])
+                if isinstance(connections, dict)
+                for name, conn_id in connections.items()]
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO connections (type, name, conn_id, id_digits, updated_at, uid) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            connection.execute("COMMIT")
+        except sqlite3.Error:
+            connection.execute("ROLLBACK")
+            raise
+        try:
+            os.replace(json_path, f"{json_path}.migrated")
+        except OSError as e:
+            logging.warning(f"Не удалось переименовать '{json_path}' после переноса: {e}")
+        logging.info(f"Книжка подключений перенесена из '{json_path}' в '{self.db_path}': {len(rows)} записей.")
+        return True
+
+    def _write(self, sql, params, fetch_one=False):
+        """Одна изменяющая команда в своей транзакции. Возвращает курсор (или первую строку результата при fetch_one)."""
+        with self._lock:
+            try:
+                with self._connection:
+                    self._connection.execute("BEGIN IMMEDIATE")
+                    cursor = self._connection.execute(sql, params)
+                    return cursor.fetchone() if fetch_one else cursor
+            except sqlite3.IntegrityError:
+                raise NotebookError(f"Подключение с именем '{params[1]}' уже есть в разделе '{params[0]}'.")
+
+    def _update_fuzzy_index(self, rowid, name=None, conn_id=None):
+        """Точечно обновляет построенный индекс после записи (name None - запись удалена)."""
+        # Блокировка берется после фиксации транзакции: идущее параллельно построение либо уже
+        # прочитало запись, либо дождется этого обновления
+        with self._fuzzy_lock:
+            if self._fuzzy_index is None:
+                return
+            if name is None:
+                self._fuzzy_index.remove(rowid)
+            else:
+                self._fuzzy_index.add(rowid, _fuzzy_text(name, conn_id))
+
+    def add(self, conn_type, name, conn_id):
+        """Добавляет подключение (подключение с тем же типом и именем заменяется). Возвращает rowid."""
+        if self.journal is not None:
+            return self._change_journaled('add', None, conn_type, name, conn_id)
+        row = self._write("INSERT INTO connections (type, name, conn_id, id_digits, updated_at, uid) VALUES (?, ?, ?, ?, ?, ?) "
+                          "ON CONFLICT (type, name) DO UPDATE SET conn_id = excluded.conn_id, "
+                          "id_digits = excluded.id_digits, updated_at = excluded.updated_at RETURNING id",
+                          (conn_type, name, conn_id, _digits(conn_id), time.time(), _new_uid()), fetch_one=True)
+        self._update_fuzzy_index(row[0], name, conn_id)
+        return row[0]
+
+    def update(self, rowid, conn_type, name, conn_id):
+        """Изменяет одну запись. NotebookError - имя уже занято другой записью того же типа."""
+        if self.journal is not None:
+            self._change_journaled('edit', rowid, conn_type, name, conn_id)
+            return
+        self._write("UPDATE connections SET type = ?, name = ?, conn_id = ?, id_digits = ?, updated_at = ? WHERE id = ?",
+                    (conn_type, name, conn_id, _digits(conn_id), time.time(), rowid))
+        self._update_fuzzy_index(rowid, name, conn_id)
+
+    def delete(self, rowid):
+        if self.journal is not None:
+            self._change_journaled('delete', rowid)
+            return
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM connections WHERE id = ?", (rowid,))
+        self._update_fuzzy_index(rowid)
+
+    # --- Журналы изменений (общая папка JournalDir) ---
+
+    def _get_meta(self, key, default=None):
+        row = self._connection.execute("SELECT value FROM journal_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._connection.execute("INSERT OR REPLACE INTO journal_meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _get_machine_id(self):
+        """Имя своего журнала запоминается в базе: переименование компьютера не заводит новый журнал."""
+        with self._lock:
+            with self._connection:
+                machine_id = self._get_meta('machine_id')
+                if machine_id is None:
+                    machine_id = default_machine_id()
+                    self._set_meta('machine_id', machine_id)
+        return machine_id
+
+    def _new_record(self, op, uid, conn_type=None, name=None, conn_id=None):
+        """Своя запись журнала (вызывается под _lock в транзакции): номер - следующий по порядку, в очередь на дописывание."""
+        seq = int(self._get_meta('seq', 0)) + 1
+        self._set_meta('seq', seq)
+        record = {'op': op, 'uid': uid, 'ts': time.time(), 'machine': self.journal.machine_id, 'seq': seq}
+        if op != 'delete':
+            record.update(type=conn_type, name=name, id=conn_id)
+        self._connection.execute("INSERT INTO journal_outbox (seq, record) VALUES (?, ?)",
+                                 (seq, json.dumps(record, ensure_ascii=False)))
+        return record
+
+    def _resolve_visible(self, conn_type, name, changes):
+        """Оставляет в connections для (type, name) только самую позднюю неудаленную запись журналов."""
+        connection = self._connection
+        winner = connection.execute(
+            "SELECT uid, conn_id, ts FROM journal_entries WHERE type = ? AND name = ? AND deleted = 0 "
+            "ORDER BY ts DESC, machine DESC, seq DESC LIMIT 1", (conn_type, name)).fetchone()
+        for rowid, uid in connection.execute("SELECT id, uid FROM connections WHERE type = ? AND name = ?",
+                                             (conn_type, name)).fetchall():
+            if winner is None or uid != winner[0]:
+                connection.execute("DELETE FROM connections WHERE id = ?", (rowid,))
+                changes.append((rowid, None, None))
+        if winner is None:
+            return
+        uid, conn_id, ts = winner
+        # Строка записи переезжает на новое имя с прежним rowid (открытое окно книжки находит ее по rowid)
+        row = connection.execute("UPDATE connections SET type = ?, name = ?, conn_id = ?, id_digits = ?, updated_at = ? "
+                                 "WHERE uid = ? RETURNING id", (conn_type, name, conn_id, _digits(conn_id), ts, uid)).fetchone()
+        if row is None:
+            row = connection.execute("INSERT INTO connections (type, name, conn_id, id_digits, updated_at, uid) "
+                                     "VALUES (?, ?, ?, ?, ?, ?) RETURNING id",
+                                     (conn_type, name, conn_id, _digits(conn_id), ts, uid)).fetchone()
+        changes.append((row[0], name, conn_id))
+
+    def _apply_record(self, record, changes):
+        """
+        Сливает запись журнала (вызывается под _lock в транзакции). Из записей об одном uid действует
+        самая поздняя по record_order, поэтому результат не зависит от порядка чтения журналов.
+        """
+        uid = record['uid']
+        current = self._connection.execute(f"SELECT {_ENTRY_COLUMNS} FROM journal_entries WHERE uid = ?", (uid,)).fetchone()
+        if current is not None and (current[4], current[5], current[6]) >= record_order(record):
+            return
+        deleted = record['op'] == 'delete'
+        if deleted:
+            conn_type, name, conn_id = current[1:4] if current is not None else (None, None, None)
+        else:
+            conn_type, name, conn_id = str(record['type']), str(record['name']), str(record['id'])
+        self._connection.execute(f"INSERT OR REPLACE INTO journal_entries ({_ENTRY_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (uid, conn_type, name, conn_id, record['ts'], str(record['machine']), int(record['seq']), int(deleted)))
+        # Сначала новое место записи, потом прежнее: строка переезжает, а не удаляется и создается заново
+        if not deleted:
+            self._resolve_visible(conn_type, name, changes)
+        if current is not None and current[1] is not None and (current[1], current[2]) != (conn_type, name):
+            self._resolve_visible(current[1], current[2], changes)
+        elif deleted and conn_type is not None:
+            self._resolve_visible(conn_type, name, changes)
+
+    def _apply_changes_to_fuzzy_index(self, changes):
+        for rowid, name, conn_id in changes:
+            self._update_fuzzy_index(rowid, name, conn_id)
+
+    def _change_journaled(self, op, rowid, conn_type=None, name=None, conn_id=None):
+        """Изменение книжки с журналом: запись журнала сливается в базу и уходит в общую папку. Возвращает rowid."""
+        self._publish_local_entries()
+        changes = []
+        with self._lock:
+            with self._connection:
+                self._connection.execute("BEGIN IMMEDIATE")
+                uid = None
+                if rowid is not None:
+                    row = self._connection.execute("SELECT uid FROM connections WHERE id = ?", (rowid,)).fetchone()
+                    if row is None:
+                        return None # Запись уже удалена (например, изменением с другой машины)
+                    uid = row[0]
+                if op != 'delete':
+                    taken = self._connection.execute("SELECT uid FROM connections WHERE type = ? AND name = ?",
+                                                     (conn_type, name)).fetchone()
+                    if taken is not None and taken[0] != uid:
+                        if op != 'add':
+                            raise NotebookError(f"Подключение с именем '{name}' уже есть в разделе '{conn_type}'.")
+                        uid, op = taken[0], 'edit' # Как и без журнала: то же имя - замена ID
+                record = self._new_record(op, uid or _new_uid(), conn_type, name, conn_id)
+                self._apply_record(record, changes)
+                if op != 'delete':
+                    rowid = self._connection.execute("SELECT id FROM connections WHERE uid = ?", (record['uid'],)).fetchone()[0]
+        self._apply_changes_to_fuzzy_index(changes)
+        self._flush_outbox()
+        return rowid
+
+    def _publish_local_entries(self):
+        """Первое включение журнала: записи, которых еще нет в журналах, публикуются как добавленные этой машиной."""
+        if self._journal_published:
+            return
+        with self._lock:
+            with self._connection:
+                self._connection.execute("BEGIN IMMEDIATE")
+                if self._get_meta('published') == '1':
+                    self._journal_published = True
+                    return
+                rows = self._connection.execute(
+                    "SELECT uid, type, name, conn_id FROM connections "
+                    "WHERE uid NOT IN (SELECT uid FROM journal_entries) ORDER BY id").fetchall()
+                changes = []
+                for uid, conn_type, name, conn_id in rows:
+                    self._apply_record(self._new_record('add', uid, conn_type, name, conn_id), changes)
+                self._set_meta('published', 1)
+        self._journal_published = True
+        if rows:
+            logging.info(f"Книжка подключений: {len(rows)} записей опубликовано в журнал '{self.journal.path}'.")
+
+    def _flush_outbox(self):
+        """Дописывает свои записи из очереди в журнал общей папки. False - папка недоступна (записи остаются в очереди)."""
+        with self._journal_lock:
+            with self._lock:
+                pending = self._connection.execute("SELECT seq, record FROM journal_outbox ORDER BY seq").fetchall()
+            for seq, record in pending:
+                try:
+                    self.journal.append(json.loads(record))
+                except OSError as e:
+                    logging.warning(f"Журнал книжки '{self.journal.path}' недоступен, изменения будут дописаны позже: {e}")
+                    return False
+                with self._lock:
+                    with self._connection:
+                        self._connection.execute("DELETE FROM journal_outbox WHERE seq = ?", (seq,))
+                        self._set_meta('own_records', int(self._get_meta('own_records', 0)) + 1)
+        return True
+
+    def _compact_journal(self):
+        """Сжимает свой журнал до последних записей этой машины о каждой записи книжки."""
+        with self._journal_lock:
+            with self._lock:
+                own_records = int(self._get_meta('own_records', 0))
+                entries = self._connection.execute(
+                    f"SELECT {_ENTRY_COLUMNS} FROM journal_entries WHERE machine = ? ORDER BY seq",
+                    (self.journal.machine_id,)).fetchall()
+                has_outbox = self._connection.execute("SELECT 1 FROM journal_outbox LIMIT 1").fetchone() is not None
+            if has_outbox or own_records < max(JOURNAL_COMPACT_MIN_RECORDS, JOURNAL_COMPACT_RATIO * len(entries)):
+                return
+            # Записи, перекрытые записями других машин, не нужны: самая поздняя запись о каждом uid
+            # остается в журнале своей машины, поэтому слияние всех журналов дает прежний результат
+            generation, size = self.journal.rewrite([_entry_to_record(entry) for entry in entries])
+            with self._lock:
+                with self._connection:
+                    self._set_meta('own_records', len(entries))
+                    self._connection.execute("INSERT OR REPLACE INTO journal_files (name, generation, offset) VALUES (?, ?, ?)",
+                                             (os.path.basename(self.journal.path), generation, size))
+            logging.info(f"Журнал книжки '{self.journal.path}' сжат: {own_records} -> {len(entries)} записей.")
+
+    def sync_journal(self):
+        """
+        Дописывает свои отложенные изменения и сливает новые записи журналов общей папки.
+        Возвращает число измененных строк книжки (0 - журнал не включен или изменений нет).
+        """
+        if self.journal is None:
+            return 0
+        try:
+            self._publish_local_entries()
+            self._flush_outbox()
+            with self._lock:
+                positions = {name: (generation, offset) for name, generation, offset
+                             in self._connection.execute("SELECT name, generation, offset FROM journal_files")}
+            changes = []
+            for name in self.journal.journal_names():
+                generation, offset = positions.get(name, (None, 0))
+                records, new_generation, new_offset = self.journal.read_new(name, generation, offset)
+                if (new_generation, new_offset) == (generation, offset):
+                    continue
+                with self._lock:
+                    with self._connection:
+                        self._connection.execute("BEGIN IMMEDIATE")
+                        for record in records:
+                            self._apply_record(record, changes)
+                        self._connection.execute("INSERT OR REPLACE INTO journal_files (name, generation, offset) VALUES (?, ?, ?)",
+                                                 (name, new_generation, new_offset))
+            self._apply_changes_to_fuzzy_index(changes)
+            self._compact_journal()
+        except OSError as e:
+            logging.warning(f"Не удалось прочитать журналы книжки в '{self.journal.journal_dir}': {e}")
+            return 0
+        if changes:
+            logging.info(f"Книжка подключений: из журналов других машин применено изменений: {len(changes)}.")
+        return len(changes)
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM connections").fetchone()[0]
+
+    def get(self, rowid):
+        """Запись {'rowid', 'type', 'name', 'id'} или None, если ее нет."""
+        with self._lock:
+            row = self._connection.execute(f"SELECT {_COLUMNS} FROM connections WHERE id = ?", (rowid,)).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def _filter_condition(self, text):
+        """(условие WHERE, параметры) для строки поиска; (None, []) - фильтра нет."""
+        fts_query = build_fts_query(text)
+        if fts_query is None:
+            return None, []
+        if self.has_fts:
+            return "id IN (SELECT rowid FROM connections_fts WHERE connections_fts MATCH ?)", [fts_query]
+        pattern = f"%{text.strip()}%"
+        return "(name LIKE ? OR conn_id LIKE ? OR id_digits LIKE ? OR type LIKE ?)", [pattern] * 4
+
+    def search(self, text="", limit=None, conn_type=None, after=None):
+        """
+        Записи {'rowid', 'type', 'name', 'id'}, отсортированные по типу и имени.
+        Пустой text - все записи; иначе каждое слово ввода должно быть началом слова в имени, ID или типе.
+        conn_type - только один раздел; after - (имя, rowid) последней полученной записи раздела
+        для чтения следующей страницы (сортировка имен - как у SQLite NOCASE, см. sort_key).
+        """
+        conditions, params = [], []
+        filter_condition, filter_params = self._filter_condition(text)
+        if filter_condition:
+            conditions.append(filter_condition)
+            params.extend(filter_params)
+        if conn_type is not None:
+            conditions.append("type = ?")
+            params.append(conn_type)
+        if after is not None:
+            conditions.append("(name COLLATE NOCASE, id) > (?, ?)")
+            params.extend(after)
+        where_sql = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        limit_sql = f" LIMIT {int(limit)}" if limit else ""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {_COLUMNS} FROM connections{where_sql} ORDER BY type, name COLLATE NOCASE, id{limit_sql}",
+                params).fetchall()
+        return [_row_to_dict(row) for row in rows]
+
+    def matches(self, rowid, text):
+        """Подходит ли запись под строку поиска (для точечного обновления списка после изменения)."""
+        filter_condition, filter_params = self._filter_condition(text)
+        where_sql = f"id = ? AND {filter_condition}" if filter_condition else "id = ?"
+        with self._lock:
+            return self._connection.execute(f"SELECT 1 FROM connections WHERE {where_sql}",
+                                            [rowid] + filter_params).fetchone() is not None
+
+    def _get_fuzzy_index(self):
+        """Индекс нечеткого поиска (вызывается под _fuzzy_lock); перестраивается, если базу изменил другой процесс."""
+        with self._lock:
+            # data_version меняется только от транзакций других соединений - свои изменения индекс учитывает сам
+            data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+            if self._fuzzy_index is not None and data_version == self._fuzzy_data_version:
+                return self._fuzzy_index
+            started_at = time.monotonic()
+            rows = self._connection.execute("SELECT id, name, conn_id FROM connections").fetchall()
+        index = TrigramIndex()
+        index.build((rowid, _fuzzy_text(name, conn_id)) for rowid, name, conn_id in rows)
+        self._fuzzy_index, self._fuzzy_data_version = index, data_version
+        logging.debug(f"Индекс нечеткого поиска книжки построен: {len(rows)} записей за {time.monotonic() - started_at:.2f} сек.")
+        return index
+
+    def warm_fuzzy_index(self):
+        """Строит индекс нечеткого поиска заранее (из фонового потока), чтобы первый поиск его не ждал."""
+        with self._fuzzy_lock:
+            self._get_fuzzy_index()
+
+    def fuzzy_search(self, text, limit=10, min_similarity=DEFAULT_MIN_SIMILARITY):
+        """
+        До limit записей, похожих на text (опечатки, порядок слов, часть ID), лучшие первыми:
+        [(запись {'rowid', 'type', 'name', 'id'}, оценка)], оценка - см. TrigramIndex.search.
+        """
+        with self._fuzzy_lock:
+            ranked = self._get_fuzzy_index().search(text, limit=limit, min_similarity=min_similarity)
+        if not ranked:
+            return []
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {_COLUMNS} FROM connections WHERE id IN ({', '.join('?' * len(ranked))})",
+                [rowid for rowid, _ in ranked]).fetchall()
+        connections = {row[0]: _row_to_dict(row) for row in rows}
+        return [(connections[rowid], score) for rowid, score in ranked if rowid in connections]
+
+    def fuzzy_score(self, rowid, text, min_similarity=DEFAULT_MIN_SIMILARITY):
+        """Оценка одной записи для text или None, если она не подходит (для точечного обновления списка)."""
+        with self._fuzzy_lock:
+            return self._get_fuzzy_index().score(rowid, text, min_similarity=min_similarity)
+
+    def get_server_statuses(self):
+        """Последние результаты опроса серверов: {rowid: {'ok', 'version', 'edition', 'server_state', 'latency_ms', 'error', 'checked_at'}}."""
+        with self._lock:
+            rows = self._connection.execute(f"SELECT id, {', '.join(_STATUS_FIELDS)} FROM server_status").fetchall()
+        return {row[0]: dict(zip(_STATUS_FIELDS, row[1:]), ok=bool(row[1])) for row in rows}
+
+    def save_server_status(self, rowid, status):
+        """Сохраняет результат опроса сервера (запись книжки могла быть удалена - тогда ничего не делает)."""
+        with self._lock:
+            with self._connection:
+                self._connection.execute(
+                    f"INSERT OR REPLACE INTO server_status (id, {', '.join(_STATUS_FIELDS)}) "
+                    f"SELECT id, {', '.join('?' * len(_STATUS_FIELDS))} FROM connections WHERE id = ?",
+                    [status.get(field) for field in _STATUS_FIELDS] + [rowid])
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def get_notebook_store(config):
+    """Общее для процесса хранилище книжки (открывается и при необходимости переносит JSON при первом обращении)."""
+    db_path = os.path.abspath(get_notebook_db_path(config))
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            journal_dir = get_config_value(config, 'Notebook', 'JournalDir', default='', type_cast=str)
+            store = _stores[db_path] = NotebookStore(db_path, journal_dir)
+        return store
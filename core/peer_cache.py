@@ -0,0 +1,328 @@
+# core/peer_cache.py
+
+import os
+import json
+import time
+import uuid
+import socket
+import shutil
+import hashlib
+import logging
+import threading
+
+from core.config import get_config_value
+
+PEER_SERVICE_NAME = "mhrunner-peer"
+SHA256_SUFFIX = ".sha256"
+
+# Идентификатор этого экземпляра, чтобы не принимать собственные анонсы за чужие
+INSTANCE_ID = uuid.uuid4().hex
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def is_peer_cache_enabled(config):
+    return get_config_value(config, 'PeerCache', 'Enabled', default=False, type_cast=bool)
+
+
+def get_peer_cache_dir(config):
+    """Каталог кэша архивов. По умолчанию - подпапка _archives в InstallerRoot."""
+    cache_dir = get_config_value(config, 'PeerCache', 'CacheDir', default='', type_cast=str)
+    if not cache_dir:
+        installer_root = get_config_value(config, 'Settings', 'InstallerRoot', default='D:\\Backs')
+        cache_dir = os.path.join(installer_root, '_archives')
+    return cache_dir
+
+
+def get_cache_key(app_type, version_formatted):
+    """Имя архива в кэше. Не зависит от шаблонов имен источников, одинаково у всех пиров."""
+    return f"{app_type}_{version_formatted}.zip"
+
+
+def compute_sha256(file_path, buffer_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            buffer = f.read(buffer_size)
+            if not buffer:
+                break
+            sha256.update(buffer)
+    return sha256.hexdigest()
+
+
+def _read_sha256_sidecar(archive_path):
+    """Возвращает SHA-256 из файла-спутника, если он актуален (не старше архива)."""
+    sidecar_path = archive_path + SHA256_SUFFIX
+    try:
+        if os.path.getmtime(sidecar_path) < os.path.getmtime(archive_path):
+            return None
+        with open(sidecar_path, 'r', encoding='utf-8') as f:
+            value = f.read().strip()
+        return value or None
+    except OSError:
+        return None
+
+
+def _write_sha256_sidecar(archive_path, sha256):
+    try:
+        with open(archive_path + SHA256_SUFFIX, 'w', encoding='utf-8') as f:
+            f.write(sha256)
+    except OSError as e:
+        logging.warning(f"Не удалось записать контрольную сумму для '{archive_path}': {e}")
+
+
+def store_archive_in_cache(config, app_type, version_formatted, archive_path, move=False):
+    """
+    Помещает скачанный архив в кэш пиров. При move=True архив перемещается (временный
+    архив после успешной распаковки все равно удаляется), иначе копируется.
+    Возвращает путь к архиву в кэше или None.
+    """
+    cache_dir = get_peer_cache_dir(config)
+    cached_path = os.path.join(cache_dir, get_cache_key(app_type, version_formatted))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        partial_path = cached_path + ".part"
+        if move:
+            shutil.move(archive_path, partial_path)
+        else:
+            shutil.copyfile(archive_path, partial_path)
+        sha256 = compute_sha256(partial_path)
+        os.replace(partial_path, cached_path)
+        _write_sha256_sidecar(cached_path, sha256)
+        logging.info(f"Архив сохранен в кэш пиров: '{cached_path}' (SHA-256: {sha256}).")
+        return cached_path
+    except Exception as e:
+        logging.warning(f"Не удалось сохранить архив '{archive_path}' в кэш пиров '{cache_dir}': {e}")
+        return None
+
+
+def build_peer_catalog(cache_dir):
+    """Формирует каталог архивов кэша: {имя: {size, sha256}}."""
+    archives = {}
+    if not os.path.isdir(cache_dir):
+        return {'service': PEER_SERVICE_NAME, 'instance': INSTANCE_ID, 'archives': archives}
+
+    for entry in os.scandir(cache_dir):
+        if not entry.is_file() or not entry.name.lower().endswith('.zip'):
+            continue
+        sha256 = _read_sha256_sidecar(entry.path)
+        if sha256 is None:
+            try:
+                sha256 = compute_sha256(entry.path)
+                _write_sha256_sidecar(entry.path, sha256)
+            except OSError as e:
+                logging.warning(f"Не удалось вычислить SHA-256 для '{entry.path}': {e}")
+                continue
+        archives[entry.name] = {'size': entry.stat().st_size, 'sha256': sha256}
+
+    return {'service': PEER_SERVICE_NAME, 'instance': INSTANCE_ID, 'archives': archives}
+
+
+class PeerCacheService:
+    """
+    Раздает кэш архивов по HTTP (с поддержкой Range) и анонсирует себя в локальной
+    сети UDP-широковещанием. Отвечает на запросы обнаружения от других пиров.
+    """
+
+    def __init__(self, config):
+        self.cache_dir = get_peer_cache_dir(config)
+        self.serve_port = get_config_value(config, 'PeerCache', 'ServePort', default=8765, type_cast=int)
+        self.discovery_port = get_config_value(config, 'PeerCache', 'DiscoveryPort', default=8766, type_cast=int)
+        self.broadcast_enabled = get_config_value(config, 'PeerCache', 'Broadcast', default=True, type_cast=bool)
+        self.announce_interval = get_config_value(config, 'PeerCache', 'AnnounceIntervalSec', default=60, type_cast=int)
+        self.http_server = None
+        self._udp_socket = None
+        self._stop_event = threading.Event()
+        self._known_peers = {} # (host, port) -> время последнего анонса
+        self._known_peers_lock = threading.Lock()
+
+    def start(self):
+        from core.archive_server import start_archive_server # http.server нужен, только если кэш пиров включен
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.http_server = start_archive_server('', self.serve_port, self.cache_dir,
+                                                catalog_provider=lambda: build_peer_catalog(self.cache_dir),
+                                                server_name_label="peer-cache")
+        if self.broadcast_enabled:
+            try:
+                self._udp_socket = _create_udp_socket(bind_port=self.discovery_port)
+                threading.Thread(target=self._discovery_loop, name="peer-cache-discovery", daemon=True).start()
+                threading.Thread(target=self._announce_loop, name="peer-cache-announce", daemon=True).start()
+            except OSError as e:
+                logging.warning(f"Не удалось открыть UDP-порт обнаружения пиров {self.discovery_port}: {e}")
+                self._udp_socket = None
+
+    def stop(self):
+        self._stop_event.set()
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+        if self._udp_socket:
+            self._udp_socket.close()
+            self._udp_socket = None
+        logging.info("Сервис кэша пиров остановлен.")
+
+    def get_announced_peers(self, max_age_sec=None):
+        max_age_sec = max_age_sec or self.announce_interval * 3
+        now = time.monotonic()
+        with self._known_peers_lock:
+            return [peer for peer, seen_at in self._known_peers.items() if now - seen_at <= max_age_sec]
+
+    def _announce_message(self, message_type):
+        return json.dumps({'type': message_type, 'service': PEER_SERVICE_NAME,
+                           'instance': INSTANCE_ID, 'port': self.serve_port}).encode('utf-8')
+
+    def _announce_loop(self):
+        udp_socket = self._udp_socket
+        while not self._stop_event.is_set():
+            try:
+                udp_socket.sendto(self._announce_message('announce'), ('<broadcast>', self.discovery_port))
+            except OSError as e:
+                logging.debug(f"Ошибка отправки анонса кэша пиров: {e}")
+            self._stop_event.wait(self.announce_interval)
+
+    def _discovery_loop(self):
+        udp_socket = self._udp_socket
+        while not self._stop_event.is_set():
+            try:
+                data, address = udp_socket.recvfrom(4096)
+            except OSError:
+                if self._stop_event.is_set():
+                    break
+                continue
+
+            message = _parse_peer_message(data)
+            if message is None or message.get('instance') == INSTANCE_ID:
+                continue
+
+            if message.get('type') == 'discover':
+                try:
+                    udp_socket.sendto(self._announce_message('announce'), address)
+                except OSError as e:
+                    logging.debug(f"Ошибка ответа на запрос обнаружения от {address}: {e}")
+            elif message.get('type') == 'announce' and message.get('port'):
+                with self._known_peers_lock:
+                    self._known_peers[(address[0], int(message['port']))] = time.monotonic()
+
+
+def _create_udp_socket(bind_port=0):
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    udp_socket.bind(('', bind_port))
+    return udp_socket
+
+
+def _parse_peer_message(data):
+    try:
+        message = json.loads(data.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(message, dict) or message.get('service') != PEER_SERVICE_NAME:
+        return None
+    # Широковещательный пакет не аутентифицирован: анонс без корректного порта отбрасывается целиком
+    port = message.get('port')
+    if (message.get('type') == 'announce' or port is not None) and not (type(port) is int and 0 < port <= 65535):
+        logging.debug(f"Отброшено сообщение пира с некорректным портом: {port!r}")
+        return None
+    return message
+
+
+def start_peer_cache_service(config):
+    """Запускает сервис кэша пиров, если он включен в конфиге. Повторный вызов возвращает уже запущенный сервис."""
+    global _service
+    if not is_peer_cache_enabled(config):
+        return None
+    with _service_lock:
+        if _service is None:
+            service = PeerCacheService(config)
+            try:
+                service.start()
+            except OSError as e:
+                logging.error(f"Не удалось запустить сервис кэша пиров на порту {service.serve_port}: {e}")
+                return None
+            _service = service
+        return _service
+
+
+def _parse_configured_peers(config):
+    peers = []
+    default_port = get_config_value(config, 'PeerCache', 'ServePort', default=8765, type_cast=int)
+    peers_str = get_config_value(config, 'PeerCache', 'Peers', default='', type_cast=str)
+    for peer in (p.strip() for p in peers_str.split(',')):
+        if not peer:
+            continue
+        host, _, port_str = peer.rpartition(':')
+        if host and port_str.isdigit():
+            peers.append((host, int(port_str)))
+        else:
+            peers.append((peer, default_port))
+    return peers
+
+
+def discover_peers(config):
+    """
+    Возвращает список пиров (host, port): из конфига, из полученных анонсов
+    и ответивших на широковещательный запрос обнаружения.
+    """
+    peers = _parse_configured_peers(config)
+
+    if _service is not None:
+        peers.extend(_service.get_announced_peers())
+
+    if get_config_value(config, 'PeerCache', 'Broadcast', default=True, type_cast=bool):
+        discovery_port = get_config_value(config, 'PeerCache', 'DiscoveryPort', default=8766, type_cast=int)
+        timeout_ms = get_config_value(config, 'PeerCache', 'DiscoveryTimeoutMs', default=500, type_cast=int)
+        query = json.dumps({'type': 'discover', 'service': PEER_SERVICE_NAME, 'instance': INSTANCE_ID}).encode('utf-8')
+        try:
+            with _create_udp_socket() as udp_socket:
+                udp_socket.sendto(query, ('<broadcast>', discovery_port))
+                deadline = time.monotonic() + timeout_ms / 1000
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    udp_socket.settimeout(remaining)
+                    try:
+                        data, address = udp_socket.recvfrom(4096)
+                    except socket.timeout:
+                        break
+                    message = _parse_peer_message(data)
+                    if message and message.get('type') == 'announce' and message.get('instance') != INSTANCE_ID and message.get('port'):
+                        peers.append((address[0], int(message['port'])))
+        except OSError as e:
+            logging.debug(f"Широковещательное обнаружение пиров не удалось: {e}")
+
+    # Убираем дубликаты, сохраняя порядок (сначала настроенные пиры)
+    unique_peers = list(dict.fromkeys(peers))
+    logging.debug(f"Обнаружены пиры кэша: {unique_peers}")
+    return unique_peers
+
+
+def find_peer_with_archive(config, cache_key):
+    """
+    Опрашивает каталоги пиров и возвращает (base_url, sha256, size) первого пира,
+    у которого есть архив cache_key, или None.
+    """
+    import requests # Тяжелый импорт - только когда действительно ищем архив у пиров
+    timeout_ms = get_config_value(config, 'PeerCache', 'DiscoveryTimeoutMs', default=500, type_cast=int)
+    for host, port in discover_peers(config):
+        base_url = f"http://{host}:{port}"
+        try:
+            response = requests.get(f"{base_url}/catalog.json", timeout=max(timeout_ms / 1000, 1.0))
+            response.raise_for_status()
+            catalog = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logging.debug(f"Пир {base_url} недоступен или вернул некорректный каталог: {e}")
+            continue
+
+        if catalog.get('instance') == INSTANCE_ID:
+            continue
+        archive_info = catalog.get('archives', {}).get(cache_key)
+        if archive_info and archive_info.get('sha256'):
+            logging.info(f"Архив '{cache_key}' найден у пира {base_url} (SHA-256: {archive_info['sha256']}).")
+            return base_url, archive_info['sha256'], archive_info.get('size', 0)
+
+    logging.debug(f"Ни один пир не предложил архив '{cache_key}'.")
+    return None
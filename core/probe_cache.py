@@ -0,0 +1,120 @@
+# core/probe_cache.py - Кэш ответов getServerMonitoringInfo
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+
+from core.config import get_config_value
+
+PROBE_CACHE_FILE_NAME = "probe_cache.json"
+
+_entries = {} # ключ -> {'server_info', 'probe_url', 'fetched_at'}
+_lock = threading.Lock()
+_disk_loaded = False
+
+
+def make_probe_key(parsed_target):
+    """Нормализованный ключ кэша по результату parse_target_string: схема://хост:порт."""
+    return f"{parsed_target['Scheme']}://{parsed_target['UrlOrIp'].lower()}:{parsed_target['Port']}"
+
+
+def _get_ttl(config):
+    return get_config_value(config, 'ProbeCache', 'TtlSec', default=120, type_cast=int)
+
+
+def _is_disk_enabled(config):
+    return get_config_value(config, 'ProbeCache', 'DiskCache', default=False, type_cast=bool)
+
+
+def _get_disk_path():
+    return os.path.join(os.path.dirname(sys.argv[0]), PROBE_CACHE_FILE_NAME)
+
+
+def _load_disk_layer(config):
+    """Однократно подгружает сохраненные на диске ответы (если дисковый слой включен)."""
+    global _disk_loaded
+    if _disk_loaded or not _is_disk_enabled(config):
+        return
+    _disk_loaded = True
+    try:
+        with open(_get_disk_path(), 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        if isinstance(stored, dict):
+            for key, entry in stored.items():
+                if key not in _entries or _entries[key]['fetched_at'] < entry.get('fetched_at', 0):
+                    _entries[key] = entry
+        logging.debug(f"Загружено {len(stored)} записей кэша опроса серверов с диска.")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.warning(f"Не удалось прочитать кэш опроса серверов '{_get_disk_path()}': {e}")
+
+
+def _save_disk_layer(config):
+    if not _is_disk_enabled(config):
+        return
+    ttl = _get_ttl(config)
+    now = time.time()
+    fresh_entries = {k: v for k, v in _entries.items() if now - v['fetched_at'] < ttl}
+    disk_path = _get_disk_path()
+    try:
+        with open(f"{disk_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(fresh_entries, f, ensure_ascii=False)
+        os.replace(f"{disk_path}.tmp", disk_path)
+    except OSError as e:
+        logging.warning(f"Не удалось сохранить кэш опроса серверов '{disk_path}': {e}")
+
+
+def get_cached_probe(config, parsed_target):
+    """
+    Возвращает свежую запись {'server_info', 'probe_url', 'fetched_at'} для сервера
+    или None, если записи нет или она старше [ProbeCache] TtlSec.
+    """
+    ttl = _get_ttl(config)
+    if ttl <= 0:
+        return None
+    key = make_probe_key(parsed_target)
+    with _lock:
+        _load_disk_layer(config)
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry['fetched_at'] >= ttl:
+            del _entries[key]
+            return None
+        return dict(entry)
+
+
+def get_probe_cache_snapshot(config):
+    """Список свежих записей кэша {'key', 'version', 'age_sec'} (для консольной команды cache)."""
+    ttl = _get_ttl(config)
+    now = time.time()
+    with _lock:
+        _load_disk_layer(config)
+        return [{'key': key, 'version': (entry.get('server_info') or {}).get('version'), 'age_sec': int(now - entry['fetched_at'])}
+                for key, entry in sorted(_entries.items()) if now - entry['fetched_at'] < ttl]
+
+
+def store_probe(config, parsed_target, server_info, probe_url):
+    """Сохраняет успешный ответ сервера в кэш."""
+    if _get_ttl(config) <= 0:
+        return
+    key = make_probe_key(parsed_target)
+    with _lock:
+        _load_disk_layer(config)
+        _entries[key] = {'server_info': server_info, 'probe_url': probe_url, 'fetched_at': time.time()}
+        _save_disk_layer(config)
+
+
+def invalidate_probe(config, parsed_target=None):
+    """Удаляет запись сервера из кэша (или весь кэш, если parsed_target не указан)."""
+    with _lock:
+        _load_disk_layer(config)
+        if parsed_target is None:
+            _entries.clear()
+        else:
+            _entries.pop(make_probe_key(parsed_target), None)
+        _save_disk_layer(config)
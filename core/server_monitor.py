@@ -0,0 +1,195 @@
+# core/server_monitor.py - Фоновый опрос серверов iiko/Syrve из книжки подключений
+#
+# Записи книжки типа Server опрашиваются getServerMonitoringInfo пакетами через
+# check_servers_batch (не больше [ServerMonitor] Concurrency запросов одновременно).
+# У каждого сервера свой срок следующего опроса: IntervalSec со случайным разбросом Jitter,
+# поэтому опросы не собираются в одну волну, а после перезапуска учитывается время
+# последнего сохраненного опроса (в том числе сделанного другим экземпляром с общей книжкой).
+# Результат сохраняется в книжку (server_status) и в кэш опроса (probe_cache), так что
+# запуск BackOffice сразу после опроса не ждет ответа сервера. Когда версия сервера
+# меняется, вызывается on_version_changed и, если включено PrepareOnVersionChange,
+# дистрибутив новой версии готовится заранее (core.speculative). Модуль не зависит от Qt.
+
+import time
+import random
+import logging
+import threading
+
+from core.config import get_config_value
+from core.batch_check import check_servers_batch
+from core.notebook_store import NOTEBOOK_SERVER_TYPE
+from core.speculative import SpeculativePrep
+from utils.url_utils import determine_app_type, format_version
+
+# Первый опрос серверов без сохраненного результата распределяется по этому интервалу
+STARTUP_SPREAD_SEC = 10
+# Как часто перечитывается список серверов книжки (новые, удаленные, измененные адреса)
+RESCAN_INTERVAL_SEC = 30
+# Серверы, срок опроса которых наступит в пределах этого окна, опрашиваются одним пакетом
+BATCH_WINDOW_SEC = 15
+
+
+def is_server_monitor_enabled(config):
+    return get_config_value(config, 'ServerMonitor', 'Enabled', default=True, type_cast=bool)
+
+
+class ServerMonitor:
+    """
+    Периодический опрос серверов книжки в фоновом потоке.
+    on_status(event) - после каждого опроса, on_version_changed(event) - при смене версии;
+    event = {'rowid', 'name', 'target', 'status', 'previous_version'}. Колбэки вызываются
+    в потоке опроса.
+    """
+
+    def __init__(self, config, store, on_status=None, on_version_changed=None):
+        self.config = config
+        self.store = store
+        self.on_status = on_status
+        self.on_version_changed = on_version_changed
+        self._statuses = {} # rowid -> последний статус (как в store.get_server_statuses)
+        self._targets = {} # rowid -> адрес, по которому назначен срок опроса
+        self._due = {} # rowid -> time.monotonic() следующего опроса
+        self._preparations = {} # (app_type, версия) -> SpeculativePrep, пока подготовка идет
+        self._preparations_lock = threading.Lock() # stop() вызывается из потока GUI
+        self._probe_requests = set() # rowid (None - все серверы), запрошенные probe_now
+        self._probe_requests_lock = threading.Lock() # probe_now вызывается из других потоков
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    def update_config(self, config):
+        self.config = config
+        self._wake_event.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="server-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        with self._preparations_lock:
+            preparations = list(self._preparations.values())
+            self._preparations.clear()
+        for preparation in preparations:
+            preparation.cancel()
+
+    def probe_now(self, rowid=None):
+        """Опросить сервер (или все серверы), не дожидаясь срока. Вызывается из любого потока."""
+        with self._probe_requests_lock:
+            self._probe_requests.add(rowid)
+        self._wake_event.set()
+
+    def _next_due(self, now):
+        interval = get_config_value(self.config, 'ServerMonitor', 'IntervalSec', default=300, type_cast=float)
+        jitter = min(max(get_config_value(self.config, 'ServerMonitor', 'Jitter', default=0.2, type_cast=float), 0.0), 1.0)
+        return now + interval * random.uniform(1 - jitter, 1 + jitter)
+
+    def _rescan(self):
+        """Сверяет расписание со списком серверов книжки. Возвращает {rowid: запись}."""
+        servers = {connection['rowid']: connection for connection in self.store.search(conn_type=NOTEBOOK_SERVER_TYPE)}
+        self._statuses = self.store.get_server_statuses()
+        now, wall_now = time.monotonic(), time.time()
+        for rowid in list(self._due):
+            if rowid not in servers:
+                del self._due[rowid]
+                self._targets.pop(rowid, None)
+        for rowid, connection in servers.items():
+            if self._targets.get(rowid) == connection['id']:
+                continue
+            self._targets[rowid] = connection['id']
+            status = self._statuses.get(rowid)
+            spread_due_at = now + random.uniform(0, STARTUP_SPREAD_SEC)
+            if status is None:
+                self._due[rowid] = spread_due_at
+            else:
+                # Опрос, сохраненный ранее (или другим экземпляром), сдвигает срок следующего
+                self._due[rowid] = max(spread_due_at, self._next_due(now) - max(0.0, wall_now - status['checked_at']))
+        return servers
+
+    def _run(self):
+        servers, rescanned_at = {}, None
+        while not self._stop_event.is_set():
+            if not is_server_monitor_enabled(self.config):
+                self._wake_event.wait(RESCAN_INTERVAL_SEC)
+                self._wake_event.clear()
+                continue
+            now = time.monotonic()
+            with self._probe_requests_lock:
+                probe_requests, self._probe_requests = self._probe_requests, set()
+            try:
+                # Запрошенного сервера еще нет в расписании (только что добавлен в книжку) - перечитываем список
+                if (rescanned_at is None or now - rescanned_at >= RESCAN_INTERVAL_SEC
+                        or any(rowid is not None and rowid not in self._due for rowid in probe_requests)):
+                    servers, rescanned_at = self._rescan(), now
+                for rowid in (list(self._due) if None in probe_requests else probe_requests & self._due.keys()):
+                    self._due[rowid] = now
+                if any(due_at <= now for due_at in self._due.values()):
+                    due_rowids = [rowid for rowid, due_at in self._due.items()
+                                  if due_at <= now + BATCH_WINDOW_SEC and rowid in servers]
+                    self._probe(servers, due_rowids)
+            except Exception as e:
+                logging.error(f"Ошибка фонового опроса серверов книжки: {e}")
+            if self._stop_event.is_set():
+                return
+            next_due_at = min(self._due.values(), default=None)
+            wait_sec = RESCAN_INTERVAL_SEC if next_due_at is None else max(0.0, min(next_due_at - time.monotonic(), RESCAN_INTERVAL_SEC))
+            self._wake_event.wait(wait_sec)
+            self._wake_event.clear()
+
+    def _probe(self, servers, rowids):
+        rowids_by_target = {}
+        for rowid in rowids:
+            rowids_by_target.setdefault(servers[rowid]['id'], []).append(rowid)
+            # Срок назначается до опроса: сервер, опрос которого прервался, не опрашивается в цикле
+            self._due[rowid] = self._next_due(time.monotonic())
+        concurrency = get_config_value(self.config, 'ServerMonitor', 'Concurrency', default=8, type_cast=int)
+        logging.debug(f"Фоновый опрос серверов книжки: {len(rowids_by_target)}.")
+
+        def on_result(result):
+            for rowid in rowids_by_target.get(result['target'], ()):
+                self._handle_result(servers[rowid], result)
+
+        check_servers_batch(self.config, list(rowids_by_target), on_result=on_result,
+                            is_canceled_callback=self._stop_event.is_set, concurrency=concurrency)
+
+    def _handle_result(self, connection, result):
+        rowid = connection['rowid']
+        previous = self._statuses.get(rowid) or {}
+        status = {'ok': result['ok'], 'checked_at': time.time(), 'error': result['error'],
+                  'latency_ms': result['elapsed_ms'] if result['ok'] else None}
+        for field in ('version', 'edition', 'server_state'):
+            # Сервер не ответил - показываем последнее известное
+            status[field] = result[field] if result['ok'] else previous.get(field)
+        self._statuses[rowid] = status
+        self.store.save_server_status(rowid, status)
+        event = {'rowid': rowid, 'name': connection['name'], 'target': connection['id'], 'status': status,
+                 'previous_version': previous.get('version')}
+        if self.on_status:
+            self.on_status(event)
+        if result['ok'] and previous.get('version') and previous['version'] != status['version']:
+            logging.info(f"Версия сервера '{connection['name']}' ({connection['id']}) изменилась: "
+                         f"{previous['version']} -> {status['version']}.")
+            if get_config_value(self.config, 'ServerMonitor', 'PrepareOnVersionChange', default=True, type_cast=bool):
+                self._prepare_installer(connection, status)
+            if self.on_version_changed:
+                self.on_version_changed(event)
+
+    def _prepare_installer(self, connection, status):
+        """Упреждающая подготовка дистрибутива новой версии (одна на тип приложения и версию)."""
+        app_info = determine_app_type(connection['id'], status['edition'])
+        if app_info is None:
+            logging.debug(f"Тип приложения '{connection['id']}' (edition '{status['edition']}') не определен, дистрибутив не готовится.")
+            return
+        version_formatted = format_version(status['version'])
+        key = (app_info['AppType'], version_formatted)
+        with self._preparations_lock:
+            # Завершенные подготовки не храним: готовый дистрибутив и так найдется в InstallerRoot
+            for finished_key in [k for k, preparation in self._preparations.items() if preparation.is_finished()]:
+                del self._preparations[finished_key]
+            if key in self._preparations or self._stop_event.is_set():
+                return
+            try:
+                self._preparations[key] = SpeculativePrep(self.config, version_formatted, [(app_info['AppType'], app_info['Vendor'])])
+            except Exception as e:
+                logging.warning(f"Не удалось начать подготовку дистрибутива {app_info['AppType']} {version_formatted}: {e}")
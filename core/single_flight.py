@@ -0,0 +1,169 @@
+# core/single_flight.py - Одна подготовка дистрибутива на ключ: между потоками и между процессами
+#
+# Несколько запусков одной версии (задачи в одном окне, два окна, два пользователя на
+# одном RDS-сервере) не должны одновременно удалять и распаковывать одну и ту же папку
+# в InstallerRoot. Первый вызов с данным ключом становится ведущим и выполняет работу,
+# остальные вызовы этого процесса ждут его результат и получают тот же путь (или ту же
+# ошибку). Между процессами ведущий дополнительно берет блокировку ОС на файл рядом с
+# InstallerRoot; ОС снимает ее сама, если процесс-держатель аварийно завершился.
+
+import os
+import time
+import logging
+import threading
+
+# Как часто ожидающие проверяют отмену и обновляют прогресс
+WAIT_POLL_INTERVAL_SEC = 0.25
+
+
+class InterProcessLock:
+    """Неблокирующая эксклюзивная блокировка файла (msvcrt на Windows, flock на POSIX)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        """Пробует взять блокировку. True - взята, False - держит другой процесс."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        except OSError as e:
+            logging.debug(f"Ошибка снятия блокировки '{self.path}': {e}")
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class _Flight:
+    """Выполняющаяся работа по одному ключу."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.last_status = None
+        self.progress = 0.0 # 0..1 в рамках шага ведущего
+
+
+class SingleFlight:
+    """Реестр выполняющихся работ по ключам в пределах процесса."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def run(self, key, lock_path, work, update_status_callback=None, update_progress_callback=None,
+            progress_base=0, progress_range=100, is_canceled_callback=None):
+        """
+        Выполняет work(update_status_callback, update_progress_callback) не более одного раза
+        одновременно для key (в процессе) и для lock_path (между процессами).
+        Если ведущий вызов отменен (вернул None), ожидающий не отмененный вызов повторяет работу сам.
+        Возвращает результат work или None при отмене.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                is_leader = flight is None
+                if is_leader:
+                    flight = self._flights[key] = _Flight()
+
+            if is_leader:
+                return self._lead(key, flight, lock_path, work, update_status_callback, update_progress_callback,
+                                  progress_base, progress_range, is_canceled_callback)
+
+            logging.info(f"{self.name}: '{key}' уже готовится в этом процессе, ожидание результата.")
+            if update_status_callback:
+                update_status_callback("Дистрибутив уже готовится другим запуском, ожидание...")
+            if not self._wait(flight, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback):
+                return None # Отменен ожидающий вызов; ведущий продолжает работу
+            if flight.error is not None:
+                raise flight.error
+            if flight.result is not None:
+                if update_progress_callback:
+                    update_progress_callback(progress_base + progress_range)
+                return flight.result
+            logging.info(f"{self.name}: подготовка '{key}' ведущим вызовом отменена, повторная попытка.")
+
+    def _lead(self, key, flight, lock_path, work, update_status_callback, update_progress_callback,
+              progress_base, progress_range, is_canceled_callback):
+        def track_status(message, level="INFO"):
+            flight.last_status = message
+            if update_status_callback:
+                update_status_callback(message, level)
+
+        def track_progress(value):
+            if progress_range:
+                flight.progress = max(0.0, min(1.0, (value - progress_base) / progress_range))
+            if update_progress_callback:
+                update_progress_callback(value)
+
+        process_lock = InterProcessLock(lock_path)
+        try:
+            if not self._acquire_process_lock(process_lock, update_status_callback, is_canceled_callback):
+                return None
+            try:
+                flight.result = work(track_status, track_progress)
+            finally:
+                process_lock.release()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _acquire_process_lock(self, process_lock, update_status_callback, is_canceled_callback):
+        """Берет межпроцессную блокировку, ожидая другой экземпляр. False - ожидание отменено."""
+        if process_lock.try_acquire():
+            return True
+        started_at = time.monotonic()
+        logging.info(f"{self.name}: '{process_lock.path}' занят другим экземпляром приложения, ожидание.")
+        if update_status_callback:
+            update_status_callback("Дистрибутив готовится другим экземпляром приложения, ожидание...")
+        while not process_lock.try_acquire():
+            if is_canceled_callback and is_canceled_callback():
+                logging.info(f"{self.name}: ожидание '{process_lock.path}' отменено.")
+                return False
+            time.sleep(WAIT_POLL_INTERVAL_SEC)
+        logging.info(f"{self.name}: '{process_lock.path}' освобожден через {time.monotonic() - started_at:.1f} сек.")
+        return True
+
+    def _wait(self, flight, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback):
+        """Ждет ведущего, транслируя его статус и прогресс. False - ожидание отменено."""
+        last_status = None
+        while not flight.done.wait(WAIT_POLL_INTERVAL_SEC):
+            if is_canceled_callback and is_canceled_callback():
+                return False
+            if update_status_callback and flight.last_status and flight.last_status != last_status:
+                last_status = flight.last_status
+                update_status_callback(last_status)
+            if update_progress_callback:
+                update_progress_callback(progress_base + progress_range * flight.progress)
+        return True
@@ -0,0 +1,115 @@
+# core/speculative.py - Упреждающая подготовка дистрибутива, пока пользователь отвечает на диалог
+#
+# Когда последовательность запуска останавливается на диалоге (выбор RMS/Chain или
+# подтверждение состояния сервера), версия сервера уже известна. Чтобы скачивание
+# не начиналось только после ответа пользователя, кандидаты (оба типа, если тип
+# неизвестен) готовятся в фоновых потоках тем же find_or_download_installer.
+# Если пользователь подтверждает запуск, продолжение забирает готовый (или почти
+# готовый) результат; если отказывается, подготовка отменяется: частично скачанный
+# архив остается для докачки, а уже распакованный дистрибутив - в InstallerRoot.
+
+import time
+import logging
+import threading
+
+from core.config import get_config_value
+from core.installer import find_or_download_installer
+
+
+def is_speculative_prep_enabled(config):
+    return get_config_value(config, 'Settings', 'SpeculativePrep', default=True, type_cast=bool)
+
+
+class _PrepJob:
+    """Подготовка одного кандидата (тип приложения) в отдельном потоке."""
+
+    def __init__(self, config, app_type, version_formatted, vendor):
+        self.app_type = app_type
+        self.vendor = vendor
+        self.version_formatted = version_formatted
+        self.cancel_event = threading.Event()
+        self.progress = 0.0 # 0..1 в рамках шага поиска/скачивания
+        self.last_status = None
+        self.installer_path = None
+        self.error = None
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.thread = threading.Thread(target=self._run, args=(config,), name=f"speculative-{app_type}", daemon=True)
+
+    def _set_status(self, message, level="INFO"):
+        self.last_status = message
+        logging.debug(f"Упреждающая подготовка {self.app_type}: {message}")
+
+    def _set_progress(self, value):
+        self.progress = max(0.0, min(1.0, value / 100.0))
+
+    def _run(self, config):
+        try:
+            self.installer_path = find_or_download_installer(
+                config, self.app_type, self.version_formatted, self.vendor,
+                self._set_status, self._set_progress, 0, 100, self.cancel_event.is_set)
+        except Exception as e:
+            self.error = e
+        self.finished_at = time.monotonic()
+        state = "отменена" if self.cancel_event.is_set() else ("ошибка: " + str(self.error) if self.error else "готово")
+        logging.info(f"Упреждающая подготовка {self.app_type} {self.version_formatted} завершена за "
+                     f"{self.finished_at - self.started_at:.1f} сек ({state}).")
+
+
+class SpeculativePrep:
+    """
+    Набор фоновых подготовок дистрибутива для одной последовательности запуска.
+    Хранится в launch_data['speculative_prep'] и переживает перезапуск воркера после диалога.
+    """
+
+    def __init__(self, config, version_formatted, candidates):
+        """candidates - список (app_type, vendor)."""
+        self.version_formatted = version_formatted
+        self._jobs = {}
+        for app_type, vendor in candidates:
+            if app_type not in self._jobs:
+                self._jobs[app_type] = _PrepJob(config, app_type, version_formatted, vendor)
+        logging.info(f"Упреждающая подготовка дистрибутивов версии {version_formatted}: {', '.join(self._jobs)}.")
+        for job in self._jobs.values():
+            job.thread.start()
+
+    def has_candidate(self, app_type, vendor, version_formatted):
+        job = self._jobs.get(app_type)
+        return job is not None and job.vendor == vendor and job.version_formatted == version_formatted and not job.cancel_event.is_set()
+
+    def take(self, app_type, update_status_callback=None, update_progress_callback=None, progress_base=0, progress_range=100, is_canceled_callback=None):
+        """
+        Дожидается подготовки app_type (остальные кандидаты отменяются) и возвращает путь
+        к дистрибутиву, как find_or_download_installer. Ошибка подготовки выбрасывается.
+        Возвращает None, если подготовка была отменена (или отменена операция).
+        """
+        self.cancel(except_app_type=app_type)
+        job = self._jobs[app_type]
+        if job.thread.is_alive():
+            logging.info(f"Ожидание упреждающей подготовки {app_type} (готово {job.progress:.0%}).")
+        last_status = None
+        while job.thread.is_alive():
+            if is_canceled_callback and is_canceled_callback():
+                job.cancel_event.set()
+            if update_status_callback and job.last_status and job.last_status != last_status:
+                last_status = job.last_status
+                update_status_callback(last_status)
+            if update_progress_callback:
+                update_progress_callback(progress_base + progress_range * job.progress)
+            job.thread.join(0.1)
+        if job.error is not None:
+            raise job.error
+        if job.installer_path is not None and update_progress_callback:
+            update_progress_callback(progress_base + progress_range)
+        return job.installer_path
+
+    def is_finished(self):
+        """Все подготовки завершены (готово, ошибка или отмена)."""
+        return not any(job.thread.is_alive() for job in self._jobs.values())
+
+    def cancel(self, except_app_type=None):
+        """Отменяет подготовки (кроме except_app_type). Уже готовые дистрибутивы остаются в InstallerRoot."""
+        for app_type, job in self._jobs.items():
+            if app_type != except_app_type and job.thread.is_alive() and not job.cancel_event.is_set():
+                logging.info(f"Упреждающая подготовка {app_type} отменена.")
+                job.cancel_event.set()
@@ -0,0 +1,197 @@
+# core/sync.py - Пакетная синхронизация набора версий в InstallerRoot
+
+import re
+import time
+import logging
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from core.config import get_config_value
+from core.installer import find_or_download_installer
+from core.catalog import APP_TYPES, build_archive_name_patterns, match_archive_name
+from utils.url_utils import format_version
+
+_VENDORS = {'iiko': 'iiko', 'syrve': 'Syrve'}
+_EDITIONS = {'rms': 'RMS', 'default': 'RMS', 'chain': 'Chain'}
+
+
+def parse_sync_entry(entry_string):
+    """
+    Разбирает строку вида "iiko RMS 7.5.6", "Syrve Chain 8.1" или "SyrveChain 812".
+    Возвращает {'vendor', 'app_type', 'version'} (версия форматированная) или None.
+    """
+    tokens = [t for t in re.split(r"[\s,;]+", entry_string.strip()) if t]
+    if len(tokens) == 2:
+        app_type_token, version_token = tokens
+        app_type = next((t for t in APP_TYPES if t.lower() == app_type_token.lower()), None)
+        vendor = 'Syrve' if app_type and app_type.startswith('Syrve') else 'iiko'
+    elif len(tokens) == 3:
+        vendor = _VENDORS.get(tokens[0].lower())
+        edition = _EDITIONS.get(tokens[1].lower())
+        app_type = f"{vendor}{edition}" if vendor and edition else None
+        version_token = tokens[2]
+    else:
+        app_type = None
+
+    if not app_type:
+        logging.error(f"Не удалось разобрать строку синхронизации: '{entry_string}'. Ожидается 'производитель тип версия'.")
+        return None
+
+    version_formatted = format_version(version_token) if '.' in version_token else version_token
+    if not version_formatted.isdigit():
+        logging.error(f"Некорректная версия '{version_token}' в строке синхронизации '{entry_string}'.")
+        return None
+    return {'vendor': vendor, 'app_type': app_type, 'version': version_formatted}
+
+
+def version_key(version_formatted):
+    """Ключ сравнения форматированных версий ('756' -> (7, 5, 6)), дополненный нулями до трех частей."""
+    digits = [int(d) for d in version_formatted if d.isdigit()]
+    return tuple(digits + [0] * (3 - len(digits)))
+
+
+def list_remote_entries(config):
+    """
+    Возвращает все версии, доступные в HTTP-источнике. Сначала запрашивается /catalog.json
+    (зеркало), затем - листинги каталогов веб-сервера. Имена архивов сопоставляются
+    с шаблонами [HttpSource] *_ArchiveName.
+    """
+    base_url = get_config_value(config, 'HttpSource', 'Url', default='', type_cast=str)
+    if not base_url:
+        raise ValueError("Не указан [HttpSource] Url для получения каталога версий.")
+    base_url = base_url.rstrip('/') + '/'
+    timeout = get_config_value(config, 'Settings', 'HttpRequestTimeoutSec', default=15, type_cast=int)
+
+    patterns = build_archive_name_patterns(config)
+    archive_names = _fetch_catalog_names(base_url, timeout)
+    if archive_names is None:
+        archive_names = _fetch_listing_names(base_url, _get_template_subdirs(config), timeout)
+
+    entries = []
+    for archive_name in archive_names:
+        app_type, version_formatted = match_archive_name(patterns, archive_name)
+        if app_type:
+            vendor = 'Syrve' if app_type.startswith('Syrve') else 'iiko'
+            entries.append({'vendor': vendor, 'app_type': app_type, 'version': version_formatted})
+    logging.info(f"В удаленном каталоге '{base_url}' найдено версий: {len(entries)}.")
+    return entries
+
+
+def _get_template_subdirs(config):
+    """Подкаталоги из шаблонов имен архивов (например, 'Syrve/') плюс корень."""
+    subdirs = {''}
+    for app_type in APP_TYPES:
+        template = get_config_value(config, 'HttpSource', f'{app_type}_ArchiveName', default='', type_cast=str)
+        if '/' in template:
+            subdirs.add(template.rsplit('/', 1)[0] + '/')
+    return sorted(subdirs)
+
+
+def _fetch_catalog_names(base_url, timeout):
+    try:
+        response = requests.get(urllib.parse.urljoin(base_url, 'catalog.json'), timeout=timeout)
+        catalog = response.json() if response.status_code == 200 else None
+        if not isinstance(catalog, dict) or 'archives' not in catalog:
+            return None
+        return list(catalog['archives'].keys())
+    except (requests.exceptions.RequestException, ValueError, AttributeError) as e:
+        logging.debug(f"Каталог catalog.json недоступен: {e}")
+        return None
+
+
+def _fetch_listing_names(base_url, subdirs, timeout):
+    """Собирает имена архивов из HTML-листингов каталога и его подкаталогов из шаблонов (например, Syrve/)."""
+    names = []
+    for subdir in subdirs:
+        try:
+            response = requests.get(urllib.parse.urljoin(base_url, subdir), timeout=timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Не удалось получить листинг '{base_url}{subdir}': {e}")
+            continue
+        for href in re.findall(r'href="([^"?#]+\.zip)"', response.text, re.IGNORECASE):
+            names.append(subdir + urllib.parse.unquote(href.rsplit('/', 1)[-1]))
+    return names
+
+
+def select_newer_entries(entries, newer_than):
+    """Оставляет версии строго новее newer_than (строка версии, например '7.5' или '756')."""
+    threshold = format_version(newer_than) if '.' in newer_than else newer_than
+    return [e for e in entries if version_key(e['version']) > version_key(threshold)]
+
+
+def run_sync(config, entries, concurrency=None, is_canceled_callback=None, on_result=None):
+    """
+    Скачивает и распаковывает дистрибутивы entries в InstallerRoot параллельно
+    (не более concurrency одновременно). Возвращает список результатов:
+    {'entry', 'status' ('ok'|'error'|'canceled'), 'source', 'bytes', 'download_seconds', 'seconds', 'error'}.
+    on_result(result) вызывается по мере завершения каждой записи.
+    """
+    concurrency = concurrency or get_config_value(config, 'Sync', 'Concurrency', default=3, type_cast=int)
+    concurrency = max(1, concurrency)
+    logging.info(f"Синхронизация {len(entries)} дистрибутивов, параллельно: {concurrency}.")
+
+    def sync_one(entry):
+        stats = {}
+        started_at = time.monotonic()
+        result = {'entry': entry, 'status': 'ok', 'source': None, 'bytes': 0, 'download_seconds': 0.0, 'error': None}
+        try:
+            path = find_or_download_installer(config, entry['app_type'], entry['version'], entry['vendor'],
+                                              None, None, 0, 100, is_canceled_callback, stats=stats)
+            if path is None:
+                result['status'] = 'canceled' if is_canceled_callback and is_canceled_callback() else 'error'
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        result.update({k: v for k, v in stats.items() if k in ('source', 'bytes', 'download_seconds')})
+        result['seconds'] = time.monotonic() - started_at
+        return result
+
+    results = []
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="sync")
+    try:
+        futures = [executor.submit(sync_one, entry) for entry in entries]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result: on_result(result)
+    except KeyboardInterrupt:
+        # Не ждем активные загрузки: вызывающий код выставляет отмену, и они завершатся сами
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return results
+
+
+def format_entry(entry):
+    return f"{entry['app_type']} {entry['version']}"
+
+
+def format_summary(results, wall_seconds):
+    """Формирует текстовую сводку: строка на каждый дистрибутив и скорость по источникам."""
+    lines = [f"{'Дистрибутив':<22} {'Статус':<9} {'Источник':<9} {'МБ':>9} {'Сек':>8} {'МБ/с':>8}"]
+    per_source = {}
+    for result in sorted(results, key=lambda r: (r['entry']['app_type'], version_key(r['entry']['version']))):
+        megabytes = result['bytes'] / (1024 * 1024)
+        seconds = result['download_seconds']
+        speed = f"{megabytes / seconds:.2f}" if seconds > 0 and megabytes > 0 else '-'
+        lines.append(f"{format_entry(result['entry']):<22} {result['status']:<9} {result['source'] or '-':<9} {megabytes:>9.1f} {result['seconds']:>8.1f} {speed:>8}")
+        if result['source'] and result['bytes']:
+            source_stats = per_source.setdefault(result['source'], {'count': 0, 'bytes': 0, 'seconds': 0.0})
+            source_stats['count'] += 1
+            source_stats['bytes'] += result['bytes']
+            source_stats['seconds'] += seconds
+
+    lines.append("")
+    lines.append(f"{'Источник':<9} {'Архивов':>8} {'МБ':>10} {'МБ/с':>8}")
+    for source, source_stats in sorted(per_source.items()):
+        megabytes = source_stats['bytes'] / (1024 * 1024)
+        speed = f"{megabytes / source_stats['seconds']:.2f}" if source_stats['seconds'] > 0 else '-'
+        lines.append(f"{source:<9} {source_stats['count']:>8} {megabytes:>10.1f} {speed:>8}")
+
+    failed = sum(1 for r in results if r['status'] != 'ok')
+    lines.append("")
+    lines.append(f"Всего: {len(results)}, с ошибками: {failed}, время: {wall_seconds:.1f} с.")
+    return "\n".join(lines)
@@ -0,0 +1,156 @@
+# gui/fleet_window.py - Окно пакетной проверки серверов
+import json
+import logging
+
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QPushButton,
+    QTableWidget, QTableWidgetItem, QLabel, QProgressBar, QHeaderView,
+    QAbstractItemView, QApplication
+)
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from PyQt6.QtGui import QColor
+
+from core.batch_check import split_targets
+from workers.tasks import BatchCheckWorker
+
+
+class FleetCheckWindow(QDialog):
+    """
+    Пакетная проверка серверов: список адресов, параллельный опрос getServerMonitoringInfo
+    и сортируемая таблица результатов, заполняемая по мере ответов.
+    Работает в собственном потоке и не блокирует главное окно.
+    """
+    target_selected = pyqtSignal(str)  # Двойной клик по строке - передать адрес в главное окно
+
+    COLUMNS = ('target', 'state', 'edition', 'version', 'server_state', 'elapsed_ms', 'error')
+
+    def __init__(self, config, parent=None):
+        super().__init__(parent)
+        self.config = config
+        self.worker_thread = None
+        self.worker = None
+        self._results = []
+        self.setWindowTitle(self.tr("Batch server check"))
+        self.resize(820, 520)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        self.targets_edit = QPlainTextEdit()
+        self.targets_edit.setPlaceholderText(self.tr("Server addresses: one per line, or separated by commas/spaces"))
+        self.targets_edit.setMaximumHeight(110)
+        layout.addWidget(self.targets_edit)
+
+        buttons_layout = QHBoxLayout()
+        self.paste_button = QPushButton(self.tr("Paste"))
+        self.paste_button.clicked.connect(self.paste_from_clipboard)
+        buttons_layout.addWidget(self.paste_button)
+        self.start_button = QPushButton(self.tr("Check"))
+        self.start_button.clicked.connect(self.start_or_abort)
+        buttons_layout.addWidget(self.start_button)
+        self.copy_button = QPushButton(self.tr("Copy as JSON lines"))
+        self.copy_button.clicked.connect(self.copy_results)
+        buttons_layout.addWidget(self.copy_button)
+        buttons_layout.addStretch(1)
+        self.status_label = QLabel()
+        buttons_layout.addWidget(self.status_label)
+        layout.addLayout(buttons_layout)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        layout.addWidget(self.progress_bar)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels([
+            self.tr("Server"), self.tr("Result"), self.tr("Edition"), self.tr("Version"),
+            self.tr("Server state"), self.tr("Time, ms"), self.tr("Error")
+        ])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSortingEnabled(True)
+        self.table.cellDoubleClicked.connect(self._on_row_double_clicked)
+        layout.addWidget(self.table)
+
+    def paste_from_clipboard(self):
+        clipboard_content = QApplication.clipboard().text()
+        if clipboard_content and clipboard_content.strip():
+            self.targets_edit.setPlainText(clipboard_content.strip())
+
+    def start_or_abort(self):
+        if self.worker_thread is not None and self.worker_thread.isRunning():
+            logging.info("Пакетная проверка: запрошена отмена.")
+            self.start_button.setEnabled(False)
+            self.worker.cancel()
+            return
+
+        targets = split_targets(self.targets_edit.toPlainText())
+        if not targets:
+            self.status_label.setText(self.tr("Enter at least one server address."))
+            return
+
+        self._results = []
+        self.table.setRowCount(0)
+        self.progress_bar.setValue(0)
+        self.status_label.setText(self.tr("Checking {count} servers...").format(count=len(targets)))
+
+        self.worker_thread = QThread()
+        self.worker_thread.setObjectName("BatchCheckWorkerThread")
+        self.worker = BatchCheckWorker(self.config, targets)
+        self.worker.moveToThread(self.worker_thread)
+        self.worker.result_ready.connect(self._add_result)
+        self.worker.progress_update.connect(self.progress_bar.setValue)
+        self.worker.status_update.connect(lambda message, level: self.status_label.setText(message))
+        self.worker.finished.connect(self.worker_thread.quit)
+        self.worker.finished.connect(self.worker.deleteLater)
+        self.worker_thread.finished.connect(self.worker_thread.deleteLater)
+        self.worker_thread.finished.connect(self._worker_finished)
+        self.worker_thread.started.connect(self.worker.run)
+        self.targets_edit.setEnabled(False)
+        self.start_button.setText(self.tr("Abort"))
+        self.worker_thread.start()
+
+    def _worker_finished(self):
+        self.worker = None
+        self.worker_thread = None
+        self.targets_edit.setEnabled(True)
+        self.start_button.setText(self.tr("Check"))
+        self.start_button.setEnabled(True)
+
+    def _add_result(self, result):
+        self._results.append(result)
+        # Сортировка на время вставки отключается, иначе строка "уедет" до заполнения всех ячеек
+        self.table.setSortingEnabled(False)
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        values = dict(result, state=self.tr("OK") if result['ok'] else self.tr("Error"))
+        for column, key in enumerate(self.COLUMNS):
+            value = values.get(key)
+            item = QTableWidgetItem()
+            # Время храним числом, чтобы сортировка была числовой, а не строковой
+            item.setData(Qt.ItemDataRole.DisplayRole, value if isinstance(value, int) else ("" if value is None else str(value)))
+            if not result['ok']:
+                item.setForeground(QColor("red"))
+            elif key == 'server_state' and value != "STARTED_SUCCESSFULLY":
+                item.setForeground(QColor("orange"))
+            self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+
+    def _on_row_double_clicked(self, row, column):
+        item = self.table.item(row, 0)
+        if item is not None:
+            self.target_selected.emit(item.text())
+
+    def copy_results(self):
+        lines = [json.dumps(result, ensure_ascii=False) for result in self._results]
+        QApplication.clipboard().setText("\n".join(lines))
+        self.status_label.setText(self.tr("Copied {count} results.").format(count=len(lines)))
+
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancel()
+        if self.worker_thread is not None and not self.worker_thread.wait(3000):
+            logging.warning("Пакетная проверка не завершилась за 3 секунды при закрытии окна.")
+        super().closeEvent(event)
@@ -1,31 +1,53 @@
 # gui/main_window.py
 import logging
 import os
+import re
 import shutil
 import sys
+import threading
+import importlib
 import traceback
-from gui.notebook import NotebookWindow
 
 from PyQt6.QtWidgets import (
     QMainWindow, QApplication, QWidget, QVBoxLayout,
     QGridLayout, QLabel, QLineEdit, QPushButton, QProgressBar,
-    QTextEdit, QMessageBox, QSizePolicy, QInputDialog, QHBoxLayout
+    QTextEdit, QMessageBox, QSizePolicy, QInputDialog, QHBoxLayout, QListWidget, QListWidgetItem,
+    QSystemTrayIcon, QMenu, QStyle, QCompleter
 )
-from PyQt6.QtCore import Qt, QThread, QEvent, QTimer, QProcess, QSize
-from PyQt6.QtGui import QColor, QPalette, QFont, QTextOption, QIcon, QGuiApplication
+from PyQt6.QtCore import Qt, QEvent, QTimer, QProcess, QSize, QModelIndex, pyqtSignal
+from PyQt6.QtGui import QColor, QPalette, QFont, QTextOption, QIcon, QGuiApplication, QStandardItemModel, QStandardItem
 
-from core.config import get_config_value
+from core.config import get_config_value, save_config_values
 from utils.anydesk_utils import launch_anydesk
 from utils.litemanager_utils import launch_litemanager
-from utils.url_utils import find_anydesk_id, find_litemanager_id, parse_target_string
+from utils.url_utils import find_anydesk_id, find_litemanager_id, parse_target_string, guess_vendor
 from utils.process_utils import is_anydesk_running
-from workers.tasks import CheckWorker, LaunchWorker, LaunchWorkerFromStep4, LaunchWorkerFromStep5, BaseWorker
+from workers.scheduler import JobScheduler, JOB_QUEUED, JOB_RUNNING, JOB_WAITING_USER, JOB_DONE, JOB_FAILED, JOB_CANCELED
+
+# Разделители адресов при вставке/вводе нескольких серверов (пробел не разделяет: он бывает в ID AnyDesk)
+TARGET_LIST_SEPARATORS = r"[\r\n,;]+"
+# Сколько завершенных задач остается в списке
+FINISHED_JOBS_TO_KEEP = 10
+# Модули последовательности запуска, которые догружаются в фоне после первой отрисовки окна
+PRELOAD_MODULES = ('requests', 'core.launcher', 'core.installer', 'core.launch_history')
+PRELOAD_DELAY_MS = 300
+# С какой длины ввода в строке адреса показываются подсказки (книжка, история запусков)
+SUGGEST_MIN_QUERY_LENGTH = 2
 
 
 class MainWindow(QMainWindow):
+    first_painted = pyqtSignal() # Первая отрисовка окна (для замера времени запуска)
+    config_reloaded = pyqtSignal(object) # Новый ConfigSnapshot из потока наблюдения за config.ini
+    server_status_updated = pyqtSignal(dict) # Результат фонового опроса сервера книжки (ServerMonitor)
+    server_version_changed = pyqtSignal(dict) # Версия сервера книжки изменилась
+    notebook_changed = pyqtSignal() # В книжку слиты изменения из журналов других машин (NotebookJournalSync)
+
     def __init__(self, config, translator, initial_target=None):
         super().__init__()
 
+        self._first_paint_done = False
+        self.tray_icon = None # Значок в трее резидентного режима (enable_resident_mode)
+        self._quitting = False
         self.config = config
         self.translator = translator
         self.initial_target = initial_target
@@ -61,14 +83,100 @@ class MainWindow(QMainWindow):
         # Применяем переводы ко всем элементам
         self.retranslateUi()
 
-        self.worker_thread = None
-        self.worker = None
-        self._launch_data = {}
+        self.scheduler = JobScheduler(self.config, self)
+        self.scheduler.job_added.connect(self._on_job_added)
+        self.scheduler.job_updated.connect(self._on_job_updated)
+        self.scheduler.job_finished.connect(self._on_job_finished)
+        self.scheduler.dialog_requested.connect(self._request_dialog)
+        self._displayed_job_id = None # Задача, статус и вывод которой показаны в окне
+        self._pending_dialogs = [] # Диалоги задач ждут, пока пользователь ответит на текущий
+        self._dialog_open = False
+        self.fleet_window = None
+        self.server_monitor = None # Запускается в фоне после первой отрисовки (_start_background_services)
+        self.journal_sync = None # Синхронизация журналов книжки, если задан [Notebook] JournalDir
+        self.config_reloaded.connect(self.apply_config)
+        self.server_version_changed.connect(self._on_server_version_changed)
 
         if self.initial_target:
             self.target_entry.setText(self.initial_target)
             QTimer.singleShot(100, self.start_process_flow)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._first_paint_done:
+            self._first_paint_done = True
+            self.first_painted.emit()
+            QTimer.singleShot(PRELOAD_DELAY_MS, self._start_background_services)
+
+    def _start_background_services(self):
+        """
+        После первой отрисовки, в фоновом потоке: догружает модули запуска (requests, шаги), чтобы
+        первый Launch/Check не ждал их импорта, запускает синхронизацию журналов книжки, строит индексы
+        подсказок и запускает опрос серверов книжки.
+        """
+        def preload():
+            if get_config_value(self.config, 'Startup', 'PreloadModules', default=True, type_cast=bool):
+                for module_name in PRELOAD_MODULES:
+                    try:
+                        importlib.import_module(module_name)
+                    except Exception as e:
+                        logging.debug(f"Фоновая загрузка модуля '{module_name}' не удалась: {e}")
+                logging.debug("Модули последовательности запуска загружены в фоне.")
+            if get_config_value(self.config, 'Notebook', 'JournalDir', default='', type_cast=str):
+                self._start_journal_sync()
+            if get_config_value(self.config, 'Suggestions', 'Enabled', default=True, type_cast=bool):
+                # Индексы подсказок строятся здесь, а не при первом нажатии клавиши в строке адреса
+                try:
+                    from core.launch_history import warm_launch_history
+                    from core.notebook_store import get_notebook_store
+                    warm_launch_history()
+                    get_notebook_store(self.config).warm_fuzzy_index()
+                except Exception as e:
+                    logging.debug(f"Фоновое построение индексов подсказок не удалось: {e}")
+            if get_config_value(self.config, 'ServerMonitor', 'Enabled', default=True, type_cast=bool):
+                self._start_server_monitor()
+        threading.Thread(target=preload, name="module-preload", daemon=True).start()
+
+    def _start_server_monitor(self):
+        try:
+            from core.server_monitor import ServerMonitor
+            from core.notebook_store import get_notebook_store
+            server_monitor = ServerMonitor(self.config, get_notebook_store(self.config),
+                                           on_status=self.server_status_updated.emit,
+                                           on_version_changed=self.server_version_changed.emit)
+        except Exception as e:
+            logging.error(f"Не удалось запустить опрос серверов книжки: {e}")
+            return
+        server_monitor.start()
+        self.server_monitor = server_monitor
+
+    def _start_journal_sync(self):
+        try:
+            from core.notebook_journal import NotebookJournalSync
+            from core.notebook_store import get_notebook_store
+            interval_sec = get_config_value(self.config, 'Notebook', 'JournalSyncSec', default=30, type_cast=float)
+            journal_sync = NotebookJournalSync(get_notebook_store(self.config), max(interval_sec, 1.0),
+                                               on_change=self.notebook_changed.emit)
+        except Exception as e:
+            logging.error(f"Не удалось запустить синхронизацию журналов книжки: {e}")
+            return
+        journal_sync.start()
+        self.journal_sync = journal_sync
+
+    def stop_background_services(self):
+        if self.server_monitor is not None:
+            self.server_monitor.stop()
+        if self.journal_sync is not None:
+            self.journal_sync.stop()
+
+    def _on_server_version_changed(self, event):
+        message = self.tr("Server {name}: version {old} -> {new}").format(
+            name=event['name'], old=event['previous_version'], new=event['status']['version'])
+        if self.tray_icon is not None:
+            self.tray_icon.showMessage(self.windowTitle(), message)
+        elif not self.scheduler.active_jobs():
+            self._update_status(message)
+
     def setup_ui(self):
         """Создает и размещает все виджеты в окне."""
         input_row_layout = QHBoxLayout()
@@ -86,11 +194,24 @@ class MainWindow(QMainWindow):
         input_row_layout.addWidget(self.notebook_button, 0, Qt.AlignmentFlag.AlignRight)
         self.notebook_button.clicked.connect(self.show_notebook)
 
+        self.fleet_button = QPushButton("🖧")
+        self.fleet_button.setMaximumSize(30, 30)
+        input_row_layout.addWidget(self.fleet_button, 0, Qt.AlignmentFlag.AlignRight)
+        self.fleet_button.clicked.connect(self.show_fleet_check)
+
         self.target_entry = QLineEdit()
         self.target_entry.returnPressed.connect(self.start_process_flow)
         self.target_entry.installEventFilter(self)
+        self.target_entry.textEdited.connect(self._update_target_suggestions)
         input_row_layout.addWidget(self.target_entry, 1)
 
+        # Подсказки строит suggest_targets (нечеткий поиск), поэтому completer сам их не фильтрует
+        self.suggestions_model = QStandardItemModel(self)
+        self.target_completer = QCompleter(self.suggestions_model, self)
+        self.target_completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.target_completer.setWidget(self.target_entry)
+        self.target_completer.activated[QModelIndex].connect(self._apply_target_suggestion)
+
         self.paste_button = QPushButton()
         self.paste_button.clicked.connect(self.paste_from_clipboard)
         self.paste_button.setFixedWidth(105)
@@ -130,6 +251,22 @@ class MainWindow(QMainWindow):
 
         self.main_layout.addLayout(grid_layout)
 
+        jobs_row_layout = QHBoxLayout()
+        jobs_row_layout.setSpacing(10)
+        self.jobs_list = QListWidget()
+        self.jobs_list.setMaximumHeight(70)
+        self.jobs_list.currentItemChanged.connect(self._on_job_selected)
+        jobs_row_layout.addWidget(self.jobs_list, 1)
+        self.cancel_job_button = QPushButton()
+        self.cancel_job_button.setFixedWidth(105)
+        self.cancel_job_button.clicked.connect(self.abort_process)
+        jobs_row_layout.addWidget(self.cancel_job_button, 0, Qt.AlignmentFlag.AlignTop)
+        self.jobs_widget = QWidget()
+        self.jobs_widget.setLayout(jobs_row_layout)
+        jobs_row_layout.setContentsMargins(0, 0, 0, 0)
+        self.jobs_widget.setVisible(False) # Показывается при первой задаче
+        self.main_layout.addWidget(self.jobs_widget)
+
         self.json_output_text = QTextEdit()
         self.json_output_text.setReadOnly(True)
         self.json_output_text.setWordWrapMode(QTextOption.WrapMode.WordWrap)
@@ -142,7 +279,17 @@ class MainWindow(QMainWindow):
         self.paste_button.setText(self.tr("Paste"))
         self.check_button.setText(self.tr("Check"))
         self.launch_button.setText(self.tr("Launch"))
+        self.fleet_button.setToolTip(self.tr("Batch server check"))
+        self.cancel_job_button.setText(self.tr("Abort"))
+        self.target_entry.setPlaceholderText(self.tr("Address, or several separated by commas"))
         self.status_label.setText(self.tr("Waiting for input..."))
+        for row in range(self.jobs_list.count()):
+            item = self.jobs_list.item(row)
+            item.setText(self._job_item_text(self.scheduler.jobs[item.data(Qt.ItemDataRole.UserRole)]))
+        if self.tray_icon is not None:
+            self.tray_icon.setToolTip(self.tr("Service Launcher App"))
+            self.tray_show_action.setText(self.tr("Show"))
+            self.tray_exit_action.setText(self.tr("Exit"))
         # Обновляем иконку флага, так как язык мог измениться
         self._update_language_button_icon()
 
@@ -176,20 +323,32 @@ class MainWindow(QMainWindow):
         current_locale = get_config_value(self.config, 'Settings', 'Language', default='ru')
         target_locale = 'en' if current_locale == 'ru' else 'ru'
 
-        # Переключаем язык с помощью нашего класса Translator
-        self.translator.switch_language(target_locale)
-        
-        # Сохраняем новую настройку в config.ini
-        self.config.set('Settings', 'Language', target_locale)
+        # Сохраняем новую настройку в config.ini (атомарно, поверх текущего содержимого файла);
+        # язык переключает apply_config по новому снимку
         try:
-            config_path = os.path.join(os.path.dirname(sys.argv[0]), "config.ini")
-            with open(config_path, 'w', encoding='utf-8') as configfile:
-                self.config.write(configfile)
+            self.apply_config(save_config_values({'Settings': {'Language': target_locale}}))
             logging.info(f"Язык переключен на '{target_locale}' и сохранен в конфиг.")
         except Exception as e:
             logging.error(f"Не удалось сохранить настройку языка в config.ini: {e}")
             QMessageBox.critical(self, self.tr("Error"), self.tr("Failed to save language settings."))
 
+    def apply_config(self, config):
+        """
+        Применяет новый снимок конфигурации (сохранение настроек или изменение config.ini на диске).
+        Новые задачи и окна используют его сразу; логирование и кэш пиров - после перезапуска.
+        """
+        previous_locale = get_config_value(self.config, 'Settings', 'Language', default='ru')
+        self.config = config
+        self.translator.config = config
+        self.scheduler.update_config(config)
+        if self.server_monitor is not None:
+            self.server_monitor.update_config(config)
+        if self.fleet_window is not None:
+            self.fleet_window.config = config
+        target_locale = get_config_value(config, 'Settings', 'Language', default='ru')
+        if target_locale != previous_locale:
+            self.translator.switch_language(target_locale)
+
     def _apply_light_palette(self):
         # ... (код этой функции без изменений)
         palette = QPalette()
@@ -250,60 +409,88 @@ class MainWindow(QMainWindow):
 
         self._update_progress(0)
 
-    def _request_dialog(self, dialog_type, title, message, options, callback_data):
-        logging.debug(f"GUI получил запрос на диалог: {dialog_type}")
-        self.check_button.setEnabled(False)
+    def _request_dialog(self, job_id, dialog_type, title, message, options, callback_data):
+        """Диалоги задач показываются по одному: следующий - после ответа на текущий."""
+        logging.debug(f"GUI получил запрос на диалог от задачи #{job_id}: {dialog_type}")
+        self._pending_dialogs.append((job_id, dialog_type, title, message, options, callback_data))
+        if not self._dialog_open:
+            self._show_next_dialog()
+
+    def _show_next_dialog(self):
+        while self._pending_dialogs:
+            job_id, dialog_type, title, message, options, callback_data = self._pending_dialogs.pop(0)
+            job = self.scheduler.jobs.get(job_id)
+            if job is None or job.is_finished or job.is_canceled:
+                # Задачу отменили, пока диалог ждал очереди
+                self._cancel_speculative_prep(callback_data)
+                continue
+            self._dialog_open = True
+            try:
+                self._show_dialog(job, dialog_type, title, message, options, callback_data)
+            finally:
+                self._dialog_open = False
 
-        result = None
+    def _show_dialog(self, job, dialog_type, title, message, options, callback_data):
+        self._display_job(job.id)
+        dialog_title = f"{self.tr(title)}: {job.title}"
         if dialog_type == 'app_type':
-            reply = QMessageBox.question(self, self.tr(title), self.tr(message),
+            reply = QMessageBox.question(self, dialog_title, self.tr(message),
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
                                          QMessageBox.StandardButton.Yes)
             if reply == QMessageBox.StandardButton.Yes: result = options[0]
             elif reply == QMessageBox.StandardButton.No: result = options[1]
             else: result = None
-            self._handle_app_type_dialog_result(result, callback_data)
+            self._handle_app_type_dialog_result(job.id, result, callback_data)
         elif dialog_type == 'server_state_confirm':
-            reply = QMessageBox.question(self, self.tr(title), self.tr(message),
+            reply = QMessageBox.question(self, dialog_title, self.tr(message),
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
                                          QMessageBox.StandardButton.Yes)
-            self._handle_server_state_confirm_dialog_result(reply == QMessageBox.StandardButton.Yes, callback_data)
+            self._handle_server_state_confirm_dialog_result(job.id, reply == QMessageBox.StandardButton.Yes, callback_data)
         else:
             logging.error(f"Получен запрос на неизвестный тип диалога: {dialog_type}")
             error_msg = self.tr("Internal error: unknown dialog type '{dialog_type}'.").format(dialog_type=dialog_type)
             self._handle_error(error_msg, f"Неизвестный тип диалога запрошен воркером: {dialog_type}")
-            if isinstance(self.worker, BaseWorker):
-                 self.worker.cancel()
+            self.scheduler.cancel(job.id)
 
-    def _handle_app_type_dialog_result(self, selected_option, launch_data):
+    def _handle_app_type_dialog_result(self, job_id, selected_option, launch_data):
         logging.debug(f"Обработка результата диалога выбора типа приложения: '{selected_option}'")
         if selected_option is None:
             logging.info("Выбор типа приложения отменен пользователем.")
-            if isinstance(self.worker, BaseWorker): self.worker.cancel()
+            self._cancel_speculative_prep(launch_data)
+            self.scheduler.cancel(job_id)
             return
-        vendor = "iiko"
-        if "syrve" in launch_data.get('target_string', '').lower(): vendor = "Syrve"
+        vendor = guess_vendor(launch_data.get('target_string', ''))
         if selected_option == 'RMS': launch_data['app_type'] = f"{vendor}RMS"
         elif selected_option == 'Chain': launch_data['app_type'] = f"{vendor}Chain"
         else:
             error_msg = self.tr("Unexpected result from app type dialog: '{selected_option}'.").format(selected_option=selected_option)
             self._handle_error(error_msg, f"Диалог выбора типа приложения вернул неожиданный результат: {selected_option}")
-            if isinstance(self.worker, BaseWorker): self.worker.cancel()
+            self._cancel_speculative_prep(launch_data)
+            self.scheduler.cancel(job_id)
             return
         launch_data['vendor'] = vendor
         logging.info(f"Пользователь выбрал тип приложения: '{launch_data['app_type']}'. Перезапуск воркера с Шага 4.")
         self._update_status(self.tr("Continuing launch (type selected: {app_type})").format(app_type=launch_data['app_type']))
-        self._start_worker(LaunchWorkerFromStep4, launch_data)
+        from workers.tasks import LaunchWorkerFromStep4
+        self.scheduler.submit(LaunchWorkerFromStep4, launch_data, 'launch', launch_data['target_string'], job_id=job_id)
 
-    def _handle_server_state_confirm_dialog_result(self, confirmed, launch_data):
+    def _handle_server_state_confirm_dialog_result(self, job_id, confirmed, launch_data):
         logging.debug(f"Обработка результата диалога подтверждения состояния сервера: {confirmed}")
         if confirmed:
             logging.info("Пользователь подтвердил продолжение запуска. Перезапуск воркера с Шага 5.")
             self._update_status(self.tr("Continuing launch at user's request."))
-            self._start_worker(LaunchWorkerFromStep5, launch_data)
+            from workers.tasks import LaunchWorkerFromStep5
+            self.scheduler.submit(LaunchWorkerFromStep5, launch_data, 'launch', launch_data['target_string'], job_id=job_id)
         else:
             logging.info("Запуск отменен по запросу пользователя (состояние сервера).")
-            if isinstance(self.worker, BaseWorker): self.worker.cancel()
+            self._cancel_speculative_prep(launch_data)
+            self.scheduler.cancel(job_id)
+
+    def _cancel_speculative_prep(self, launch_data):
+        """Отменяет фоновую подготовку дистрибутива, начатую на время диалога (см. core/speculative.py)."""
+        speculative_prep = launch_data.pop('speculative_prep', None)
+        if speculative_prep is not None:
+            speculative_prep.cancel()
 
     def _enable_buttons(self):
         self.launch_button.setEnabled(True)
@@ -315,99 +502,173 @@ class MainWindow(QMainWindow):
         self.target_entry.setEnabled(False)
         self.paste_button.setEnabled(False)
 
-    def _set_check_button_to_check(self):
-        self.check_button.setText(self.tr("Check"))
-        try: self.check_button.clicked.disconnect(self.abort_process)
-        except TypeError: pass
-        try: self.check_button.clicked.connect(self.start_check)
-        except TypeError: pass
-        self.check_button.setEnabled(True)
-
-    def _set_check_button_to_abort(self):
-        self.check_button.setText(self.tr("Abort"))
-        try: self.check_button.clicked.disconnect(self.start_check)
-        except TypeError: pass
-        try: self.check_button.clicked.connect(self.abort_process)
-        except TypeError: pass
-        self.check_button.setEnabled(True)
-
-    def _start_worker(self, worker_class, data):
-        self.worker_thread = QThread()
-        self.worker_thread.setObjectName(f"{worker_class.__name__}Thread")
-        self.worker = worker_class(self.config, data)
-        self.worker.moveToThread(self.worker_thread)
-        self.worker.status_update.connect(self._update_status)
-        self.worker.progress_update.connect(self._update_progress)
-        self.worker.text_update.connect(self._update_text_area)
-        self.worker.error.connect(self._handle_error)
-        self.worker.dialog_request.connect(self._request_dialog)
-        self.worker.finished.connect(self.worker_thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.worker_thread.finished.connect(self.worker_thread.deleteLater)
-        self.worker_thread.finished.connect(self._worker_finished)
-        self.worker_thread.started.connect(self.worker.run)
-        self._disable_buttons()
-        self._set_check_button_to_abort()
-        self.worker_thread.start()
-        logging.info(f"Запущен новый воркер: {worker_class.__name__} в потоке {self.worker_thread.objectName()}")
-
-    def _worker_finished(self):
-        logging.info("GUI получил сигнал worker_thread.finished.")
-        self.worker = None
-        self.worker_thread = None
-        logging.debug("Ссылки self.worker и self.worker_thread обнулены.")
-        logging.info("Возврат UI в исходное состояние.")
-        self._enable_buttons()
-        self._set_check_button_to_check()
-
-    def start_process_flow(self):
-        target_string = self.target_entry.text().strip()
-        if not target_string:
-            self._update_status(self.tr("Enter a URL or an LM/AnyDesk ID."), level="WARNING")
-            return
-
-        self._update_text_area("")
-        self._update_progress(0)
-
-        modifiers = QGuiApplication.keyboardModifiers()
-        ctrl_is_pressed = modifiers & Qt.KeyboardModifier.ControlModifier
-        logging.debug(f"Ctrl нажат?: {bool(ctrl_is_pressed)}")
-
-        litemanager_id = find_litemanager_id(self.config, target_string)
-        if litemanager_id:
-            self._handle_litemanager_flow(litemanager_id)
+    # --- Список задач ---
+
+    def _job_item_text(self, job):
+        state_text = {
+            JOB_QUEUED: self.tr("queued"),
+            JOB_RUNNING: f"{job.progress}%",
+            JOB_WAITING_USER: self.tr("waiting for answer"),
+            JOB_DONE: self.tr("done"),
+            JOB_FAILED: self.tr("error"),
+            JOB_CANCELED: self.tr("aborted"),
+        }.get(job.state, job.state)
+        kind_text = self.tr("Check") if job.kind == 'check' else self.tr("Launch")
+        return f"#{job.id} {kind_text} {job.title} - {state_text}"
+
+    def _find_job_item(self, job_id):
+        for row in range(self.jobs_list.count()):
+            item = self.jobs_list.item(row)
+            if item.data(Qt.ItemDataRole.UserRole) == job_id:
+                return item
+        return None
+
+    def _on_job_added(self, job_id):
+        job = self.scheduler.jobs[job_id]
+        item = QListWidgetItem(self._job_item_text(job))
+        item.setData(Qt.ItemDataRole.UserRole, job_id)
+        self.jobs_list.addItem(item)
+        self.jobs_widget.setVisible(True)
+        # Новая задача сразу становится отображаемой
+        self.jobs_list.setCurrentItem(item)
+
+    def _on_job_updated(self, job_id):
+        job = self.scheduler.jobs.get(job_id)
+        item = self._find_job_item(job_id)
+        if job is None or item is None:
             return
-
-        anydesk_id = find_anydesk_id(target_string)
-        if anydesk_id:
-            self._handle_anydesk_flow(anydesk_id, bool(ctrl_is_pressed))
+        item.setText(self._job_item_text(job))
+        if job_id == self._displayed_job_id:
+            if job.status:
+                self._update_status(job.status, level=job.status_level)
+            self._update_progress(job.progress)
+            if job.text != self.json_output_text.toPlainText():
+                self._update_text_area(job.text)
+
+    def _on_job_finished(self, job_id):
+        job = self.scheduler.jobs.get(job_id)
+        if job is not None and job_id == self._displayed_job_id:
+            self._show_job_result(job)
+        self._update_cancel_button()
+        # Ограничиваем список: старые завершенные задачи удаляются
+        for removed_id in self.scheduler.remove_finished(keep_last=FINISHED_JOBS_TO_KEEP):
+            item = self._find_job_item(removed_id)
+            if item is not None:
+                self.jobs_list.takeItem(self.jobs_list.row(item))
+
+    def _on_job_selected(self, current, previous):
+        if current is not None:
+            self._display_job(current.data(Qt.ItemDataRole.UserRole))
+
+    def _display_job(self, job_id):
+        """Показывает статус, прогресс и вывод задачи в основной части окна."""
+        job = self.scheduler.jobs.get(job_id)
+        if job is None:
             return
-
-        if self.worker_thread is not None and self.worker_thread.isRunning():
-             self._update_status(self.tr("An operation is already in progress. Please wait."), level="WARNING")
-             return
-
-        self._update_status(self.tr("Parsing the entered address..."), level="INFO")
-
+        self._displayed_job_id = job_id
+        item = self._find_job_item(job_id)
+        if item is not None and self.jobs_list.currentItem() is not item:
+            self.jobs_list.setCurrentItem(item)
+        if job.status:
+            self._update_status(job.status, level=job.status_level)
+        self._update_progress(job.progress)
+        self._update_text_area(job.text)
+        if job.is_finished:
+            self._show_job_result(job)
+        self._update_cancel_button()
+
+    def _show_job_result(self, job):
+        if job.state == JOB_FAILED and job.error is not None:
+            self._handle_error(*job.error)
+
+    def _update_cancel_button(self):
+        job = self.scheduler.jobs.get(self._displayed_job_id)
+        self.cancel_job_button.setEnabled(job is not None and not job.is_finished and not job.is_canceled)
+
+    def _submit_launch(self, target_string, force_refresh):
+        """Ставит запуск BackOffice по адресу в очередь задач. Возвращает id задачи или None."""
         try:
             parsed_target_data = parse_target_string(target_string)
             if parsed_target_data is None or not parsed_target_data.get('UrlOrIp'):
                 self._update_status(self.tr("Invalid input: Failed to parse the address."), level="ERROR")
                 logging.error(f"Ошибка парсинга введенной строки: '{target_string}'.")
                 self._update_progress(0)
-                return
-            self._launch_data = {
+                return None
+            launch_data = {
                 'target_string': target_string,
                 'parsed_target': parsed_target_data,
-                'config_protocol': parsed_target_data['Scheme']
+                'config_protocol': parsed_target_data['Scheme'],
+                # Ctrl + Launch: не использовать ответ сервера, закэшированный предыдущей проверкой
+                'force_refresh': force_refresh
             }
         except Exception as e:
             logging.error(f"Неожиданная ошибка при предварительном парсинге строки '{target_string}': {e}\n{traceback.format_exc()}")
             self._update_status(self.tr("Invalid input: Parsing error ({error}).").format(error=e), level="ERROR")
             self._update_progress(0)
+            return None
+        from workers.tasks import LaunchWorker # Воркеры (requests, шаги запуска) загружаются при первом запуске, не на старте
+        return self.scheduler.submit(LaunchWorker, launch_data, 'launch', target_string)
+
+    def _update_target_suggestions(self, text):
+        """Подсказки для введенного вручную текста (setText из книжки и вставки их не вызывает)."""
+        popup = self.target_completer.popup()
+        query = text.strip()
+        # В списке из нескольких адресов подсказки не показываются
+        if len(query) < SUGGEST_MIN_QUERY_LENGTH or re.search(TARGET_LIST_SEPARATORS, query):
+            popup.hide()
             return
+        from core.launch_history import suggest_targets
+        suggestions = suggest_targets(self.config, query)
+        self.suggestions_model.clear()
+        for suggestion in suggestions:
+            item = QStandardItem(suggestion['label'])
+            item.setData(suggestion['value'], Qt.ItemDataRole.UserRole)
+            self.suggestions_model.appendRow(item)
+        if suggestions:
+            self.target_completer.complete()
+        else:
+            popup.hide()
+
+    def _apply_target_suggestion(self, index):
+        self.target_entry.setText(index.data(Qt.ItemDataRole.UserRole))
+
+    def _record_launch_target(self, target):
+        from core.launch_history import record_target
+        record_target(self.config, target)
+
+    def start_process_flow(self):
+        self.target_completer.popup().hide()
+        target_string = self.target_entry.text().strip()
+        if not target_string:
+            self._update_status(self.tr("Enter a URL or an LM/AnyDesk ID."), level="WARNING")
+            return
+
+        self._update_text_area("")
+        self._update_progress(0)
+
+        modifiers = QGuiApplication.keyboardModifiers()
+        ctrl_is_pressed = modifiers & Qt.KeyboardModifier.ControlModifier
+        logging.debug(f"Ctrl нажат?: {bool(ctrl_is_pressed)}")
+
+        targets = [t.strip() for t in re.split(TARGET_LIST_SEPARATORS, target_string) if t.strip()]
+        if len(targets) == 1:
+            litemanager_id = find_litemanager_id(self.config, target_string)
+            if litemanager_id:
+                self._record_launch_target(target_string)
+                self._handle_litemanager_flow(litemanager_id)
+                return
 
-        self._start_worker(LaunchWorker, self._launch_data)
+            anydesk_id = find_anydesk_id(target_string)
+            if anydesk_id:
+                self._record_launch_target(target_string)
+                self._handle_anydesk_flow(anydesk_id, bool(ctrl_is_pressed))
+                return
+
+        self._update_status(self.tr("Parsing the entered address..."), level="INFO")
+        # Несколько адресов - отдельная задача на каждый, выполняются параллельно
+        for target in dict.fromkeys(targets):
+            if self._submit_launch(target, bool(ctrl_is_pressed)) is not None:
+                self._record_launch_target(target)
 
     def _handle_anydesk_flow(self, anydesk_id, ctrl_pressed):
         self._update_status(self.tr("AnyDesk ID found: {anydesk_id}. Preparing...").format(anydesk_id=anydesk_id), level="INFO")
@@ -446,7 +707,6 @@ class MainWindow(QMainWindow):
             QLineEdit.EchoMode.Password
         )
         self._enable_buttons()
-        self._set_check_button_to_check()
 
         if accepted and password:
             self._update_status(self.tr("Launching AnyDesk for {anydesk_id}...").format(anydesk_id=anydesk_id), level="INFO")
@@ -492,7 +752,6 @@ class MainWindow(QMainWindow):
             QLineEdit.EchoMode.Password
         )
         self._enable_buttons()
-        self._set_check_button_to_check()
 
         if accepted and password:
             self._update_status(self.tr("Launching LiteManager for {lm_id}...").format(lm_id=lm_id), level="INFO")
@@ -535,50 +794,105 @@ class MainWindow(QMainWindow):
             self._update_progress(0)
             return
 
-        if self.worker_thread is not None and self.worker_thread.isRunning():
-             self._update_status(self.tr("An operation is already in progress. Please wait."), level="WARNING")
-             return
-        
+        # Ctrl + Check: опросить сервер заново, не используя кэш
+        force_refresh = bool(QGuiApplication.keyboardModifiers() & Qt.KeyboardModifier.ControlModifier)
+
         self._update_text_area("")
         self._update_status(self.tr("Performing server check..."))
         self._update_progress(0)
-        self._start_worker(CheckWorker, target_string)
+        targets = [t.strip() for t in re.split(TARGET_LIST_SEPARATORS, target_string) if t.strip()]
+        from workers.tasks import CheckWorker
+        for target in dict.fromkeys(targets):
+            self.scheduler.submit(CheckWorker, {'target_string': target, 'force_refresh': force_refresh}, 'check', target)
 
     def abort_process(self):
-        logging.info("Нажата кнопка 'Abort'. Попытка прервать операцию.")
-        self.check_button.setEnabled(False)
+        """Отменяет задачу, выбранную в списке."""
+        job = self.scheduler.jobs.get(self._displayed_job_id)
+        if job is None or job.is_finished:
+            logging.debug("Кнопка Abort нажата, но нет активной задачи.")
+            self._update_cancel_button()
+            return
+        logging.info(f"Нажата кнопка 'Abort'. Попытка прервать задачу #{job.id}.")
+        self.cancel_job_button.setEnabled(False)
+        self.scheduler.cancel(job.id)
         self._update_status(self.tr("Aborting operation..."), level="WARNING")
 
-        if self.worker is not None and isinstance(self.worker, BaseWorker) and self.worker_thread is not None and self.worker_thread.isRunning():
-             self.worker.cancel()
-        else:
-             logging.debug("Кнопка Abort нажата, но нет активного воркера.")
-             self._enable_buttons()
-             self._set_check_button_to_check()
-
     def paste_from_clipboard(self):
         clipboard = QApplication.clipboard()
         clipboard_content = clipboard.text()
 
         if clipboard_content and clipboard_content.strip():
-            truncated_content = clipboard_content.strip()[:100]
+            lines = [line.strip() for line in clipboard_content.strip().splitlines() if line.strip()]
+            if len(lines) > 1:
+                # Несколько строк - список адресов для параллельного запуска
+                truncated_content = ", ".join(line[:100] for line in lines)
+            else:
+                truncated_content = clipboard_content.strip()[:100]
             self.target_entry.clear()
             self.target_entry.setText(truncated_content)
             self._update_status(self.tr("Waiting for input..."))
         else:
             self._update_status(self.tr("Clipboard is empty or contains non-text data."), level="WARNING")
 
+    def enable_resident_mode(self):
+        """Закрытие окна прячет его в трей: процесс остается и принимает запуски от других процессов."""
+        if not QSystemTrayIcon.isSystemTrayAvailable():
+            logging.warning("Системный трей недоступен: закрытие окна завершает резидентный экземпляр.")
+            return
+        icon = self.windowIcon()
+        if icon.isNull():
+            icon = self.style().standardIcon(QStyle.StandardPixmap.SP_ComputerIcon)
+        self.tray_icon = QSystemTrayIcon(icon, self)
+        tray_menu = QMenu(self)
+        self.tray_show_action = tray_menu.addAction("")
+        self.tray_show_action.triggered.connect(self.show_from_tray)
+        self.tray_exit_action = tray_menu.addAction("")
+        self.tray_exit_action.triggered.connect(self.quit_from_tray)
+        self.tray_icon.setContextMenu(tray_menu)
+        self.tray_icon.activated.connect(self._on_tray_activated)
+        self.retranslateUi()
+        self.tray_icon.show()
+        # Диалоги и окна задач, закрытые при спрятанном главном окне, не должны завершать процесс
+        QApplication.instance().setQuitOnLastWindowClosed(False)
+
+    def _on_tray_activated(self, reason):
+        if reason in (QSystemTrayIcon.ActivationReason.Trigger, QSystemTrayIcon.ActivationReason.DoubleClick):
+            self.show_from_tray()
+
+    def show_from_tray(self):
+        self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
+    def quit_from_tray(self):
+        self._quitting = True
+        if self.close():
+            QApplication.instance().quit()
+        else:
+            self._quitting = False
+
+    def handle_forwarded_argv(self, argv):
+        """Запуск, переданный резидентному экземпляру другим процессом: как initial_target при старте."""
+        self.show_from_tray()
+        if argv:
+            self.target_entry.setText(argv[0])
+            self.start_process_flow()
+
     def closeEvent(self, event):
-        if self.worker_thread is not None and self.worker_thread.isRunning():
+        if self.tray_icon is not None and not self._quitting:
+            # Резидентный режим: окно прячется, задачи продолжают выполняться
+            event.ignore()
+            self.hide()
+            return
+        if self.scheduler.active_jobs():
             reply = QMessageBox.question(self, self.tr("Exit"),
                                          self.tr("An operation is in progress. Abort and exit?"),
                                          QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
                                          QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
-                if isinstance(self.worker, BaseWorker):
-                     self.worker.cancel()
-                if not self.worker_thread.wait(5000):
-                     self.worker_thread.terminate()
+                self.scheduler.cancel_all()
+                if not self.scheduler.wait_for_done(5000):
+                     logging.warning("Не все задачи завершились за 5 сек после отмены.")
                 event.accept()
             else:
                 event.ignore()
@@ -594,11 +908,37 @@ class MainWindow(QMainWindow):
 
     def show_notebook(self):
         """Открывает окно книжки подключений"""
-        notebook_window = NotebookWindow(self)
+        from gui.notebook import NotebookWindow
+        notebook_window = NotebookWindow(self.config, self)
         notebook_window.connection_selected.connect(self.handle_notebook_selection)
-        notebook_window.exec()
+        notebook_window.probe_requested.connect(self._probe_notebook_server)
+        self.server_status_updated.connect(notebook_window.model.update_server_status)
+        self.notebook_changed.connect(notebook_window.filter_connections)
+        if self.journal_sync is not None:
+            self.journal_sync.sync_now()
+        try:
+            notebook_window.exec()
+        finally:
+            self.server_status_updated.disconnect(notebook_window.model.update_server_status)
+            self.notebook_changed.disconnect(notebook_window.filter_connections)
+
+    def _probe_notebook_server(self, rowid):
+        if self.server_monitor is None:
+            self._update_status(self.tr("Server monitoring is disabled."), level="WARNING")
+            return
+        self.server_monitor.probe_now(rowid)
 
     def handle_notebook_selection(self, connection_id):
         """Обрабатывает выбор подключения из книжки"""
         self.target_entry.setText(connection_id)
-        self.start_process_flow()
\ No newline at end of file
+        self.start_process_flow()
+
+    def show_fleet_check(self):
+        """Открывает (немодальное) окно пакетной проверки серверов"""
+        if self.fleet_window is None:
+            from gui.fleet_window import FleetCheckWindow
+            self.fleet_window = FleetCheckWindow(self.config, self)
+            self.fleet_window.target_selected.connect(self.target_entry.setText)
+        self.fleet_window.show()
+        self.fleet_window.raise_()
+        self.fleet_window.activateWindow()
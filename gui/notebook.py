@@ -1,244 +1,479 @@
-from PyQt6.QtWidgets import (
-    QDialog, QVBoxLayout, QHBoxLayout, QLineEdit,
-    QPushButton, QTreeWidget, QTreeWidgetItem,
-    QComboBox, QLabel, QMessageBox, QMenu
-)
-from PyQt6.QtCore import Qt, pyqtSignal
-import json
-import os
-import logging
-
-class AddConnectionDialog(QDialog):
-    """Диалог для добавления нового подключения"""
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Add connection")
-        self.setup_ui()
-
-    def setup_ui(self):
-        layout = QVBoxLayout(self)
-
-        # Тип подключения
-        type_layout = QHBoxLayout()
-        type_layout.addWidget(QLabel("Type:"))
-        self.conn_type = QComboBox()
-        self.conn_type.addItems(["Anydesk", "LiteManager"])
-        type_layout.addWidget(self.conn_type)
-        layout.addLayout(type_layout)
-
-        # Имя подключения
-        name_layout = QHBoxLayout()
-        name_layout.addWidget(QLabel("Name:"))
-        self.name_edit = QLineEdit()
-        self.name_edit.setMaxLength(25)
-        name_layout.addWidget(self.name_edit)
-        layout.addLayout(name_layout)
-
-        # ID подключения
-        id_layout = QHBoxLayout()
-        id_layout.addWidget(QLabel("ID:       "))
-        self.id_edit = QLineEdit()
-        self.id_edit.setMaxLength(15)
-        id_layout.addWidget(self.id_edit)
-        layout.addLayout(id_layout)
-
-        # Кнопки
-        buttons_layout = QHBoxLayout()
-        save_btn = QPushButton("Save")
-        save_btn.clicked.connect(self.accept)
-        cancel_btn = QPushButton("Cancel")
-        cancel_btn.clicked.connect(self.reject)
-        buttons_layout.addWidget(save_btn)
-        buttons_layout.addWidget(cancel_btn)
-        layout.addLayout(buttons_layout)
-
-    def get_data(self):
-        return {
-            "type": self.conn_type.currentText(),
-            "name": self.name_edit.text(),
-            "id": self.id_edit.text()
-        }
-
-
-class NotebookWindow(QDialog):
-    """Основное окно книжки подключений"""
-    connection_selected = pyqtSignal(str)  # Сигнал для передачи ID в главное окно
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Connection Book")
-        self.setFixedWidth(320)
-        self.setFixedHeight(450)
-        self.notebook_path = "notebook.json"
-        self.notebook_default = {"Anydesk": {}, "LiteManager": {}}
-        self.connections = self.load_connections()
-        self.setup_ui()
-        self.populate_tree()
-
-    def setup_ui(self):
-        layout = QVBoxLayout(self)
-
-        # Поисковая строка и кнопка добавления
-        search_layout = QHBoxLayout()
-        self.search_edit = QLineEdit()
-        self.search_edit.setPlaceholderText("Search...")
-        self.search_edit.textChanged.connect(self.filter_connections)
-        add_btn = QPushButton("+")
-        add_btn.clicked.connect(self.add_connection)
-        search_layout.addWidget(self.search_edit)
-        search_layout.addWidget(add_btn)
-        layout.addLayout(search_layout)
-
-        # Дерево подключений
-        self.tree = QTreeWidget()
-        self.tree.setIndentation(10)
-        self.tree.setHeaderHidden(True)  # Скрываем заголовки
-        self.tree.setColumnCount(2)  # Уменьшаем до 2 колонок: имя и ID
-        self.tree.itemDoubleClicked.connect(self.on_item_double_clicked)
-        self.tree.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        self.tree.customContextMenuRequested.connect(self.show_context_menu)
-        layout.addWidget(self.tree)
-
-    def create_notebook(self):
-        logging.info("Файл записной книжки не найден")
-        try:
-            with open(self.notebook_path, "w", encoding="utf-8") as file:
-                json.dump(self.notebook_default, file, ensure_ascii=False, indent=4)
-            logging.info("Был создан пустой файл записной книжки")
-        except Exception:
-            logging.error("Не удалось создать файл записной книжки", exc_info=True)
-
-    def load_connections(self):
-        if not os.path.exists(self.notebook_path):
-            self.create_notebook()
-            return self.notebook_default
-        try:
-            with open(self.notebook_path, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            QMessageBox.warning(self, "Ошибка", f"Не удалось загрузить книжку: {e}")
-            self.create_notebook()
-            return self.notebook_default
-
-    def save_connections(self):
-        try:
-            with open(self.notebook_path, 'w') as f:
-                json.dump(self.connections, f, indent=4)
-        except Exception as e:
-            QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить книжку: {e}")
-
-    def populate_tree(self):
-        self.tree.clear()
-
-        # Создаем корневые элементы для каждого типа подключения
-        for conn_type, connections in self.connections.items():
-            # Создаем родительский элемент для типа подключения
-            type_item = QTreeWidgetItem([conn_type, ""])
-            self.tree.addTopLevelItem(type_item)
-
-            # Добавляем дочерние элементы (подключения)
-            for name, id_value in connections.items():
-                # Форматируем строку подключения с отступом
-                connection_item = QTreeWidgetItem([f"{name}:  ", str(id_value)])
-                type_item.addChild(connection_item)
-
-            # Разворачиваем родительский элемент по умолчанию
-            type_item.setExpanded(True)
-
-        # Подгоняем ширину колонок под содержимое
-        for i in range(2):
-            self.tree.resizeColumnToContents(i)
-
-    def filter_connections(self):
-        search_text = self.search_edit.text().lower()
-
-        # Проходим по всем типам подключений (корневым элементам)
-        for i in range(self.tree.topLevelItemCount()):
-            type_item = self.tree.topLevelItem(i)
-            show_type = False
-
-            # Проверяем все дочерние элементы (подключения)
-            for j in range(type_item.childCount()):
-                child_item = type_item.child(j)
-                # Проверяем, содержит ли подключение искомый текст
-                show_connection = any(
-                    search_text in child_item.text(col).lower()
-                    for col in range(child_item.columnCount())
-                )
-                child_item.setHidden(not show_connection)
-                show_type = show_type or show_connection
-
-            # Показываем тип, если есть видимые подключения или поиск пустой
-            type_item.setHidden(not (show_type or not search_text))
-
-    def add_connection(self):
-        dialog = AddConnectionDialog(self)
-        if dialog.exec():
-            data = dialog.get_data()
-            if not all([data["name"], data["id"]]):
-                QMessageBox.warning(self, "Ошибка", "Все поля должны быть заполнены")
-                return
-
-            self.connections[data["type"]][data["name"]] = data["id"]
-            self.save_connections()
-            self.populate_tree()
-
-    def on_item_double_clicked(self, item, column):
-        # Проверяем, что это дочерний элемент (подключение), а не тип
-        if item.parent():
-            connection_id = item.text(1)  # ID теперь в колонке 1
-            self.connection_selected.emit(connection_id)
-            self.accept()
-
-    def show_context_menu(self, position):
-        item = self.tree.itemAt(position)
-        if item and item.parent():  # Проверяем, что это подключение, а не тип
-            menu = QMenu()
-            edit_action = menu.addAction("Edit")
-            delete_action = menu.addAction("Delete")
-
-            action = menu.exec(self.tree.viewport().mapToGlobal(position))
-            if action == edit_action:
-                self.edit_connection(item)
-            elif action == delete_action:
-                self.delete_connection(item)
-
-    def edit_connection(self, item):
-        conn_type = item.parent().text(0)
-        old_name = item.text(0).rstrip(':  ')
-        old_id = item.text(1)
-
-        dialog = AddConnectionDialog(self)
-        dialog.conn_type.setCurrentText(conn_type)
-        dialog.name_edit.setText(old_name)
-        dialog.id_edit.setText(old_id)
-
-        if dialog.exec():
-            data = dialog.get_data()
-            if not all([data["name"], data["id"]]):
-                QMessageBox.warning(self, "Ошибка", "Все поля должны быть заполнены")
-                return
-
-            # Удаляем старое подключение
-            del self.connections[conn_type][old_name]
-            # Добавляем новое
-            self.connections[data["type"]][data["name"]] = data["id"]
-            self.save_connections()
-            self.populate_tree()
-
-    def delete_connection(self, item):
-        conn_type = item.parent().text(0)
-        name = item.text(0).rstrip(':  ')
-
-        reply = QMessageBox.question(
-            self,
-            'Подтверждение',
-            f'Вы уверены, что хотите удалить подключение "{name}"?',
-            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-        )
-
-        if reply == QMessageBox.StandardButton.Yes:
-            del self.connections[conn_type][name]
-            self.save_connections()
-            self.populate_tree()
\ No newline at end of file
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLineEdit,
+    QPushButton, QTreeView,
+    QComboBox, QLabel, QMessageBox, QMenu
+)
+from PyQt6.QtCore import Qt, pyqtSignal, QAbstractItemModel, QModelIndex, QTimer
+from PyQt6.QtGui import QColor
+import time
+import bisect
+import sqlite3
+import logging
+
+from core.notebook_store import get_notebook_store, sort_key, NotebookError, NOTEBOOK_TYPES, NOTEBOOK_SERVER_TYPE
+from core.fuzzy_index import normalize_text
+
+# Сколько записей раздела читается из базы за раз (следующая страница - при прокрутке до конца)
+NOTEBOOK_PAGE_SIZE = 200
+# Пауза после ввода в строку поиска, после которой выполняется запрос
+SEARCH_DEBOUNCE_MS = 200
+# С какой длины запроса (без пробелов) поиск нечеткий: лучшие совпадения первыми, с опечатками.
+# Более короткий запрос - поиск по началу слов с постраничным чтением
+FUZZY_MIN_QUERY_LENGTH = 3
+# Сколько лучших нечетких совпадений показывается (уточнение запроса сужает список)
+NOTEBOOK_FUZZY_LIMIT = 200
+# Длина поля ID: ID AnyDesk/LiteManager и адрес сервера (Server)
+CONNECTION_ID_MAX_LENGTH = 15
+SERVER_ADDRESS_MAX_LENGTH = 255
+
+class AddConnectionDialog(QDialog):
+    """Диалог для добавления нового подключения"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Add connection")
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        # Тип подключения
+        type_layout = QHBoxLayout()
+        type_layout.addWidget(QLabel("Type:"))
+        self.conn_type = QComboBox()
+        self.conn_type.addItems(list(NOTEBOOK_TYPES))
+        self.conn_type.currentTextChanged.connect(self._on_type_changed)
+        type_layout.addWidget(self.conn_type)
+        layout.addLayout(type_layout)
+
+        # Имя подключения
+        name_layout = QHBoxLayout()
+        name_layout.addWidget(QLabel("Name:"))
+        self.name_edit = QLineEdit()
+        self.name_edit.setMaxLength(25)
+        name_layout.addWidget(self.name_edit)
+        layout.addLayout(name_layout)
+
+        # ID подключения
+        id_layout = QHBoxLayout()
+        id_layout.addWidget(QLabel("ID:       "))
+        self.id_edit = QLineEdit()
+        self.id_edit.setMaxLength(CONNECTION_ID_MAX_LENGTH)
+        id_layout.addWidget(self.id_edit)
+        layout.addLayout(id_layout)
+
+        # Кнопки
+        buttons_layout = QHBoxLayout()
+        save_btn = QPushButton("Save")
+        save_btn.clicked.connect(self.accept)
+        cancel_btn = QPushButton("Cancel")
+        cancel_btn.clicked.connect(self.reject)
+        buttons_layout.addWidget(save_btn)
+        buttons_layout.addWidget(cancel_btn)
+        layout.addLayout(buttons_layout)
+
+    def _on_type_changed(self, conn_type):
+        # У сервера вместо ID - адрес (URL или IP:порт)
+        is_server = conn_type == NOTEBOOK_SERVER_TYPE
+        self.id_edit.setMaxLength(SERVER_ADDRESS_MAX_LENGTH if is_server else CONNECTION_ID_MAX_LENGTH)
+        self.id_edit.setPlaceholderText("https://server:443" if is_server else "")
+
+    def get_data(self):
+        return {
+            "type": self.conn_type.currentText(),
+            "name": self.name_edit.text(),
+            "id": self.id_edit.text()
+        }
+
+
+class _ConnectionGroup:
+    """Раздел книжки (тип подключения) с уже прочитанными записями."""
+    __slots__ = ('conn_type', 'rows', 'keys', 'exhausted')
+
+    def __init__(self, conn_type):
+        self.conn_type = conn_type
+        self.rows = [] # записи {'rowid', 'type', 'name', 'id'} в порядке sort_key
+        self.keys = [] # ключи порядка записей (sort_key или оценка + sort_key) - для вставки на место
+        self.exhausted = False # Прочитаны все записи раздела, подходящие под фильтр
+
+
+class NotebookModel(QAbstractItemModel):
+    """
+    Книжка в виде дерева "тип -> подключения" поверх NotebookStore. Записи читаются
+    страницами по мере прокрутки (canFetchMore/fetchMore), фильтр выполняется запросом
+    к индексу, а изменения одной записи вставляют/удаляют одну строку без пересборки.
+    Запрос от FUZZY_MIN_QUERY_LENGTH символов ищется нечетко: в разделах - лучшие
+    NOTEBOOK_FUZZY_LIMIT совпадений по убыванию оценки, без догрузки страниц.
+    Третья колонка - последний результат фонового опроса для записей типа Server.
+    internalId элемента: 0 - раздел, номер раздела + 1 - подключение в этом разделе.
+    """
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.filter_text = ""
+        self.statuses = {} # rowid -> последний опрос сервера (NotebookStore.get_server_statuses)
+        self.fuzzy = False # Текущий фильтр ищется нечетко (порядок записей - по оценке)
+        self.groups = []
+        self._fetching = False # Во время вставки страницы следующая не запрашивается (повторный вход из представлений)
+        self._load_groups()
+
+    def _fetch_page(self, group):
+        after = (group.rows[-1]['name'], group.rows[-1]['rowid']) if group.rows else None
+        try:
+            rows = self.store.search(self.filter_text, limit=NOTEBOOK_PAGE_SIZE, conn_type=group.conn_type, after=after)
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка чтения книжки подключений: {e}")
+            rows = []
+        group.exhausted = len(rows) < NOTEBOOK_PAGE_SIZE
+        return rows
+
+    @staticmethod
+    def _rank_key(connection, score):
+        # Лучшая оценка - выше; при равной - порядок обычного списка
+        return (-score[0], -score[1]) + sort_key(connection)
+
+    def _load_fuzzy_groups(self):
+        try:
+            ranked = self.store.fuzzy_search(self.filter_text, limit=NOTEBOOK_FUZZY_LIMIT)
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка чтения книжки подключений: {e}")
+            ranked = []
+        for conn_type in NOTEBOOK_TYPES:
+            group = _ConnectionGroup(conn_type)
+            group.exhausted = True
+            for connection, score in ranked:
+                if connection['type'] == conn_type:
+                    group.rows.append(connection)
+                    group.keys.append(self._rank_key(connection, score))
+            if group.rows:
+                self.groups.append(group)
+
+    def _load_groups(self):
+        """Первая страница каждого раздела; при поиске разделы без совпадений не показываются."""
+        self.groups = []
+        try:
+            self.statuses = self.store.get_server_statuses()
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка чтения состояния серверов книжки: {e}")
+        self.fuzzy = len(normalize_text(self.filter_text).replace(" ", "")) >= FUZZY_MIN_QUERY_LENGTH
+        if self.fuzzy:
+            self._load_fuzzy_groups()
+            return
+        for conn_type in NOTEBOOK_TYPES:
+            group = _ConnectionGroup(conn_type)
+            group.rows = self._fetch_page(group)
+            group.keys = [sort_key(row) for row in group.rows]
+            if group.rows or not self.filter_text.strip():
+                self.groups.append(group)
+
+    def set_filter(self, text):
+        self.beginResetModel()
+        self.filter_text = text
+        self._load_groups()
+        self.endResetModel()
+
+    # --- QAbstractItemModel ---
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, 0)
+        return self.createIndex(row, column, parent.row() + 1)
+
+    def parent(self, index):
+        if not index.isValid() or index.internalId() == 0:
+            return QModelIndex()
+        return self.createIndex(index.internalId() - 1, 0, 0)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.groups)
+        if parent.internalId() == 0 and parent.column() == 0:
+            return len(self.groups[parent.row()].rows)
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 3
+
+    def hasChildren(self, parent=QModelIndex()):
+        if parent.isValid():
+            if parent.internalId() != 0 or parent.column() != 0:
+                return False
+            group = self.groups[parent.row()]
+            return bool(group.rows) or not group.exhausted
+        return bool(self.groups)
+
+    def canFetchMore(self, parent):
+        return (not self._fetching and parent.isValid() and parent.internalId() == 0 and parent.column() == 0
+                and not self.groups[parent.row()].exhausted)
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+        group = self.groups[parent.row()]
+        rows = self._fetch_page(group)
+        if rows:
+            self._fetching = True
+            try:
+                self.beginInsertRows(parent, len(group.rows), len(group.rows) + len(rows) - 1)
+                group.rows.extend(rows)
+                group.keys.extend(sort_key(row) for row in rows)
+                self.endInsertRows()
+            finally:
+                self._fetching = False
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if index.internalId() == 0:
+            if role == Qt.ItemDataRole.DisplayRole and index.column() == 0:
+                return self.groups[index.row()].conn_type
+            return None
+        connection = self.groups[index.internalId() - 1].rows[index.row()]
+        if index.column() == 2:
+            return self._status_data(self.statuses.get(connection['rowid']), role)
+        if role == Qt.ItemDataRole.DisplayRole:
+            # Форматируем строку подключения с отступом
+            return f"{connection['name']}:  " if index.column() == 0 else connection['id']
+        if role == Qt.ItemDataRole.UserRole:
+            return connection['rowid']
+        return None
+
+    @staticmethod
+    def _status_data(status, role):
+        if status is None:
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            if status['ok']:
+                return f"{status['version']}  {status['latency_ms']} ms"
+            return f"{status['version'] or '?'}  no response"
+        if role == Qt.ItemDataRole.ForegroundRole:
+            if not status['ok']:
+                return QColor("gray")
+            return QColor("green") if status['server_state'] == "STARTED_SUCCESSFULLY" else QColor("darkorange")
+        if role == Qt.ItemDataRole.ToolTipRole:
+            checked_at = time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(status['checked_at']))
+            details = status['server_state'] if status['ok'] else status['error']
+            return f"{status['edition'] or ''} {status['version'] or ''}\n{details}\n{checked_at}".strip()
+        return None
+
+    def connection(self, index):
+        """Запись подключения для индекса или None (раздел)."""
+        if not index.isValid() or index.internalId() == 0:
+            return None
+        return self.groups[index.internalId() - 1].rows[index.row()]
+
+    # --- Точечные изменения ---
+
+    def _remove_loaded(self, rowid):
+        for group_row, group in enumerate(self.groups):
+            for row, connection in enumerate(group.rows):
+                if connection['rowid'] == rowid:
+                    self.beginRemoveRows(self.index(group_row, 0), row, row)
+                    del group.rows[row]
+                    del group.keys[row]
+                    self.endRemoveRows()
+                    return
+
+    def _group_row(self, conn_type):
+        for group_row, group in enumerate(self.groups):
+            if group.conn_type == conn_type:
+                return group_row
+        # Раздел был скрыт поиском - показываем его на его месте в порядке NOTEBOOK_TYPES
+        order = {name: position for position, name in enumerate(NOTEBOOK_TYPES)}
+        group_row = len([g for g in self.groups if order.get(g.conn_type, len(order)) < order.get(conn_type, len(order))])
+        group = _ConnectionGroup(conn_type)
+        group.exhausted = True # Единственная запись раздела под фильтром - та, что сейчас вставится
+        self.beginInsertRows(QModelIndex(), group_row, group_row)
+        self.groups.insert(group_row, group)
+        self.endInsertRows()
+        return group_row
+
+    def update_server_status(self, event):
+        """Новый результат опроса сервера (событие ServerMonitor) - обновляет ячейку состояния."""
+        rowid = event['rowid']
+        self.statuses[rowid] = event['status']
+        for group_row, group in enumerate(self.groups):
+            if group.conn_type != NOTEBOOK_SERVER_TYPE:
+                continue
+            for row, connection in enumerate(group.rows):
+                if connection['rowid'] == rowid:
+                    status_index = self.index(row, 2, self.index(group_row, 0))
+                    self.dataChanged.emit(status_index, status_index)
+                    return
+
+    def refresh_connection(self, rowid):
+        """Обновляет одну запись после добавления/изменения/удаления в хранилище."""
+        self._remove_loaded(rowid)
+        try:
+            # Смена адреса сервера сбрасывает его прежнее состояние
+            self.statuses = self.store.get_server_statuses()
+            connection = self.store.get(rowid)
+            if connection is None:
+                return
+            if self.fuzzy:
+                score = self.store.fuzzy_score(rowid, self.filter_text)
+                if score is None:
+                    return
+                key = self._rank_key(connection, score)
+            elif self.store.matches(rowid, self.filter_text):
+                key = sort_key(connection)
+            else:
+                return
+        except sqlite3.Error as e:
+            logging.error(f"Ошибка чтения книжки подключений: {e}")
+            return
+        group_row = self._group_row(connection['type'])
+        group = self.groups[group_row]
+        row = bisect.bisect_left(group.keys, key)
+        if row == len(group.rows) and not group.exhausted:
+            return # Запись дальше прочитанной части - появится со следующей страницей
+        self.beginInsertRows(self.index(group_row, 0), row, row)
+        group.rows.insert(row, connection)
+        group.keys.insert(row, key)
+        self.endInsertRows()
+
+
+class NotebookWindow(QDialog):
+    """Основное окно книжки подключений"""
+    connection_selected = pyqtSignal(str)  # Сигнал для передачи ID в главное окно
+    probe_requested = pyqtSignal(int) # "Check now" для сервера: rowid записи
+
+    def __init__(self, config, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Connection Book")
+        self.setFixedWidth(460)
+        self.setFixedHeight(450)
+        self.config = config
+        self.store = get_notebook_store(config)
+        # Поиск выполняется после паузы во вводе, а не на каждое нажатие
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.filter_connections)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        # Поисковая строка и кнопка добавления
+        search_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search...")
+        self.search_edit.textChanged.connect(self.search_timer.start)
+        add_btn = QPushButton("+")
+        add_btn.clicked.connect(self.add_connection)
+        search_layout.addWidget(self.search_edit)
+        search_layout.addWidget(add_btn)
+        layout.addLayout(search_layout)
+
+        # Дерево подключений: модель читает записи из базы по мере прокрутки
+        self.model = NotebookModel(self.store, self)
+        self.tree = QTreeView()
+        self.tree.setModel(self.model)
+        self.tree.setIndentation(10)
+        self.tree.setHeaderHidden(True)  # Скрываем заголовки
+        self.tree.setUniformRowHeights(True) # Высота строк не вычисляется для каждой записи
+        self.tree.doubleClicked.connect(self.on_item_double_clicked)
+        self.tree.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.tree.customContextMenuRequested.connect(self.show_context_menu)
+        # Разворачивание подгружает записи (fetchMore) - не внутри сигнала модели, а следующим событием
+        self.model.modelReset.connect(lambda: QTimer.singleShot(0, self._expand_groups))
+        self.model.rowsInserted.connect(
+            lambda parent, first, last: None if parent.isValid() else QTimer.singleShot(0, self._expand_groups))
+        layout.addWidget(self.tree)
+        self._expand_groups()
+
+    def _expand_groups(self):
+        # Разворачиваем разделы и подгоняем ширину колонок под прочитанные записи
+        for group_row in range(self.model.rowCount()):
+            self.tree.expand(self.model.index(group_row, 0))
+        self.tree.resizeColumnToContents(0)
+        self.tree.resizeColumnToContents(1)
+
+    def filter_connections(self):
+        self.search_timer.stop()
+        self.model.set_filter(self.search_edit.text())
+
+    def _apply_change(self, change, *args):
+        """Выполняет изменение книжки (одна транзакция). Возвращает (выполнено, результат change)."""
+        try:
+            return True, change(*args)
+        except NotebookError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+        except sqlite3.Error as e:
+            logging.error(f"Не удалось сохранить книжку подключений: {e}")
+            QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить книжку: {e}")
+        return False, None
+
+    def add_connection(self):
+        dialog = AddConnectionDialog(self)
+        if dialog.exec():
+            data = dialog.get_data()
+            if not all([data["name"], data["id"]]):
+                QMessageBox.warning(self, "Ошибка", "Все поля должны быть заполнены")
+                return
+
+            succeeded, rowid = self._apply_change(self.store.add, data["type"], data["name"], data["id"])
+            if succeeded:
+                self.model.refresh_connection(rowid)
+
+    def on_item_double_clicked(self, index):
+        # Проверяем, что это подключение, а не тип
+        connection = self.model.connection(index)
+        if connection:
+            self.connection_selected.emit(connection['id'])
+            self.accept()
+
+    def show_context_menu(self, position):
+        connection = self.model.connection(self.tree.indexAt(position))
+        if connection:  # Проверяем, что это подключение, а не тип
+            menu = QMenu()
+            edit_action = menu.addAction("Edit")
+            delete_action = menu.addAction("Delete")
+            probe_action = menu.addAction("Check now") if connection['type'] == NOTEBOOK_SERVER_TYPE else None
+
+            action = menu.exec(self.tree.viewport().mapToGlobal(position))
+            if action is None:
+                return
+            if action == probe_action:
+                self.probe_requested.emit(connection['rowid'])
+            elif action == edit_action:
+                self.edit_connection(connection)
+            elif action == delete_action:
+                self.delete_connection(connection)
+
+    def edit_connection(self, connection):
+        dialog = AddConnectionDialog(self)
+        dialog.conn_type.setCurrentText(connection['type'])
+        dialog.name_edit.setText(connection['name'])
+        dialog.id_edit.setText(connection['id'])
+
+        if dialog.exec():
+            data = dialog.get_data()
+            if not all([data["name"], data["id"]]):
+                QMessageBox.warning(self, "Ошибка", "Все поля должны быть заполнены")
+                return
+
+            rowid = connection['rowid']
+            succeeded, _ = self._apply_change(self.store.update, rowid, data["type"], data["name"], data["id"])
+            if succeeded:
+                self.model.refresh_connection(rowid)
+
+    def delete_connection(self, connection):
+        name = connection['name']
+
+        reply = QMessageBox.question(
+            self,
+            'Подтверждение',
+            f'Вы уверены, что хотите удалить подключение "{name}"?',
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+
+        if reply == QMessageBox.StandardButton.Yes:
+            rowid = connection['rowid']
+            succeeded, _ = self._apply_change(self.store.delete, rowid)
+            if succeeded:
+                self.model.refresh_connection(rowid)
@@ -0,0 +1,23 @@
+# gui/resident.py - Резидентный режим: прием запусков от последующих процессов приложения
+#
+# Поток приема (utils/single_instance.py) передает аргументы сигналом, поэтому окно
+# обрабатывает их в GUI-потоке.
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from utils.single_instance import InstanceListener
+
+
+class InstanceServer(QObject):
+    argv_received = pyqtSignal(list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._listener = InstanceListener(lambda message: self.argv_received.emit(message['argv']))
+
+    def start(self):
+        """True - этот процесс стал резидентным экземпляром."""
+        return self._listener.start()
+
+    def stop(self):
+        self._listener.stop()
@@ -1,18 +1,40 @@
 # main.py
+import time
+_STARTED_AT = time.perf_counter() # Отсчет времени запуска - до импорта остальных модулей
+
 import sys
 import os
 import logging
 
-from PyQt6.QtWidgets import QApplication
-
-# Импортируем модули
-from core.config import load_config, get_config_value
+# Импортируем модули (PyQt6 и GUI - только в ветке окна, консольный режим их не загружает)
+import cli
+from core.config import load_config, get_config_value, ConfigWatcher
 from utils.logging_setup import setup_logging
-from gui.main_window import MainWindow
-from locales.translator import Translator # Импортируем наш класс Translator
+
+# --startup-benchmark[=БЮДЖЕТ_МС]: замер запуска до первой отрисовки окна, отчет JSON в stdout и выход
+STARTUP_BENCHMARK_ARG = '--startup-benchmark'
+
+
+def on_first_paint(app, config, profiler, benchmark_budget_ms):
+    """Итог замера запуска. В режиме бенчмарка (benchmark_budget_ms не None) - отчет и выход с кодом 1 при превышении бюджета."""
+    profiler.mark('first_paint')
+    profiler.stop_import_timing()
+    report = profiler.log_report()
+    budget_ms = benchmark_budget_ms if benchmark_budget_ms is not None else \
+        get_config_value(config, 'Startup', 'BudgetMs', default=0, type_cast=int)
+    report['budget_ms'] = budget_ms
+    report['within_budget'] = profiler.check_budget(budget_ms)
+    if benchmark_budget_ms is not None:
+        import json
+        print(json.dumps(report, ensure_ascii=False), flush=True)
+        app.exit(0 if report['within_budget'] else 1)
 
 
 if __name__ == "__main__":
+    # 0. Консольные команды (launch, check, mirror и т.д.) выполняются без GUI
+    if len(sys.argv) > 1 and sys.argv[1] in cli.COMMANDS:
+        sys.exit(cli.main(sys.argv[1:], started_at=_STARTED_AT))
+
     # 1. Загружаем конфигурацию
     config = load_config()
 
@@ -20,12 +42,50 @@ if __name__ == "__main__":
     setup_logging(config)
     logging.info("Приложение запущено.")
 
+    # Замер запуска: [Startup] Profile или --startup-benchmark. Импорты GUI ниже уже измеряются
+    benchmark_budget_ms = None
+    benchmark_args = [arg for arg in sys.argv[1:] if arg.split('=', 1)[0] == STARTUP_BENCHMARK_ARG]
+    if benchmark_args:
+        _, _, budget_value = benchmark_args[0].partition('=')
+        try:
+            benchmark_budget_ms = int(budget_value) if budget_value else get_config_value(config, 'Startup', 'BudgetMs', default=0, type_cast=int)
+        except ValueError:
+            print(f"Использование: {STARTUP_BENCHMARK_ARG}[=БЮДЖЕТ_МС], БЮДЖЕТ_МС - целое число миллисекунд "
+                  f"(получено '{budget_value}').", file=sys.stderr)
+            sys.exit(2)
+
     # 3. Проверяем аргументы командной строки
     initial_target = None
-    if len(sys.argv) > 1:
-        initial_target = sys.argv[1]
+    target_args = [arg for arg in sys.argv[1:] if arg.split('=', 1)[0] != STARTUP_BENCHMARK_ARG]
+    if target_args:
+        initial_target = target_args[0]
         logging.info(f"Получен аргумент командной строки: '{initial_target}'")
 
+    # Резидентный режим: если экземпляр уже работает, передаем ему аргументы и выходим, не загружая Qt
+    resident_enabled = benchmark_budget_ms is None and get_config_value(config, 'Resident', 'Enabled', default=True, type_cast=bool)
+    if resident_enabled:
+        from utils.single_instance import forward_to_running_instance
+        if forward_to_running_instance(target_args):
+            logging.info(f"Аргументы переданы резидентному экземпляру за {int((time.perf_counter() - _STARTED_AT) * 1000)} мс, выход.")
+            sys.exit(0)
+
+    profiler = None
+    if benchmark_budget_ms is not None or get_config_value(config, 'Startup', 'Profile', default=False, type_cast=bool):
+        from utils.startup_profiler import StartupProfiler
+        profiler = StartupProfiler(_STARTED_AT)
+        profiler.mark('config_loaded')
+        profiler.start_import_timing()
+
+    from PyQt6.QtWidgets import QApplication
+    from core.peer_cache import start_peer_cache_service
+    from gui.main_window import MainWindow
+    from locales.translator import Translator # Импортируем наш класс Translator
+    if profiler:
+        profiler.mark('imports_done')
+
+    # Запускаем раздачу кэша архивов пирам в локальной сети (если включено в конфиге)
+    start_peer_cache_service(config)
+
     # 4. Создаем экземпляр QApplication
     app = QApplication(sys.argv)
 
@@ -38,6 +98,25 @@ if __name__ == "__main__":
 
     # 6. Создаем главное окно, передавая ему конфиг, переводчик и начальный аргумент
     main_window = MainWindow(config, translator, initial_target)
+    if profiler:
+        profiler.mark('main_window_created')
+        main_window.first_painted.connect(lambda: on_first_paint(app, config, profiler, benchmark_budget_ms))
+
+    # Этот процесс становится резидентным: принимает запуски следующих вызовов и прячется в трей
+    if resident_enabled:
+        from gui.resident import InstanceServer
+        instance_server = InstanceServer(app)
+        if instance_server.start():
+            main_window.enable_resident_mode()
+            instance_server.argv_received.connect(main_window.handle_forwarded_argv)
+            app.aboutToQuit.connect(instance_server.stop)
+
+    # Изменения config.ini на диске применяются без перезапуска
+    if get_config_value(config, 'Settings', 'ConfigHotReload', default=True, type_cast=bool):
+        config_watcher = ConfigWatcher(main_window.config_reloaded.emit)
+        config_watcher.start()
+        app.aboutToQuit.connect(config_watcher.stop)
+    app.aboutToQuit.connect(main_window.stop_background_services)
 
     # 7. Показываем окно
     main_window.show()
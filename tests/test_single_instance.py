@@ -0,0 +1,64 @@
+# tests/test_single_instance.py - Резидентный экземпляр: оборванные подключения не останавливают прием
+
+import os
+import socket
+import tempfile
+import threading
+
+import pytest
+
+from utils import single_instance
+
+
+@pytest.fixture
+def instance_dir(tmp_path, monkeypatch):
+    # Сокет и ключ - во временной папке теста, а не в общей папке пользователя
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def listener(instance_dir):
+    received = []
+    event = threading.Event()
+
+    def on_message(message):
+        received.append(message)
+        event.set()
+
+    instance_listener = single_instance.InstanceListener(on_message)
+    assert instance_listener.start()
+    yield instance_listener, received, event
+    instance_listener.stop()
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="Unix-сокет")
+def test_aborted_client_does_not_stop_listener(listener):
+    instance_listener, received, event = listener
+    # Клиент подключается и отключается, не пройдя проверку ключа
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(instance_listener.address)
+
+    assert single_instance.forward_to_running_instance(['target'], timeout_sec=5)
+    assert event.wait(5)
+    assert received[0]['argv'] == ['target']
+    assert instance_listener._thread.is_alive()
+
+
+def test_second_listener_does_not_take_over_live_instance(listener):
+    instance_listener, received, event = listener
+    assert not single_instance.InstanceListener(lambda message: None).start()
+    # Проверка занятости адреса - не запуск
+    assert not received
+    assert instance_listener._thread.is_alive()
+
+
+@pytest.mark.skipif(os.name == 'nt', reason="Unix-сокет")
+def test_forward_times_out_on_unresponsive_instance(instance_dir):
+    address, _ = single_instance.get_instance_address()
+    single_instance._write_authkey(os.urandom(single_instance.AUTHKEY_SIZE))
+    # Сокет принимает подключения, но никто не отвечает на проверку ключа
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(address)
+        server.listen(1)
+        assert not single_instance.forward_to_running_instance(['target'], timeout_sec=0.5)
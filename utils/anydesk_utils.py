@@ -2,7 +2,11 @@ import subprocess
 import os
 import logging
 import tempfile # Импорт tempfile
-import time # Импорт time
+
+from utils.process_utils import wait_for_child_started
+
+# Сколько ждать, пока cmd.exe отработает батник (передаст пароль AnyDesk), прежде чем удалить его
+ANYDESK_BATCH_TIMEOUT_SEC = 5
 
 def launch_anydesk(anydesk_path, anydesk_id, anydesk_password):
     """
@@ -53,8 +57,9 @@ exit
 
         logging.info(f"Временный батник '{os.path.basename(temp_bat_path)}' запущен для AnyDesk ID '{anydesk_id}'. PID процесса cmd: {process.pid}")
 
-        # Даем Anydesk немного времени на старт, прежде чем удалять батник
-        time.sleep(1)
+        # Батник нельзя удалять, пока cmd.exe его не прочитал: ждем, пока cmd.exe запустит AnyDesk.exe
+        # (строка с паролем уже прочитана) или завершится, вместо фиксированной паузы
+        wait_for_child_started(process, ("AnyDesk.exe",), ANYDESK_BATCH_TIMEOUT_SEC, "Батник AnyDesk")
 
         # Удаляем временный батник.
         # Даже если cmd.exe еще не завершился, файл часто можно удалить на Windows.
@@ -0,0 +1,47 @@
+import time
+import logging
+import threading
+
+
+class BandwidthLimiter:
+    """
+    Общий для всех потоков ограничитель скорости (token bucket).
+    Потоки резервируют байты под блокировкой, а ждут уже без нее,
+    поэтому суммарная скорость всех скачиваний не превышает bytes_per_sec.
+    """
+
+    def __init__(self, bytes_per_sec):
+        self.bytes_per_sec = float(bytes_per_sec)
+        self._tokens = self.bytes_per_sec # Допускаем всплеск не больше одной секунды
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.bytes_per_sec, self._tokens + (now - self._last_refill) * self.bytes_per_sec)
+            self._last_refill = now
+            self._tokens -= nbytes
+            wait_sec = -self._tokens / self.bytes_per_sec if self._tokens < 0 else 0
+        if wait_sec > 0:
+            time.sleep(wait_sec)
+
+
+_limiter = None
+
+
+def set_bandwidth_limit(bytes_per_sec):
+    """Устанавливает общий лимит скорости скачивания для процесса (0 или None - без ограничения)."""
+    global _limiter
+    if bytes_per_sec and bytes_per_sec > 0:
+        _limiter = BandwidthLimiter(bytes_per_sec)
+        logging.info(f"Установлено ограничение скорости скачивания: {bytes_per_sec / 1024:.0f} КБ/с.")
+    else:
+        _limiter = None
+
+
+def throttle(nbytes):
+    """Вызывается скачивающим кодом после получения nbytes байт. Без лимита возвращается сразу."""
+    limiter = _limiter
+    if limiter is not None:
+        limiter.consume(nbytes)
@@ -0,0 +1,57 @@
+# utils/console_progress.py - Отображение статуса и прогресса в консоли (stderr)
+#
+# Принимает те же колбэки, что и шаги core.* (update_status_callback(message, level),
+# update_progress_callback(value 0..100)). В терминале рисует одну обновляемую строку
+# с полосой прогресса; при выводе в файл/конвейер пишет только смену статуса, чтобы
+# журнал тикетной системы не засорялся процентами.
+
+import sys
+import threading
+
+PROGRESS_BAR_WIDTH = 24
+
+
+class ConsoleProgress:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self.interactive = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self._lock = threading.Lock()
+        self._status = ""
+        self._progress = 0
+        self._line_length = 0
+
+    def update_status(self, message, level="INFO"):
+        with self._lock:
+            if message == self._status:
+                return
+            self._status = message
+            if self.interactive:
+                self._redraw()
+            else:
+                self.stream.write(f"[{level}] {message}\n")
+                self.stream.flush()
+
+    def update_progress(self, value):
+        value = int(max(0, min(100, value)))
+        with self._lock:
+            if value == self._progress:
+                return
+            self._progress = value
+            if self.interactive:
+                self._redraw()
+
+    def _redraw(self):
+        filled = PROGRESS_BAR_WIDTH * self._progress // 100
+        line = f"[{'#' * filled}{'-' * (PROGRESS_BAR_WIDTH - filled)}] {self._progress:3d}% {self._status}"
+        padding = " " * max(0, self._line_length - len(line))
+        self.stream.write(f"\r{line}{padding}")
+        self.stream.flush()
+        self._line_length = len(line)
+
+    def finish(self):
+        """Завершает строку прогресса, чтобы следующий вывод начинался с новой строки."""
+        with self._lock:
+            if self.interactive and self._line_length:
+                self.stream.write("\n")
+                self.stream.flush()
+                self._line_length = 0
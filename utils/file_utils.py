@@ -1,13 +1,12 @@
 # utils/file_utils.py - Обновленный
 
 import ctypes
-import ctypes.wintypes
 import os
 import time
-import xml.etree.ElementTree as ET
 import logging
 
 from utils.exceptions import AbortOperation
+from utils.file_watcher import create_file_watcher, PollingWatcher
 
 
 def get_file_company_name(filepath):
@@ -22,6 +21,7 @@ def get_file_company_name(filepath):
         logging.error(f"Ошибка: Файл не найден для чтения метаданных: '{filepath}'")
         return None
 
+    from ctypes import wintypes
     try:
         size = ctypes.windll.version.GetFileVersionInfoSizeW(filepath, None)
         if size == 0:
@@ -35,7 +35,7 @@ def get_file_company_name(filepath):
              return None
 
         lplpBuffer = ctypes.c_void_p()
-        puLen = ctypes.wintypes.UINT()
+        puLen = wintypes.UINT()
         if ctypes.windll.version.VerQueryValueW(res, r'\\VarFileInfo\\Translation', ctypes.byref(lplpBuffer), ctypes.byref(puLen)) == 0:
              last_error = ctypes.GetLastError()
              logging.debug(f"Ошибка WinAPI VerQueryValueW (Translation) для файла '{filepath}': Код ошибки {last_error}")
@@ -49,7 +49,7 @@ def get_file_company_name(filepath):
         sub_block = f'\\StringFileInfo\\{lang_codepage}\\CompanyName'
 
         lplpBuffer = ctypes.c_wchar_p()
-        puLen = ctypes.wintypes.UINT()
+        puLen = wintypes.UINT()
         if ctypes.windll.version.VerQueryValueW(res, sub_block, ctypes.byref(lplpBuffer), ctypes.byref(puLen)) == 0:
              last_error = ctypes.GetLastError()
              logging.debug(f"Ошибка WinAPI VerQueryValueW (CompanyName) для файла '{filepath}': Код ошибки {last_error}")
@@ -65,12 +65,109 @@ def get_file_company_name(filepath):
         return None
 
 
+# Как часто ожидание просыпается без событий файловой системы, чтобы проверить отмену
+WAIT_CANCEL_CHECK_INTERVAL_SEC = 0.25
+# Как часто во время ожидания обновляется индикатор прогресса
+WAIT_PROGRESS_INTERVAL_SEC = 0.5
+# Таймаут ожидания содержимого после появления файла
+CONTENT_WAIT_TIMEOUT_SEC = 10
+# Сколько ждать, пока остановленный BackOffice отпустит файл конфигурации
+FILE_UNLOCK_TIMEOUT_SEC = 5
+# Интервалы повторной попытки эксклюзивного открытия (освобождение файла не порождает событий ФС)
+FILE_UNLOCK_RETRY_MIN_SEC = 0.01
+FILE_UNLOCK_RETRY_MAX_SEC = 0.1
+
+
+def _is_config_content_ready(filepath):
+    """Файл не пуст и похож на XML (BackOffice уже записал хотя бы начало конфигурации)."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content_preview = f.read(100)
+        return bool(content_preview) and '<' in content_preview
+    except Exception as e:
+        logging.debug(f"Ошибка при чтении превью файла '{filepath}': {e}")
+        return False
+
+
+def _wait_until(watcher, condition, timeout_sec, on_tick=None, is_canceled_callback=None):
+    """
+    Проверяет condition() при каждом событии наблюдателя (и не реже WAIT_CANCEL_CHECK_INTERVAL_SEC).
+    Возвращает True - условие выполнено, False - отмена, None - таймаут.
+    on_tick(fraction) вызывается не чаще WAIT_PROGRESS_INTERVAL_SEC с долей истекшего времени.
+    """
+    started_at = time.monotonic()
+    deadline = started_at + timeout_sec
+    last_tick_at = started_at
+    while True:
+        if is_canceled_callback and is_canceled_callback():
+            return False
+        if condition():
+            return True
+        now = time.monotonic()
+        if now >= deadline:
+            return None
+        if on_tick and now - last_tick_at >= WAIT_PROGRESS_INTERVAL_SEC:
+            last_tick_at = now
+            on_tick((now - started_at) / timeout_sec)
+        watcher.wait(min(deadline - now, WAIT_CANCEL_CHECK_INTERVAL_SEC))
+
+
+def _try_lock_exclusive(filepath):
+    """
+    Пробует открыть файл на запись и взять на него неблокирующую эксклюзивную блокировку.
+    True - файл свободен (никто не держит его открытым с запретом записи/блокировкой).
+    """
+    try:
+        fd = os.open(filepath, os.O_RDWR)
+    except PermissionError:
+        # Windows: файл открыт другим процессом без FILE_SHARE_WRITE (нарушение совместного доступа)
+        return False
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return True
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+def wait_for_file_unlocked(filepath, timeout_sec=FILE_UNLOCK_TIMEOUT_SEC):
+    """
+    Ждет, пока файл можно будет открыть эксклюзивно (процесс, писавший его, завершился и закрыл дескриптор).
+    Возвращает True, если файл свободен, False - таймаут. FileNotFoundError пробрасывается.
+    """
+    started_at = time.monotonic()
+    deadline = started_at + timeout_sec
+    retry_delay = FILE_UNLOCK_RETRY_MIN_SEC
+    attempts = 0
+    while True:
+        attempts += 1
+        if _try_lock_exclusive(filepath):
+            logging.debug(f"Файл '{filepath}' свободен (ожидание {time.monotonic() - started_at:.3f} сек, попыток: {attempts}).")
+            return True
+        now = time.monotonic()
+        if now >= deadline:
+            logging.warning(f"Файл '{filepath}' все еще занят другим процессом после {timeout_sec} сек ожидания.")
+            return False
+        time.sleep(min(retry_delay, deadline - now))
+        retry_delay = min(retry_delay * 2, FILE_UNLOCK_RETRY_MAX_SEC)
+
+
 # Добавляем is_canceled_callback в параметры
 def wait_for_file(filepath, timeout_sec, check_interval_ms, update_status_callback=None, update_progress_callback=None, progress_base=0.0, progress_range=1.0, is_canceled_callback=None):
     """
-    Ожидает появления файла с таймаутом и обновлением прогресса.
+    Ожидает появления файла и его содержимого с таймаутом и обновлением прогресса.
+    Проверка выполняется по уведомлениям ОС о создании/записи файла (utils/file_watcher.py),
+    check_interval_ms - интервал опроса, если уведомления недоступны.
     update_status_callback(message) - callback для обновления статуса.
-    update_progress_callback(progress_factor) - callback для обновления прогресса (0.0 до 1.0 для этого шага).
+    update_progress_callback(progress_value) - callback для обновления общего прогресса.
     progress_base, progress_range - определяют диапазон общего прогресса для этого шага.
     is_canceled_callback() - callback, возвращающий True, если операция отменена.
     """
@@ -79,103 +176,81 @@ def wait_for_file(filepath, timeout_sec, check_interval_ms, update_status_callba
         update_status_callback(f"Ожидание файла: '{os.path.basename(filepath)}'...")
     if is_canceled_callback and is_canceled_callback(): return False # Проверка отмены
 
-    max_attempts = int(timeout_sec * 1000 / check_interval_ms)
-    file_found = False
-
-    # Прогресс для этого этапа (внутри wait_for_file): 0% -> 50% на ожидание файла
-    step_progress_base_internal = 0.0
-    step_progress_range_internal = 0.5
-
-    for attempt in range(max_attempts):
-        if is_canceled_callback and is_canceled_callback():
-             logging.warning("Ожидание файла отменено.")
-             if update_status_callback: update_status_callback("Ожидание файла отменено.")
-             return False # Сигнал отмены
-
-        if os.path.exists(filepath):
-            file_found = True
-            logging.info("Файл найден!")
+    watcher = create_file_watcher(filepath, check_interval_ms / 1000)
+    try:
+        return _wait_for_file_with_watcher(watcher, filepath, timeout_sec, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback)
+    except OSError as e:
+        # TimeoutError - тоже OSError, но это таймаут ожидания, а не сбой наблюдения
+        if isinstance(e, TimeoutError) or isinstance(watcher, PollingWatcher):
+            raise
+        # Уведомления ОС отказали (например, исчерпан лимит inotify) - повторяем с опросом
+        logging.warning(f"Ошибка наблюдения за файлом ({e}), переход на опрос.")
+        return _wait_for_file_with_watcher(PollingWatcher(filepath, check_interval_ms / 1000), filepath, timeout_sec, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback)
+
+
+def _wait_for_file_with_watcher(watcher, filepath, timeout_sec, update_status_callback, update_progress_callback, progress_base, progress_range, is_canceled_callback):
+    # Прогресс внутри шага: 0% -> 50% на ожидание файла, 50% -> 100% на ожидание содержимого
+    def report_progress(fraction_of_step):
+        if update_progress_callback:
+            update_progress_callback(progress_base + fraction_of_step * progress_range)
+
+    started_at = time.monotonic()
+    with watcher:
+        file_found = _wait_until(watcher, lambda: os.path.exists(filepath), timeout_sec,
+                                 lambda fraction: report_progress(fraction * 0.5), is_canceled_callback)
+        if file_found is False:
+            logging.warning("Ожидание файла отменено.")
+            if update_status_callback: update_status_callback("Ожидание файла отменено.")
+            return False # Сигнал отмены
+        if file_found is None:
+            logging.error(f"Таймаут ожидания файла конфигурации '{filepath}' ({timeout_sec} сек).")
             if update_status_callback:
-                update_status_callback("Файл конфигурации найден.")
-            if update_progress_callback:
-                 # Обновляем прогресс до конца первой части ожидания
-                 update_progress_callback(progress_base + (step_progress_base_internal + step_progress_range_internal) * progress_range)
-            break
-        time.sleep(check_interval_ms / 1000)
-        if update_progress_callback and max_attempts > 0:
-            progress_in_step_internal = step_progress_base_internal + (attempt + 1) / max_attempts * step_progress_range_internal
-            update_progress_callback(progress_base + progress_in_step_internal * progress_range)
-
-
-    if not file_found:
-        logging.error(f"Таймаут ожидания файла конфигурации '{filepath}' ({timeout_sec} сек).")
-        if update_status_callback:
-            update_status_callback("Таймаут ожидания файла.", level="ERROR")
-        # НЕ возвращаем False, а выбрасываем исключение, т.к. это не отмена, а таймаут
-        raise TimeoutError(f"Таймаут ожидания файла конфигурации '{filepath}'.")
-
-
-    # Ожидание содержимого файла (не пустой/не заблокирован)
-    logging.info(f"Ожидание содержимого в файле: '{filepath}'")
-    if update_status_callback:
-        update_status_callback("Ожидание содержимого файла...")
-    if is_canceled_callback and is_canceled_callback(): return False # Проверка отмены
-
-    content_wait_timeout_sec = 10 # Таймаут ожидания содержимого
-    content_check_interval_ms = 50
-    max_content_attempts = int(content_wait_timeout_sec * 1000 / content_check_interval_ms)
-    content_found = False
+                update_status_callback("Таймаут ожидания файла.", level="ERROR")
+            # НЕ возвращаем False, а выбрасываем исключение, т.к. это не отмена, а таймаут
+            raise TimeoutError(f"Таймаут ожидания файла конфигурации '{filepath}'.")
 
-    # Прогресс для этого этапа (внутри wait_for_file): 50% -> 100% на ожидание содержимого
-    step_progress_base_content_internal = 0.5
-    step_progress_range_content_internal = 0.5
+        found_at = time.monotonic()
+        logging.info(f"Файл найден через {found_at - started_at:.2f} сек (наблюдение: {watcher.backend_name}).")
+        if update_status_callback:
+            update_status_callback("Файл конфигурации найден.")
+        report_progress(0.5)
 
-    for attempt in range(max_content_attempts):
-        if is_canceled_callback and is_canceled_callback():
-             logging.warning("Ожидание содержимого файла отменено.")
-             if update_status_callback: update_status_callback("Ожидание содержимого файла отменено.")
-             return False # Сигнал отмены
-
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content_preview = f.read(100)
-                if content_preview and '<' in content_preview:
-                    content_found = True
-                    logging.info("Содержимое файла обнаружено.")
-                    if update_status_callback:
-                        update_status_callback("Содержимое файла обнаружено.")
-                    if update_progress_callback:
-                        # Обновляем прогресс до конца второй части ожидания
-                        update_progress_callback(progress_base + (step_progress_base_internal + step_progress_range_content_internal) * progress_range)
-                    break
-        except Exception as e:
-            logging.debug(f"Ошибка при чтении превью файла '{filepath}': {e}")
-
-        time.sleep(content_check_interval_ms / 1000)
-        if update_progress_callback and max_content_attempts > 0:
-            progress_in_step_content_internal = step_progress_base_content_internal + (attempt + 1) / max_content_attempts * step_progress_range_content_internal
-            update_progress_callback(progress_base + progress_in_step_content_internal * progress_range)
-
-
-    if not content_found:
-        logging.error(f"Таймаут ожидания содержимого в файле конфигурации '{filepath}' ({content_wait_timeout_sec} сек). Файл пуст или некорректен?")
+        # Ожидание содержимого файла (не пустой/не заблокирован)
+        logging.info(f"Ожидание содержимого в файле: '{filepath}'")
+        if update_status_callback:
+            update_status_callback("Ожидание содержимого файла...")
+        content_found = _wait_until(watcher, lambda: _is_config_content_ready(filepath), CONTENT_WAIT_TIMEOUT_SEC,
+                                    lambda fraction: report_progress(0.5 + fraction * 0.5), is_canceled_callback)
+
+    if content_found is False:
+        logging.warning("Ожидание содержимого файла отменено.")
+        if update_status_callback: update_status_callback("Ожидание содержимого файла отменено.")
+        return False # Сигнал отмены
+    if content_found is None:
+        logging.error(f"Таймаут ожидания содержимого в файле конфигурации '{filepath}' ({CONTENT_WAIT_TIMEOUT_SEC} сек). Файл пуст или некорректен?")
         if update_status_callback:
             update_status_callback("Таймаут ожидания содержимого файла.", level="ERROR")
         # НЕ возвращаем False, а выбрасываем исключение
         raise TimeoutError(f"Таймаут ожидания содержимого в файле конфигурации '{filepath}'.")
 
-
+    logging.info(f"Содержимое файла обнаружено через {time.monotonic() - found_at:.2f} сек после появления файла.")
+    if update_status_callback:
+        update_status_callback("Содержимое файла обнаружено.")
+    report_progress(1.0)
     return True
 
 
-def edit_config_file(filepath, target_url_or_ip, target_port, config_protocol, target_login, update_status_callback=None):
-    """Редактирует файл backclient.config.xml."""
+def edit_config_file(filepath, target_url_or_ip, target_port, config_protocol, target_login, update_status_callback=None, unlock_timeout_sec=FILE_UNLOCK_TIMEOUT_SEC):
+    """Редактирует файл backclient.config.xml (unlock_timeout_sec - сколько ждать, пока файл отпустит остановленный BackOffice)."""
+    import xml.etree.ElementTree as ET # Нужен только при запуске BackOffice, не на старте приложения
     logging.info(f"Редактирование файла конфигурации: '{filepath}'")
     if update_status_callback:
         update_status_callback("Редактирование файла конфигурации...")
 
     try:
-        time.sleep(0.5) # Даем немного времени после остановки процесса
+        # Вместо фиксированной паузы - пробуем эксклюзивно открыть файл, пока его не отпустит BackOffice
+        if not wait_for_file_unlocked(filepath, unlock_timeout_sec) and update_status_callback:
+            update_status_callback("Файл конфигурации занят другим процессом, попытка редактирования...", level="WARNING")
 
         tree = ET.parse(filepath)
         root = tree.getroot()
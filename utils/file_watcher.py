@@ -0,0 +1,200 @@
+# utils/file_watcher.py - Ожидание изменений файла по уведомлениям ОС
+#
+# Наблюдатель следит за каталогом, в котором должен появиться файл (или за ближайшим
+# существующим родительским каталогом, если самого каталога еще нет), и просыпается
+# по уведомлению ОС о создании/изменении/закрытии файла. Бэкенды:
+#   - Linux: inotify (через ctypes);
+#   - Windows: FindFirstChangeNotificationW / WaitForSingleObject;
+#   - остальные случаи: опрос с заданным интервалом.
+
+import os
+import sys
+import time
+import select
+import ctypes
+import ctypes.util
+import logging
+
+# --- inotify ---
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_INOTIFY_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE_SELF | _IN_MOVE_SELF
+
+# --- WinAPI ---
+_FILE_NOTIFY_CHANGE_FILE_NAME = 0x00000001
+_FILE_NOTIFY_CHANGE_DIR_NAME = 0x00000002
+_FILE_NOTIFY_CHANGE_SIZE = 0x00000008
+_FILE_NOTIFY_CHANGE_LAST_WRITE = 0x00000010
+_WAIT_OBJECT_0 = 0x00000000
+_WAIT_TIMEOUT = 0x00000102
+
+
+def _nearest_existing_dir(path):
+    """Ближайший существующий каталог на пути к path (сам каталог файла или его предок)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    while directory and not os.path.isdir(directory):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+    return directory
+
+
+class _BaseWatcher:
+    """
+    Общая часть: выбирает наблюдаемый каталог и переключается на более глубокий,
+    когда недостающие каталоги на пути к файлу появляются.
+    """
+    backend_name = "base"
+
+    def __init__(self, filepath):
+        self.filepath = os.path.abspath(filepath)
+        self.watched_dir = None
+
+    def _target_dir(self):
+        return _nearest_existing_dir(self.filepath)
+
+    def _rearm_if_needed(self):
+        target_dir = self._target_dir()
+        if target_dir != self.watched_dir:
+            self._watch(target_dir)
+            logging.debug(f"Наблюдатель ({self.backend_name}): слежение за каталогом '{target_dir}'.")
+            self.watched_dir = target_dir
+            return True
+        return False
+
+    def wait(self, timeout_sec):
+        """
+        Ждет изменения в наблюдаемом каталоге не дольше timeout_sec.
+        Возвращает True, если было событие (или наблюдатель переключился на новый каталог).
+        """
+        if self._rearm_if_needed():
+            # Каталог только что появился - файл мог быть создан до начала слежения
+            return True
+        return self._wait_event(timeout_sec)
+
+    def _watch(self, directory):
+        pass
+
+    def _wait_event(self, timeout_sec):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        self._rearm_if_needed()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class PollingWatcher(_BaseWatcher):
+    """Запасной вариант: просыпается по таймеру."""
+    backend_name = "polling"
+
+    def __init__(self, filepath, poll_interval_sec):
+        super().__init__(filepath)
+        self.poll_interval_sec = max(0.01, poll_interval_sec)
+
+    def _wait_event(self, timeout_sec):
+        time.sleep(max(0.0, min(timeout_sec, self.poll_interval_sec)))
+        return True
+
+
+class InotifyWatcher(_BaseWatcher):
+    """Linux: inotify, дескриптор ожидается через select."""
+    backend_name = "inotify"
+
+    def __init__(self, filepath):
+        super().__init__(filepath)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._wd = -1
+
+    def _watch(self, directory):
+        if self._wd >= 0:
+            self._libc.inotify_rm_watch(self._fd, self._wd)
+        self._wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _INOTIFY_MASK)
+        if self._wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for '{directory}'")
+
+    def _wait_event(self, timeout_sec):
+        readable, _, _ = select.select([self._fd], [], [], max(0.0, timeout_sec))
+        if not readable:
+            return False
+        # Вычитываем все накопившиеся события: важен сам факт изменения, а не их список
+        try:
+            while os.read(self._fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class WindowsChangeWatcher(_BaseWatcher):
+    """Windows: уведомление об изменении каталога (имена файлов/каталогов, размер, запись)."""
+    backend_name = "win32"
+
+    def __init__(self, filepath):
+        super().__init__(filepath)
+        self._kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self._kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+        self._kernel32.FindFirstChangeNotificationW.argtypes = [ctypes.c_wchar_p, ctypes.c_int, ctypes.c_uint32]
+        self._kernel32.FindNextChangeNotification.argtypes = [ctypes.c_void_p]
+        self._kernel32.FindCloseChangeNotification.argtypes = [ctypes.c_void_p]
+        self._kernel32.WaitForSingleObject.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+        self._kernel32.WaitForSingleObject.restype = ctypes.c_uint32
+        self._handle = None
+
+    def _watch(self, directory):
+        self.close()
+        handle = self._kernel32.FindFirstChangeNotificationW(
+            directory, False,
+            _FILE_NOTIFY_CHANGE_FILE_NAME | _FILE_NOTIFY_CHANGE_DIR_NAME | _FILE_NOTIFY_CHANGE_SIZE | _FILE_NOTIFY_CHANGE_LAST_WRITE)
+        if handle is None or handle == ctypes.c_void_p(-1).value:
+            raise ctypes.WinError(ctypes.get_last_error())
+        self._handle = handle
+
+    def _wait_event(self, timeout_sec):
+        result = self._kernel32.WaitForSingleObject(self._handle, int(max(0.0, timeout_sec) * 1000))
+        if result == _WAIT_OBJECT_0:
+            self._kernel32.FindNextChangeNotification(self._handle)
+            return True
+        if result == _WAIT_TIMEOUT:
+            return False
+        raise ctypes.WinError(ctypes.get_last_error())
+
+    def close(self):
+        if self._handle is not None:
+            self._kernel32.FindCloseChangeNotification(self._handle)
+            self._handle = None
+
+
+def create_file_watcher(filepath, poll_interval_sec=0.1):
+    """
+    Наблюдатель за файлом filepath на основе уведомлений ОС; если они недоступны -
+    опрос каждые poll_interval_sec. Использовать как контекстный менеджер.
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            return InotifyWatcher(filepath)
+        if os.name == 'nt':
+            return WindowsChangeWatcher(filepath)
+    except (OSError, AttributeError) as e:
+        logging.debug(f"Уведомления ОС об изменении файлов недоступны ({e}), используется опрос.")
+    return PollingWatcher(filepath, poll_interval_sec)
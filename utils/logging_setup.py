@@ -6,8 +6,12 @@ from core.config import LOG_FILE_NAME, get_config_value # Импорт конф
 # Глобальная переменная для объекта конфига, будет установлена из main.py
 _config = None
 
-def setup_logging(config):
-    """Настраивает стандартный модуль логирования."""
+def setup_logging(config, stream=None):
+    """
+    Настраивает стандартный модуль логирования.
+    stream - поток для вывода в консоль (по умолчанию stdout; консольный режим передает stderr,
+    чтобы журнал не смешивался с результатами команд).
+    """
     global _config
     _config = config
 
@@ -20,7 +24,7 @@ def setup_logging(config):
                         format='[%(asctime)s] [%(levelname)s] %(message)s',
                         datefmt='%Y-%m-%d %H:%M:%S',
                         handlers=[
-                            logging.StreamHandler(sys.stdout) # Вывод в консоль
+                            logging.StreamHandler(stream or sys.stdout) # Вывод в консоль
                         ])
 
     # Добавляем файловый хэндлер, если включено отладочное логирование
@@ -1,76 +1,348 @@
+# utils/process_utils.py - Запуск, перечисление и остановка процессов без вспомогательных утилит
+#
+# Процессы запускаются напрямую (без cmd.exe), поэтому PID - это сам BackOffice.
+# Перечисление и остановка идут через API ОС, без taskkill/tasklist:
+#   - Windows: Toolhelp32 (снимок процессов), WM_CLOSE окнам процесса, TerminateProcess;
+#   - Linux: /proc/<pid>/stat, SIGTERM, SIGKILL;
+#   - прочие POSIX: сигналы, дерево процессов ограничено самим процессом.
+
 import subprocess
 import os
+import sys
+import time
+import signal
+import ctypes
 import logging
 
-def stop_process_by_pid(pid):
-    """Останавливает процесс по его PID (для Windows)."""
+# Сколько ждать завершения процесса после мягкого запроса (WM_CLOSE / SIGTERM) до принудительного
+PROCESS_GRACEFUL_TIMEOUT_SEC = 2
+# Сколько ждать завершения после принудительной остановки
+PROCESS_FORCE_TIMEOUT_SEC = 5
+# Интервал проверки завершения процессов, не являющихся нашими дочерними (нет дескриптора для ожидания)
+PROCESS_POLL_INTERVAL_SEC = 0.02
+
+# --- WinAPI ---
+_TH32CS_SNAPPROCESS = 0x00000002
+_PROCESS_TERMINATE = 0x0001
+_SYNCHRONIZE = 0x00100000
+_WAIT_OBJECT_0 = 0x00000000
+_WM_CLOSE = 0x0010
+_INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+
+
+_win_api = None
+
+
+def _get_win_api():
+    """
+    kernel32/user32 с объявленными сигнатурами и тип PROCESSENTRY32W (создаются один раз).
+    ctypes.wintypes импортируется здесь: на старте приложения WinAPI не нужен.
+    """
+    global _win_api
+    if _win_api is None:
+        from ctypes import wintypes
+
+        class PROCESSENTRY32W(ctypes.Structure):
+            _fields_ = [
+                ('dwSize', wintypes.DWORD),
+                ('cntUsage', wintypes.DWORD),
+                ('th32ProcessID', wintypes.DWORD),
+                ('th32DefaultHeapID', ctypes.c_size_t),
+                ('th32ModuleID', wintypes.DWORD),
+                ('cntThreads', wintypes.DWORD),
+                ('th32ParentProcessID', wintypes.DWORD),
+                ('pcPriClassBase', ctypes.c_long),
+                ('dwFlags', wintypes.DWORD),
+                ('szExeFile', ctypes.c_wchar * 260),
+            ]
+
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        user32 = ctypes.WinDLL('user32', use_last_error=True)
+        kernel32.CreateToolhelp32Snapshot.argtypes = [wintypes.DWORD, wintypes.DWORD]
+        kernel32.CreateToolhelp32Snapshot.restype = ctypes.c_void_p
+        kernel32.Process32FirstW.argtypes = [ctypes.c_void_p, ctypes.POINTER(PROCESSENTRY32W)]
+        kernel32.Process32NextW.argtypes = [ctypes.c_void_p, ctypes.POINTER(PROCESSENTRY32W)]
+        kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+        kernel32.OpenProcess.restype = ctypes.c_void_p
+        kernel32.TerminateProcess.argtypes = [ctypes.c_void_p, ctypes.c_uint]
+        kernel32.WaitForSingleObject.argtypes = [ctypes.c_void_p, wintypes.DWORD]
+        kernel32.WaitForSingleObject.restype = wintypes.DWORD
+        kernel32.CloseHandle.argtypes = [ctypes.c_void_p]
+        user32.EnumWindows.argtypes = [ctypes.c_void_p, wintypes.LPARAM]
+        user32.GetWindowThreadProcessId.argtypes = [wintypes.HWND, ctypes.POINTER(wintypes.DWORD)]
+        user32.PostMessageW.argtypes = [wintypes.HWND, ctypes.c_uint, wintypes.WPARAM, wintypes.LPARAM]
+        _win_api = (kernel32, user32, PROCESSENTRY32W)
+    return _win_api
+
+
+def _list_processes_windows():
+    kernel32, _, PROCESSENTRY32W = _get_win_api()
+    snapshot = kernel32.CreateToolhelp32Snapshot(_TH32CS_SNAPPROCESS, 0)
+    if snapshot is None or snapshot == _INVALID_HANDLE_VALUE:
+        raise ctypes.WinError(ctypes.get_last_error())
+    processes = []
+    try:
+        entry = PROCESSENTRY32W()
+        entry.dwSize = ctypes.sizeof(PROCESSENTRY32W)
+        has_entry = kernel32.Process32FirstW(snapshot, ctypes.byref(entry))
+        while has_entry:
+            processes.append({'pid': entry.th32ProcessID, 'ppid': entry.th32ParentProcessID, 'name': entry.szExeFile})
+            has_entry = kernel32.Process32NextW(snapshot, ctypes.byref(entry))
+    finally:
+        kernel32.CloseHandle(snapshot)
+    return processes
+
+
+def _read_proc_stat(pid):
+    """(ppid, name, state) из /proc/<pid>/stat; None, если процесса уже нет."""
+    try:
+        with open(f"/proc/{pid}/stat", 'rb') as f:
+            stat = f.read().decode('utf-8', 'replace')
+    except OSError:
+        return None
+    # Имя в скобках может содержать пробелы и скобки - берем до последней ')'
+    name = stat[stat.find('(') + 1:stat.rfind(')')]
+    fields = stat[stat.rfind(')') + 2:].split()
+    return int(fields[1]), name, fields[0]
+
+
+def _list_processes_linux():
+    processes = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        stat = _read_proc_stat(int(entry))
+        if stat is not None:
+            processes.append({'pid': int(entry), 'ppid': stat[0], 'name': stat[1]})
+    return processes
+
+
+def list_processes():
+    """Список процессов системы: словари {'pid', 'ppid', 'name'}. Без поддержки ОС - пустой список."""
+    try:
+        if os.name == 'nt':
+            return _list_processes_windows()
+        if sys.platform.startswith('linux'):
+            return _list_processes_linux()
+    except OSError as e:
+        logging.error(f"Не удалось получить список процессов: {e}")
+        return []
+    logging.debug(f"Перечисление процессов не поддерживается на {sys.platform}.")
+    return []
+
+
+def find_processes_by_name(*names):
+    """PID процессов, имя образа которых (без учета регистра) совпадает с одним из names."""
+    wanted = {name.lower() for name in names}
+    return [p['pid'] for p in list_processes() if p['name'].lower() in wanted]
+
+
+def get_process_tree(pid, processes=None):
+    """PID процесса и всех его потомков (сначала сам процесс, затем потомки по уровням)."""
+    if processes is None:
+        processes = list_processes()
+    children = {}
+    for p in processes:
+        if p['pid'] != p['ppid']: # На Windows у System Idle Process (PID 0) родитель - он сам
+            children.setdefault(p['ppid'], []).append(p['pid'])
+    tree = [pid]
+    for current_pid in tree:
+        tree.extend(child for child in children.get(current_pid, []) if child not in tree)
+    return tree
+
+
+def is_process_alive(pid):
+    """Процесс существует и не завершен (зомби на Linux считается завершенным)."""
+    if os.name == 'nt':
+        kernel32, _, _ = _get_win_api()
+        handle = kernel32.OpenProcess(_SYNCHRONIZE, False, pid)
+        if not handle:
+            return False
+        try:
+            return kernel32.WaitForSingleObject(handle, 0) != _WAIT_OBJECT_0
+        finally:
+            kernel32.CloseHandle(handle)
+    if sys.platform.startswith('linux'):
+        stat = _read_proc_stat(pid)
+        return stat is not None and stat[2] not in ('Z', 'X')
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _request_close(pid):
+    """Мягкий запрос завершения: WM_CLOSE окнам процесса (Windows) или SIGTERM."""
+    if os.name == 'nt':
+        from ctypes import wintypes
+        _, user32, _ = _get_win_api()
+        windows = []
+
+        @ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.HWND, wintypes.LPARAM)
+        def collect_window(hwnd, _lparam):
+            window_pid = wintypes.DWORD()
+            user32.GetWindowThreadProcessId(hwnd, ctypes.byref(window_pid))
+            if window_pid.value == pid:
+                windows.append(hwnd)
+            return True
+
+        user32.EnumWindows(collect_window, 0)
+        for hwnd in windows:
+            user32.PostMessageW(hwnd, _WM_CLOSE, 0, 0)
+        return bool(windows) # Процесс без окон на WM_CLOSE не отреагирует
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    return True
+
+
+def _force_kill(pid):
+    if os.name == 'nt':
+        kernel32, _, _ = _get_win_api()
+        handle = kernel32.OpenProcess(_PROCESS_TERMINATE, False, pid)
+        if not handle:
+            return
+        try:
+            if not kernel32.TerminateProcess(handle, 1):
+                logging.debug(f"TerminateProcess (PID: {pid}): {ctypes.WinError(ctypes.get_last_error())}")
+        finally:
+            kernel32.CloseHandle(handle)
+        return
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _wait_for_pids_exit(pids, timeout_sec):
+    """Ждет завершения всех pids; возвращает список еще живых по истечении timeout_sec."""
+    deadline = time.monotonic() + timeout_sec
+    alive = [pid for pid in pids if is_process_alive(pid)]
+    while alive and time.monotonic() < deadline:
+        time.sleep(PROCESS_POLL_INTERVAL_SEC)
+        alive = [pid for pid in alive if is_process_alive(pid)]
+    return alive
+
+
+def terminate_process_tree(pid, graceful_timeout_sec=PROCESS_GRACEFUL_TIMEOUT_SEC, force_timeout_sec=PROCESS_FORCE_TIMEOUT_SEC):
+    """
+    Останавливает процесс и его потомков: сначала мягко (ожидание до graceful_timeout_sec),
+    затем принудительно. Возвращает True, если все процессы дерева завершены.
+    """
+    started_at = time.monotonic()
+    tree = get_process_tree(pid)
+    # Сначала потомки, чтобы они не успели переподцепиться к другому родителю
+    ordered = list(reversed(tree))
+
+    alive = ordered
+    if graceful_timeout_sec > 0:
+        closable = [p for p in ordered if _request_close(p)]
+        alive = _wait_for_pids_exit(ordered, graceful_timeout_sec if closable else 0)
+        if not alive:
+            logging.info(f"Процесс (PID: {pid}) и потомки ({len(tree) - 1}) завершились по запросу за {time.monotonic() - started_at:.3f} сек.")
+            return True
+        logging.info(f"Процессы {alive} не завершились по запросу, принудительная остановка.")
+
+    for p in alive:
+        _force_kill(p)
+    alive = _wait_for_pids_exit(alive, force_timeout_sec)
+    if alive:
+        logging.warning(f"Процессы {alive} из дерева PID {pid} не удалось остановить за {time.monotonic() - started_at:.3f} сек.")
+        return False
+    logging.info(f"Процесс (PID: {pid}) и потомки ({len(tree) - 1}) остановлены за {time.monotonic() - started_at:.3f} сек.")
+    return True
+
+
+def spawn_process(args, cwd=None, hidden=True):
+    """
+    Запускает процесс напрямую, без командной оболочки: PID возвращаемого Popen - сам процесс.
+    hidden - не показывать консольное окно (Windows) - только для консольных программ: у оконного
+    приложения SW_HIDE скрыл бы главное окно при первом показе.
+    """
+    startupinfo = None
+    creationflags = 0
+    if os.name == 'nt' and hidden:
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+        creationflags = subprocess.CREATE_NO_WINDOW
+    started_at = time.monotonic()
+    process = subprocess.Popen(args, cwd=cwd, startupinfo=startupinfo, creationflags=creationflags)
+    logging.debug(f"Процесс '{os.path.basename(args[0])}' запущен (PID: {process.pid}) за {time.monotonic() - started_at:.3f} сек.")
+    return process
+
+
+def stop_process_by_pid(pid, graceful_timeout_sec=PROCESS_GRACEFUL_TIMEOUT_SEC):
+    """Останавливает процесс BackOffice и его дочерние процессы по PID."""
     if pid is None:
         logging.warning("PID процесса BackOffice не известен, пропуск остановки.")
         return False # Не удалось остановить
 
     logging.info(f"Попытка остановить процесс BackOffice (PID: {pid})...")
+    if not is_process_alive(pid):
+        logging.info(f"Процесс (PID: {pid}) не найден, вероятно, уже завершен.")
+        return True # Считаем, что процесс остановлен (или уже был)
     try:
-        # На Windows taskkill - надежный способ принудительно завершить процесс
-        # /F - принудительно
-        # /T - завершить дочерние процессы (не обязательно, но безопасно)
-        # creationflags=subprocess.CREATE_NO_WINDOW - предотвращает появление консольного окна taskkill
-        # check=True выбросит CalledProcessError, если taskkill вернет ненулевой код
-        result = subprocess.run(["taskkill", "/F", "/T", "/PID", str(pid)], check=True, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        logging.info(f"Процесс BackOffice (PID: {pid}) успешно остановлен. stdout: {result.stdout.strip()}")
-        return True # Успешно остановлен
-    except subprocess.CalledProcessError as e:
-        # taskkill вернет ненулевой код, если процесс не найден (уже завершен) или нет прав
-        logging.warning(f"Ошибка при остановке процесса BackOffice (PID: {pid}). Код выхода: {e.returncode}, stdout: {e.stdout.strip()}, stderr: {e.stderr.strip()}")
-        # Если код 128, это означает "процесс не найден". Считаем это успехом (процесс не запущен)
-        if e.returncode == 128:
-             logging.info(f"Процесс (PID: {pid}) не найден, вероятно, уже завершен.")
-             return True # Считаем, что процесс остановлен (или уже был)
-        return False # Не удалось остановить по другой причине
-    except FileNotFoundError:
-        logging.error("Команда 'taskkill' не найдена. Убедитесь, что вы на Windows.")
-        return False # Не удалось остановить
+        return terminate_process_tree(pid, graceful_timeout_sec)
     except Exception as e:
         logging.error(f"Неизвестная ошибка при остановке процесса BackOffice (PID: {pid}): {e}")
         return False # Не удалось остановить
 
-def is_anydesk_running():
-    """Проверяет, запущен ли процесс Anydesk.exe (для Windows)."""
-    if os.name != 'nt':
-        logging.debug("Проверка процесса Anydesk доступна только на Windows.")
-        return False # На других ОС считаем, что не запущен или неактуально
 
-    logging.debug("Проверка запущенности процесса Anydesk.exe...")
+def wait_for_process_exit(process, timeout_sec, description="процесс"):
+    """
+    Ждет завершения процесса (subprocess.Popen) не дольше timeout_sec, без фиксированных пауз:
+    ожидание идет на самом процессе. Возвращает True, если процесс завершился.
+    """
+    if process is None:
+        return True
+    started_at = time.monotonic()
     try:
-        # Используем tasklist для поиска процесса по имени образа
-        # /FI "IMAGENAME eq Anydesk.exe" - Фильтр: Имя образа равно "Anydesk.exe"
-        # /NH - No Header (не выводить заголовки столбцов)
-        # /FO CSV - Format Output как CSV (легче парсить, хотя нам не нужно парсить, только проверить наличие)
-        # check=False, чтобы не выбрасывать исключение, если процесс не найден (tasklist вернет код 1)
-        # capture_output=True, text=True - для захвата вывода
-        result = subprocess.run(
-            ["tasklist", "/FI", "IMAGENAME eq Anydesk.exe", "/NH", "/FO", "CSV"],
-            check=False,
-            capture_output=True,
-            text=True,
-            creationflags=subprocess.CREATE_NO_WINDOW # Не показывать консольное окно tasklist
-        )
-
-        # Логируем вывод для отладки
-        logging.debug(f"tasklist stdout:\n{result.stdout.strip()}")
-        if result.stderr.strip():
-             logging.debug(f"tasklist stderr:\n{result.stderr.strip()}")
-        logging.debug(f"tasklist returncode: {result.returncode}")
-
-        if "anydesk.exe" in result.stdout.lower():
-            logging.debug("Строка 'Anydesk.exe' найдена в выводе tasklist. Процесс запущен.")
+        process.wait(timeout=timeout_sec)
+    except subprocess.TimeoutExpired:
+        logging.warning(f"{description} (PID: {process.pid}) не завершился за {timeout_sec} сек.")
+        return False
+    logging.info(f"{description} (PID: {process.pid}) завершился через {time.monotonic() - started_at:.3f} сек (код {process.returncode}).")
+    return True
+
+
+def wait_for_child_started(process, child_names, timeout_sec, description="процесс"):
+    """
+    Ждет, пока процесс (subprocess.Popen) завершится или запустит потомка с именем из child_names.
+    Возвращает True, если дождались одного из событий, False - таймаут.
+    """
+    started_at = time.monotonic()
+    deadline = started_at + timeout_sec
+    wanted = {name.lower() for name in child_names}
+    while True:
+        if process.poll() is not None:
+            logging.info(f"{description} (PID: {process.pid}) завершился через {time.monotonic() - started_at:.3f} сек (код {process.returncode}).")
+            return True
+        processes = list_processes()
+        names_by_pid = {p['pid']: p['name'].lower() for p in processes}
+        started_children = [pid for pid in get_process_tree(process.pid, processes)[1:] if names_by_pid.get(pid) in wanted]
+        if started_children:
+            logging.info(f"{description} (PID: {process.pid}) запустил {started_children} через {time.monotonic() - started_at:.3f} сек.")
             return True
-        else:
-            logging.debug("Строка 'Anydesk.exe' не найдена в выводе tasklist. Процесс не запущен.")
+        if time.monotonic() >= deadline:
+            logging.warning(f"{description} (PID: {process.pid}) не запустил {sorted(wanted)} за {timeout_sec} сек.")
             return False
+        try:
+            process.wait(timeout=PROCESS_POLL_INTERVAL_SEC)
+        except subprocess.TimeoutExpired:
+            pass
 
-    except FileNotFoundError:
-        logging.error("Команда 'tasklist' не найдена. Убедитесь, что вы на Windows.")
-        return False # Не удалось проверить
-    except Exception as e:
-        logging.error(f"Неизвестная ошибка при проверке процесса Anydesk: {e}")
-        return False # Не удалось проверить
\ No newline at end of file
+
+def is_anydesk_running():
+    """Проверяет, запущен ли процесс AnyDesk (перечислением процессов, без tasklist)."""
+    logging.debug("Проверка запущенности процесса AnyDesk...")
+    anydesk_pids = find_processes_by_name("AnyDesk.exe", "anydesk")
+    if anydesk_pids:
+        logging.debug(f"Процесс AnyDesk запущен (PID: {anydesk_pids}).")
+        return True
+    logging.debug("Процесс AnyDesk не запущен.")
+    return False
@@ -0,0 +1,218 @@
+# utils/single_instance.py - Один резидентный экземпляр приложения на пользователя
+#
+# Первый запущенный экземпляр слушает локальный канал (именованный канал на Windows,
+# Unix-сокет в остальных ОС) через multiprocessing.connection. Следующие запуски (ссылка
+# из тикетной системы, обработчик браузера) до импорта Qt пробуют передать свои аргументы
+# в этот канал и сразу завершаются; резидентный экземпляр открывает окно и запускает адрес
+# с уже загруженными конфигом, кэшами и соединениями. Подключение проверяется ключом из
+# файла, доступного только текущему пользователю. Модуль не зависит от Qt.
+
+import os
+import re
+import json
+import getpass
+import logging
+import secrets
+import tempfile
+import threading
+
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+INSTANCE_NAME_PREFIX = "BackOfficeLauncher"
+# Сколько клиент ждет подключения, проверки ключа и подтверждения от резидентного экземпляра
+FORWARD_TIMEOUT_SEC = 2
+# Сколько резидентный экземпляр ждет сообщение от подключившегося клиента
+RECEIVE_TIMEOUT_SEC = 2
+AUTHKEY_SIZE = 32
+# Сообщения - JSON в байтах (не pickle): резидентный экземпляр не исполняет присланные объекты
+MAX_MESSAGE_BYTES = 64 * 1024
+ACK_MESSAGE = b'ok'
+STOP_MESSAGE = {'stop': True}
+PING_MESSAGE = {'ping': True}
+
+
+def _instance_name():
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = "user"
+    return f"{INSTANCE_NAME_PREFIX}-{re.sub(r'[^A-Za-z0-9_.-]', '_', user)}"
+
+
+def get_instance_address():
+    """(адрес, семейство) канала резидентного экземпляра текущего пользователя."""
+    if os.name == 'nt':
+        return rf"\\.\pipe\{_instance_name()}", 'AF_PIPE'
+    return os.path.join(tempfile.gettempdir(), f"{_instance_name()}.sock"), 'AF_UNIX'
+
+
+def _get_authkey_path():
+    return os.path.join(tempfile.gettempdir(), f"{_instance_name()}.key")
+
+
+def _read_authkey():
+    try:
+        with open(_get_authkey_path(), 'rb') as f:
+            authkey = f.read()
+        return authkey if len(authkey) == AUTHKEY_SIZE else None
+    except OSError:
+        return None
+
+
+def _write_authkey(authkey):
+    """Ключ в файле с правами только для владельца (атомарная замена прежнего)."""
+    authkey_path = _get_authkey_path()
+    temp_path = f"{authkey_path}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(authkey)
+    os.replace(temp_path, authkey_path)
+
+
+def _send_message(address, family, authkey, message, timeout_sec):
+    """
+    Отправляет сообщение резидентному экземпляру. Возвращает ответ (None - ответа нет).
+    Client() не ограничивает время подключения и проверки ключа, поэтому обмен идет в отдельном
+    потоке: зависший экземпляр не держит вызывающего дольше timeout_sec (TimeoutError).
+    """
+    result = {}
+
+    def exchange():
+        try:
+            with Client(address, family=family, authkey=authkey) as connection:
+                connection.send_bytes(json.dumps(message).encode('utf-8'))
+                if connection.poll(timeout_sec):
+                    result['reply'] = connection.recv_bytes(MAX_MESSAGE_BYTES)
+        except (OSError, EOFError, AuthenticationError) as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=exchange, name="instance-client", daemon=True)
+    thread.start()
+    thread.join(timeout_sec)
+    if thread.is_alive():
+        raise TimeoutError(f"резидентный экземпляр не ответил за {timeout_sec} сек.")
+    if 'error' in result:
+        raise result['error']
+    return result.get('reply')
+
+
+def forward_to_running_instance(argv, timeout_sec=FORWARD_TIMEOUT_SEC):
+    """
+    Передает аргументы командной строки резидентному экземпляру.
+    True - экземпляр принял их (текущий процесс может завершиться), False - экземпляра нет
+    или он не ответил (текущий процесс запускается как обычно).
+    """
+    address, family = get_instance_address()
+    if family == 'AF_UNIX' and not os.path.exists(address):
+        return False
+    authkey = _read_authkey()
+    if authkey is None:
+        return False
+    try:
+        reply = _send_message(address, family, authkey, {'argv': list(argv), 'cwd': os.getcwd()}, timeout_sec)
+        if reply == ACK_MESSAGE:
+            return True
+        logging.warning("Резидентный экземпляр не подтвердил получение аргументов.")
+    except (OSError, EOFError, AuthenticationError) as e:
+        logging.debug(f"Резидентный экземпляр недоступен ({address}): {e}")
+    return False
+
+
+def _is_instance_alive(address, family):
+    """
+    Слушает ли адрес другой экземпляр. Проверка - полноценный обмен с ключом: простое подключение
+    без проверки ключа резидентный экземпляр видит как оборванного клиента.
+    """
+    authkey = _read_authkey()
+    if authkey is None:
+        return False # Без ключа к экземпляру все равно не подключиться
+    try:
+        _send_message(address, family, authkey, PING_MESSAGE, FORWARD_TIMEOUT_SEC)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False # Сокет остался от аварийно завершенного экземпляра
+    except (OSError, EOFError, AuthenticationError) as e:
+        # Адрес занят, но экземпляр не отвечает - не отбираем его, работаем без резидентного режима
+        logging.debug(f"Резидентный экземпляр не ответил на проверку ({address}): {e}")
+    return True
+
+
+class InstanceListener:
+    """Прием аргументов от последующих запусков. on_message(message) вызывается в потоке приема."""
+
+    def __init__(self, on_message):
+        self.on_message = on_message
+        self.address, self.family = get_instance_address()
+        self._listener = None
+        self._authkey = None
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """Занимает адрес канала. False - его уже слушает другой экземпляр (или канал недоступен)."""
+        if self.family == 'AF_UNIX' and os.path.exists(self.address):
+            if _is_instance_alive(self.address, self.family):
+                return False
+            # Сокет остался от аварийно завершенного экземпляра
+            try:
+                os.remove(self.address)
+            except OSError:
+                pass
+        try:
+            self._authkey = secrets.token_bytes(AUTHKEY_SIZE)
+            self._listener = Listener(self.address, family=self.family, authkey=self._authkey)
+            # Ключ записывается только после того, как адрес занят: проигравший гонку экземпляр не испортит ключ победителя
+            _write_authkey(self._authkey)
+        except OSError as e:
+            logging.warning(f"Не удалось открыть канал резидентного экземпляра '{self.address}': {e}")
+            return False
+        self._thread = threading.Thread(target=self._serve, name="instance-listener", daemon=True)
+        self._thread.start()
+        logging.info(f"Резидентный режим: прием запусков через '{self.address}'.")
+        return True
+
+    def _serve(self):
+        while not self._stopping:
+            try:
+                connection = self._listener.accept()
+            except (AuthenticationError, EOFError) as e:
+                logging.warning(f"Отклонено подключение к резидентному экземпляру: {e}")
+                continue
+            except OSError as e:
+                # Клиент оборвал подключение во время проверки ключа - прием продолжается
+                if self._stopping:
+                    return
+                logging.warning(f"Ошибка приема подключения резидентным экземпляром: {e}")
+                continue
+            with connection:
+                try:
+                    if not connection.poll(RECEIVE_TIMEOUT_SEC):
+                        continue
+                    message = json.loads(connection.recv_bytes(MAX_MESSAGE_BYTES).decode('utf-8'))
+                    if self._stopping or message == STOP_MESSAGE:
+                        return
+                    connection.send_bytes(ACK_MESSAGE)
+                    if message == PING_MESSAGE:
+                        continue
+                except (OSError, EOFError, ValueError) as e:
+                    logging.debug(f"Подключение к резидентному экземпляру прервано: {e}")
+                    continue
+            if isinstance(message, dict) and isinstance(message.get('argv'), list):
+                logging.info(f"Получен запуск от другого процесса: {message['argv']}")
+                self.on_message(message)
+
+    def stop(self):
+        if self._listener is None:
+            return
+        self._stopping = True
+        # accept() не прерывается закрытием слушателя из другого потока - будим его подключением
+        try:
+            _send_message(self.address, self.family, self._authkey, STOP_MESSAGE, RECEIVE_TIMEOUT_SEC)
+        except (OSError, EOFError, AuthenticationError):
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout=RECEIVE_TIMEOUT_SEC)
+        try:
+            self._listener.close()
+        except OSError:
+            pass
+        self._listener = None
@@ -0,0 +1,100 @@
+# utils/startup_profiler.py - Замер времени запуска: импорты модулей и контрольные точки
+#
+# Включается [Startup] Profile = true или аргументом --startup-benchmark. Время каждого
+# нового импорта измеряется оберткой builtins.__import__ (полное время и собственное, без
+# вложенных импортов - как у python -X importtime, но доступно и в собранном exe).
+# Контрольные точки (конфиг загружен, импорты завершены, окно создано, первая отрисовка)
+# отсчитываются от первой строки main.py. Модуль не зависит от Qt.
+
+import sys
+import time
+import logging
+import builtins
+import threading
+import importlib.util
+
+# Сколько самых долгих импортов выводить в отчет
+STARTUP_REPORT_TOP_IMPORTS = 15
+
+
+class StartupProfiler:
+    def __init__(self, started_at):
+        self.started_at = started_at # time.perf_counter() в начале процесса
+        self.marks = {} # имя -> мс от started_at (в порядке добавления)
+        self.imports = {} # модуль -> [полное мс, собственное мс]
+        self._original_import = builtins.__import__
+        self._local = threading.local()
+
+    def mark(self, name):
+        self.marks[name] = round((time.perf_counter() - self.started_at) * 1000, 1)
+        logging.debug(f"Запуск: '{name}' через {self.marks[name]} мс.")
+
+    def start_import_timing(self):
+        builtins.__import__ = self._timed_import
+
+    def stop_import_timing(self):
+        # Импорт, начатый до остановки в другом потоке, завершится через сохраненный оригинал
+        if builtins.__import__ == self._timed_import:
+            builtins.__import__ = self._original_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original_import = self._original_import
+        if level == 0:
+            module_name = name
+        else:
+            try:
+                module_name = importlib.util.resolve_name('.' * level + name, (globals or {}).get('__package__'))
+            except (ImportError, ValueError):
+                module_name = name
+        # from-импорт может загружать подмодули уже загруженного пакета
+        new_modules = [candidate for candidate in [module_name] + [f"{module_name}.{item}" for item in (fromlist or ()) if item != '*']
+                       if candidate not in sys.modules]
+        if not new_modules:
+            return original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0) # Сюда вложенные импорты добавляют свое время
+        started_at = time.perf_counter()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            nested_ms = stack.pop()
+            if stack:
+                stack[-1] += elapsed_ms
+            for loaded_name in new_modules:
+                if loaded_name in sys.modules and loaded_name not in self.imports:
+                    self.imports[loaded_name] = [round(elapsed_ms, 2), round(elapsed_ms - nested_ms, 2)]
+
+    def report(self, top=STARTUP_REPORT_TOP_IMPORTS):
+        """{'marks': {...}, 'imports_count', 'slowest_imports': [{'module', 'total_ms', 'self_ms'}, ...]}"""
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        return {
+            'marks': dict(self.marks),
+            'imports_count': len(self.imports),
+            'slowest_imports': [{'module': name, 'total_ms': total_ms, 'self_ms': self_ms} for name, (total_ms, self_ms) in slowest],
+        }
+
+    def log_report(self):
+        report = self.report()
+        logging.info("Время запуска: " + ", ".join(f"{name} {ms} мс" for name, ms in report['marks'].items())
+                     + f"; новых модулей: {report['imports_count']}.")
+        for entry in report['slowest_imports']:
+            logging.info(f"  импорт {entry['module']}: {entry['total_ms']} мс (собственное {entry['self_ms']} мс)")
+        return report
+
+    def check_budget(self, budget_ms, mark_name='first_paint'):
+        """True, если бюджета нет (<= 0) или контрольная точка уложилась в него."""
+        if budget_ms <= 0:
+            return True
+        elapsed_ms = self.marks.get(mark_name)
+        if elapsed_ms is None:
+            logging.warning(f"Бюджет запуска: контрольная точка '{mark_name}' не достигнута.")
+            return False
+        if elapsed_ms > budget_ms:
+            logging.warning(f"Бюджет запуска превышен: '{mark_name}' через {elapsed_ms} мс при бюджете {budget_ms} мс.")
+            return False
+        logging.info(f"Бюджет запуска соблюден: '{mark_name}' через {elapsed_ms} мс (бюджет {budget_ms} мс).")
+        return True
@@ -20,6 +20,8 @@ def parse_target_string(input_string):
 
     # Удаляем потенциальную схему (http, https, ftp, ftps) и символы авторизации (@)
     # Это упрощает поиск хоста и порта в оставшейся части строки.
+    scheme_match = re.match(r"^(https?)://", input_string.strip(), flags=re.IGNORECASE)
+    input_scheme = scheme_match.group(1).lower() if scheme_match else None
     temp_input = re.sub(r"^(https?|ftp|ftps)://", "", input_string, flags=re.IGNORECASE)
     temp_input = re.sub(r"^[^@]+@", "", temp_input)
 
@@ -27,6 +29,7 @@ def parse_target_string(input_string):
 
     url_or_ip = None
     port = 443 # Порт по умолчанию
+    port_explicit = False
 
     # 1. Определяем порт
     # Ищем последнее двоеточие, за которым следуют цифры до конца строки или слэша.
@@ -37,6 +40,7 @@ def parse_target_string(input_string):
             # Валидируем порт: должен быть в разумном диапазоне
             if 1 <= explicit_port <= 65535:
                  port = explicit_port
+                 port_explicit = True
                  logging.debug(f"Явный порт '{port}' извлечен из исходной строки.")
                  # Удаляем часть с портом из строки для парсинга хоста
                  temp_input_for_host = temp_input[:port_match.start()]
@@ -90,7 +94,10 @@ def parse_target_string(input_string):
         'UrlOrIp': url_or_ip,
         'Port': port,
         'Scheme': config_scheme, # Добавляем определенную схему
-        'IsIpAddress': is_ip_address
+        'IsIpAddress': is_ip_address,
+        # Что было указано во вводе явно (для обнаружения схемы/порта, см. core/discovery.py)
+        'PortExplicit': port_explicit,
+        'InputScheme': input_scheme
     }
 
 def find_anydesk_id(input_string):
@@ -199,14 +206,15 @@ def format_version(version_string):
     return result
 
 
+def guess_vendor(input_string):
+    """Производитель по введенной строке: "Syrve", если она содержит "syrve" (без учета регистра), иначе "iiko"."""
+    return "Syrve" if "syrve" in (input_string or "").lower() else "iiko"
+
+
 def determine_app_type(input_string, edition):
     """Определяет тип приложения и производителя на основе входной строки и edition."""
-    # ... (остается без изменений)
     logging.debug(f"Определение типа приложения для строки '{input_string}' и edition '{edition}'")
-    vendor = "iiko" # По умолчанию
-    # Проверяем входную строку на наличие "syrve" (без учета регистра)
-    if "syrve" in input_string.lower():
-        vendor = "Syrve"
+    vendor = guess_vendor(input_string)
 
     app_type = None
     # Определяем тип на основе edition
@@ -0,0 +1,220 @@
+# workers/scheduler.py - Очередь задач запуска/проверки на общем пуле потоков
+#
+# Каждое нажатие "Launch"/"Check" становится задачей (Job) со своим прогрессом,
+# статусом и отменой. Задачи выполняются на одном переиспользуемом QThreadPool,
+# не больше [Settings] MaxConcurrentJobs одновременно; остальные ждут в очереди пула.
+# Продолжение запуска после диалога (LaunchWorkerFromStep4/5) выполняется как та же
+# задача с повышенным приоритетом, чтобы не стоять в очереди за новыми задачами.
+
+import logging
+import itertools
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from core.config import get_config_value
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_WAITING_USER = 'waiting_user' # Воркер завершился, ожидая ответа на диалог
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELED = 'canceled'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELED)
+
+# Приоритет пула для продолжения задачи после диалога (новые задачи - 0)
+CONTINUATION_PRIORITY = 10
+
+
+class Job:
+    """Состояние одной задачи (обновляется только в GUI-потоке)."""
+
+    def __init__(self, job_id, kind, title):
+        self.id = job_id
+        self.kind = kind # 'launch' | 'check'
+        self.title = title
+        self.state = JOB_QUEUED
+        self.progress = 0
+        self.status = ""
+        self.status_level = "INFO"
+        self.text = ""
+        self.error = None # (message, detailed_traceback)
+        self.worker = None
+        self.dialog_requested = False
+
+    @property
+    def is_finished(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def is_canceled(self):
+        return self.worker is not None and self.worker._is_canceled
+
+
+class _WorkerRunnable(QRunnable):
+    """Выполняет run() воркера в потоке пула. Сигналы воркера доставляются в GUI очередью."""
+
+    def __init__(self, scheduler, job_id, worker):
+        super().__init__()
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.worker = worker
+        self.setAutoDelete(True)
+
+    def run(self):
+        self.scheduler.job_started.emit(self.job_id)
+        try:
+            self.worker.run()
+        except Exception as e:
+            # run() воркеров сам ловит ошибки; сюда попадает только непредвиденное
+            logging.error(f"Необработанная ошибка в задаче #{self.job_id}: {e}")
+            self.worker.finished.emit()
+
+
+class JobScheduler(QObject):
+    """Очередь задач на общем пуле потоков с ограничением одновременных задач."""
+    job_added = pyqtSignal(int)
+    job_started = pyqtSignal(int)
+    job_updated = pyqtSignal(int)
+    job_finished = pyqtSignal(int)
+    # job_id, dialog_type, title, message, options, callback_data
+    dialog_requested = pyqtSignal(int, str, str, str, list, object)
+
+    def __init__(self, config, parent=None):
+        super().__init__(parent)
+        self.config = config
+        self.jobs = {} # job_id -> Job (в порядке добавления)
+        self._ids = itertools.count(1)
+        self.pool = QThreadPool(self)
+        max_jobs = get_config_value(config, 'Settings', 'MaxConcurrentJobs', default=3, type_cast=int)
+        self.pool.setMaxThreadCount(max(1, max_jobs))
+        self.job_started.connect(self._on_job_started)
+        logging.info(f"Планировщик задач: одновременно не более {self.pool.maxThreadCount()} задач.")
+
+    def update_config(self, config):
+        """Новый снимок конфигурации для следующих задач; выполняющиеся дорабатывают с прежним."""
+        self.config = config
+        max_jobs = get_config_value(config, 'Settings', 'MaxConcurrentJobs', default=3, type_cast=int)
+        if max(1, max_jobs) != self.pool.maxThreadCount():
+            self.pool.setMaxThreadCount(max(1, max_jobs))
+            logging.info(f"Планировщик задач: одновременно не более {self.pool.maxThreadCount()} задач.")
+
+    def submit(self, worker_class, data, kind, title, job_id=None):
+        """
+        Ставит воркер в очередь пула. job_id - продолжение существующей задачи после диалога.
+        Возвращает id задачи.
+        """
+        is_continuation = job_id is not None
+        if is_continuation:
+            job = self.jobs[job_id]
+        else:
+            job = Job(next(self._ids), kind, title)
+            self.jobs[job.id] = job
+        job.state = JOB_QUEUED
+        job.dialog_requested = False
+
+        worker = worker_class(self.config, data)
+        job.worker = worker
+        worker.status_update.connect(lambda message, level, j=job.id: self._on_status(j, message, level))
+        worker.progress_update.connect(lambda value, j=job.id: self._on_progress(j, value))
+        worker.text_update.connect(lambda text, j=job.id: self._on_text(j, text))
+        worker.error.connect(lambda message, details, j=job.id: self._on_error(j, message, details))
+        worker.dialog_request.connect(lambda *args, j=job.id: self._on_dialog_request(j, *args))
+        worker.finished.connect(lambda j=job.id, w=worker: self._on_worker_finished(j, w))
+
+        if not is_continuation:
+            self.job_added.emit(job.id)
+        else:
+            self.job_updated.emit(job.id)
+        self.pool.start(_WorkerRunnable(self, job.id, worker), CONTINUATION_PRIORITY if is_continuation else 0)
+        logging.info(f"Задача #{job.id} ({worker_class.__name__}, '{job.title}') поставлена в очередь.")
+        return job.id
+
+    def cancel(self, job_id):
+        """Отменяет задачу: выполняющийся воркер проверит флаг отмены, ожидающая в очереди завершится сразу после старта."""
+        job = self.jobs.get(job_id)
+        if job is None or job.is_finished:
+            return
+        logging.info(f"Отмена задачи #{job_id} ('{job.title}').")
+        if job.worker is not None:
+            job.worker.cancel()
+        if job.state == JOB_WAITING_USER:
+            # Воркер уже завершился, а диалог еще не показан/не отвечен
+            self._finish(job, JOB_CANCELED)
+
+    def cancel_all(self):
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+
+    def active_jobs(self):
+        return [job for job in self.jobs.values() if not job.is_finished]
+
+    def wait_for_done(self, timeout_ms):
+        """Ждет завершения потоков пула (при выходе из приложения). True - все завершились."""
+        return self.pool.waitForDone(timeout_ms)
+
+    def remove_finished(self, keep_last=0):
+        """Удаляет из списка завершенные задачи, оставляя keep_last последних. Возвращает удаленные id."""
+        finished_ids = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        removed_ids = finished_ids[:max(0, len(finished_ids) - keep_last)]
+        for job_id in removed_ids:
+            del self.jobs[job_id]
+        return removed_ids
+
+    # --- Обработчики сигналов воркеров (GUI-поток) ---
+
+    def _on_job_started(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and job.state == JOB_QUEUED:
+            job.state = JOB_RUNNING
+            self.job_updated.emit(job_id)
+
+    def _on_status(self, job_id, message, level):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.status, job.status_level = message, level
+            self.job_updated.emit(job_id)
+
+    def _on_progress(self, job_id, value):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.progress = value
+            self.job_updated.emit(job_id)
+
+    def _on_text(self, job_id, text):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.text = text
+            self.job_updated.emit(job_id)
+
+    def _on_error(self, job_id, message, detailed_traceback):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.error = (message, detailed_traceback)
+
+    def _on_dialog_request(self, job_id, dialog_type, title, message, options, callback_data):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job.dialog_requested = True
+        self.dialog_requested.emit(job_id, dialog_type, title, message, options, callback_data)
+
+    def _on_worker_finished(self, job_id, worker):
+        job = self.jobs.get(job_id)
+        if job is None or job.worker is not worker or job.is_finished:
+            return
+        if job.dialog_requested and not worker._is_canceled:
+            job.state = JOB_WAITING_USER
+            self.job_updated.emit(job_id)
+            return
+        if worker._is_canceled:
+            self._finish(job, JOB_CANCELED)
+        elif job.error is not None:
+            self._finish(job, JOB_FAILED)
+        else:
+            self._finish(job, JOB_DONE)
+
+    def _finish(self, job, state):
+        job.state = state
+        logging.info(f"Задача #{job.id} ('{job.title}') завершена: {state}.")
+        self.job_updated.emit(job.id)
+        self.job_finished.emit(job.id)
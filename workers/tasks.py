@@ -18,15 +18,19 @@ from core.launcher import (
     step_format_version,
     step_get_installer_name,
     step_appdata_cleanup,
+    step_seed_config,
     step_first_run,
     step_wait_edit_config,
     step_restart
 )
 from core.installer import find_or_download_installer
+from core.speculative import SpeculativePrep, is_speculative_prep_enabled
+from core.batch_check import check_servers_batch
 from utils.exceptions import AbortOperation
 from utils.process_utils import stop_process_by_pid
 from utils.file_utils import edit_config_file, wait_for_file
 from core.config import get_config_value
+from utils.url_utils import format_version, guess_vendor
 
 
 
@@ -68,9 +72,11 @@ class BaseWorker(QObject):
 
 class CheckWorker(BaseWorker):
     """Воркер для выполнения проверки сервера."""
-    def __init__(self, config, target_string, parent=None):
+    def __init__(self, config, check_data, parent=None):
         super().__init__(config, parent)
-        self.target_string = target_string
+        # check_data: {'target_string': ..., 'force_refresh': bool}
+        self.target_string = check_data['target_string']
+        self.force_refresh = check_data.get('force_refresh', False)
 
     def run(self):
         logging.info(f"CheckWorker запущен для '{self.target_string}'.")
@@ -82,7 +88,8 @@ class CheckWorker(BaseWorker):
                 self.config,
                 self.target_string,
                 self._update_status,
-                self._update_progress
+                self._update_progress,
+                force_refresh=self.force_refresh
             )
 
             # Проверка на отмену после завершения check_server_info
@@ -112,6 +119,39 @@ class CheckWorker(BaseWorker):
             logging.info("CheckWorker завершен.")
 
 
+class BatchCheckWorker(BaseWorker):
+    """Воркер пакетной проверки множества серверов. Результаты передаются по мере готовности."""
+    result_ready = pyqtSignal(dict)
+
+    def __init__(self, config, targets, parent=None):
+        super().__init__(config, parent)
+        self.targets = targets
+
+    def run(self):
+        logging.info(f"BatchCheckWorker запущен для {len(self.targets)} серверов.")
+        done_count = 0
+
+        def handle_result(result):
+            nonlocal done_count
+            done_count += 1
+            self.result_ready.emit(result)
+            self._update_progress(done_count * 100 / max(1, len(self.targets)))
+
+        try:
+            results = check_servers_batch(self.config, self.targets, handle_result, lambda: self._is_canceled)
+            ok_count = sum(1 for r in results if r['ok'])
+            if self._is_canceled:
+                self._update_status(f"Проверка отменена: {len(results)} из {len(self.targets)}.", level="WARNING")
+            else:
+                self._update_status(f"Проверено: {len(results)}, ответили: {ok_count}.", level="INFO")
+        except Exception as e:
+            self._update_status("Ошибка пакетной проверки.", level="ERROR")
+            self.error.emit(str(e), traceback.format_exc())
+        finally:
+            self.finished.emit()
+            logging.info("BatchCheckWorker завершен.")
+
+
 class LaunchWorker(BaseWorker):
     """Воркер для выполнения последовательности запуска BackOffice."""
     PROGRESS_BOUNDARIES = {
@@ -156,6 +196,56 @@ class LaunchWorker(BaseWorker):
              logging.debug(f"Отслеживаемый процесс BackOffice (PID: {self._current_process.pid}) уже завершен.")
              self._current_process = None # Сбрасываем ссылку, если процесс уже завершен
 
+    def _start_speculative_prep(self, candidates):
+        """
+        Запускает фоновую подготовку дистрибутивов candidates [(app_type, vendor), ...] на время
+        диалога с пользователем. Уже идущая подготовка тех же кандидатов переиспользуется.
+        """
+        if not is_speculative_prep_enabled(self.config):
+            return
+        try:
+            version_formatted = format_version(self.launch_data['version_raw'])
+            existing_prep = self.launch_data.get('speculative_prep')
+            if existing_prep is not None:
+                if all(existing_prep.has_candidate(app_type, vendor, version_formatted) for app_type, vendor in candidates):
+                    existing_prep.cancel(except_app_type=candidates[0][0] if len(candidates) == 1 else None)
+                    return
+                existing_prep.cancel()
+            self.launch_data['speculative_prep'] = SpeculativePrep(self.config, version_formatted, candidates)
+        except Exception as e:
+            # Упреждающая подготовка - только оптимизация, основной путь от нее не зависит
+            logging.warning(f"Не удалось начать упреждающую подготовку дистрибутива: {e}")
+
+    def _cancel_speculative_prep(self):
+        speculative_prep = self.launch_data.pop('speculative_prep', None)
+        if speculative_prep is not None:
+            speculative_prep.cancel()
+
+    def _prepare_installer(self, base, range_):
+        """Шаг 7: дистрибутив из упреждающей подготовки (если она шла для этого типа) или обычный поиск/скачивание."""
+        speculative_prep = self.launch_data.pop('speculative_prep', None)
+        if speculative_prep is not None:
+            if speculative_prep.has_candidate(self.launch_data['app_type'], self.launch_data['vendor'], self.launch_data['version_formatted']):
+                installer_path = speculative_prep.take(
+                    self.launch_data['app_type'], self._update_status, self._update_progress,
+                    base, range_, lambda: self._is_canceled)
+                if installer_path is not None or self._is_canceled:
+                    return installer_path
+                logging.info("Упреждающая подготовка не дала результата, обычный поиск дистрибутива.")
+            else:
+                speculative_prep.cancel()
+        return find_or_download_installer(
+            self.config,
+            self.launch_data['app_type'],
+            self.launch_data['version_formatted'],
+            self.launch_data['vendor'],
+            self._update_status,
+            self._update_progress,
+            base,
+            range_,
+            lambda: self._is_canceled # Передаем колбэк отмены
+        )
+
 
     def run(self):
         logging.info("LaunchWorker запущен.")
@@ -173,7 +263,7 @@ class LaunchWorker(BaseWorker):
             base, range_ = self._get_step_progress_range('http_request')
             self._update_progress(base + range_ * 0.1) # Начальный прогресс шага
             self._update_status(f"Выполнение GET-запроса к {self.launch_data['parsed_target']['UrlOrIp']}:{self.launch_data['parsed_target']['Port']}...")
-            step_data = step_http_request(self.config, self.launch_data['parsed_target'])
+            step_data = step_http_request(self.config, self.launch_data['parsed_target'], self.launch_data.get('force_refresh', False))
             self.launch_data.update(step_data)
             self._update_step_progress('http_request')
             logging.debug("Шаг 2 завершен.")
@@ -187,6 +277,9 @@ class LaunchWorker(BaseWorker):
             if self.launch_data.get('app_info') is None:
                  logging.info("Требуется выбор типа приложения пользователем.")
                  self._update_step_progress('process_response', 0.5) # Прогресс до середины шага
+                 # Пока пользователь выбирает, готовим оба варианта
+                 vendor = guess_vendor(self.launch_data['target_string'])
+                 self._start_speculative_prep([(f"{vendor}RMS", vendor), (f"{vendor}Chain", vendor)])
                  self._request_dialog('app_type', "Выбор типа приложения",
                                       f"Не удалось автоматически определить тип RMS/Chain для производителя по edition ('{self.launch_data.get('edition', 'N/A')}').\nВыберите тип приложения:",
                                       ['RMS', 'Chain'],
@@ -223,6 +316,7 @@ class LaunchWorker(BaseWorker):
 
             # Останавливаем процесс BackOffice, если он был запущен до отмены (например, на шаге 9)
             self._stop_backoffice_process()
+            self._cancel_speculative_prep()
 
 
         except Exception as e:
@@ -236,6 +330,7 @@ class LaunchWorker(BaseWorker):
 
             # Останавливаем процесс BackOffice, если он был запущен и еще работает
             self._stop_backoffice_process()
+            self._cancel_speculative_prep()
 
 
         finally:
@@ -257,6 +352,7 @@ class LaunchWorker(BaseWorker):
             if not server_state_ok:
                  logging.info("Требуется подтверждение состояния сервера пользователем.")
                  self._update_step_progress('check_state', 0.5) # Прогресс до середины шага
+                 self._start_speculative_prep([(self.launch_data['app_type'], self.launch_data['vendor'])])
                  self._request_dialog('server_state_confirm', "Состояние сервера",
                                       f"Состояние сервера '{self.launch_data['parsed_target']['UrlOrIp']}' не 'STARTED_SUCCESSFULLY', текущее состояние: '{self.launch_data['server_state']}'.\nПродолжить запуск BackOffice?",
                                       ['Yes', 'No'],
@@ -276,6 +372,7 @@ class LaunchWorker(BaseWorker):
             self._update_progress(self.PROGRESS_BOUNDARIES['check_state'][0]) # Сбрасываем прогресс шага
             self._update_text(f"Операция отменена:\n{e}")
             self._stop_backoffice_process() # Останавливаем процесс при отмене
+            self._cancel_speculative_prep()
 
         except Exception as e:
             logging.error(f"Ошибка в _run_from_step4: {e}\n{traceback.format_exc()}")
@@ -284,6 +381,7 @@ class LaunchWorker(BaseWorker):
             self._update_text(f"Ошибка во время запуска:\n{traceback.format_exc()}")
             self.error.emit(str(e), traceback.format_exc())
             self._stop_backoffice_process() # Останавливаем процесс при ошибке
+            self._cancel_speculative_prep()
 
 
     def _run_from_step5(self):
@@ -312,17 +410,7 @@ class LaunchWorker(BaseWorker):
             if self._is_canceled: raise AbortOperation("Operation aborted before step 7.")
             base, range_ = self._get_step_progress_range('find_download')
             self._update_progress(base) # Начальный прогресс шага
-            installer_path = find_or_download_installer(
-                self.config,
-                self.launch_data['app_type'],
-                self.launch_data['version_formatted'],
-                self.launch_data['vendor'],
-                self._update_status,
-                self._update_progress,
-                base,
-                range_,
-                lambda: self._is_canceled # Передаем колбэк отмены
-            )
+            installer_path = self._prepare_installer(base, range_)
 
             if installer_path is None:
                  # find_or_download_installer возвращает None только при отмене
@@ -351,44 +439,52 @@ class LaunchWorker(BaseWorker):
             logging.debug("Шаг 8 завершен.")
 
 
-            # Шаг 9: Первый запуск BackOffice.exe (95-96%)
+            # Шаг 9 (быстрый путь): конфиг из шаблона версии, без первого запуска и перезапуска
             if self._is_canceled: raise AbortOperation("Operation aborted before step 9.")
-            base, range_ = self._get_step_progress_range('first_run')
-            self._update_progress(base + range_ * 0.1) # Начальный прогресс шага
-            self._update_status("Первый запуск BackOffice.exe...")
-            step_data = step_first_run(self.launch_data['installer_path'], self.launch_data['sanitized_target'])
-            self.launch_data.update(step_data)
-            self._current_process = self.launch_data.get('backoffice_process') # Сохраняем ссылку на процесс для возможной остановки
-            self._update_status(f"BackOffice.exe запущен (PID: {self._current_process.pid}).")
-            self._update_step_progress('first_run')
-            logging.debug("Шаг 9 завершен.")
-
-
-            # Шаг 10: Ожидание и редактирование файла backclient.config (96-98%)
-            if self._is_canceled: raise AbortOperation("Operation aborted before step 10.")
-            base, range_ = self._get_step_progress_range('wait_edit_config')
-            self._update_progress(base) # Начальный прогресс шага
-
-            # и редактирования конфига, получая логин из config.
-            step_success = step_wait_edit_config(
-                 self.config, # Передаем объект конфига
-                 self.launch_data, # Передаем launch_data (содержит все нужные пути и данные)
-                 self._update_status,
-                 self._update_progress,
-                 base,
-                 range_,
-                 lambda: self._is_canceled
-            )
-
-            if not step_success:
-                 # step_wait_edit_config вернет False только при отмене
-                 raise AbortOperation("Waiting for config file and editing aborted.")
-            # Если step_wait_edit_config выбросил TimeoutError или RuntimeError,
-            # они будут пойманы в блоке except LaunchWorker.run.
-
-            self._update_status("Файл конфигурации успешно отредактирован.")
-            self._update_step_progress('wait_edit_config', 1.0) # Обновляем прогресс шага до 100%
-            logging.debug("Шаг 10 завершен.")
+            seed_data = step_seed_config(self.config, self.launch_data, self._update_status)
+            if seed_data is not None:
+                self.launch_data.update(seed_data)
+                self._update_status("Файл конфигурации подготовлен из шаблона.")
+                self._update_step_progress('wait_edit_config', 1.0)
+                logging.debug("Шаги 9-10 пропущены: конфигурация из шаблона.")
+            else:
+                # Шаг 9: Первый запуск BackOffice.exe (95-96%)
+                base, range_ = self._get_step_progress_range('first_run')
+                self._update_progress(base + range_ * 0.1) # Начальный прогресс шага
+                self._update_status("Первый запуск BackOffice.exe...")
+                step_data = step_first_run(self.launch_data['installer_path'], self.launch_data['sanitized_target'])
+                self.launch_data.update(step_data)
+                self._current_process = self.launch_data.get('backoffice_process') # Сохраняем ссылку на процесс для возможной остановки
+                self._update_status(f"BackOffice.exe запущен (PID: {self._current_process.pid}).")
+                self._update_step_progress('first_run')
+                logging.debug("Шаг 9 завершен.")
+
+
+                # Шаг 10: Ожидание и редактирование файла backclient.config (96-98%)
+                if self._is_canceled: raise AbortOperation("Operation aborted before step 10.")
+                base, range_ = self._get_step_progress_range('wait_edit_config')
+                self._update_progress(base) # Начальный прогресс шага
+
+                # и редактирования конфига, получая логин из config.
+                step_success = step_wait_edit_config(
+                     self.config, # Передаем объект конфига
+                     self.launch_data, # Передаем launch_data (содержит все нужные пути и данные)
+                     self._update_status,
+                     self._update_progress,
+                     base,
+                     range_,
+                     lambda: self._is_canceled
+                )
+
+                if not step_success:
+                     # step_wait_edit_config вернет False только при отмене
+                     raise AbortOperation("Waiting for config file and editing aborted.")
+                # Если step_wait_edit_config выбросил TimeoutError или RuntimeError,
+                # они будут пойманы в блоке except LaunchWorker.run.
+
+                self._update_status("Файл конфигурации успешно отредактирован.")
+                self._update_step_progress('wait_edit_config', 1.0) # Обновляем прогресс шага до 100%
+                logging.debug("Шаг 10 завершен.")
 
 
             # Шаг 11: Перезапуск BackOffice.exe (98-100%)
@@ -441,6 +537,7 @@ class LaunchWorker(BaseWorker):
 
             # Останавливаем процесс BackOffice, если он был запущен и отслеживается
             self._stop_backoffice_process()
+            self._cancel_speculative_prep()
 
 
         except Exception as e:
@@ -452,6 +549,7 @@ class LaunchWorker(BaseWorker):
 
             # Останавливаем процесс BackOffice, если он был запущен и отслеживается
             self._stop_backoffice_process()
+            self._cancel_speculative_prep()
 
         finally:
             # В этом finally блоке НЕ останавливаем процесс,
@@ -480,6 +578,7 @@ class LaunchWorkerFromStep4(LaunchWorker):
              self._update_progress(0)
              self._update_text(f"Операция отменена:\n{e}")
              self._stop_backoffice_process() # Останавливаем процесс при отмене
+             self._cancel_speculative_prep()
 
          except Exception as e:
              logging.error(f"Ошибка в LaunchWorkerFromStep4: {e}\n{traceback.format_exc()}")
@@ -488,6 +587,7 @@ class LaunchWorkerFromStep4(LaunchWorker):
              self._update_text(f"Ошибка во время запуска:\n{traceback.format_exc()}")
              self.error.emit(str(e), traceback.format_exc())
              self._stop_backoffice_process() # Останавливаем процесс при ошибке
+             self._cancel_speculative_prep()
 
          finally:
              self.finished.emit()
@@ -512,6 +612,7 @@ class LaunchWorkerFromStep5(LaunchWorker):
              self._update_progress(0)
              self._update_text(f"Операция отменена:\n{e}")
              self._stop_backoffice_process() # Останавливаем процесс при отмене
+             self._cancel_speculative_prep()
 
          except Exception as e:
              logging.error(f"Ошибка в LaunchWorkerFromStep5: {e}\n{traceback.format_exc()}")
@@ -520,6 +621,7 @@ class LaunchWorkerFromStep5(LaunchWorker):
              self._update_text(f"Ошибка во время запуска:\n{traceback.format_exc()}")
              self.error.emit(str(e), traceback.format_exc())
              self._stop_backoffice_process() # Останавливаем процесс при ошибке
+             self._cancel_speculative_prep()
 
          finally:
              self.finished.emit()